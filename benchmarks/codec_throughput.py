@@ -0,0 +1,122 @@
+"""
+Compares the encode and decode throughput of the native codecs with Pillow.
+
+Usage: python benchmarks/codec_throughput.py [--repeat N]  (with pixediter installed or on PYTHONPATH)
+
+Throughput is given in megapixels per second of the decoded image. The time it takes to
+import each implementation is measured as well, since that is paid on the first open or
+save (on top of pixediter.image, which the editor has always imported by then).
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import random
+import subprocess
+import sys
+import time
+from collections.abc import Callable
+
+from PIL import Image
+
+from pixediter import formats
+from pixediter.image import BYTES_PER_PIXEL
+
+
+def pixel_art(width: int, height: int) -> bytes:
+    """Flat areas of a few colors, like a typical sprite sheet"""
+    rng = random.Random(1)
+    palette = [bytes((rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)) for _ in range(16)]
+    block = 8
+    rows = []
+    for _ in range(0, height, block):
+        row = b"".join(rng.choice(palette) * block for _ in range(0, width, block))[:width * BYTES_PER_PIXEL]
+        rows += [row] * block
+    return b"".join(rows[:height])
+
+
+def photo(width: int, height: int) -> bytes:
+    """Smooth gradients with noise, the worst case for the native PNG decoder (Paeth filters everywhere)"""
+    rng = random.Random(2)
+    return b"".join(
+        bytes(((x + rng.randrange(8)) % 256, (y + rng.randrange(8)) % 256, (x + y) % 256, 255))
+        for y in range(height) for x in range(width)
+    )
+
+
+def best_of(repeat: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def native_encode(codec: formats.Codec, width: int, height: int, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    codec.write(buf, width, height, data, False)
+    return buf.getvalue()
+
+
+def native_decode(codec: formats.Codec, encoded: bytes) -> bytes:
+    _, _, rows = codec.read(io.BytesIO(encoded))
+    return b"".join(rows)
+
+
+def pillow_encode(name: str, width: int, height: int, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    Image.frombytes("RGBA", (width, height), data).save(buf, name)
+    return buf.getvalue()
+
+
+def pillow_decode(encoded: bytes) -> bytes:
+    with Image.open(io.BytesIO(encoded)) as image:
+        data: bytes = image.convert("RGBA").tobytes()
+    return data
+
+
+def import_time(module: str, repeat: int, baseline: str = "pixediter.image") -> float:
+    def run(code: str) -> Callable[[], object]:
+        return lambda: subprocess.run([sys.executable, "-c", code], check=True)
+    return best_of(repeat, run(f"import {baseline}; import {module}")) - best_of(repeat, run(f"import {baseline}"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for module in ("pixediter.formats", "PIL.Image"):
+        print(f"import {module}: {import_time(module, args.repeat) * 1000:.1f} ms")
+    print()
+
+    images = [
+        ("pixel art 64x64", 64, 64, pixel_art(64, 64)),
+        ("pixel art 1024x1024", 1024, 1024, pixel_art(1024, 1024)),
+        ("photo 512x512", 512, 512, photo(512, 512)),
+    ]
+    print(f"{'image':<20} {'format':<9} {'encoder':<7} {'encode Mpx/s':>13} {'decode Mpx/s':>13} {'size':>10}")
+    for label, width, height, data in images:
+        megapixels = width * height / 1e6
+        for codec in formats.CODECS:
+            encoded = native_encode(codec, width, height, data)
+            encode = best_of(args.repeat, lambda: native_encode(codec, width, height, data))
+            decode = best_of(args.repeat, lambda: native_decode(codec, encoded))
+            print(f"{label:<20} {codec.name:<9} {'native':<7} "
+                  f"{megapixels / encode:>13.2f} {megapixels / decode:>13.2f} {len(encoded):>10}")
+            if codec.name.upper() not in Image.registered_extensions().values():
+                continue
+            try:
+                encoded = pillow_encode(codec.name, width, height, data)
+            except (KeyError, OSError):
+                # Pillow can read some formats (e.g. QOI) that it can't write
+                continue
+            encode = best_of(args.repeat, lambda: pillow_encode(codec.name, width, height, data))
+            decode = best_of(args.repeat, lambda: pillow_decode(encoded))
+            print(f"{label:<20} {codec.name:<9} {'Pillow':<7} "
+                  f"{megapixels / encode:>13.2f} {megapixels / decode:>13.2f} {len(encoded):>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Measures what rendering the editor costs: time, bytes written, write calls and terminal
+cells touched, for a full redraw and for a single pencil stroke.
+
+Usage: python benchmarks/render_cost.py [--repeat N]  (with pixediter installed or on PYTHONPATH)
+
+The editor renders into a VirtualTerminal, so no pty is needed and the counts are exact.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from collections.abc import Callable
+
+from pixediter import colors
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.virtual_terminal import FrameStats
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def measure(vt: VirtualTerminal, repeat: int, fn: Callable[[], object]) -> tuple[float, FrameStats]:
+    """Returns the best time of fn and the counts of its last run"""
+    best = float("inf")
+    stats = FrameStats()
+    for _ in range(repeat):
+        vt.end_frame()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+        stats = vt.end_frame()
+    return best, stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'canvas':<10} {'operation':<14} {'ms':>8} {'bytes':>9} {'writes':>7} {'cells':>6}")
+    for width, height in ((16, 16), (32, 32), (60, 40)):
+        with terminal.using(VirtualTerminal(200, 60)) as vt:
+            app = App(width, height)
+            app.full_redraw()
+            app.color.set_color("primary", colors.RED)
+            stroke = [
+                MouseEvent(MouseEventType.MOUSE_DOWN, MouseButton.LEFT, 5, 5),
+                *(MouseEvent(MouseEventType.MOUSE_DRAG, MouseButton.LEFT, 5 + 2 * i, 5) for i in range(width // 2)),
+                MouseEvent(MouseEventType.MOUSE_UP, MouseButton.LEFT, 5 + width, 5),
+            ]
+
+            def draw_stroke() -> None:
+                for ev in stroke:
+                    app._handle_click(ev)
+
+            for label, fn in (("full redraw", app.full_redraw), ("pencil stroke", draw_stroke)):
+                seconds, stats = measure(vt, args.repeat, fn)
+                print(f"{width}x{height:<7} {label:<14} {seconds * 1000:>8.2f} "
+                      f"{stats.bytes:>9} {stats.writes:>7} {stats.cells:>6}")
+
+
+if __name__ == "__main__":
+    main()
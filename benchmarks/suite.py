@@ -0,0 +1,445 @@
+"""
+Runs the benchmarks of the tools, the renderer and the codecs and compares them to a baseline.
+
+Usage: python benchmarks/suite.py [--repeat N] [--filter TEXT] [--json FILE] [--baseline FILE]
+(with pixediter installed or on PYTHONPATH)
+
+Every case is run N times on fresh state and the best time is reported, along with the
+median to show how noisy the run was. Rendering cases also report the bytes and write
+calls sent to the terminal, which goes to a sink that only counts them so that parsing
+escape sequences does not add to the time. Panning is measured with the terminal features
+for moving the screen contents (see terminal.shift) and without them. Zoomed out rendering
+includes bringing the mipmap pyramid up to date after a few pixels were drawn. A frame of
+a gradient preview is measured in each of the modes for slow links (see bandwidth), and
+rendering in the palettes of terminals without RGB colors (see indexed_colors). Playing
+an animation steps once through its frames, drawing the pixels that differ between them,
+and exporting it writes them as an animated GIF and PNG (see export).
+
+--json writes the results to FILE. A file written by an earlier run (for example on the
+main branch) can be given as --baseline, and each case is then compared to it: a ratio
+below 1 is faster than the baseline. Cases slower than the baseline by more than
+--threshold are marked as regressions and make the exit status 1, so the suite can be
+used as a check.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from pixediter import bandwidth
+from pixediter import colors
+from pixediter import export
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.colors import Color
+from pixediter.ColorSelector import ColorSelector
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+from pixediter.tools import DrawEvent
+from pixediter.tools import FillTool
+from pixediter.tools import Gradient
+from pixediter.tools import LineTool
+from pixediter.tools import RectangleTool
+from pixediter.tools import Tool
+
+# a case prepares fresh state and returns the operation to time, which may return extra
+# metrics (such as the bytes written) to report along with the time
+Run = Callable[[], dict[str, int] | None]
+Setup = Callable[[], Run]
+
+TOOL_SIZES = (64, 256)
+RENDER_SIZES = (16, 64, 128)
+IMAGE_SIZES = (64, 256, 1024)
+FORMATS = (".png", ".qoi", ".ff", ".pxr")
+PAN_SIZE = 256
+INDEXED_SIZE = 64
+INDEXED_DEPTHS = (terminal.COLORS_256, terminal.COLORS_16)
+ZOOM_SIZE = 1024
+ZOOM_LEVELS = (2, 4)
+PREVIEW_FRAME_SIZE = 128
+ANIMATION_SIZE = 64
+ANIMATION_FRAMES = 8
+EXPORT_EXTENSIONS = (".gif", ".png")
+# how the previews are drawn in each mode of the link (the block size of DrawArea.preview_block)
+PREVIEW_BLOCKS = {
+    bandwidth.FULL: None,
+    bandwidth.DROP_FRAMES: 1,
+    bandwidth.COARSE: bandwidth.COARSE_BLOCK,
+}
+PAN_FEATURES = {
+    "repaint": (),
+    "scroll-regions": (terminal.SCROLL_REGIONS,),
+    "rectangle-copy": terminal.FEATURES,
+}
+
+
+@dataclass
+class Case:
+    name: str
+    setup: Setup
+
+
+@dataclass
+class Result:
+    name: str
+    best: float
+    median: float
+    metrics: dict[str, int]
+
+
+class Sink:
+    """A terminal backend that throws the output away, counting it"""
+
+    def __init__(self, columns: int, rows: int, features: Iterable[str] = (), color_depth: str = terminal.TRUECOLOR):
+        self.columns = columns
+        self.rows = rows
+        self.features = frozenset(features)
+        self.color_depth = color_depth
+        self.bytes = 0
+        self.writes = 0
+
+    def write(self, text: str) -> None:
+        self.bytes += len(text.encode())
+        self.writes += 1
+
+    def flush(self) -> None:
+        pass
+
+    def size(self) -> tuple[int, int]:
+        return self.columns, self.rows
+
+
+def pixel_art(size: int) -> ImageData:
+    """Flat 8x8 blocks of a few colors, like a typical sprite sheet"""
+    rng = random.Random(size)
+    palette = [bytes((rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)) for _ in range(16)]
+    rows = []
+    for _ in range(0, size, 8):
+        row = b"".join(rng.choice(palette) * 8 for _ in range(0, size, 8))[:size * BYTES_PER_PIXEL]
+        rows += [row] * 8
+    return ImageData(size, size, data=bytearray(b"".join(rows[:size])))
+
+
+def no_draw(x: int, y: int, color: Color) -> None:
+    pass
+
+
+def drag(tool: Tool, img: ImageData, path: list[tuple[int, int]], button: MouseButton = MouseButton.LEFT) -> Run:
+    """Returns a run that drags tool along path, previewing every step and drawing at the end"""
+    color = ColorSelector(primary=colors.RED, secondary=colors.BLUE)
+
+    def run() -> None:
+        start, *middle, end = path
+        tool.mouse_down(img, DrawEvent(start, MouseEventType.MOUSE_DOWN, button, color), no_draw)
+        for pos in middle:
+            tool.mouse_drag(img, DrawEvent(pos, MouseEventType.MOUSE_DRAG, button, color), no_draw)
+        tool.mouse_up(img, DrawEvent(end, MouseEventType.MOUSE_UP, button, color), no_draw)
+        tool.reset_state()
+    return run
+
+
+def diagonal(size: int, steps: int = 8) -> list[tuple[int, int]]:
+    return [((size - 1) * i // steps, (size - 1) * i // steps) for i in range(steps + 1)]
+
+
+def fill(size: int) -> Setup:
+    def setup() -> Run:
+        img = ImageData(size, size)
+        return drag(FillTool(), img, [(size // 2, size // 2)] * 2)
+    return setup
+
+
+def gradient(size: int, button: MouseButton) -> Setup:
+    def setup() -> Run:
+        return drag(Gradient(), ImageData(size, size), diagonal(size, steps=4), button)
+    return setup
+
+
+def preview_drag(tool_type: type[LineTool] | type[RectangleTool], size: int) -> Setup:
+    def setup() -> Run:
+        return drag(tool_type(), ImageData(size, size), diagonal(size, steps=32))
+    return setup
+
+
+def render(size: int, color_depth: str = terminal.TRUECOLOR) -> Setup:
+    def setup() -> Run:
+        # large enough to show the whole canvas next to the palette and the tool list
+        sink = Sink(2 * size + 40, size + 12, color_depth=color_depth)
+        with terminal.using(sink):
+            app = App(size, size)
+            app.draw_area.set_image(pixel_art(size))
+
+        def run() -> dict[str, int]:
+            sink.bytes = sink.writes = 0
+            with terminal.using(sink):
+                app.draw_area.render()
+            return {"bytes": sink.bytes, "writes": sink.writes}
+        return run
+    return setup
+
+
+def pan(size: int, features: Iterable[str]) -> Setup:
+    def setup() -> Run:
+        # the canvas is larger than the terminal
+        sink = Sink(120, 40, features)
+        with terminal.using(sink):
+            app = App(size, size)
+            app.draw_area.set_image(pixel_art(size))
+            app.full_redraw()
+
+        def run() -> dict[str, int]:
+            sink.bytes = sink.writes = 0
+            with terminal.using(sink):
+                for _ in range(8):
+                    app.draw_area.scroll(0, 1)
+            return {"bytes": sink.bytes, "writes": sink.writes}
+        return run
+    return setup
+
+
+def zoomed_render(size: int, zoom: int) -> Setup:
+    def setup() -> Run:
+        sink = Sink(120, 40)
+        with terminal.using(sink):
+            app = App(size, size)
+            app.draw_area.set_image(pixel_art(size))
+            app.draw_area.set_zoom(zoom)
+            app.full_redraw()
+        img = app.draw_area.image
+
+        def run() -> dict[str, int]:
+            sink.bytes = sink.writes = 0
+            # a diagonal stroke dirties a tile on every level along it
+            for i in range(0, size, 16):
+                img[i, i] = colors.RED
+            with terminal.using(sink):
+                app.draw_area.render()
+            return {"bytes": sink.bytes, "writes": sink.writes}
+        return run
+    return setup
+
+
+def preview_frame(size: int, mode: str) -> Setup:
+    def setup() -> Run:
+        sink = Sink(120, 40)
+        with terminal.using(sink):
+            app = App(size, size)
+            app.tool.select("Gradient")
+            app.full_redraw()
+        area = app.draw_area
+        area.preview_block = PREVIEW_BLOCKS[mode]
+
+        def run() -> dict[str, int]:
+            sink.bytes = sink.writes = 0
+            with terminal.using(sink):
+                for event_type, x in ((MouseEventType.MOUSE_DOWN, 0), (MouseEventType.MOUSE_DRAG, 40)):
+                    area.onclick(MouseEvent(event_type, MouseButton.LEFT, area.left + x, area.top + x // 2))
+                area.draw_previews()
+            metrics = {"bytes": sink.bytes, "writes": sink.writes}
+            # coarse blocks are drawn again pixel by pixel when the mouse stops, which isn't part of the frame
+            with terminal.using(sink):
+                area.end_stroke()
+            app.tool.current.reset_state()
+            return metrics
+        return run
+    return setup
+
+
+def sprite_walk(app: App, size: int, frames: int) -> None:
+    """Makes the image an animation of an 8x8 sprite moving along the diagonal of pixel art"""
+    area = app.draw_area
+    area.set_image(pixel_art(size))
+    for i in range(1, frames):
+        area.insert_frame()
+        for y in range(8 * i, 8 * i + 8):
+            for x in range(8 * i, 8 * i + 8):
+                area.image[x, y] = colors.BLACK
+    area.select_frame(0)
+
+
+def play(size: int, frames: int) -> Setup:
+    def setup() -> Run:
+        sink = Sink(2 * size + 40, size + 12)
+        with terminal.using(sink):
+            app = App(size, size)
+            sprite_walk(app, size, frames)
+            app.full_redraw()
+        area = app.draw_area
+
+        def run() -> dict[str, int]:
+            sink.bytes = sink.writes = 0
+            with terminal.using(sink):
+                for i in range(1, frames + 1):
+                    area.select_frame(i % frames)
+            return {"bytes": sink.bytes, "writes": sink.writes}
+        return run
+    return setup
+
+
+def export_animation(directory: str, size: int, frames: int, extension: str) -> Setup:
+    def setup() -> Run:
+        with terminal.using(Sink(120, 40)):
+            app = App(size, size)
+            sprite_walk(app, size, frames)
+        animation = app.draw_area.frames
+        filepath = os.path.join(directory, f"animation{size}{extension}")
+
+        def run() -> None:
+            export.export(filepath, size, size, animation.snapshot())
+        return run
+    return setup
+
+
+def crop(size: int) -> Setup:
+    def setup() -> Run:
+        img = pixel_art(size)
+
+        def run() -> None:
+            # the middle half of the image, and then a margin around that
+            img.crop(size // 4, size // 4, 3 * size // 4, 3 * size // 4)
+            img.crop(-size // 4, -size // 4, 3 * size // 4, 3 * size // 4)
+        return run
+    return setup
+
+
+def save_file(directory: str, size: int, extension: str) -> Setup:
+    def setup() -> Run:
+        img = pixel_art(size)
+        filepath = os.path.join(directory, f"save{size}{extension}")
+        if os.path.exists(filepath):
+            os.remove(filepath)
+
+        def run() -> None:
+            img.save_file(filepath)
+        return run
+    return setup
+
+
+def from_file(directory: str, size: int, extension: str) -> Setup:
+    filepath = os.path.join(directory, f"load{size}{extension}")
+
+    def setup() -> Run:
+        if not os.path.exists(filepath):
+            pixel_art(size).save_file(filepath)
+
+        def run() -> None:
+            # touching the last pixel makes a memory mapped raw canvas read its data too
+            ImageData.from_file(filepath)[size - 1, size - 1]
+        return run
+    return setup
+
+
+def cases(directory: str) -> Iterator[Case]:
+    for size in TOOL_SIZES:
+        yield Case(f"fill/{size}x{size}", fill(size))
+        yield Case(f"gradient-linear/{size}x{size}", gradient(size, MouseButton.LEFT))
+        yield Case(f"gradient-radial/{size}x{size}", gradient(size, MouseButton.CTRL_LEFT))
+        yield Case(f"line-preview/{size}x{size}", preview_drag(LineTool, size))
+        yield Case(f"rectangle-preview/{size}x{size}", preview_drag(RectangleTool, size))
+    for size in RENDER_SIZES:
+        yield Case(f"render/{size}x{size}", render(size))
+    for color_depth in INDEXED_DEPTHS:
+        yield Case(f"render-{color_depth}colors/{INDEXED_SIZE}x{INDEXED_SIZE}", render(INDEXED_SIZE, color_depth))
+    for name, features in PAN_FEATURES.items():
+        yield Case(f"pan-{name}/{PAN_SIZE}x{PAN_SIZE}", pan(PAN_SIZE, features))
+    for zoom in ZOOM_LEVELS:
+        yield Case(f"render-zoom1:{1 << zoom}/{ZOOM_SIZE}x{ZOOM_SIZE}", zoomed_render(ZOOM_SIZE, zoom))
+    for mode in bandwidth.MODES:
+        size = PREVIEW_FRAME_SIZE
+        yield Case(f"preview-frame-{mode}/{size}x{size}", preview_frame(size, mode))
+    size = ANIMATION_SIZE
+    yield Case(f"play-{ANIMATION_FRAMES}frames/{size}x{size}", play(size, ANIMATION_FRAMES))
+    for extension in EXPORT_EXTENSIONS:
+        case = export_animation(directory, size, ANIMATION_FRAMES, extension)
+        yield Case(f"export{extension}-{ANIMATION_FRAMES}frames/{size}x{size}", case)
+    for size in IMAGE_SIZES:
+        yield Case(f"crop/{size}x{size}", crop(size))
+        for extension in FORMATS:
+            yield Case(f"save{extension}/{size}x{size}", save_file(directory, size, extension))
+            yield Case(f"load{extension}/{size}x{size}", from_file(directory, size, extension))
+
+
+def measure(case: Case, repeat: int) -> Result:
+    times = []
+    metrics: dict[str, int] = {}
+    for _ in range(repeat):
+        run = case.setup()
+        start = time.perf_counter()
+        metrics = run() or {}
+        times.append(time.perf_counter() - start)
+    return Result(case.name, min(times), statistics.median(times), metrics)
+
+
+def compare(result: Result, baseline: dict[str, dict[str, float]], threshold: float) -> tuple[str, bool]:
+    """Returns the comparison column for result and whether it's a regression"""
+    old = baseline.get(result.name)
+    if old is None:
+        return "new", False
+    ratio = result.best / old["best"]
+    regression = ratio > 1 + threshold
+    mark = " slower" if regression else " faster" if ratio < 1 - threshold else ""
+    return f"{ratio:.2f}x{mark}", regression
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="Only run the cases whose name contains TEXT")
+    parser.add_argument("--json", metavar="FILE", help="Write the results to FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="Compare to the results in FILE")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="How much slower than the baseline is a regression (default: 0.1 = 10%%)")
+    args = parser.parse_args()
+
+    baseline: dict[str, dict[str, float]] = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = []
+    regressions = 0
+    print(f"{'case':<30} {'best ms':>10} {'median ms':>10} {'bytes':>9} {'writes':>7}  "
+          f"{'vs baseline' if baseline else ''}")
+    with tempfile.TemporaryDirectory() as directory:
+        for case in cases(directory):
+            if args.filter not in case.name:
+                continue
+            result = measure(case, args.repeat)
+            results.append(result)
+            comparison, regression = compare(result, baseline, args.threshold) if baseline else ("", False)
+            regressions += regression
+            print(f"{result.name:<30} {result.best * 1000:>10.3f} {result.median * 1000:>10.3f} "
+                  f"{result.metrics.get('bytes', ''):>9} {result.metrics.get('writes', ''):>7}  {comparison}")
+
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "results": {
+                    result.name: {"best": result.best, "median": result.median, **result.metrics}
+                    for result in results
+                },
+            }, f, indent=2)
+    if regressions:
+        print(f"{regressions} cases are more than {args.threshold:.0%} slower than the baseline", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Optional
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pixediter.selection import Clipboard
+    from pixediter.selection import Selection
+
+
+SelectionChangeListener = Callable[[Optional["Selection"], Optional["Selection"]], None]
+
+
+class AreaSelector:
+    def __init__(self) -> None:
+        self.current: Optional[Selection] = None
+        self.clipboard: Optional[Clipboard] = None
+        self.on_change_listeners: list[SelectionChangeListener] = []
+
+    def add_change_listener(self, fn: SelectionChangeListener) -> None:
+        self.on_change_listeners.append(fn)
+
+    def select(self, selection: Optional[Selection]) -> None:
+        """Replaces the current selection, an empty selection is the same as no selection"""
+        if selection is not None and not selection:
+            selection = None
+        old_selection = self.current
+        self.current = selection
+        for fn in self.on_change_listeners:
+            fn(old_selection, selection)
@@ -1,11 +1,41 @@
+from __future__ import annotations
+
+from collections.abc import Callable
 from collections.abc import Iterator
+from collections.abc import Sequence
+from typing import TYPE_CHECKING
+
+from pixediter.AreaSelector import AreaSelector
+from pixediter.utils import LazyModule
+
+if TYPE_CHECKING:
+    from pixediter import tools
+    from pixediter.tools import Tool
+else:
+    tools = LazyModule("pixediter.tools")
 
-from pixediter.tools import Tool
+# the tools of the toolbox by their names (Tool.name), made with the selection they work on
+TOOLS: dict[str, Callable[[AreaSelector], Tool]] = {
+    "Pencil": lambda selection: tools.PencilTool(),
+    "Rectangle": lambda selection: tools.RectangleTool(),
+    "Line": lambda selection: tools.LineTool(),
+    "Fill": lambda selection: tools.FillTool(),
+    "Gradient": lambda selection: tools.Gradient(),
+    "Select": lambda selection: tools.SelectTool(selection),
+    "Magic wand": lambda selection: tools.MagicWandTool(selection),
+}
 
 
 class ToolSelector:
-    def __init__(self, *tools: Tool):
-        self.tools = tools
+    """
+    The tools to choose from, by name. A tool is only created (from TOOLS) when it's first
+    used, so the tools don't need to be loaded to show the toolbox.
+    """
+
+    def __init__(self, selection: AreaSelector, names: Sequence[str] = tuple(TOOLS)):
+        self.names = list(names)
+        self.selection = selection
+        self._tools: dict[int, Tool] = {}
         self._current_idx = 0
 
     def select(self, tool_name: str) -> Tool:
@@ -14,10 +44,8 @@ class ToolSelector:
         Does nothing if tool with the given name does not exist.
         Returns selected tool.
         """
-        for idx, tool in enumerate(self.tools):
-            if tool.name == tool_name:
-                self._current_idx = idx
-                break
+        if tool_name in self.names:
+            self._current_idx = self.names.index(tool_name)
         return self.current
 
     def select_by_index(self, i: int) -> Tool:
@@ -26,17 +54,31 @@ class ToolSelector:
         Does nothing if specified index was invalid.
         Returns selected tool.
         """
-        if 0 <= i < len(self.tools):
+        if 0 <= i < len(self.names):
             self._current_idx = i
         return self.current
 
     def __len__(self) -> int:
-        return len(self.tools)
+        return len(self.names)
 
     def __iter__(self) -> Iterator[Tool]:
-        return (tool for tool in self.tools)
+        return (self._tool(i) for i in range(len(self.names)))
+
+    def _tool(self, i: int) -> Tool:
+        tool = self._tools.get(i)
+        if tool is None:
+            tool = self._tools[i] = TOOLS[self.names[i]](self.selection)
+        return tool
+
+    @property
+    def current_index(self) -> int:
+        return self._current_idx
+
+    @property
+    def current_name(self) -> str:
+        return self.names[self._current_idx]
 
     @property
     def current(self) -> Tool:
         """Return the currently selected tool"""
-        return self.tools[self._current_idx]
+        return self._tool(self._current_idx)
@@ -0,0 +1,460 @@
+"""
+Frames of an animation, stored as tiles that the frames share.
+
+A document is a sequence of frames, each a stack of layers of the same size. Only the
+frame that is being edited (the current one) is a LayerStack with pixels of its own. The
+layers of the other frames are cut into tiles of TILE_SIZE x TILE_SIZE pixels and kept in
+a TileStore, which has each distinct tile once, looked up by its content (the bytes are
+their own hash key). Frames that differ in a few places share the rest of their tiles, so
+a walk cycle costs little more than the pixels that actually move. Stored tiles are never
+changed: storing an edited frame again only adds the tiles that changed (copy-on-write),
+and tiles that no frame refers to anymore are dropped.
+
+The composites of stored frames, for onion skinning and playback, are made when first
+needed and the last CACHED_COMPOSITES of them are kept, by frame (which is replaced by a
+new one when it's stored again); a composite is as big as a whole frame, so keeping every
+one would cost far more than the tiles. The onion skin (the neighbouring frames, fainter
+the further away they are) is composited from those and cached until the neighbours
+change. Exporting makes the composites one at a time without keeping them (flatten()),
+from a snapshot that later edits don't change.
+
+Animations are saved in ANIMATION_FILE_EXTENSION files: the distinct tiles once, and for
+every frame the indexes of the tiles of its layers.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from pixediter import blending
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+from pixediter.layers import Layer
+from pixediter.layers import LayerStack
+from pixediter.layers import TILE_SIZE
+
+ANIMATION_FILE_EXTENSION = ".pxa"
+# how long a frame is shown (milliseconds)
+DEFAULT_DURATION = 100
+# the opacity of the onion skin of the neighbouring frames, halved for every frame further away
+ONION_OPACITY = 96
+# how many composites of stored frames are kept: enough for the onion skin and for going
+# back and forth between the frames around the current one
+CACHED_COMPOSITES = 8
+
+_MAGIC = b"PXANIM"
+_VERSION = 1
+_HEADER = struct.Struct("<6sBIIHIHH")
+_FRAME = struct.Struct("<IHH")
+_LAYER = struct.Struct("<?B")
+_LENGTH = struct.Struct("<I")
+
+
+class AnimationError(ValueError):
+    pass
+
+
+class TileStore:
+    """Tiles of pixels by their content, each stored once however many layers have it"""
+
+    def __init__(self) -> None:
+        # the stored copy of each tile by its content, and how many layers refer to it
+        self._tiles: dict[bytes, bytes] = {}
+        self._references: dict[bytes, int] = {}
+        self.size = 0
+
+    def __len__(self) -> int:
+        return len(self._tiles)
+
+    def add(self, tile: bytes) -> bytes:
+        """Returns the stored tile with the content of tile, storing it if it's new"""
+        stored = self._tiles.get(tile)
+        if stored is None:
+            stored = self._tiles[tile] = tile
+            self._references[stored] = 1
+            self.size += len(stored)
+        else:
+            self._references[stored] += 1
+        return stored
+
+    def release(self, tiles: tuple[bytes, ...]) -> None:
+        """Drops a reference to each of tiles, and the tiles that have none left"""
+        for tile in tiles:
+            count = self._references[tile] - 1
+            if count:
+                self._references[tile] = count
+            else:
+                del self._references[tile]
+                del self._tiles[tile]
+                self.size -= len(tile)
+
+    def cut(self, image: ImageData) -> tuple[bytes, ...]:
+        """Stores the tiles of image, row by row"""
+        return tuple(
+            self.add(image.region(x, y, min(image.width, x + TILE_SIZE), min(image.height, y + TILE_SIZE)))
+            for y in range(0, image.height, TILE_SIZE)
+            for x in range(0, image.width, TILE_SIZE)
+        )
+
+
+@dataclass(frozen=True)
+class StoredLayer:
+    name: str
+    visible: bool
+    opacity: int
+    blend_mode: str
+    tiles: tuple[bytes, ...]
+
+
+# compared by identity: a frame is replaced rather than changed, so caches can be keyed by it
+@dataclass(eq=False)
+class Frame:
+    layers: tuple[StoredLayer, ...] = ()
+    active_index: int = 0
+    duration: int = DEFAULT_DURATION
+
+
+class Animation:
+    def __init__(self, layers: LayerStack):
+        self.tiles = TileStore()
+        self.frames = [Frame()]
+        self.index = 0
+        self.live = layers
+        # the live frame has changed since it was stored
+        self._modified = True
+        self._onion: tuple[tuple[Frame, ...], ImageData] | None = None
+        # the composites of stored frames, the least recently used first
+        self._composites: OrderedDict[Frame, ImageData] = OrderedDict()
+        layers.add_change_listener(self._on_change)
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    @property
+    def frame(self) -> Frame:
+        return self.frames[self.index]
+
+    def store(self) -> Frame:
+        """Stores the layers of the current frame, sharing the tiles that haven't changed"""
+        frame = self.frames[self.index]
+        live = self.live
+        if not self._modified and _properties(frame) == [_layer_properties(layer) for layer in live]:
+            return frame
+        layers = tuple(
+            StoredLayer(layer.name, layer.visible, layer.opacity, layer.blend_mode, self.tiles.cut(layer.image))
+            for layer in live
+        )
+        self._forget(frame)
+        stored = self.frames[self.index] = Frame(layers, live.active_index, frame.duration)
+        self._modified = False
+        return stored
+
+    def select(self, index: int) -> LayerStack:
+        """Makes frame index the current one, returns its layers for editing"""
+        if not 0 <= index < len(self.frames):
+            raise AnimationError(f"No frame {index}")
+        if index != self.index:
+            stored = self.store()
+            if stored not in self._composites:
+                # the live layers are let go of, so their composite doesn't change anymore
+                self._cache(stored, self.live.flatten())
+            self._load(index)
+        return self.live
+
+    def insert(self, copy: bool = True) -> LayerStack:
+        """Adds a frame after the current one, a copy of it or a blank one, and selects it"""
+        current = self.store()
+        if copy:
+            layers = current.layers
+            for layer in layers:
+                for tile in layer.tiles:
+                    self.tiles.add(tile)
+            frame = Frame(layers, current.active_index, current.duration)
+        else:
+            blank = LayerStack(ImageData(self.live.width, self.live.height))
+            frame = Frame(self._stored_layers(blank), 0, current.duration)
+        self.frames.insert(self.index + 1, frame)
+        return self.select(self.index + 1)
+
+    def remove(self) -> LayerStack:
+        """Deletes the current frame, the next one (or the last one) becomes the current frame"""
+        if len(self.frames) == 1:
+            raise AnimationError("Can't remove the only frame")
+        self._forget(self.frames.pop(self.index))
+        self._load(min(self.index, len(self.frames) - 1))
+        return self.live
+
+    def move(self, new_index: int) -> None:
+        """Moves the current frame to new_index"""
+        if not 0 <= new_index < len(self.frames):
+            raise AnimationError(f"No frame {new_index}")
+        self.frames.insert(new_index, self.frames.pop(self.index))
+        self.index = new_index
+
+    def set_duration(self, duration: int, every_frame: bool = False) -> None:
+        if duration <= 0:
+            raise AnimationError("The duration of a frame has to be positive")
+        for frame in self.frames if every_frame else [self.frame]:
+            frame.duration = duration
+
+    def apply(self, fn: Callable[[LayerStack], None]) -> None:
+        """Applies fn (which may change the size of the image) to the layers of every frame"""
+        self.store()
+        for i, frame in enumerate(self.frames):
+            if i == self.index:
+                continue
+            stack = self._materialize(frame)
+            fn(stack)
+            self._forget(frame)
+            self.frames[i] = Frame(self._stored_layers(stack), frame.active_index, frame.duration)
+        fn(self.live)
+
+    def composite(self, index: int) -> ImageData:
+        """The composite of frame index, don't change it"""
+        if index == self.index:
+            return self.live.flatten()
+        frame = self.frames[index]
+        composite = self._composites.get(frame)
+        if composite is None:
+            composite = flatten(frame, self.live.width, self.live.height)
+            self._cache(frame, composite)
+        else:
+            self._composites.move_to_end(frame)
+        return composite
+
+    def snapshot(self) -> list[tuple[Frame, int]]:
+        """
+        Every frame with its duration as they are now, for reading on another thread
+        (with flatten()): editing the frames afterwards replaces them instead of changing them
+        """
+        self.store()
+        return [(frame, frame.duration) for frame in self.frames]
+
+    def onion_skin(self, before: int, after: int) -> ImageData | None:
+        """
+        The frames before and after the current one, composited with less opacity the
+        further away they are, to be shown on top of it; None if there are none
+        """
+        neighbours = [i for i in range(self.index - before, self.index + after + 1) if i != self.index]
+        # the nearest frames end up on top
+        neighbours = sorted((i for i in neighbours if 0 <= i < len(self.frames)), key=lambda i: -abs(i - self.index))
+        if not neighbours:
+            return None
+        key = tuple(self.frames[i] for i in neighbours)
+        if self._onion is not None and len(key) == len(self._onion[0]) and all(
+            a is b for a, b in zip(key, self._onion[0])
+        ):
+            return self._onion[1]
+        width, height = self.live.width, self.live.height
+        data = bytearray(width * height * BYTES_PER_PIXEL)
+        for i in neighbours:
+            opacity = ONION_OPACITY >> (abs(i - self.index) - 1)
+            if opacity:
+                blending.blend_row(data, bytes(self.composite(i).data), opacity)
+        overlay = ImageData(width, height, data=data)
+        self._onion = (key, overlay)
+        return overlay
+
+    def save(self, filepath: str) -> None:
+        """Saves every frame with its layers, each distinct tile once"""
+        self.store()
+        indexes: dict[bytes, int] = {}
+        tiles: list[bytes] = []
+        for frame in self.frames:
+            for layer in frame.layers:
+                for tile in layer.tiles:
+                    if tile not in indexes:
+                        indexes[tile] = len(tiles)
+                        tiles.append(tile)
+        parts = []
+        for tile in tiles:
+            parts += [_LENGTH.pack(len(tile)), tile]
+        for frame in self.frames:
+            parts.append(_FRAME.pack(frame.duration, frame.active_index, len(frame.layers)))
+            for layer in frame.layers:
+                parts += [_string(layer.name), _string(layer.blend_mode), _LAYER.pack(layer.visible, layer.opacity)]
+                parts.append(struct.pack(f"<{len(layer.tiles)}I", *(indexes[tile] for tile in layer.tiles)))
+        live = self.live
+        header = _HEADER.pack(
+            _MAGIC, _VERSION, live.width, live.height, TILE_SIZE, len(tiles), len(self.frames), self.index
+        )
+        with open(filepath, "wb") as f:
+            f.write(header)
+            f.write(zlib.compress(b"".join(parts)))
+        live.filepath = filepath
+
+    @classmethod
+    def load(cls, filepath: str) -> Animation:
+        with open(filepath, "rb") as f:
+            header = f.read(_HEADER.size)
+            if len(header) != _HEADER.size:
+                raise AnimationError(f"'{filepath}' is not a PixEdiTer animation")
+            magic, version, width, height, tile_size, tile_count, frame_count, current = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION or tile_size != TILE_SIZE:
+                raise AnimationError(f"'{filepath}' is not a PixEdiTer animation")
+            try:
+                body = memoryview(zlib.decompress(f.read()))
+            except zlib.error as exc:
+                raise AnimationError(f"'{filepath}' is damaged: {exc}")
+        reader = _Reader(body)
+        tile_bytes = [reader.read(reader.unpack(_LENGTH)[0]) for _ in range(tile_count)]
+        tiles_per_layer = -(-width // TILE_SIZE) * -(-height // TILE_SIZE)
+        animation = cls(LayerStack(ImageData(width, height)))
+        store = animation.tiles
+        frames = []
+        for _ in range(frame_count):
+            duration, active_index, layer_count = reader.unpack(_FRAME)
+            layers = []
+            for _ in range(layer_count):
+                name, blend_mode = reader.string(), reader.string()
+                visible, opacity = reader.unpack(_LAYER)
+                indexes = reader.unpack(struct.Struct(f"<{tiles_per_layer}I"))
+                if any(i >= tile_count for i in indexes):
+                    raise AnimationError(f"'{filepath}' is damaged: no tile {max(indexes)}")
+                tiles = tuple(store.add(tile_bytes[i]) for i in indexes)
+                layers.append(StoredLayer(name, bool(visible), opacity, blend_mode, tiles))
+            frames.append(Frame(tuple(layers), active_index, duration))
+        if not frames or not 0 <= current < len(frames):
+            raise AnimationError(f"'{filepath}' is damaged: no frame {current}")
+        animation.frames = frames
+        animation._load(current)
+        animation.live.filepath = filepath
+        return animation
+
+    def _on_change(self, layer: Layer, x0: int, y0: int, x1: int, y1: int) -> None:
+        self._modified = True
+
+    def _load(self, index: int) -> None:
+        """Makes the stored frame index the live one"""
+        filepath = self.live.filepath
+        self.index = index
+        self.live = self._materialize(self.frames[index])
+        self.live.filepath = filepath
+        self.live.add_change_listener(self._on_change)
+        self._modified = False
+
+    def _cache(self, frame: Frame, composite: ImageData) -> None:
+        self._composites[frame] = composite
+        while len(self._composites) > CACHED_COMPOSITES:
+            self._composites.popitem(last=False)
+
+    def _forget(self, frame: Frame) -> None:
+        """Lets go of the tiles and the composite of a frame that was replaced or removed"""
+        for layer in frame.layers:
+            self.tiles.release(layer.tiles)
+        self._composites.pop(frame, None)
+
+    def _stored_layers(self, stack: LayerStack) -> tuple[StoredLayer, ...]:
+        return tuple(
+            StoredLayer(layer.name, layer.visible, layer.opacity, layer.blend_mode, self.tiles.cut(layer.image))
+            for layer in stack
+        )
+
+    def _materialize(self, frame: Frame) -> LayerStack:
+        return _stack(frame, self.live.width, self.live.height)
+
+
+def changed_runs(old: ImageData, new: ImageData) -> Iterator[tuple[int, int, int]]:
+    """The runs of pixels that differ between two images of the same size, as (y, x0, x1) with x1 exclusive"""
+    width = old.width
+    stride = width * BYTES_PER_PIXEL
+    old_pixels = memoryview(old.data).cast("I")
+    new_pixels = memoryview(new.data).cast("I")
+    for y in range(old.height):
+        start = y * stride
+        if old.data[start:start + stride] == new.data[start:start + stride]:
+            continue
+        offset = y * width
+        x0 = None
+        for x in range(width):
+            if old_pixels[offset + x] != new_pixels[offset + x]:
+                if x0 is None:
+                    x0 = x
+            elif x0 is not None:
+                yield y, x0, x
+                x0 = None
+        if x0 is not None:
+            yield y, x0, width
+
+
+def flatten(frame: Frame, width: int, height: int) -> ImageData:
+    """The composite of a stored frame, which isn't kept (see Animation.composite)"""
+    # composited straight from the tiles: a LayerStack refers to itself through the
+    # listeners of its layers, so it would only be freed by the garbage collector
+    layers = frame.layers
+    if len(layers) == 1 and layers[0].visible and layers[0].opacity == 255 and layers[0].blend_mode == "normal":
+        return _image(layers[0].tiles, width, height)
+    data = bytearray(width * height * BYTES_PER_PIXEL)
+    for layer in layers:
+        if layer.visible and layer.opacity > 0:
+            blending.blend_row(data, bytes(_image(layer.tiles, width, height).data), layer.opacity, layer.blend_mode)
+    return ImageData(width, height, data=data)
+
+
+def _stack(frame: Frame, width: int, height: int) -> LayerStack:
+    """A stack of layers with the pixels of a stored frame"""
+    stack: LayerStack | None = None
+    for stored in frame.layers:
+        image = _image(stored.tiles, width, height)
+        if stack is None:
+            stack = LayerStack(image, stored.name)
+            stack.set_visible(0, stored.visible)
+            stack.set_opacity(0, stored.opacity)
+            stack.set_blend_mode(0, stored.blend_mode)
+        else:
+            stack.add(Layer(image, stored.name, stored.visible, stored.opacity, stored.blend_mode))
+    assert stack is not None
+    stack.active_index = frame.active_index
+    return stack
+
+
+def _properties(frame: Frame) -> list[tuple[str, bool, int, str]]:
+    return [(layer.name, layer.visible, layer.opacity, layer.blend_mode) for layer in frame.layers]
+
+
+def _layer_properties(layer: Layer) -> tuple[str, bool, int, str]:
+    return layer.name, layer.visible, layer.opacity, layer.blend_mode
+
+
+def _image(tiles: tuple[bytes, ...], width: int, height: int) -> ImageData:
+    """Puts an image back together from its tiles"""
+    data = bytearray(width * height * BYTES_PER_PIXEL)
+    tiles_iter = iter(tiles)
+    for y0 in range(0, height, TILE_SIZE):
+        rows = min(height, y0 + TILE_SIZE) - y0
+        for x0 in range(0, width, TILE_SIZE):
+            tile = next(tiles_iter)
+            row_size = (min(width, x0 + TILE_SIZE) - x0) * BYTES_PER_PIXEL
+            for row in range(rows):
+                start = ((y0 + row) * width + x0) * BYTES_PER_PIXEL
+                data[start:start + row_size] = tile[row * row_size:(row + 1) * row_size]
+    return ImageData(width, height, data=data)
+
+
+def _string(text: str) -> bytes:
+    encoded = text.encode()
+    return _LENGTH.pack(len(encoded)) + encoded
+
+
+class _Reader:
+    def __init__(self, data: memoryview):
+        self.data = data
+        self.pos = 0
+
+    def read(self, size: int) -> bytes:
+        if self.pos + size > len(self.data):
+            raise AnimationError("Unexpected end of file")
+        chunk = bytes(self.data[self.pos:self.pos + size])
+        self.pos += size
+        return chunk
+
+    def unpack(self, fmt: struct.Struct) -> tuple[int, ...]:
+        values: tuple[int, ...] = fmt.unpack(self.read(fmt.size))
+        return values
+
+    def string(self) -> str:
+        return self.read(self.unpack(_LENGTH)[0]).decode()
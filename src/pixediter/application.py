@@ -1,47 +1,89 @@
 from __future__ import annotations
 
+import functools
 import os
+import time
 from collections.abc import Callable
 from collections.abc import Generator
+from collections.abc import Iterable
 from collections.abc import Iterator
 from contextlib import contextmanager
 from typing import Any
 from typing import NoReturn
+from typing import TYPE_CHECKING
 
 import pixediter
+from pixediter import bandwidth
 from pixediter import borders
 from pixediter import colors
 from pixediter import events
+from pixediter import profiling
 from pixediter import terminal
-from pixediter import tools
+from pixediter.animation import Animation
+from pixediter.animation import ANIMATION_FILE_EXTENSION
+from pixediter.AreaSelector import AreaSelector
 from pixediter.ColorSelector import ColorSelector
+from pixediter.compositor import Compositor
 from pixediter.events import MouseEvent
 from pixediter.events import MouseEventType
 from pixediter.image import ImageData
+from pixediter.image import RAW_CANVAS_EXTENSION
+from pixediter.layers import LayerStack
 from pixediter.ToolSelector import ToolSelector
 from pixediter.utils import draw
+from pixediter.utils import LazyModule
 from pixediter.widgets.ColorAdjuster import ColorAdjuster
 from pixediter.widgets.DrawArea import DrawArea
+from pixediter.widgets.Minimap import Minimap
+from pixediter.widgets.Minimap import MINIMAP_COLUMNS
 from pixediter.widgets.Palette import Palette
 from pixediter.widgets.TerminalWidget import TerminalWidget
 from pixediter.widgets.Toolbox import Toolbox
 
+# the modules for editing are imported when they are first needed, so that the editor
+# can show its first frame sooner
+if TYPE_CHECKING:
+    from pixediter import commands
+    from pixediter import export
+    from pixediter import filters
+    from pixediter import journal
+    from pixediter import parallel
+    from pixediter.widgets.Preview import Preview
+else:
+    commands = LazyModule("pixediter.commands")
+    export = LazyModule("pixediter.export")
+    journal = LazyModule("pixediter.journal")
+    parallel = LazyModule("pixediter.parallel")
+
 TITLE = f"PixEdiTer v{pixediter.__version__}"
+TITLE_AREA = (4, 1, 4 + len(TITLE) - 1, 1)
 debugging = "DEBUG" in os.environ
+# while drawing, the preview at natural size is brought up to date at most this often (seconds)
+PREVIEW_INTERVAL = 0.05
+# on a slow link, how long the input has to stop before the previews are drawn in full (seconds)
+REFINE_DELAY = 0.15
+# how often the link is measured while nothing is input, until it's back to normal (seconds)
+LINK_CHECK_INTERVAL = 0.5
+# how often the progress of an export is shown (seconds)
+EXPORT_PROGRESS_INTERVAL = 0.25
 
 
 class App:
-    def __init__(self, width: int = 16, height: int = 16):
+    def __init__(
+            self,
+            width: int = 16,
+            height: int = 16,
+            profiler: profiling.Profiler | None = None,
+            link: bandwidth.Monitor | None = None
+    ):
         self.MARGIN_LEFT = 3
+        self.profiler = profiling.Profiler() if profiler is None else profiler
+        # the output adapts to how fast the terminal takes it
+        self.link = bandwidth.Monitor() if link is None else link
 
         self.color = ColorSelector(primary=colors.GRAY, secondary=colors.WHITE)
-        self.tool = ToolSelector(
-            tools.PencilTool(),
-            tools.RectangleTool(),
-            tools.LineTool(),
-            tools.FillTool(),
-            tools.Gradient(),
-        )
+        self.selection = AreaSelector()
+        self.tool = ToolSelector(self.selection)
 
         DRAW_AREA_LEFT = self.MARGIN_LEFT
         DRAW_AREA_TOP = 3
@@ -55,7 +97,8 @@ class App:
             borders=borders.sharp,
             image=ImageData(width, height),
             color=self.color,
-            tools=self.tool
+            tools=self.tool,
+            selector=self.selection
         )
 
         palette_top = DRAW_AREA_BOTTOM + 3
@@ -81,14 +124,28 @@ class App:
             color=self.color
         )
 
+        # it's most useful for images that don't fit, so it's kept on the screen, on top of
+        # the canvas and clear of its edge so that the canvas can still be scrolled with the
+        # minimap on it (see Compositor.shift)
+        self.minimap = Minimap(
+            top=self.color_adjuster.bottom + 3,
+            left=max(1, min(DRAW_AREA_RIGHT + 4, self.terminal_columns - MINIMAP_COLUMNS - 3)),
+            borders=borders.sharp,
+            draw_area=self.draw_area
+        )
+
         self.widgets = [
             self.draw_area,
             self.palette,
             self.toolbox,
-            self.color_adjuster
+            self.color_adjuster,
+            self.minimap
         ]
         for i, widget in enumerate(self.widgets):
             widget.title = str(i)
+        # the widgets are toggled by their index in self.widgets and stacked in compositor.z_order
+        self.compositor = Compositor(self.widgets, background=self.draw_title, background_area=TITLE_AREA)
+        self.draw_area.shift_screen = functools.partial(self.compositor.shift, self.draw_area)
 
         self.commands: dict[str, Callable[[str, list[str]], Any]] = {
             ":help": self.show_help,
@@ -99,55 +156,477 @@ class App:
             ":new": self.new_image,
             ":open": self.load_image_cmd,
             ":save": self.save_image_cmd,
+            ":export": self.export_cmd,
             ":setcolor": self.setcolor_cmd,
             ":crop": self.crop,
+            ":scale": self.scale_cmd,
+            ":rotate": self.rotate_cmd,
+            ":flip": self.flip_cmd,
+            ":transpose": self.transpose_cmd,
+            ":filter": self.filter_cmd,
+            ":layer": self.layer_cmd,
+            ":frame": self.frame_cmd,
+            ":onion": self.onion_cmd,
+            ":play": self.play_cmd,
+            ":select": self.select_cmd,
+            ":copy": self.copy_cmd,
+            ":cut": self.cut_cmd,
+            ":paste": self.paste_cmd,
+            ":fill": self.fill_cmd,
+            ":recolor": self.recolor_cmd,
+            ":stats": self.stats_cmd,
+            ":zoom": self.zoom_cmd,
+            ":preview": self.preview_cmd,
+            ":link": self.link_cmd,
         }
 
         self._waiting_for_key = False
-        self.full_redraw()
+        # the terminal was resized and the screen has not been repainted yet
+        self._resized = False
+        # run() is waiting for the next event, so the screen can be repainted right away
+        self._idle = False
+        # the command line that is being typed, empty when there is none
+        self._cmd = ""
+        self._pending_filter: filters.Pipeline | None = None
+        # the image at its natural size, shown with :preview
+        self.preview: Preview | None = None
+        self._preview_refreshed = 0.0
+        self.journal: journal.Journal | None = None
+        # the animation being exported in the background
+        self.export: export.Export | None = None
 
     def exit(self, *args: Any) -> NoReturn:
         """exits the program without saving"""
+        if self.export is not None:
+            self.export.wait()
+        self.close()
         terminal.clear()
         raise SystemExit(0)
 
+    def close(self) -> None:
+        """Throws away the unsaved changes (and their journal) and stops the workers of filters"""
+        self._restart_journal(keep=False)
+        parallel.shutdown()
+
+    def _restart_journal(self, keep: bool = True) -> None:
+        """
+        Throws away the current journal (its changes were saved or discarded on purpose)
+        and starts a new one for the current image, unless keep is False
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        filepath = self.draw_area.layers.filepath
+        # edits to raw canvases go straight to the file through the memory mapping, and
+        # the journal has no frames, so edits to animations aren't journaled
+        unjournaled = (RAW_CANVAS_EXTENSION, ANIMATION_FILE_EXTENSION)
+        if keep and filepath is not None and not filepath.endswith(unjournaled) and len(self.draw_area.frames) == 1:
+            self.journal = journal.Journal(filepath, self.draw_area.layers)
+
+    def commit(self, operation: str, params: str = "") -> None:
+        """Journals the changes that operation made since the previous commit"""
+        if self.journal is not None:
+            with self.profiler.stage("journal"):
+                self.journal.commit(operation, params)
+
+    def replay_journal(self) -> int:
+        """Reapplies the unsaved operations from the journal of the image, returns how many there were"""
+        filepath = self.draw_area.layers.filepath
+        if filepath is None:
+            return 0
+        count = journal.replay(filepath, self.draw_area.layers)
+        # the replayed changes go to the new journal, in case the program dies again before saving
+        self.commit("replay", str(count))
+        self.full_redraw()
+        return count
+
     def draw_title(self) -> None:
-        draw(4, 1, TITLE, colors.GREEN)
+        x0, y0, _, _ = TITLE_AREA
+        draw(x0, y0, TITLE, colors.GREEN)
 
     def full_redraw(self) -> None:
-        terminal.clear()
-        self.terminal_columns, self.terminal_rows = terminal.size()
-        self.draw_title()
-        for widget in self.widgets:
-            widget.render()
+        with self.profiler.stage("render"):
+            terminal.clear()
+            # asked again in case a resize went unnoticed, e.g. without a SIGWINCH handler
+            terminal.resized()
+            self.terminal_columns, self.terminal_rows = terminal.size()
+            self.compositor.paint_all()
+            self.show_link_mode()
+
+    def on_resize(self) -> None:
+        """Called when the terminal has been resized, repaints the screen before the next event"""
+        self._resized = True
+        if self._idle:
+            self.relayout()
+
+    def relayout(self) -> None:
+        """Fits the widgets to the new size of the terminal"""
+        self._resized = False
+        # the screen is repainted anyway when the key is pressed
+        if not self._waiting_for_key:
+            with self.profiler.event("resize"):
+                self.full_redraw()
 
     def new_image(self, cmd: str, args: list[str]) -> None:
         """
         :new <width: int> <height: int> -- replaces canvas with a new image
         """
-        width, height = map(int, args)
+        width, height = commands.image_size(args)
         self.draw_area.set_image(ImageData(width, height))
+        self._restart_journal()
         self.full_redraw()
 
     def crop(self, cmd: str, args: list[str]) -> None:
         """
         :crop <x0: int> <y0: int> <x1: int> <y1: int> -- crops image to area between given coordinates
         """
-        if len(args) == 2:
-            x0, y0, x1, y1 = 0, 0, int(args[0]), int(args[1])
-        elif len(args) == 4:
-            x0, y0, x1, y1 = [int(arg) for arg in args]
-        else:
-            raise ValueError("crop requires exactly 2 or 4 arguments")
+        x0, y0, x1, y1 = commands.crop_area(args)
         self.draw_area.crop(x0, y0, x1, y1)
         self.full_redraw()
 
+    def scale_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :scale <factor | width height> [nearest | bilinear | scale2x] -- scales the image (e.g. :scale 2x scale2x)
+        """
+        layers = self.draw_area.layers
+        self.draw_area.transform(commands.scale(args, layers.width, layers.height))
+        self.full_redraw()
+
+    def rotate_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :rotate <90 | 180 | 270> -- rotates the image clockwise
+        """
+        self.draw_area.transform(commands.rotate(args))
+        self.full_redraw()
+
+    def flip_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :flip <h | v> -- flips the image horizontally or vertically
+        """
+        self.draw_area.transform(commands.flip(args))
+        self.full_redraw()
+
+    def transpose_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :transpose -- swaps the rows and columns of the image
+        """
+        self.draw_area.transform(commands.transpose(args))
+        self.full_redraw()
+
+    def filter_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :filter <filter> [| <filter>...] -- previews filters (e.g. grayscale | contrast 1.2), Enter applies them
+        """
+        pipeline = commands.filter_pipeline(args)
+        self.draw_area.preview_filter(pipeline)
+        self._pending_filter = pipeline
+        self.show("Press Enter to apply the filter, any other key to cancel")
+
+    def layer_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :layer [new [<name>] | delete | select <n> | show/hide <n> | up | down | opacity <n> | blend <mode>] -- layers
+        Layer 0 is the bottom one. Without arguments lists the layers.
+        """
+        layers = self.draw_area.layers
+        if not args:
+            self.show("  ".join(
+                ("*" if i == layers.active_index else "") + f"{i}:{layer.name}"
+                + ("" if layer.visible else " (hidden)")
+                for i, layer in enumerate(layers)
+            ))
+            return
+
+        commands.layer(layers, args)
+        self.draw_area.render()
+        active = layers.active
+        self.show(f"Layer {layers.active_index}: {active.name} ({active.blend_mode}, opacity {active.opacity})")
+
+    def frame_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :frame [new | copy | delete | next | prev | <n> | move <n> | duration <ms> [all]] -- frames of an animation
+        Frame 0 is the first one. Without arguments shows the current frame.
+        """
+        frames = self.draw_area.frames
+        if not args:
+            self.show_frame()
+            return
+
+        action, *rest = args
+        if action in ("new", "copy"):
+            self.draw_area.insert_frame(copy=action == "copy")
+        elif action == "delete":
+            self.draw_area.remove_frame()
+        elif action in ("next", "prev"):
+            self.draw_area.select_frame((frames.index + (1 if action == "next" else -1)) % len(frames))
+        elif action.isdigit():
+            self.draw_area.select_frame(int(action))
+        elif action == "move" and len(rest) == 1:
+            self.draw_area.move_frame(int(rest[0]))
+        elif action == "duration" and rest[1:] in ([], ["all"]):
+            frames.set_duration(int(rest[0]), every_frame=rest[1:] == ["all"])
+        else:
+            raise ValueError(f"Unknown frame action '{action}'")
+        self._frame_changed()
+
+    def onion_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :onion [off | <before: int> [<after: int>]] -- shows the neighbouring frames faintly on top of the current one
+        """
+        if args == ["off"]:
+            onion = None
+        elif not args:
+            onion = None if self.draw_area.onion is not None else (1, 1)
+        elif len(args) <= 2 and all(arg.isdigit() for arg in args):
+            before = int(args[0])
+            onion = (before, int(args[1]) if len(args) == 2 else before)
+        else:
+            raise ValueError("onion requires 'off' or how many frames before and after to show")
+        with self.profiler.stage("render"):
+            self.draw_area.set_onion_skin(onion)
+            self.compositor.restore_above(self.draw_area)
+        self.show("Onion skin off" if onion is None else f"Onion skin: {onion[0]} before, {onion[1]} after")
+
+    def play_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :play -- plays the animation until something is input
+        """
+        if len(self.draw_area.frames) == 1:
+            raise ValueError("There is only one frame")
+        with self.profiler.stage("render"):
+            self.draw_area.play()
+            self.compositor.restore_above(self.draw_area)
+        self.show("Playing, press any key to stop")
+
+    def step_frame(self, step: int) -> None:
+        """Shows the frame step frames after the current one, going around at the ends"""
+        frames = self.draw_area.frames
+        self.draw_area.select_frame((frames.index + step) % len(frames))
+        self._frame_changed()
+        self.refresh_views(invalidate=True)
+
+    def show_frame(self) -> None:
+        frames = self.draw_area.frames
+        self.show(
+            f"Frame {frames.index} of {len(frames)} ({frames.frame.duration} ms), "
+            f"{len(frames.tiles)} distinct tiles ({frames.tiles.size // 1024} KiB)"
+        )
+
+    def _frame_changed(self) -> None:
+        if self.journal is not None and len(self.draw_area.frames) > 1:
+            self._restart_journal(keep=False)
+        with self.profiler.stage("render"):
+            self.compositor.restore_above(self.draw_area)
+        self.show_frame()
+
+    def select_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :select [all | none | <x0: int> <y0: int> <x1: int> <y1: int>] -- selects a rectangle (corners included)
+        """
+        commands.select(self.selection, self.draw_area.image, args)
+
+    def copy_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :copy -- copies the selected area (or the whole image) of the current layer
+        """
+        commands.copy(self.selection, self.draw_area.image)
+        self.show("Copied selection")
+
+    def cut_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :cut -- copies the selected area (or the whole image) of the current layer and clears it
+        """
+        bbox = commands.cut(self.selection, self.draw_area.image)
+        if bbox is not None:
+            self.draw_area.render_region(*bbox)
+        self.show("Cut selection")
+
+    def paste_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :paste [<x: int> <y: int>] -- pastes the copied pixels, by default on top of the selection
+        """
+        self.draw_area.render_region(*commands.paste(self.selection, self.draw_area.image, args))
+
+    def fill_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :fill [primary | secondary] -- fills the selected area (or the whole image) with a color
+        """
+        bbox = commands.fill(self.selection, self.draw_area.image, self.color, args)
+        if bbox is not None:
+            self.draw_area.render_region(*bbox)
+
+    def recolor_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :recolor <from: str> <to: str> -- replaces a color (#rrggbb[aa]) in the selected area (or the whole image)
+        """
+        bbox, count = commands.recolor(self.selection, self.draw_area.image, args)
+        if bbox is not None:
+            self.draw_area.render_region(*bbox)
+        self.show(f"Recolored {count} pixels")
+
+    def zoom_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :zoom [<level: int> | in | out] -- shows the image at 1 / 2**level of its size (0 is 1:1)
+        """
+        if not args:
+            self.show(f"Zoom 1:{self.draw_area.scale}")
+            return
+        if args == ["in"]:
+            level = self.draw_area.zoom - 1
+        elif args == ["out"]:
+            level = self.draw_area.zoom + 1
+        elif len(args) == 1 and args[0].isdigit():
+            level = int(args[0])
+        else:
+            raise ValueError("zoom requires a level, 'in' or 'out'")
+        self.set_zoom(level)
+
+    def set_zoom(self, level: int) -> None:
+        with self.profiler.stage("render"):
+            self.draw_area.set_zoom(level)
+            self.compositor.update(self.draw_area)
+        self.show(f"Zoom 1:{self.draw_area.scale}")
+
+    def preview_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :preview [on | off] -- shows the image at its natural size (in terminals that can show images)
+        """
+        if args not in ([], ["on"], ["off"]):
+            raise ValueError("preview requires 'on' or 'off'")
+        show = self.preview is None if not args else args == ["on"]
+        if show and self.preview is None:
+            from pixediter import graphics
+            from pixediter.widgets.Preview import Preview
+            from pixediter.widgets.Preview import PREVIEW_MAX_COLUMNS
+            protocol = graphics.protocol(terminal.features())
+            self.preview = Preview(
+                top=self.draw_area.top,
+                left=max(1, min(self.minimap.right + 4, self.terminal_columns - PREVIEW_MAX_COLUMNS - 3)),
+                borders=borders.sharp,
+                draw_area=self.draw_area,
+                protocol=protocol
+            )
+            self.preview.title = str(len(self.widgets))
+            self.widgets.append(self.preview)
+            with self.profiler.stage("render"):
+                self.compositor.add(self.preview)
+            self.show(f"Preview at natural size ({protocol})")
+        elif not show and self.preview is not None:
+            preview, self.preview = self.preview, None
+            self.widgets.remove(preview)
+            with self.profiler.stage("render"):
+                preview.hide()
+                self.compositor.remove(preview)
+
+    def link_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :link [auto | full | drop-frames | coarse] -- how previews are drawn on a slow link, adapting to it by default
+        """
+        if len(args) != 1 or args[0] not in ("auto", *bandwidth.MODES):
+            raise ValueError(f"link requires one of auto, {', '.join(bandwidth.MODES)}")
+        pinned = None if args[0] == "auto" else args[0]
+        previous = self.link.mode
+        if self.link.pin(pinned):
+            self._link_mode_changed(previous)
+        self.show(f"Previews: {args[0]}")
+
+    def _link_mode_changed(self, previous: str) -> None:
+        mode = self.link.mode
+        with self.profiler.stage("render"):
+            if mode == bandwidth.FULL:
+                self.draw_area.end_stroke()
+                self.draw_area.preview_block = None
+            elif mode == bandwidth.COARSE:
+                self.draw_area.preview_block = bandwidth.COARSE_BLOCK
+            else:
+                self.draw_area.preview_block = 1
+            self.show_link_mode(previous)
+
+    def show_link_mode(self, previous: str | None = None) -> None:
+        """Shows the mode of the link at the end of the status line, clearing what previous showed"""
+        label = bandwidth.LABELS[self.link.mode]
+        cleared = len(bandwidth.LABELS[previous]) if previous is not None else 0
+        width = max(len(label), cleared)
+        if width:
+            draw(self.terminal_columns - width, self.terminal_rows - 1, label.rjust(width), colors.YELLOW)
+
+    def _adapt_output(self) -> None:
+        """Measures the link after an event and draws the collected previews when it's time"""
+        previous = self.link.mode
+        if self.link.sample():
+            self._link_mode_changed(previous)
+        if self.draw_area.preview_block is not None and self.link.frame_due():
+            columns, rows = terminal.size()
+            with self.profiler.stage("render"), terminal.clipped(1, 1, columns, rows):
+                if self.draw_area.draw_previews():
+                    self.link.frame_drawn()
+
+    def _on_idle(self) -> None:
+        """
+        Nothing was input for a while: the next frame is shown when playing, and the previews
+        are drawn in full if the link has caught up
+        """
+        with self.profiler.stage("render"):
+            advanced = self.draw_area.advance()
+            if advanced:
+                self.compositor.restore_above(self.draw_area)
+        # the views skip the frames that the link has no room for
+        if advanced and self.link.backlog <= bandwidth.BACKLOG_HIGH:
+            self.refresh_views(invalidate=True)
+        self.show_export()
+        previous = self.link.mode
+        if self.link.sample():
+            self._link_mode_changed(previous)
+        # the help and the stats cover the canvas
+        if self.link.backlog <= bandwidth.BACKLOG_HIGH and not self._waiting_for_key:
+            columns, rows = terminal.size()
+            with self.profiler.stage("render"), terminal.clipped(1, 1, columns, rows):
+                self.draw_area.refine()
+            self.link.frame_drawn()
+
+    def idle_timeout(self) -> float | None:
+        """How long to wait for input before handling an IDLE event, None to wait for as long as it takes"""
+        timeouts = [self.draw_area.playback_timeout()]
+        if self.export is not None:
+            timeouts.append(EXPORT_PROGRESS_INTERVAL)
+        if self.draw_area.has_previews():
+            timeouts.append(REFINE_DELAY)
+        if self.link.mode != bandwidth.FULL and self.link.pinned is None:
+            timeouts.append(LINK_CHECK_INTERVAL)
+        return min((timeout for timeout in timeouts if timeout is not None), default=None)
+
+    def refresh_views(self, invalidate: bool = False) -> None:
+        """
+        Brings the minimap and the preview up to date with the image and the viewport, with
+        invalidate the preview checks all of the image (e.g. after changing the layers)
+        """
+        columns, rows = terminal.size()
+        with self.profiler.stage("render"), terminal.clipped(1, 1, columns, rows):
+            if self.minimap.refresh():
+                self.compositor.restore_above(self.minimap)
+            if self.preview is not None:
+                self._refresh_preview(invalidate)
+
+    def _refresh_preview(self, invalidate: bool = False) -> None:
+        assert self.preview is not None
+        if invalidate:
+            self.preview.invalidate()
+        bbox = self.preview.outer_bbox()
+        # a new image may need a different size
+        self.preview.fit()
+        if self.preview.outer_bbox() != bbox:
+            self.compositor.update(self.preview)
+        elif self.preview.refresh():
+            self.compositor.restore_above(self.preview)
+        self._preview_refreshed = time.monotonic()
+
     def debug(self, to_show: str) -> None:
         if debugging:
             self.show(to_show)
 
     def show(self, to_show: Any) -> None:
-        available_space = self.terminal_columns - self.MARGIN_LEFT
+        # the end of the line is left for the mode of the link
+        label = bandwidth.LABELS[self.link.mode]
+        available_space = self.terminal_columns - self.MARGIN_LEFT - (len(label) + 1 if label else 0)
         padded_text = str(to_show).ljust(available_space)[:available_space]
         draw(self.MARGIN_LEFT, self.terminal_rows - 1, padded_text)
 
@@ -155,12 +634,16 @@ class App:
         self.show(f"Unknown command '{cmd}'")
 
     def set_image_file_path(self, file_path: str) -> None:
-        self.draw_area.image.filepath = file_path
+        self.draw_area.layers.filepath = file_path
+        self._restart_journal()
 
     def load_image(self, file_path: str) -> None:
-        image = ImageData.from_file(file_path)
-        self.draw_area.set_image(image)
+        if file_path.endswith(ANIMATION_FILE_EXTENSION):
+            self.draw_area.set_animation(Animation.load(file_path))
+        else:
+            self.draw_area.set_layers(LayerStack.from_file(file_path))
         self.full_redraw()
+        self._restart_journal()
 
     def load_image_cmd(self, cmd: str, args: list[str]) -> None:
         """
@@ -171,33 +654,71 @@ class App:
 
     def save_image_cmd(self, cmd: str, args: list[str]) -> None:
         """
-        :save [<path: str>] -- saves the image into <path> (requires Pillow)
+        :save [<path: str>] -- saves the image into <path> (requires Pillow), or all frames into a .pxa file
         """
         if not args:
             filepath = None
         else:
             filepath, = args
-        self.draw_area.image.save_file(filepath)
-        self.show(f"Saved image as {self.draw_area.image.filepath}")
+        target = filepath or self.draw_area.layers.filepath
+        if target is not None and target.endswith(ANIMATION_FILE_EXTENSION):
+            self.draw_area.frames.save(target)
+        else:
+            self.draw_area.layers.save_file(filepath)
+        self._restart_journal()
+        self.show(f"Saved image as {self.draw_area.layers.filepath}")
 
-    def setcolor_cmd(self, cmd: str, args: list[str]) -> None:
+    def export_cmd(self, cmd: str, args: list[str]) -> None:
         """
-        :setcolor [primary | secondary] <color: str> -- set current color to hexadecimal <color>
+        :export <path: str> -- exports the frames as an animated .gif or .png (APNG) in the background
         """
-        if len(args) == 1:
-            which = "primary"
-            hexcolor = args[0]
-        elif len(args) == 2:
-            which, hexcolor = args
+        if len(args) != 1:
+            raise ValueError("export requires a path")
+        if self.export is not None:
+            raise ValueError(f"Still exporting {self.export.filepath}")
+        self.export = export.Export(args[0], self.draw_area.frames)
+        self.export.start()
+        self.show_export()
+
+    def show_export(self) -> None:
+        """Shows how far the export has got, or how it ended once it has"""
+        if self.export is None or self._cmd or self._waiting_for_key or self._pending_filter is not None:
+            # the command line, the help and the filter prompt stay until they're done with
+            return
+        current = self.export
+        if current.running():
+            self.show(f"Exporting {current.filepath}: {100 * current.done // max(1, current.total)}%")
+            return
+        self.export = None
+        if current.error is not None:
+            self.show(f"Error: exporting {current.filepath} failed: {current.error}")
         else:
-            raise ValueError("'setcolor' command expects 1–2 arguments")
-        color = colors.Color.from_hex(hexcolor)
-        if "primary".startswith(which):
-            self.color.set_color("primary", color)
-        elif "secondary".startswith(which):
-            self.color.set_color("secondary", color)
-        else:
-            raise ValueError("You can only set 'primary' or 'secondary' color")
+            self.show(f"Exported {current.total // 2} frames to {current.filepath}")
+
+    def setcolor_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :setcolor [primary | secondary] <color: str> -- set current color to hexadecimal <color> (#rrggbb[aa])
+        """
+        commands.setcolor(self.color, args)
+
+    def stats_cmd(self, cmd: str, args: list[str]) -> None:
+        """
+        :stats -- shows how long handling each kind of event has taken (with --profile)
+        """
+        if not self.profiler.enabled:
+            raise ValueError("Profiling is off, start the editor with --profile to collect stats")
+        terminal.clear()
+        self.draw_title()
+        row_number = 3
+        draw(self.MARGIN_LEFT, row_number, "Latency (times in milliseconds, stages are means per event):", colors.GREEN)
+        header, *lines = self.profiler.table()
+        draw(self.MARGIN_LEFT + 2, row_number + 2, header, colors.WHITE)
+        # the events that don't fit on the screen are left out
+        available_rows = max(0, self.terminal_rows - row_number - 7)
+        for i, line in enumerate(lines[:available_rows]):
+            draw(self.MARGIN_LEFT + 2, row_number + 3 + i, line, colors.GRAY)
+        draw(self.MARGIN_LEFT, row_number + 4 + min(len(lines), available_rows), "Press any key to continue...")
+        self._waiting_for_key = True
 
     def show_help(self, cmd: str, args: list[str]) -> None:
         """
@@ -214,6 +735,9 @@ class App:
             "ctrl-s": "save",
             ":  OR  ctrl-e": "open command line",
             "r": "force redraw",
+            "+  OR  -": "zoom in or out",
+            ",  OR  .": "previous or next frame",
+            "p": "play or stop the animation",
             "q": "exit without saving",
             "?": "show this help"
         }
@@ -253,96 +777,182 @@ class App:
             else:
                 raise
 
-    def run(self) -> None:
-        cmd = ""
-        for ev in events.listen():
-            if self._waiting_for_key:
-                self.full_redraw()
-                self._waiting_for_key = False
-                continue
-
-            if isinstance(ev, MouseEvent):
-                self._handle_click(ev)
-                continue
-
-            if cmd:
-                if ev == "backspace":
-                    cmd = cmd[:-1]
-                    self.show(cmd)
-                elif ev == "\n":
-                    cmd, *args = cmd.split()
-                    with self.handled_exceptions(Exception):
-                        self.commands.get(cmd, self.unknown_command)(cmd, args)
-                    cmd = ""
-                elif not isinstance(ev, MouseEvent) and len(ev) == 1:
-                    cmd += ev
-                    self.show(cmd)
-                continue
-
-            if ev in {"q", "ctrl-q"}:
-                self.exit()
-            elif ev in {":", "ctrl-e"}:
-                cmd = ":"
-                self.show(cmd)
-            elif ev == "?":
-                self.commands[":help"](":help", [])
-            elif ev == "r":
-                self.full_redraw()
-            elif ev in set("0123456789"):
-                i = int(ev)
-                if i < len(self.widgets):
-                    self.widgets[i].toggle_selected()
-                    self.full_redraw()
-            elif ev == "up":
-                for widget in self.selected_widgets():
-                    widget.move(0, -1)
-                self.full_redraw()
-            elif ev == "down":
-                for widget in self.selected_widgets():
-                    widget.move(0, 1)
-                self.full_redraw()
-            elif ev == "left":
-                for widget in self.selected_widgets():
-                    widget.move(-1, 0)
-                self.full_redraw()
-            elif ev == "right":
-                for widget in self.selected_widgets():
-                    widget.move(1, 0)
-                self.full_redraw()
-            elif ev == "ctrl-up":
-                for widget in self.selected_widgets():
-                    widget.resize_up()
-                self.full_redraw()
-            elif ev == "ctrl-down":
-                for widget in self.selected_widgets():
-                    widget.resize_down()
-                self.full_redraw()
-            elif ev == "ctrl-left":
-                for widget in self.selected_widgets():
-                    widget.resize_left()
-                self.full_redraw()
-            elif ev == "ctrl-right":
-                for widget in self.selected_widgets():
-                    widget.resize_right()
-                self.full_redraw()
-            elif ev == "ctrl-s":
-                with self.handled_exceptions(Exception):
-                    self.commands[":save"](":save", [])
+    def run(self, source: Iterable[MouseEvent | str] | None = None) -> None:
+        """Handles the events from source (by default the user's input) until it ends or the user exits"""
+        events_ = iter(events.listen() if source is None else source)
+        while True:
+            # a resize that happens while waiting is handled right away by on_resize()
+            self._idle = True
+            try:
+                ev = next(events_)
+            except StopIteration:
+                return
+            finally:
+                self._idle = False
+            if self._resized:
+                self.relayout()
+            with self.profiler.event(self._event_name(ev)):
+                if ev == events.IDLE:
+                    self._on_idle()
+                else:
+                    self.handle_event(ev)
+                    self._adapt_output()
+
+    def _event_name(self, ev: MouseEvent | str) -> str:
+        """What ev is called in the profile: the mouse event and tool, a command or a key"""
+        if isinstance(ev, MouseEvent):
+            return f"{ev.event_type.name.lower()} {self.tool.current_name}"
+        if ev == events.IDLE:
+            return ev
+        if self._cmd and ev == "\n":
+            return self._cmd.split()[0]
+        return "key"
+
+    def handle_event(self, ev: MouseEvent | str) -> None:
+        if self.draw_area.playing:
+            # anything that is input stops the playback, p only that
+            with self.profiler.stage("render"):
+                self.draw_area.stop()
+                self.compositor.restore_above(self.draw_area)
+            self.show_frame()
+            if ev == "p":
+                return
+
+        if self._waiting_for_key:
+            self.full_redraw()
+            self._waiting_for_key = False
+            return
+
+        if self._pending_filter is not None:
+            pipeline, self._pending_filter = self._pending_filter, None
+            if ev == "\n":
+                self.draw_area.apply_filter(pipeline)
+                self.commit(":filter", pipeline.description)
+                self.refresh_views(invalidate=True)
+                self.show(f"Applied filter {pipeline.description}")
             else:
-                self.debug(f"got event: {ev!r}")
+                self.draw_area.render()
+                self.show("Filter cancelled")
+            return
+
+        if isinstance(ev, MouseEvent):
+            self._handle_click(ev)
+            return
+
+        if self._cmd:
+            if ev == "backspace":
+                self._cmd = self._cmd[:-1]
+                self.show(self._cmd)
+            elif ev == "\n":
+                cmd, *args = self._cmd.split()
+                self._cmd = ""
+                with self.profiler.stage("command"), self.handled_exceptions(Exception):
+                    self.commands.get(cmd, self.unknown_command)(cmd, args)
+                self.commit(cmd, " ".join(args))
+                # the help and the stats cover the screen until a key is pressed
+                if not self._waiting_for_key and self._pending_filter is None:
+                    self.refresh_views(invalidate=True)
+            elif not isinstance(ev, MouseEvent) and len(ev) == 1:
+                self._cmd += ev
+                self.show(self._cmd)
+            return
+
+        if ev in {"q", "ctrl-q"}:
+            self.exit()
+        elif ev in {":", "ctrl-e"}:
+            self._cmd = ":"
+            self.show(self._cmd)
+        elif ev == "?":
+            self.commands[":help"](":help", [])
+        elif ev == "r":
+            self.full_redraw()
+        elif ev in {",", "."}:
+            self.step_frame(1 if ev == "." else -1)
+        elif ev == "p":
+            with self.handled_exceptions(ValueError):
+                self.play_cmd(":play", [])
+        elif ev in {"+", "-"}:
+            self.set_zoom(self.draw_area.zoom + (1 if ev == "-" else -1))
+            self.refresh_views()
+        elif ev in set("0123456789"):
+            i = int(ev)
+            if i < len(self.widgets):
+                widget = self.widgets[i]
+                widget.toggle_selected()
+                with self.profiler.stage("render"):
+                    # the widget that is moved is shown on top of the others
+                    if widget.selected:
+                        self.compositor.raise_widget(widget)
+                    else:
+                        self.compositor.update(widget)
+        elif ev == "up":
+            self._update_selected(lambda widget: widget.move(0, -1))
+        elif ev == "down":
+            self._update_selected(lambda widget: widget.move(0, 1))
+        elif ev == "left":
+            self._update_selected(lambda widget: widget.move(-1, 0))
+        elif ev == "right":
+            self._update_selected(lambda widget: widget.move(1, 0))
+        elif ev == "ctrl-up":
+            self._update_selected(lambda widget: widget.resize_up())
+        elif ev == "ctrl-down":
+            self._update_selected(lambda widget: widget.resize_down())
+        elif ev == "ctrl-left":
+            self._update_selected(lambda widget: widget.resize_left())
+        elif ev == "ctrl-right":
+            self._update_selected(lambda widget: widget.resize_right())
+        elif ev == "ctrl-s":
+            with self.handled_exceptions(Exception):
+                self.commands[":save"](":save", [])
+        else:
+            self.debug(f"got event: {ev!r}")
+        # e.g. resizing the image with ctrl-arrows
+        self.commit(ev)
+
+    def _update_selected(self, change: Callable[[TerminalWidget], None]) -> None:
+        """Moves or resizes the selected widgets and repaints what changed"""
+        widgets = list(self.selected_widgets())
+        for widget in widgets:
+            change(widget)
+        with self.profiler.stage("render"):
+            for widget in widgets:
+                self.compositor.update(widget)
 
     def _handle_click(self, ev: MouseEvent) -> None:
-        for widget in reversed(self.widgets):
-            if widget.contains(ev.x, ev.y):
-                handled = widget.onclick(ev)
-                if handled:
-                    break
+        view = (self.draw_area.scroll_x, self.draw_area.scroll_y)
+        with self.profiler.stage("tool"):
+            for widget in reversed(self.compositor.z_order):
+                if widget.contains(ev.x, ev.y):
+                    handled = widget.onclick(ev)
+                    if handled:
+                        break
+        if (
+                ev.event_type == MouseEventType.MOUSE_DRAG and self.preview is not None
+                and time.monotonic() - self._preview_refreshed >= PREVIEW_INTERVAL
+        ):
+            # the stroke so far, only the tiles it changed are sent
+            columns, rows = terminal.size()
+            with self.profiler.stage("render"), terminal.clipped(1, 1, columns, rows):
+                self._refresh_preview()
+        if (self.draw_area.scroll_x, self.draw_area.scroll_y) != view:
+            # a large image may extend under the other widgets, draw them back on top of it
+            with self.profiler.stage("render"):
+                self.compositor.restore_above(self.draw_area)
+            self.refresh_views()
         if ev.event_type == MouseEventType.MOUSE_UP:
             # this needs to be handled here rather than in tools themselves because MOUSE_UP
             # event may happen outside DrawArea widget
             self.tool.current.reset_state()
+            # a stroke ends when the button is released
+            colors_used = f"{self.color.primary.hex()} {self.color.secondary.hex()}"
+            self.commit(self.tool.current.name, f"{ev.button.name} {colors_used}")
             # some of the drawing may have happened on top of widgets
             # that had been moved to on top of DrawArea
-            for widget in self.widgets:
-                widget.render()
+            with self.profiler.stage("render"):
+                self.draw_area.end_stroke()
+                if self.draw_area.zoom:
+                    # zoomed out, the tools only previewed single pixels of the image
+                    self.draw_area.render_region(*self.draw_area.visible_region())
+                self.compositor.restore_above(self.draw_area)
+            self.refresh_views()
         self.debug(f"got event: {ev!r}")
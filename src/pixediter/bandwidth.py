@@ -0,0 +1,163 @@
+"""
+Keeping up with a slow link to the terminal, e.g. over SSH.
+
+Dragging a tool over a large image previews thousands of pixels for every movement of the
+mouse. A slow link can't carry that: the output queues up in the tty and in ssh, and the
+screen falls further and further behind the mouse. The Monitor watches for that after
+every event, with two measures:
+
+- the backlog: the bytes written to the tty that its other end (the terminal, or sshd)
+  hasn't read yet, if the backend can tell (TIOCOUTQ)
+- the write latency: how long writing and flushing blocked during the event, a moving
+  average; writes block when the queues are full, which shows a slow link even where
+  the backlog can't be seen. It is measured on the backend that writes to the tty, so
+  behind a RenderThread it is the time the thread spent blocked, and the backlog is read
+  from the RenderThread, which counts its display list in it
+
+When either is high, the Monitor moves to the next mode, which draws less, and when both
+have been low for RECOVER_AFTER seconds it moves back one step at a time through MODES:
+
+- FULL: previews are drawn as the tools draw them
+- DROP_FRAMES: previews are collected and drawn at most every FRAME_INTERVALS seconds and
+  not while the backlog is high, so the frames in between are dropped and only the last
+  color of each pixel is sent
+- COARSE: like DROP_FRAMES, but in blocks of COARSE_BLOCK x COARSE_BLOCK pixels, which
+  are drawn again pixel by pixel when the mouse stops (see events.IDLE) or the stroke ends
+
+The mode can also be pinned, and it is shown on the status line when it isn't FULL.
+"""
+from __future__ import annotations
+
+import time
+
+from pixediter import terminal
+
+# bytes in the tty's output queue
+BACKLOG_HIGH = 16 * 1024
+BACKLOG_LOW = 1024
+# seconds an event spent blocked on writing (the moving average)
+LATENCY_HIGH = 0.02
+LATENCY_LOW = 0.002
+# the weight of the latest event in the moving average
+SMOOTHING = 0.3
+# a mode is given this many seconds to help before moving to the next one
+ESCALATE_AFTER = 0.2
+# the link has to be calm this many seconds to move back a mode
+RECOVER_AFTER = 1.0
+COARSE_BLOCK = 4
+
+# how previews are drawn, from the most output to the least
+FULL = "full"
+DROP_FRAMES = "drop-frames"
+COARSE = "coarse"
+MODES = (FULL, DROP_FRAMES, COARSE)
+# what the status line shows for each mode
+LABELS = {
+    FULL: "",
+    DROP_FRAMES: "[slow link: dropping frames]",
+    COARSE: "[slow link: coarse previews]",
+}
+# the collected previews are drawn at most this often (seconds)
+FRAME_INTERVALS = {
+    FULL: 0.0,
+    DROP_FRAMES: 0.1,
+    COARSE: 0.2,
+}
+
+
+class Monitor:
+    def __init__(self) -> None:
+        self.mode = FULL
+        # the mode chosen by the user instead of adapting, None to adapt
+        self.pinned: str | None = None
+        self.backlog = 0
+        self.latency = 0.0
+        # where the backlog is read from
+        self._backend: terminal.BackendWrapper | None = None
+        # seconds spent blocked on writing in total, and as of the last sample; only the
+        # thread writing to the backend adds to the total, so it needs no lock
+        self._blocked = 0.0
+        self._sampled = 0.0
+        now = time.monotonic()
+        self._mode_changed = now
+        self._calm_since: float | None = None
+        self._frame_drawn = now
+
+    def metered(self, backend: terminal.Backend) -> MeteredBackend:
+        """Returns backend with its output measured by this monitor"""
+        metered = MeteredBackend(backend, self)
+        self._backend = metered
+        return metered
+
+    def watch(self, backend: terminal.BackendWrapper) -> None:
+        """Reads the backlog from backend, which writes to the metered one (e.g. a RenderThread)"""
+        self._backend = backend
+
+    def pin(self, mode: str | None) -> bool:
+        """Uses mode from now on, None goes back to adapting, returns whether the mode changed"""
+        self.pinned = mode
+        if mode is None or mode == self.mode:
+            return False
+        self._set_mode(mode)
+        return True
+
+    def blocked(self, seconds: float) -> None:
+        self._blocked += seconds
+
+    def sample(self) -> bool:
+        """Measures the link after an event and adapts the mode to it, returns whether the mode changed"""
+        now = time.monotonic()
+        backlog = self._backend.backlog() if self._backend is not None else None
+        self.backlog = 0 if backlog is None else backlog
+        blocked = self._blocked
+        self.latency += SMOOTHING * (blocked - self._sampled - self.latency)
+        self._sampled = blocked
+        if self.pinned is not None:
+            return False
+        index = MODES.index(self.mode)
+        if self.backlog > BACKLOG_HIGH or self.latency > LATENCY_HIGH:
+            self._calm_since = None
+            if index + 1 < len(MODES) and now - self._mode_changed >= ESCALATE_AFTER:
+                self._set_mode(MODES[index + 1])
+                return True
+        elif self.backlog <= BACKLOG_LOW and self.latency <= LATENCY_LOW:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif index > 0 and now - max(self._calm_since, self._mode_changed) >= RECOVER_AFTER:
+                self._set_mode(MODES[index - 1])
+                return True
+        else:
+            self._calm_since = None
+        return False
+
+    def frame_due(self) -> bool:
+        """Whether the collected previews should be drawn now"""
+        if time.monotonic() - self._frame_drawn < FRAME_INTERVALS[self.mode]:
+            return False
+        # more output would only wait behind what is already queued
+        return self.backlog <= BACKLOG_HIGH
+
+    def frame_drawn(self) -> None:
+        self._frame_drawn = time.monotonic()
+
+    def _set_mode(self, mode: str) -> None:
+        self.mode = mode
+        self._mode_changed = time.monotonic()
+
+
+class MeteredBackend(terminal.BackendWrapper):
+    """Passes output to another backend, timing how long writing it blocks"""
+
+    def __init__(self, backend: terminal.Backend, monitor: Monitor):
+        super().__init__(backend)
+        self.monitor = monitor
+
+    def write(self, text: str) -> None:
+        start = time.monotonic()
+        self.backend.write(text)
+        self.monitor.blocked(time.monotonic() - start)
+
+    def flush(self) -> None:
+        start = time.monotonic()
+        self.backend.flush()
+        self.monitor.blocked(time.monotonic() - start)
@@ -0,0 +1,128 @@
+"""
+Alpha compositing with integer math.
+
+MUL[a][v] is the 8-bit product a * v / 255 (rounded), so compositing a color over an
+opaque one is just two table lookups and an addition per channel.
+"""
+from __future__ import annotations
+
+import functools
+from collections.abc import Callable
+
+from pixediter import colors
+from pixediter.colors import Color
+
+
+# built from the running sums a * v + 127, the table is made before the first frame
+MUL = [bytes([x // 255 for x in range(127, 256 * a + 127, a)]) if a else bytes(256) for a in range(256)]
+
+
+def over(src: Color, dst: Color) -> Color:
+    """Composites src on top of dst ("source-over")"""
+    alpha = src.a
+    if alpha == 255:
+        return src
+    if alpha == 0:
+        return dst
+    src_mul = MUL[alpha]
+    dst_mul = MUL[255 - alpha]
+    if dst.a == 255:
+        return Color(
+            src_mul[src.r] + dst_mul[dst.r],
+            src_mul[src.g] + dst_mul[dst.g],
+            src_mul[src.b] + dst_mul[dst.b],
+        )
+
+    # the destination is translucent as well, its contribution is weighted by its own alpha
+    dst_alpha = dst_mul[dst.a]
+    out_alpha = alpha + dst_alpha
+    if out_alpha == 0:
+        return colors.TRANSPARENT
+    half = out_alpha // 2
+    return Color(
+        (src.r * alpha + dst.r * dst_alpha + half) // out_alpha,
+        (src.g * alpha + dst.g * dst_alpha + half) // out_alpha,
+        (src.b * alpha + dst.b * dst_alpha + half) // out_alpha,
+        out_alpha,
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def over_luts(rgba: tuple[int, int, int, int]) -> tuple[bytes, bytes, bytes]:
+    """
+    Returns lookup tables (one per channel) that map an opaque destination value to the
+    result of compositing the given color on top of it
+    """
+    r, g, b, alpha = rgba
+    src_mul = MUL[alpha]
+    dst_mul = MUL[255 - alpha]
+    return tuple(  # type: ignore[return-value]
+        bytes(src_mul[channel] + dst_mul[d] for d in range(256))
+        for channel in (r, g, b)
+    )
+
+
+# separable blend modes, fn(source, destination) -> blended channel value
+BLEND_MODES: dict[str, Callable[[int, int], int]] = {
+    "normal": lambda s, d: s,
+    "multiply": lambda s, d: (s * d + 127) // 255,
+    "screen": lambda s, d: s + d - (s * d + 127) // 255,
+    "add": lambda s, d: min(255, s + d),
+    "subtract": lambda s, d: max(0, d - s),
+    "darken": min,
+    "lighten": max,
+    "difference": lambda s, d: abs(s - d),
+}
+
+
+@functools.cache
+def blend_table(mode: str) -> list[bytes] | None:
+    """Returns a 256x256 table of the blend mode (table[source][destination]), None for normal mode"""
+    if mode == "normal":
+        return None
+    fn = BLEND_MODES[mode]
+    return [bytes(fn(s, d) for d in range(256)) for s in range(256)]
+
+
+def blend_row(dst: bytearray, src: bytes, opacity: int = 255, mode: str = "normal") -> None:
+    """
+    Composites a row of RGBA pixels src on top of dst (in place) using the given
+    blend mode and layer opacity
+    """
+    table = blend_table(mode)
+    if table is None and opacity == 255 and src[3::4].count(255) == len(src) // 4:
+        dst[:] = src
+        return
+    opacity_mul = MUL[opacity]
+    for i in range(0, len(src), 4):
+        alpha = opacity_mul[src[i + 3]]
+        if alpha == 0:
+            continue
+        r, g, b = src[i], src[i + 1], src[i + 2]
+        dst_alpha = dst[i + 3]
+        if table is not None and dst_alpha:
+            # the blended color is only used where the destination is opaque
+            br, bg, bb = table[r][dst[i]], table[g][dst[i + 1]], table[b][dst[i + 2]]
+            if dst_alpha == 255:
+                r, g, b = br, bg, bb
+            else:
+                keep = MUL[255 - dst_alpha]
+                mix = MUL[dst_alpha]
+                r, g, b = mix[br] + keep[r], mix[bg] + keep[g], mix[bb] + keep[b]
+        if alpha == 255:
+            dst[i:i + 4] = bytes((r, g, b, 255))
+            continue
+        src_mul = MUL[alpha]
+        dst_mul = MUL[255 - alpha]
+        if dst_alpha == 255:
+            dst[i] = src_mul[r] + dst_mul[dst[i]]
+            dst[i + 1] = src_mul[g] + dst_mul[dst[i + 1]]
+            dst[i + 2] = src_mul[b] + dst_mul[dst[i + 2]]
+            continue
+        dst_alpha = dst_mul[dst_alpha]
+        out_alpha = alpha + dst_alpha
+        half = out_alpha // 2
+        dst[i] = (r * alpha + dst[i] * dst_alpha + half) // out_alpha
+        dst[i + 1] = (g * alpha + dst[i + 1] * dst_alpha + half) // out_alpha
+        dst[i + 2] = (b * alpha + dst[i + 2] * dst_alpha + half) // out_alpha
+        dst[i + 3] = out_alpha
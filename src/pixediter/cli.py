@@ -1,8 +1,23 @@
+from __future__ import annotations
+
 import argparse
 import os
+import sys
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextlib import nullcontext
+from typing import TYPE_CHECKING
 
+from pixediter import bandwidth
+from pixediter import profiling
 from pixediter import terminal
-from pixediter.application import App
+from pixediter.render_thread import RenderThread
+
+# only what is needed to parse the arguments is imported up front: scripts never show the
+# user interface and the editor imports the rest after its first frame is on the screen
+if TYPE_CHECKING:
+    from pixediter.application import App
 
 
 def size(wxh: str) -> tuple[int, int]:
@@ -31,7 +46,7 @@ def path(file_path: str) -> str:
         else:
             raise argparse.ArgumentTypeError("No file at the given path")
 
-    directory = os.path.dirname(fpath)
+    directory = os.path.dirname(fpath) or "."
     if not os.path.exists(directory):
         raise argparse.ArgumentTypeError(f"Directory '{directory}' does not exist")
     if not os.access(directory, os.W_OK):
@@ -39,37 +54,230 @@ def path(file_path: str) -> str:
     return fpath
 
 
+def speed(value: str) -> float | None:
+    """Parses a replay speed: a factor of the recorded speed or "max" for no waiting at all"""
+    if value == "max":
+        return None
+    try:
+        factor = float(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(exc)
+    if factor <= 0:
+        raise argparse.ArgumentTypeError("Speed has to be positive")
+    return factor
+
+
+def confirm(question: str) -> bool:
+    try:
+        return input(f"{question} [y/N] ").strip().lower() in ("y", "yes")
+    except EOFError:
+        return False
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--size",
         type=size,
-        default=(24, 24),
+        default=None,
         metavar="WIDTHxHEIGHT",
-        help="Size of the canvas"
+        help="Size of the canvas (default: 24x24)"
+    )
+    parser.add_argument(
+        "--script",
+        metavar="SCRIPT",
+        default=None,
+        help="Run the commands in SCRIPT on every FILE without the user interface"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Number of files processed in parallel with --script (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--record",
+        metavar="LOG",
+        default=None,
+        help="Record the input of the session into LOG"
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="LOG",
+        default=None,
+        help="Replay the input recorded in LOG and report the time and output it took"
+    )
+    parser.add_argument(
+        "--speed",
+        type=speed,
+        default=1.0,
+        metavar="FACTOR",
+        help="Speed of --replay compared to the recording, or 'max' to not wait between events"
+    )
+    parser.add_argument(
+        "--headless",
+        action="store_true",
+        help="Replay into a virtual terminal of the recorded size instead of this terminal"
+    )
+    parser.add_argument(
+        "--colors",
+        choices=terminal.COLOR_DEPTHS,
+        default=None,
+        help="Colors the terminal can show, 256 and 16 map colors to its palette"
+             f" (default: ${terminal.COLORS_VARIABLE} or guessed from the environment)"
     )
     parser.add_argument(
-        "image_file_path",
+        "--profile",
+        metavar="DIR",
+        default=os.environ.get("PIXEDITER_PROFILE"),
+        help="Time every stage of handling each event (see :stats) and write latency histograms into DIR on exit"
+             " (default: $PIXEDITER_PROFILE)"
+    )
+    parser.add_argument(
+        "--cprofile",
+        action="store_true",
+        help=f"With --profile, also write cProfile statistics into DIR/{profiling.CPROFILE_FILE}"
+    )
+    parser.add_argument(
+        "image_file_paths",
         metavar="FILE",
-        nargs="?",
+        nargs="*",
         type=path,
-        default=None,
-        help="(optional) Path to image file"
+        help="(optional) Path to image file, any number of them with --script"
     )
     args = parser.parse_args()
-    width, height = args.size
-    file_path = args.image_file_path
 
-    app = App(width, height)
+    if args.script is not None:
+        from pixediter import script
+        if not args.image_file_paths:
+            parser.error("--script requires at least one FILE")
+        raise SystemExit(script.main(args.script, args.image_file_paths, args.jobs))
+    if len(args.image_file_paths) > 1:
+        parser.error("only one FILE can be edited at a time")
+    if args.headless and args.replay is None:
+        parser.error("--headless only works with --replay")
+    if args.cprofile and args.profile is None:
+        parser.error("--cprofile only works with --profile")
+    profiler = profiling.Profiler(cprofile=args.cprofile)
+
+    file_path = args.image_file_paths[0] if args.image_file_paths else None
+    if args.replay is not None:
+        replay_session(
+            args.replay, file_path, args.size, args.speed, args.headless, args.colors, profiler, args.profile
+        )
+        return
+    width, height = args.size or (24, 24)
 
+    # asked before the app takes over the terminal
+    replay = False
     if file_path is not None:
-        if os.path.exists(file_path):
+        from pixediter import journal
+        count = journal.recoverable(file_path)
+        question = f"'{file_path}' has {count} unsaved operations from a previous session, replay them?"
+        replay = count > 0 and confirm(question)
+
+    link = bandwidth.Monitor()
+    # the output is written on a thread once the first frame is on the screen, the link
+    # is measured where the thread writes to it
+    renderer = RenderThread(link.metered(terminal.StdoutBackend(args.colors)))
+    link.watch(renderer)
+    with profiled(profiler, args.profile, renderer):
+        app = open_app(width, height, file_path, profiler, link)
+        if replay:
+            app.replay_journal()
+
+        from pixediter import events
+        raw_input: Iterable[str] = events.read_input(app.idle_timeout)
+        if args.record is not None:
+            from pixediter import recording
+            columns, rows = terminal.size()
+            header = recording.Header(columns, rows, width, height, file_path)
+            raw_input = recording.record(raw_input, args.record, header)
+
+        with (
+                renderer.running(),
+                terminal.hidden_cursor(),
+                terminal.mouse_tracking(),
+                terminal.resize_handler(app.on_resize)
+        ):
+            app.run(profiler.decoded(raw_input))
+
+
+def open_app(
+        width: int,
+        height: int,
+        file_path: str | None,
+        profiler: profiling.Profiler,
+        link: bandwidth.Monitor | None = None
+) -> App:
+    """Creates the app and draws its first frame"""
+    from pixediter.application import App
+    with profiler.event(profiling.STARTUP):
+        app = App(width, height, profiler, link)
+        if file_path is not None and os.path.exists(file_path):
             app.load_image(file_path)
         else:
-            app.set_image_file_path(file_path)
+            app.full_redraw()
+            if file_path is not None:
+                app.set_image_file_path(file_path)
+    return app
+
+
+@contextmanager
+def profiled(profiler: profiling.Profiler, directory: str | None, output: terminal.Backend) -> Iterator[None]:
+    """
+    Sends the output of the with block to output, profiling the block if directory is
+    given and writing the results into it at the end
+    """
+    if directory is None:
+        with terminal.using(output):
+            yield
+        return
+    profiler.start()
+    try:
+        with terminal.using(profiling.TimedBackend(output, profiler)):
+            yield
+    finally:
+        profiler.stop()
+        profiler.export(directory)
+        print(f"Wrote the profile into {directory}", file=sys.stderr)
+
 
-    with terminal.hidden_cursor(), terminal.mouse_tracking():
-        app.run()
+def replay_session(
+        log: str,
+        file_path: str | None,
+        canvas_size: tuple[int, int] | None,
+        replay_speed: float | None,
+        headless: bool,
+        color_depth: str | None,
+        profiler: profiling.Profiler,
+        profile_directory: str | None
+) -> None:
+    """Feeds the input recorded in log to the app and reports how long handling it took"""
+    from pixediter import recording
+    from pixediter.virtual_terminal import VirtualTerminal
+    header = recording.read_header(log)
+    width, height = canvas_size or (header.width, header.height)
+    stats = recording.ReplayStats()
+    output: terminal.Backend
+    if headless:
+        output = VirtualTerminal(header.columns, header.rows, color_depth=color_depth or terminal.TRUECOLOR)
+    else:
+        output = terminal.StdoutBackend(color_depth)
+    link = bandwidth.Monitor()
+    with profiled(profiler, profile_directory, recording.CountingBackend(link.metered(output), stats)):
+        app = open_app(width, height, file_path or header.file, profiler, link)
+        try:
+            resizes = nullcontext() if headless else terminal.resize_handler(app.on_resize)
+            with terminal.hidden_cursor(), resizes:
+                app.run(profiler.decoded(stats.timed(recording.replay(log, replay_speed))))
+        except SystemExit:
+            # the session ended with the user exiting
+            pass
+        finally:
+            app.close()
+    print(stats.report(), file=sys.stderr)
 
 
 if __name__ == "__main__":
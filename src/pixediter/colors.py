@@ -1,8 +1,6 @@
 from __future__ import annotations
 
-import colorsys
 import dataclasses
-import random
 
 from pixediter import terminal
 
@@ -12,14 +10,21 @@ class Color:
     r: int
     g: int
     b: int
+    a: int = 255
 
     def hex(self) -> str:
+        if self.a != 255:
+            return f"#{self.r:02x}{self.g:02x}{self.b:02x}{self.a:02x}"
         return f"#{self.r:02x}{self.g:02x}{self.b:02x}"
 
     def rgb(self) -> tuple[int, int, int]:
         return (self.r, self.g, self.b)
 
+    def rgba(self) -> tuple[int, int, int, int]:
+        return (self.r, self.g, self.b, self.a)
+
     def hsl(self) -> tuple[float, float, float]:
+        import colorsys
         h, l, s = colorsys.rgb_to_hls(self.r/255, self.g/255, self.b/255)
         return h, s, l
 
@@ -30,7 +35,10 @@ class Color:
         red = max(0, min(255, red))
         green = max(0, min(255, green))
         blue = max(0, min(255, blue))
-        return Color(red, green, blue)
+        return Color(red, green, blue, self.a)
+
+    def add_alpha(self, alpha: int) -> Color:
+        return Color(self.r, self.g, self.b, max(0, min(255, self.a + alpha)))
 
     def add_hsl(self, hue: float, saturation: float, lightness: float) -> Color:
         H, S, L = self.hsl()
@@ -40,29 +48,35 @@ class Color:
         H %= 1.0
         S = max(0.0, min(1.0, S))
         L = max(0.0, min(1.0, L))
-        return Color.from_hsl(H, S, L)
+        return Color.from_hsl(H, S, L, self.a)
 
     @classmethod
     def from_hex(cls, hexcolor: str) -> Color:
         hexcolor = hexcolor.removeprefix("#")
         hexcolor = hexcolor.removeprefix("0x")
         hexval = int(hexcolor, 16)
-        if hexval < 0 or hexval > 0xFFFFFF:
+        if hexval < 0 or hexval > 0xFFFFFFFF or (len(hexcolor) > 6 and len(hexcolor) != 8):
             raise ValueError(f"Invalid hex color value '{hexcolor}'")
+        a = 255
+        if len(hexcolor) == 8:
+            a = hexval & 255
+            hexval >>= 8
         b = hexval & 255
         hexval >>= 8
         g = hexval & 255
         hexval >>= 8
         r = hexval & 255
-        return cls(r, g, b)
+        return cls(r, g, b, a)
 
     @classmethod
-    def from_hsl(cls, hue: float, saturation: float, lightness: float) -> Color:
+    def from_hsl(cls, hue: float, saturation: float, lightness: float, alpha: int = 255) -> Color:
+        import colorsys
         r, g, b = colorsys.hls_to_rgb(hue, lightness, saturation)
-        return Color(int(255 * r), int(255 * g), int(255 * b))
+        return Color(int(255 * r), int(255 * g), int(255 * b), alpha)
 
     @classmethod
     def random(cls) -> Color:
+        import random
         r = random.randint(0, 255)
         g = random.randint(0, 255)
         b = random.randint(0, 255)
@@ -76,7 +90,8 @@ class Color:
         r = round(color_a.r + (color_b.r - color_a.r) * value)
         g = round(color_a.g + (color_b.g - color_a.g) * value)
         b = round(color_a.b + (color_b.b - color_a.b) * value)
-        return cls(r, g, b)
+        a = round(color_a.a + (color_b.a - color_a.a) * value)
+        return cls(r, g, b, a)
 
     @classmethod
     def lerp_hsl(cls, color_a: Color, color_b: Color, value: float) -> Color:
@@ -94,7 +109,8 @@ class Color:
         hue = (h_a + hue_difference * value) % 1.0
         saturation = s_a + (s_b - s_a) * value
         lightness = l_a + (l_b - l_a) * value
-        return cls.from_hsl(hue, saturation, lightness)
+        alpha = round(color_a.a + (color_b.a - color_a.a) * value)
+        return cls.from_hsl(hue, saturation, lightness, alpha)
 
     def colorize(self, txt: str) -> str:
         return terminal.colorize(txt, self.r, self.g, self.b)
@@ -109,3 +125,4 @@ GREEN = Color(0, 255, 0)
 CYAN = Color(0, 255, 255)
 BLUE = Color(0, 0, 255)
 MAGENTA = Color(255, 0, 255)
+TRANSPARENT = Color(0, 0, 0, 0)
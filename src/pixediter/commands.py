@@ -0,0 +1,201 @@
+"""
+The editing commands of the command line, shared by the editor and headless scripts.
+
+Each function takes the arguments of a command as they were typed and works on the
+layers, the image, the colors or the selection it's given; what to repaint is left to the
+caller. Commands that change the size of the image return a function for the caller to
+apply to every layer (and frame), since the editor and scripts keep their layers
+differently.
+"""
+from __future__ import annotations
+
+from pixediter import filters
+from pixediter import selection
+from pixediter import transform
+from pixediter.AreaSelector import AreaSelector
+from pixediter.colors import Color
+from pixediter.ColorSelector import ColorSelector
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+
+Area = tuple[int, int, int, int]
+
+
+class CommandError(ValueError):
+    pass
+
+
+def image_size(args: list[str]) -> tuple[int, int]:
+    """:new <width> <height>"""
+    if len(args) != 2:
+        raise CommandError("new requires a width and a height")
+    width, height = map(int, args)
+    return width, height
+
+
+def crop_area(args: list[str]) -> Area:
+    """:crop [<x0> <y0>] <x1> <y1>"""
+    if len(args) == 2:
+        return 0, 0, int(args[0]), int(args[1])
+    if len(args) == 4:
+        x0, y0, x1, y1 = map(int, args)
+        return x0, y0, x1, y1
+    raise CommandError("crop requires exactly 2 or 4 arguments")
+
+
+def scale(args: list[str], width: int, height: int) -> transform.Transform:
+    """:scale <factor | width height> [<method>] of an image of width x height"""
+    method = "nearest"
+    if args and args[-1] in transform.SCALING_METHODS:
+        *args, method = args
+    if len(args) == 1:
+        factor = float(args[0].removesuffix("x"))
+        new_width, new_height = round(width * factor), round(height * factor)
+    elif len(args) == 2:
+        new_width, new_height = map(int, args)
+    else:
+        raise CommandError("scale requires a factor or a width and a height")
+    return lambda img: transform.scale(img, new_width, new_height, method)
+
+
+def rotate(args: list[str]) -> transform.Transform:
+    """:rotate <90 | 180 | 270>"""
+    if len(args) != 1 or args[0] not in {"90", "180", "270"}:
+        raise CommandError("rotate requires an angle of 90, 180 or 270")
+    degrees = int(args[0])
+    return lambda img: transform.rotate(img, degrees)
+
+
+def flip(args: list[str]) -> transform.Transform:
+    """:flip <h | v>"""
+    if args == ["h"]:
+        return transform.flip_horizontal
+    if args == ["v"]:
+        return transform.flip_vertical
+    raise CommandError("flip requires a direction (h or v)")
+
+
+def transpose(args: list[str]) -> transform.Transform:
+    """:transpose"""
+    return transform.transpose
+
+
+def filter_pipeline(args: list[str]) -> filters.Pipeline:
+    """:filter <filter> [| <filter>...]"""
+    if not args:
+        raise CommandError(f"filter requires a filter name (available: {', '.join(filters.FILTERS)})")
+    return filters.parse(" ".join(args))
+
+
+def layer(layers: LayerStack, args: list[str]) -> None:
+    """:layer <action> [<argument>]"""
+    action, *rest = args
+    if action == "new":
+        layers.new_layer(" ".join(rest) or None)
+    elif action == "delete":
+        layers.remove(layers.active_index)
+    elif action == "select":
+        layers.select(int(rest[0]))
+    elif action in ("show", "hide"):
+        layers.set_visible(int(rest[0]) if rest else layers.active_index, action == "show")
+    elif action == "up":
+        layers.move(layers.active_index, layers.active_index + 1)
+    elif action == "down":
+        layers.move(layers.active_index, layers.active_index - 1)
+    elif action == "opacity":
+        layers.set_opacity(layers.active_index, int(rest[0]))
+    elif action == "blend":
+        layers.set_blend_mode(layers.active_index, rest[0])
+    else:
+        raise CommandError(f"Unknown layer action '{action}'")
+
+
+def setcolor(color: ColorSelector, args: list[str]) -> None:
+    """:setcolor [primary | secondary] <#rrggbb[aa]>"""
+    if len(args) == 1:
+        which, hexcolor = "primary", args[0]
+    elif len(args) == 2:
+        which, hexcolor = args
+    else:
+        raise CommandError("'setcolor' command expects 1–2 arguments")
+    new = Color.from_hex(hexcolor)
+    if "primary".startswith(which):
+        color.set_color("primary", new)
+    elif "secondary".startswith(which):
+        color.set_color("secondary", new)
+    else:
+        raise CommandError("You can only set 'primary' or 'secondary' color")
+
+
+def selected_area(selector: AreaSelector, image: ImageData) -> selection.Selection:
+    """The current selection, or the whole image if nothing is selected"""
+    if selector.current is not None:
+        return selector.current
+    return selection.Selection.everything(image.width, image.height)
+
+
+def select(selector: AreaSelector, image: ImageData, args: list[str]) -> None:
+    """:select [all | none | <x0> <y0> <x1> <y1>]"""
+    if args == ["none"]:
+        selector.select(None)
+    elif not args or args == ["all"]:
+        selector.select(selection.Selection.everything(image.width, image.height))
+    elif len(args) == 4:
+        x0, y0, x1, y1 = map(int, args)
+        selector.select(selection.Selection.rectangle(image.width, image.height, x0, y0, x1, y1))
+    else:
+        raise CommandError("select requires 'all', 'none' or exactly 4 arguments")
+
+
+def copy(selector: AreaSelector, image: ImageData) -> None:
+    """:copy"""
+    selector.clipboard = selection.copy(image, selected_area(selector, image))
+
+
+def cut(selector: AreaSelector, image: ImageData) -> Area | None:
+    """:cut, returns the area that was cleared"""
+    area = selected_area(selector, image)
+    selector.clipboard = selection.copy(image, area)
+    selection.clear(image, area)
+    return area.bbox()
+
+
+def paste(selector: AreaSelector, image: ImageData, args: list[str]) -> Area:
+    """:paste [<x> <y>], returns the area the pixels were pasted on"""
+    clip = selector.clipboard
+    if clip is None:
+        raise CommandError("Nothing to paste")
+    if len(args) == 2:
+        x, y = int(args[0]), int(args[1])
+    elif not args:
+        bbox = selector.current.bbox() if selector.current is not None else None
+        x, y = bbox[:2] if bbox is not None else (0, 0)
+    else:
+        raise CommandError("paste requires 0 or 2 arguments")
+    selection.paste(image, clip, x, y)
+    selector.select(clip.mask.placed(image.width, image.height, x, y))
+    return x, y, x + clip.width, y + clip.height
+
+
+def fill(selector: AreaSelector, image: ImageData, color: ColorSelector, args: list[str]) -> Area | None:
+    """:fill [primary | secondary], returns the area that was filled"""
+    which = args[0] if args else "primary"
+    if "primary".startswith(which):
+        fill_color = color.primary
+    elif "secondary".startswith(which):
+        fill_color = color.secondary
+    else:
+        raise CommandError("You can only fill with 'primary' or 'secondary' color")
+    area = selected_area(selector, image)
+    selection.fill(image, area, fill_color)
+    return area.bbox()
+
+
+def recolor(selector: AreaSelector, image: ImageData, args: list[str]) -> tuple[Area | None, int]:
+    """:recolor <from> <to>, returns the area and how many pixels were recolored"""
+    if len(args) != 2:
+        raise CommandError("recolor requires exactly 2 colors")
+    old, new = (Color.from_hex(arg) for arg in args)
+    area = selected_area(selector, image)
+    count = selection.recolor(image, area, old, new)
+    return area.bbox(), count
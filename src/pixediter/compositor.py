@@ -0,0 +1,180 @@
+"""
+Painting the widgets so that only the parts of the screen that changed are drawn.
+
+The widgets are stacked in z_order, the last one on top. The compositor remembers where it
+painted each widget, so when a widget is moved, resized or restyled, only two kinds of
+cells are repainted: the ones the widget left (with whatever is under them now) and the
+ones it covers now. Repainting an area renders the widgets that overlap it, clipped to it
+with terminal.clipped(), and clears the cells no widget covers.
+
+Widgets are expected to draw every cell of their area, so a widget whose part of a
+repainted area is covered by a widget above it is not rendered at all.
+
+A widget can also have the terminal move what it has drawn (see shift()). The compositor
+knows which rows are free to move as a whole, and repaints what the widgets above it left
+behind when they moved along.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from collections.abc import Iterable
+
+from pixediter import terminal
+from pixediter.widgets.TerminalWidget import TerminalWidget
+
+# x0, y0, x1, y1: the columns and rows of terminal cells, corners included
+Rect = tuple[int, int, int, int]
+
+
+def intersection(a: Rect, b: Rect) -> Rect | None:
+    x0, y0, x1, y1 = max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3])
+    if x0 > x1 or y0 > y1:
+        return None
+    return x0, y0, x1, y1
+
+
+def contains(outer: Rect, inner: Rect) -> bool:
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def difference(a: Rect, b: Rect) -> list[Rect]:
+    """Returns the cells of a that are not in b, as at most four rectangles"""
+    common = intersection(a, b)
+    if common is None:
+        return [a]
+    x0, y0, x1, y1 = a
+    cx0, cy0, cx1, cy1 = common
+    parts = [
+        (x0, y0, x1, cy0 - 1),
+        (x0, cy1 + 1, x1, y1),
+        (x0, cy0, cx0 - 1, cy1),
+        (cx1 + 1, cy0, x1, cy1),
+    ]
+    return [(px0, py0, px1, py1) for px0, py0, px1, py1 in parts if px0 <= px1 and py0 <= py1]
+
+
+class Compositor:
+    def __init__(
+            self,
+            widgets: Iterable[TerminalWidget],
+            background: Callable[[], None] = lambda: None,
+            background_area: Rect | None = None
+    ):
+        self.z_order = list(widgets)
+        # draws what is behind the widgets (e.g. the title) in background_area, it's clipped
+        # like the widgets
+        self.background = background
+        self.background_area = background_area
+        self._painted: dict[TerminalWidget, Rect] = {}
+
+    def paint_all(self) -> None:
+        """Paints everything, on a screen that was cleared"""
+        columns, rows = terminal.size()
+        # what doesn't fit would wrap to the next row
+        with terminal.clipped(1, 1, columns, rows):
+            self.background()
+            for widget in self.z_order:
+                widget.render()
+                self._painted[widget] = widget.outer_bbox()
+
+    def update(self, widget: TerminalWidget) -> None:
+        """Repaints what changed when widget was moved, resized or restyled"""
+        new = widget.outer_bbox()
+        old = self._painted.get(widget)
+        exposed = difference(old, new) if old is not None else []
+        for area in [*exposed, new]:
+            self.repaint(area)
+        self._painted[widget] = new
+
+    def add(self, widget: TerminalWidget) -> None:
+        """Puts widget on top of the others and paints it"""
+        self.z_order.append(widget)
+        self.update(widget)
+
+    def remove(self, widget: TerminalWidget) -> None:
+        """Takes widget away and paints what was under it"""
+        self.z_order.remove(widget)
+        painted = self._painted.pop(widget, None)
+        if painted is not None:
+            self.repaint(painted)
+
+    def raise_widget(self, widget: TerminalWidget) -> None:
+        """Moves widget on top of the others"""
+        self.z_order.remove(widget)
+        self.z_order.append(widget)
+        self.update(widget)
+
+    def restore_above(self, widget: TerminalWidget) -> None:
+        """Paints the widgets above widget back on top of it, e.g. after drawing on it"""
+        area = widget.outer_bbox()
+        for upper in self.z_order[self.z_order.index(widget) + 1:]:
+            overlap = intersection(upper.outer_bbox(), area)
+            if overlap is not None:
+                upper.render_clipped(*overlap)
+
+    def shift(self, widget: TerminalWidget, x0: int, y0: int, x1: int, y1: int, dx: int, dy: int) -> bool:
+        """
+        Moves what is on the screen in an area of widget by dx columns and dy rows, like
+        terminal.shift(). The parts of the rows outside the area that belong to widget must
+        look the same on every row. The widgets above it are painted back by restore_above().
+        """
+        columns, rows = terminal.size()
+        area = (x0, y0, x1, y1)
+        if intersection(area, (1, 1, columns, rows)) != area:
+            return False
+        above = self.z_order[self.z_order.index(widget) + 1:]
+        # the rows can move as a whole if nothing else is on them, apart from what is
+        # painted back anyway
+        others = [w.outer_bbox() for w in self.z_order if w is not widget and w not in above]
+        if self.background_area is not None:
+            others.append(self.background_area)
+        row_span = (1, y0, columns, y1)
+        whole_rows = (
+            all(intersection(box, row_span) is None for box in others)
+            and all(intersection(w.outer_bbox(), row_span) is None or contains(area, w.outer_bbox()) for w in above)
+        )
+        if not terminal.shift(x0, y0, x1, y1, dx, dy, whole_rows):
+            return False
+        if whole_rows and dy != 0:
+            # the rows that came in empty, outside of the area
+            ey0, ey1 = (y0, y0 + dy - 1) if dy > 0 else (y1 + dy + 1, y1)
+            widget.render_clipped(1, ey0, x0 - 1, ey1)
+            widget.render_clipped(x1 + 1, ey0, columns, ey1)
+        # the parts of the widgets above that moved along
+        for upper in above:
+            bx0, by0, bx1, by1 = upper.outer_bbox()
+            moved = intersection((bx0 + dx, by0 + dy, bx1 + dx, by1 + dy), area)
+            if moved is not None:
+                widget.render_clipped(*moved)
+        return True
+
+    def repaint(self, area: Rect) -> None:
+        """Paints everything in area"""
+        columns, rows = terminal.size()
+        visible = intersection(area, (1, 1, columns, rows))
+        if visible is None:
+            return
+        boxes = [widget.outer_bbox() for widget in self.z_order]
+        self._clear_uncovered(visible, boxes)
+        with terminal.clipped(*visible):
+            self.background()
+        for i, widget in enumerate(self.z_order):
+            part = intersection(boxes[i], visible)
+            if part is None or any(contains(upper, part) for upper in boxes[i + 1:]):
+                continue
+            widget.render_clipped(*part)
+
+    @staticmethod
+    def _clear_uncovered(area: Rect, boxes: list[Rect]) -> None:
+        """Clears the cells of area that are not covered by any of the boxes"""
+        x0, y0, x1, y1 = area
+        for y in range(y0, y1 + 1):
+            x = x0
+            for bx0, _, bx1, _ in sorted(box for box in boxes if box[1] <= y <= box[3]):
+                if bx0 > x:
+                    width = min(bx0, x1 + 1) - x
+                    if width > 0:
+                        terminal.addstr(y, x, " " * width)
+                x = max(x, bx1 + 1)
+            if x <= x1:
+                terminal.addstr(y, x, " " * (x1 - x + 1))
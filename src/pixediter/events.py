@@ -3,14 +3,17 @@ from __future__ import annotations
 import dataclasses
 import enum
 import sys
-import termios
-import tty
+from collections.abc import Callable
 from collections.abc import Generator
+from collections.abc import Iterable
 from collections.abc import Iterator
 from contextlib import contextmanager
 
+# nothing was input for a while (see read_input)
+IDLE = "idle"
 
 NAMED_EVENTS = {
+    "":           IDLE,
     "\x1b[A":     "up",
     "\x1b[B":     "down",
     "\x1b[C":     "right",
@@ -53,8 +56,14 @@ class MouseButton(enum.Enum):
     CTRL_ALT_SHIFT_RIGHT = 30
     SCROLL_UP = 64
     SCROLL_DOWN = 65
+    SCROLL_LEFT = 66
+    SCROLL_RIGHT = 67
+    SHIFT_SCROLL_UP = 68
+    SHIFT_SCROLL_DOWN = 69
     ALT_SCROLL_UP = 72
     ALT_SCROLL_DOWN = 73
+    CTRL_SCROLL_UP = 80
+    CTRL_SCROLL_DOWN = 81
 
     # When initializing through MouseEvent, these should never happen
     # because it stores MOUSE_DRAG separately in MouseEventType
@@ -68,6 +77,9 @@ class MouseButton(enum.Enum):
     CTRL_MIDDLE_DRAG = 49
     CTRL_RIGHT_DRAG = 50
 
+    def scroll(self) -> bool:
+        return 64 <= self.value < 96
+
     def left(self) -> bool:
         return self.value < 64 and self.value & 3 == 0
 
@@ -129,6 +141,8 @@ class MouseEvent:
 
 @contextmanager
 def setcbreak(fd: int) -> Iterator[None]:
+    import termios
+    import tty
     old_settings = termios.tcgetattr(fd)
     try:
         tty.setcbreak(fd)
@@ -148,22 +162,56 @@ def mouse_tracking_enabled() -> Iterator[None]:
         print(DISABLE_MOUSE_TRACKING, end="", flush=True)
 
 
-def listen() -> Generator[MouseEvent | str, None, None]:
-    with setcbreak(sys.stdin.fileno()):
+def read_input(idle_timeout: Callable[[], float | None] | None = None) -> Generator[str, None, None]:
+    """
+    Yields the raw input from stdin: single characters and whole escape sequences. When
+    idle_timeout returns a number of seconds and nothing is input in that time, an empty
+    string is yielded instead, which is the IDLE event.
+    """
+    import codecs
+    import os
+    import select
+    fd = sys.stdin.fileno()
+    # stdin is read without a buffer, so that select() sees all of the input that is left
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    def read_char() -> str:
+        char = ""
+        while not char:
+            byte = os.read(fd, 1)
+            if not byte:
+                raise EOFError
+            char = decoder.decode(byte)
+        return char
+
+    with setcbreak(fd):
         while True:
-            event = sys.stdin.read(1)
-            if event == "\x1b":  # ESC
-                # i think most escape sequences end with alphabetic character?
-                # seems to work fine for now at least
-                while not event[-1].isalpha():
-                    event += sys.stdin.read(1)
-                if event.startswith("\x1b[<"):
-                    yield MouseEvent.parse(event)
-                    continue
-            if event in NAMED_EVENTS:
-                yield NAMED_EVENTS[event]
-            else:
-                yield event
+            timeout = None if idle_timeout is None else idle_timeout()
+            if timeout is not None and not select.select([fd], [], [], timeout)[0]:
+                yield ""
+                continue
+            try:
+                event = read_char()
+                if event == "\x1b":  # ESC
+                    # i think most escape sequences end with alphabetic character?
+                    # seems to work fine for now at least
+                    while not event[-1].isalpha():
+                        event += read_char()
+            except EOFError:
+                return
+            yield event
+
+
+def parse(raw: str) -> MouseEvent | str:
+    if raw.startswith("\x1b[<"):
+        return MouseEvent.parse(raw)
+    return NAMED_EVENTS.get(raw, raw)
+
+
+def listen(raw_input: Iterable[str] | None = None) -> Generator[MouseEvent | str, None, None]:
+    """Yields the events of raw_input (by default read from stdin)"""
+    for raw in read_input() if raw_input is None else raw_input:
+        yield parse(raw)
 
 
 def main() -> int:
@@ -0,0 +1,266 @@
+"""
+Exporting the frames of an animation as an animated GIF or PNG (APNG) file.
+
+The frames come from a snapshot of the animation (see Animation.snapshot), so the editor
+can go on editing while an Export writes them on a thread of its own. The composite of
+each frame is made when it's needed and let go of after the next one, and every frame is
+encoded and written before the next one is made, so exporting takes memory for a couple
+of frames however long the animation is.
+
+It takes two passes over the frames. The first finds the area (the bounding box) of the
+pixels that differ from the frame before, frames that don't differ at all are merged into
+the one before, and for GIF files the colors. The second encodes only those areas, which
+the viewer draws on top of what it showed before. GIF frames share one palette: the
+colors of the animation if there are few enough, otherwise xterm's 256 colors (see
+indexed_colors). Pixels of a GIF frame that didn't change are the transparent index,
+which compresses well, unless the animation itself has transparent pixels: then every
+frame is written whole and cleared after it's shown, since GIF frames can only be drawn
+on top of each other.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from array import array
+from collections.abc import Callable
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import BinaryIO
+from typing import TYPE_CHECKING
+
+from pixediter import terminal
+from pixediter.animation import Animation
+from pixediter.animation import changed_runs
+from pixediter.animation import flatten
+from pixediter.animation import Frame
+from pixediter.formats import gif
+from pixediter.formats import png
+from pixediter.image import ImageData
+
+if TYPE_CHECKING:
+    import threading
+
+GIF_EXTENSIONS = gif.EXTENSIONS
+APNG_EXTENSIONS = (".png", ".apng")
+# the colors a GIF palette has room for next to the transparent index
+MAX_COLORS = 255
+# pixels with less alpha are transparent in GIF files
+GIF_ALPHA_THRESHOLD = 128
+
+Area = tuple[int, int, int, int]
+
+
+class ExportError(ValueError):
+    pass
+
+
+@dataclass
+class Change:
+    """A frame to write: the area (x0, y0, x1, y1) that differs from the frame before and how long it's shown"""
+    index: int
+    area: Area
+    duration: int
+
+
+@dataclass
+class Plan:
+    changes: list[Change]
+    opaque: bool
+    # the pixels of the animation (see _pixels), None if there are more than MAX_COLORS
+    colors: set[int] | None
+
+
+def is_supported(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in GIF_EXTENSIONS + APNG_EXTENSIONS
+
+
+def changed_area(old: ImageData, new: ImageData) -> Area | None:
+    """The bounding box of the pixels that differ between two images of the same size, None if none do"""
+    x0 = y0 = x1 = y1 = -1
+    for y, run_x0, run_x1 in changed_runs(old, new):
+        if y0 < 0:
+            x0, y0, x1 = run_x0, y, run_x1
+        x0, x1, y1 = min(x0, run_x0), max(x1, run_x1), y + 1
+    return None if y0 < 0 else (x0, y0, x1, y1)
+
+
+def plan(
+        count: int,
+        composite: Callable[[int], ImageData],
+        durations: list[int],
+        progress: Callable[[], None] = lambda: None,
+        collect_colors: bool = True
+) -> Plan:
+    """Goes through the frames (composite(i) for each) to find what to write"""
+    changes: list[Change] = []
+    opaque = True
+    colors: set[int] | None = set() if collect_colors else None
+    previous: ImageData | None = None
+    for i in range(count):
+        image = composite(i)
+        area = (0, 0, image.width, image.height) if previous is None else changed_area(previous, image)
+        if area is None:
+            changes[-1].duration += durations[i]
+        else:
+            changes.append(Change(i, area, durations[i]))
+            region = image.region(*area)
+            if opaque and region[3::4].count(255) != len(region) // 4:
+                opaque = False
+            if colors is not None:
+                colors.update(_pixels(region))
+                if len(colors) > MAX_COLORS:
+                    colors = None
+        previous = image
+        progress()
+    return Plan(changes, opaque, colors)
+
+
+def write_apng(
+        f: BinaryIO,
+        width: int,
+        height: int,
+        frames: Plan,
+        composite: Callable[[int], ImageData],
+        progress: Callable[[], None] = lambda: None
+) -> None:
+    writer = png.AnimationWriter(f, width, height, len(frames.changes), frames.opaque)
+    for change in frames.changes:
+        x0, y0, x1, y1 = change.area
+        writer.add_frame(x0, y0, x1 - x0, y1 - y0, composite(change.index).region(x0, y0, x1, y1), change.duration)
+        progress()
+    writer.close()
+
+
+def write_gif(
+        f: BinaryIO,
+        width: int,
+        height: int,
+        frames: Plan,
+        composite: Callable[[int], ImageData],
+        progress: Callable[[], None] = lambda: None
+) -> None:
+    palette, index = _gif_palette(frames.colors)
+    transparent = len(palette)
+    writer = gif.AnimationWriter(f, width, height, palette + [(0, 0, 0)])
+    # pixels of a frame that are the same in the frame before are left transparent
+    previous: ImageData | None = None
+    for change in frames.changes:
+        image = composite(change.index)
+        x0, y0, x1, y1 = change.area
+        if not frames.opaque:
+            x0, y0, x1, y1 = 0, 0, width, height
+        pixels = _pixels(image.region(x0, y0, x1, y1))
+        if previous is None or not frames.opaque:
+            indexes = bytes(
+                transparent if pixel >> 24 < GIF_ALPHA_THRESHOLD else index(pixel)
+                for pixel in pixels
+            )
+        else:
+            before = _pixels(previous.region(x0, y0, x1, y1))
+            indexes = bytes(
+                transparent if pixel == old else index(pixel)
+                for pixel, old in zip(pixels, before)
+            )
+        disposal = gif.KEEP if frames.opaque else gif.RESTORE_BACKGROUND
+        writer.add_frame(x0, y0, x1 - x0, y1 - y0, indexes, change.duration, transparent, disposal)
+        previous = image
+        progress()
+    writer.close()
+
+
+def _pixels(data: bytes) -> Sequence[int]:
+    """RGBA pixels as integers with the red channel in the lowest byte and alpha in the highest"""
+    if sys.byteorder == "little":
+        return memoryview(data).cast("I")
+    pixels = array("I", data)
+    pixels.byteswap()
+    return pixels
+
+
+def _gif_palette(colors: set[int] | None) -> tuple[list[tuple[int, int, int]], Callable[[int], int]]:
+    """The colors of a GIF palette, and a function that maps a pixel to its index"""
+    if colors is not None:
+        opaque = sorted({pixel & 0xFFFFFF for pixel in colors if pixel >> 24 >= GIF_ALPHA_THRESHOLD})
+        palette = [(rgb & 0xFF, rgb >> 8 & 0xFF, rgb >> 16) for rgb in opaque] or [(0, 0, 0)]
+        indexes = {rgb: i for i, rgb in enumerate(opaque)}
+        return palette, lambda pixel: indexes[pixel & 0xFFFFFF]
+    # too many colors: the cube and the grays of xterm's palette, without the 16 colors of the theme
+    from pixediter import indexed_colors
+    xterm = indexed_colors.palette(terminal.COLORS_256)
+    found: dict[int, int] = {}
+
+    def nearest(pixel: int) -> int:
+        i = found.get(pixel)
+        if i is None:
+            i = found[pixel] = xterm.index(pixel & 0xFF, pixel >> 8 & 0xFF, pixel >> 16 & 0xFF) - 16
+        return i
+    return [xterm.colors[i] for i in range(16, 256)], nearest
+
+
+def export(
+        filepath: str,
+        width: int,
+        height: int,
+        frames: list[tuple[Frame, int]],
+        progress: Callable[[], None] = lambda: None
+) -> None:
+    """
+    Writes frames (with their durations, see Animation.snapshot) as an animated GIF or PNG
+    file, calling progress after each frame of both passes
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in GIF_EXTENSIONS + APNG_EXTENSIONS:
+        raise ExportError(f"Can't export animations as {extension or filepath} (use .gif or .png)")
+
+    def composite(i: int) -> ImageData:
+        return flatten(frames[i][0], width, height)
+    plan_ = plan(len(frames), composite, [duration for _, duration in frames], progress, extension in GIF_EXTENSIONS)
+    write = write_gif if extension in GIF_EXTENSIONS else write_apng
+    try:
+        with open(filepath, "wb") as f:
+            write(f, width, height, plan_, composite, progress)
+    except BaseException:
+        # not half a file
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        raise
+
+
+class Export:
+    """Exports the frames of an animation (as they are when it's made) on a thread of its own"""
+
+    def __init__(self, filepath: str, animation: Animation):
+        if not is_supported(filepath):
+            raise ExportError(f"Can't export animations as {filepath} (use .gif or .png)")
+        self.filepath = filepath
+        self.width = animation.live.width
+        self.height = animation.live.height
+        self.frames = animation.snapshot()
+        # both passes go through every frame
+        self.done = 0
+        self.total = 2 * len(self.frames)
+        self.error: Exception | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        import threading
+        self._thread = threading.Thread(target=self._run, name="export", daemon=True)
+        self._thread.start()
+
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait(self) -> None:
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            export(self.filepath, self.width, self.height, self.frames, self._progress)
+        except Exception as error:
+            self.error = error
+        # the frames aren't needed anymore
+        self.frames = []
+
+    def _progress(self) -> None:
+        self.done += 1
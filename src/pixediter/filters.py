@@ -0,0 +1,276 @@
+"""
+Color filters for ImageData.
+
+Filters are parsed from a pipeline string such as "grayscale | contrast 1.2 | posterize 4".
+Each filter is either a per-channel lookup table (LUT) or a channel mixing matrix.
+Before the pipeline is run, adjacent LUTs are composed into a single LUT, adjacent
+matrices are multiplied together, and LUTs surrounding a matrix are folded into the
+matrix's weight and output tables, so that the whole chain runs in one pass over the
+pixel buffer without calling a function per pixel. Chains with matrices are run once for
+each distinct color (pixel art has few of them), other pixels of that color reuse the result.
+"""
+from __future__ import annotations
+
+import sys
+from collections.abc import Callable
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+from pixediter import parallel
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+
+
+IDENTITY = bytes(range(256))
+Matrix = tuple[tuple[float, float, float], tuple[float, float, float], tuple[float, float, float]]
+
+# matrix weights are stored as fixed-point integers with this many fractional bits
+FIXED_POINT_BITS = 16
+# the alpha channel of an RGBA pixel read as a native 32 bit integer
+ALPHA_MASK = 0xFF000000 if sys.byteorder == "little" else 0xFF
+
+
+class FilterError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Lut:
+    """Per-channel lookup tables, each one maps a channel value 0–255 to a new value"""
+    r: bytes = IDENTITY
+    g: bytes = IDENTITY
+    b: bytes = IDENTITY
+
+    @classmethod
+    def uniform(cls, fn: Callable[[int], float]) -> Lut:
+        table = bytes(clamp(round(fn(v))) for v in range(256))
+        return cls(table, table, table)
+
+    def then(self, other: Lut) -> Lut:
+        """Returns a LUT that is equivalent to applying self and then other"""
+        return Lut(self.r.translate(other.r), self.g.translate(other.g), self.b.translate(other.b))
+
+    def is_identity(self) -> bool:
+        return self.r == self.g == self.b == IDENTITY
+
+
+@dataclass(frozen=True)
+class Mix:
+    """Channel mixing: output channel i is the sum of matrix[i][j] * input channel j"""
+    matrix: Matrix
+
+    def then(self, other: Mix) -> Mix:
+        a, b = self.matrix, other.matrix
+        rows = tuple(
+            tuple(sum(b[i][k] * a[k][j] for k in range(3)) for j in range(3))
+            for i in range(3)
+        )
+        return Mix(rows)  # type: ignore[arg-type]
+
+
+Stage = Lut | Mix
+
+
+def clamp(value: int) -> int:
+    return max(0, min(255, value))
+
+
+class MixKernel:
+    """
+    A channel mixing matrix with the LUTs before and after it folded in.
+
+    The input LUTs are baked into per-channel weight tables (weights[out][in][value]) and
+    the output LUTs into a table indexed by the (offset) mixed sum, which also takes care
+    of clamping the result into 0–255.
+    """
+
+    def __init__(self, before: Lut, mix: Mix, after: Lut):
+        one = 1 << FIXED_POINT_BITS
+        self.weights = [
+            [
+                [round(weight * one) * value for value in lut]
+                for weight, lut in zip(row, (before.r, before.g, before.b))
+            ]
+            for row in mix.matrix
+        ]
+        lowest = min(sum(min(0.0, w) for w in row) for row in mix.matrix)
+        highest = max(sum(max(0.0, w) for w in row) for row in mix.matrix)
+        self.low = int(lowest * 255) - 1
+        high = int(highest * 255) + 1
+        self.out = [
+            bytes(lut[clamp(v)] for v in range(self.low, high + 1))
+            for lut in (after.r, after.g, after.b)
+        ]
+
+    def apply(self, r: int, g: int, b: int) -> tuple[int, int, int]:
+        (rr, rg, rb), (gr, gg, gb), (br, bg, bb) = self.weights
+        half = 1 << (FIXED_POINT_BITS - 1)
+        low = self.low
+        out_r, out_g, out_b = self.out
+        return (
+            out_r[((rr[r] + rg[g] + rb[b] + half) >> FIXED_POINT_BITS) - low],
+            out_g[((gr[r] + gg[g] + gb[b] + half) >> FIXED_POINT_BITS) - low],
+            out_b[((br[r] + bg[g] + bb[b] + half) >> FIXED_POINT_BITS) - low],
+        )
+
+
+class Pipeline:
+    def __init__(self, stages: Sequence[Stage], description: str = ""):
+        self.stages = list(stages)
+        self.description = description
+        self.lut, self.kernels = self._fuse(self.stages)
+
+    @staticmethod
+    def _fuse(stages: Sequence[Stage]) -> tuple[Lut | None, list[MixKernel]]:
+        # merge runs of the same kind of stage: LUT, MIX, LUT, MIX, ..., LUT
+        merged: list[Stage] = [Lut()]
+        for stage in stages:
+            last = merged[-1]
+            if isinstance(stage, Lut) and isinstance(last, Lut):
+                merged[-1] = last.then(stage)
+            elif isinstance(stage, Mix) and isinstance(last, Mix):
+                merged[-1] = last.then(stage)
+            else:
+                merged.append(stage)
+        if isinstance(merged[-1], Mix):
+            merged.append(Lut())
+
+        if len(merged) == 1:
+            assert isinstance(merged[0], Lut)
+            return merged[0], []
+
+        # a LUT between two mixes is folded into the output of the first one
+        kernels = []
+        for i in range(1, len(merged), 2):
+            before, mix, after = merged[i - 1], merged[i], merged[i + 1]
+            assert isinstance(before, Lut) and isinstance(mix, Mix) and isinstance(after, Lut)
+            kernels.append(MixKernel(before if i == 1 else Lut(), mix, after))
+        return None, kernels
+
+    def apply(self, data: bytes | bytearray) -> bytes:
+        """Runs the filters on raw RGBA pixel data and returns the filtered data (alpha is kept as is)"""
+        if self.lut is not None:
+            if self.lut.is_identity():
+                return bytes(data)
+            out = bytearray(data)
+            out[0::BYTES_PER_PIXEL] = data[0::BYTES_PER_PIXEL].translate(self.lut.r)
+            out[1::BYTES_PER_PIXEL] = data[1::BYTES_PER_PIXEL].translate(self.lut.g)
+            out[2::BYTES_PER_PIXEL] = data[2::BYTES_PER_PIXEL].translate(self.lut.b)
+            return bytes(out)
+
+        out = bytearray(data)
+        kernels = [kernel.apply for kernel in self.kernels]
+        pixels = memoryview(out).cast("I")
+        # filtered pixels (without alpha) by their color
+        filtered: dict[int, int] = {}
+        for i, pixel in enumerate(pixels):
+            color = pixel & ~ALPHA_MASK
+            new = filtered.get(color)
+            if new is None:
+                offset = i * BYTES_PER_PIXEL
+                r, g, b = data[offset], data[offset + 1], data[offset + 2]
+                for kernel in kernels:
+                    r, g, b = kernel(r, g, b)
+                new = filtered[color] = int.from_bytes(bytes((r, g, b, 0)), sys.byteorder)
+            pixels[i] = new | pixel & ALPHA_MASK
+        pixels.release()
+        return bytes(out)
+
+    def apply_to_image(self, img: ImageData, executor: parallel.TileExecutor | None = None) -> None:
+        """Filters the whole image in place, large images are filtered in parallel"""
+        if executor is None:
+            executor = parallel.default_executor()
+        executor.run(img, _filter_tile, self)
+        img.mark_changed()
+
+
+def _filter_tile(buf: memoryview, start: int, end: int, pipeline: Pipeline) -> None:
+    buf[start:end] = pipeline.apply(bytes(buf[start:end]))
+
+
+def grayscale() -> Stage:
+    luma = (0.299, 0.587, 0.114)
+    return Mix((luma, luma, luma))
+
+
+def sepia() -> Stage:
+    return Mix((
+        (0.393, 0.769, 0.189),
+        (0.349, 0.686, 0.168),
+        (0.272, 0.534, 0.131),
+    ))
+
+
+def saturation(amount: float) -> Stage:
+    lr, lg, lb = (0.299, 0.587, 0.114)
+    s = amount
+    return Mix((
+        (lr + (1 - lr) * s, lg - lg * s, lb - lb * s),
+        (lr - lr * s, lg + (1 - lg) * s, lb - lb * s),
+        (lr - lr * s, lg - lg * s, lb + (1 - lb) * s),
+    ))
+
+
+def invert() -> Stage:
+    return Lut.uniform(lambda v: 255 - v)
+
+
+def brightness(amount: float) -> Stage:
+    return Lut.uniform(lambda v: v + amount)
+
+
+def contrast(amount: float) -> Stage:
+    return Lut.uniform(lambda v: (v - 128) * amount + 128)
+
+
+def gamma(amount: float) -> Stage:
+    if amount <= 0:
+        raise FilterError("gamma has to be positive")
+    return Lut.uniform(lambda v: 255 * (v / 255) ** (1 / amount))
+
+
+def posterize(levels: float) -> Stage:
+    n = int(levels)
+    if n < 2:
+        raise FilterError("posterize needs at least 2 levels")
+    step = 255 / (n - 1)
+    return Lut.uniform(lambda v: round(v / step) * step)
+
+
+def balance(red: float, green: float, blue: float) -> Stage:
+    """Multiplies each channel by the given amount"""
+    def table(multiplier: float) -> bytes:
+        return bytes(clamp(round(v * multiplier)) for v in range(256))
+    return Lut(table(red), table(green), table(blue))
+
+
+FILTERS: dict[str, Callable[..., Stage]] = {
+    "grayscale": grayscale,
+    "sepia": sepia,
+    "saturation": saturation,
+    "invert": invert,
+    "brightness": brightness,
+    "contrast": contrast,
+    "gamma": gamma,
+    "posterize": posterize,
+    "balance": balance,
+}
+
+
+def parse(pipeline: str) -> Pipeline:
+    """Parses a pipeline string like "grayscale | contrast 1.2 | posterize 4" """
+    stages = []
+    for part in pipeline.split("|"):
+        if not part.split():
+            raise FilterError("Empty filter in pipeline")
+        name, *args = part.split()
+        if name not in FILTERS:
+            raise FilterError(f"Unknown filter '{name}' (available: {', '.join(FILTERS)})")
+        try:
+            values = [float(arg) for arg in args]
+            stages.append(FILTERS[name](*values))
+        except TypeError:
+            raise FilterError(f"Wrong number of arguments for filter '{name}'")
+        except ValueError as exc:
+            raise FilterError(f"Invalid arguments for filter '{name}': {exc}")
+    return Pipeline(stages, pipeline.strip())
@@ -0,0 +1,72 @@
+"""
+Native image codecs.
+
+Every codec reads the header of a file eagerly and returns an iterator that decodes the
+image one RGBA row at a time, so a file never needs to be fully decoded in memory before
+its pixels are copied to an ImageData. Formats (or features, like interlaced PNGs) that
+have no native codec are left for Pillow, which is only imported when it is needed (see
+pixediter.formats.pillow).
+"""
+from __future__ import annotations
+
+import mmap
+import os
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import BinaryIO
+
+from pixediter.formats import farbfeld
+from pixediter.formats import pillow
+from pixediter.formats import png
+from pixediter.formats import qoi
+from pixediter.formats.common import UnsupportedImage
+
+
+@dataclass(frozen=True)
+class Codec:
+    name: str
+    magic: bytes
+    extensions: tuple[str, ...]
+    read: Callable[[BinaryIO], tuple[int, int, Iterator[bytes]]]
+    write: Callable[[BinaryIO, int, int, bytes | bytearray | mmap.mmap, bool], None]
+
+
+CODECS = (
+    Codec("PNG", png.MAGIC, png.EXTENSIONS, png.read, png.write),
+    Codec("QOI", qoi.MAGIC, qoi.EXTENSIONS, qoi.read, qoi.write),
+    Codec("farbfeld", farbfeld.MAGIC, farbfeld.EXTENSIONS, farbfeld.read, farbfeld.write),
+)
+
+
+def for_extension(filepath: str) -> Codec | None:
+    extension = os.path.splitext(filepath)[1].lower()
+    return next((codec for codec in CODECS if extension in codec.extensions), None)
+
+
+def read(f: BinaryIO) -> tuple[int, int, Iterator[bytes]]:
+    """
+    Returns the size of the image in f and an iterator of its RGBA pixel data (in
+    chunks of whole rows)
+    """
+    start = f.tell()
+    head = f.read(max(len(codec.magic) for codec in CODECS))
+    f.seek(start)
+    for codec in CODECS:
+        if head.startswith(codec.magic):
+            try:
+                return codec.read(f)
+            except UnsupportedImage:
+                f.seek(start)
+                break
+    return pillow.read(f)
+
+
+def write(filepath: str, width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> None:
+    """Saves RGBA pixel data with a codec chosen by the file extension (without alpha if opaque is True)"""
+    codec = for_extension(filepath)
+    if codec is None:
+        pillow.write(filepath, width, height, data, opaque)
+        return
+    with open(filepath, "wb") as f:
+        codec.write(f, width, height, data, opaque)
@@ -0,0 +1,12 @@
+from __future__ import annotations
+
+# codecs always decode to and encode from RGBA, like ImageData stores its pixels
+BYTES_PER_PIXEL = 4
+
+
+class ImageFormatError(ValueError):
+    """The file is damaged or not in the format it claims to be"""
+
+
+class UnsupportedImage(Exception):
+    """The file is valid but uses a feature the native codec does not implement"""
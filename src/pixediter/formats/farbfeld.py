@@ -0,0 +1,52 @@
+"""
+farbfeld reader and writer, see https://tools.suckless.org/farbfeld/
+
+farbfeld stores every channel as a big-endian 16-bit value. Only the high byte of each
+value is kept when reading, and 8-bit values v are written as v * 257 (both bytes v).
+"""
+from __future__ import annotations
+
+import mmap
+import struct
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from pixediter.formats.common import BYTES_PER_PIXEL
+from pixediter.formats.common import ImageFormatError
+
+MAGIC = b"farbfeld"
+EXTENSIONS = (".ff",)
+
+_HEADER = struct.Struct(">8sII")
+
+
+def read(f: BinaryIO) -> tuple[int, int, Iterator[bytes]]:
+    """
+    Reads the header of a farbfeld file and returns its size and an iterator that
+    decodes the image one RGBA row at a time
+    """
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size or header[:len(MAGIC)] != MAGIC:
+        raise ImageFormatError("Not a farbfeld file")
+    _, width, height = _HEADER.unpack(header)
+    return width, height, _rows(f, width, height)
+
+
+def _rows(f: BinaryIO, width: int, height: int) -> Iterator[bytes]:
+    stride = 2 * width * BYTES_PER_PIXEL
+    for _ in range(height):
+        line = f.read(stride)
+        if len(line) != stride:
+            raise ImageFormatError("farbfeld image data is truncated")
+        yield line[0::2]
+
+
+def write(f: BinaryIO, width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> None:
+    f.write(_HEADER.pack(MAGIC, width, height))
+    stride = width * BYTES_PER_PIXEL
+    for y in range(height):
+        row = data[y * stride:(y + 1) * stride]
+        out = bytearray(2 * stride)
+        out[0::2] = row
+        out[1::2] = row
+        f.write(out)
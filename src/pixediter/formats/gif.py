@@ -0,0 +1,128 @@
+"""
+Animated GIF writer.
+
+GIF images are indexes into a palette of at most 256 colors. The writer has one palette
+for every frame (the global color table) and writes each frame as a rectangle of indexes
+compressed with LZW as soon as it's added, so only one frame is in memory at a time. A
+frame can be drawn on top of the ones before it (KEEP), so it only needs to cover the
+pixels that changed, or the area it covers can be cleared after it is shown
+(RESTORE_BACKGROUND). GIF has no partial transparency, a pixel is either a color of the
+palette or the transparent index.
+
+Reading GIF files is left to Pillow.
+"""
+from __future__ import annotations
+
+import struct
+from typing import BinaryIO
+
+MAGIC = b"GIF89a"
+EXTENSIONS = (".gif",)
+
+# what happens to a frame after it has been shown
+KEEP, RESTORE_BACKGROUND = 1, 2
+
+# the largest code LZW can use
+MAX_CODE = 4095
+
+_SCREEN = struct.Struct("<HHBBB")
+_LOOP = struct.Struct("<BH")
+_CONTROL = struct.Struct("<BHB")
+_DESCRIPTOR = struct.Struct("<HHHHB")
+
+
+def lzw(indexes: bytes, code_size: int) -> bytes:
+    """Compresses indexes of code_size bits (at least 2) with the variable length LZW of GIF"""
+    clear = 1 << code_size
+    end = clear + 1
+    out = bytearray()
+    # codes are packed starting from the lowest bit
+    buffer = clear
+    bits = width = code_size + 1
+    if not indexes:
+        buffer |= end << bits
+        bits += width
+        return bytes(out + buffer.to_bytes(-(-bits // 8), "little"))
+    # (code of the prefix << 8 | next index) -> code of the longer string
+    table: dict[int, int] = {}
+    next_code = end + 1
+    prefix = indexes[0]
+    for index in indexes[1:]:
+        key = prefix << 8 | index
+        code = table.get(key)
+        if code is not None:
+            prefix = code
+            continue
+        buffer |= prefix << bits
+        bits += width
+        if bits >= 32:
+            out += (buffer & 0xFFFFFFFF).to_bytes(4, "little")
+            buffer >>= 32
+            bits -= 32
+        if next_code <= MAX_CODE:
+            table[key] = next_code
+            # the decoder widens its codes when it makes this entry, a code after the encoder
+            if next_code == 1 << width:
+                width += 1
+            next_code += 1
+        else:
+            # the table is full, it starts over
+            buffer |= clear << bits
+            bits += width
+            table.clear()
+            next_code = end + 1
+            width = code_size + 1
+        prefix = index
+    for code in (prefix, end):
+        buffer |= code << bits
+        bits += width
+        if next_code == 1 << width and width < 12:
+            width += 1
+    return bytes(out + buffer.to_bytes(-(-bits // 8), "little"))
+
+
+class AnimationWriter:
+    """Writes an animated GIF with a palette of RGB colors (up to 256) a frame at a time"""
+
+    def __init__(self, f: BinaryIO, width: int, height: int, palette: list[tuple[int, int, int]], loop: int = 0):
+        if not 0 < len(palette) <= 256:
+            raise ValueError(f"A GIF palette has 1 to 256 colors, not {len(palette)}")
+        self.f = f
+        # the size of the color table is a power of two, at least 2
+        self._bits = max(1, (len(palette) - 1).bit_length())
+        table = b"".join(bytes(color) for color in palette)
+        table += bytes(3 * (1 << self._bits) - len(table))
+        f.write(MAGIC)
+        f.write(_SCREEN.pack(width, height, 0x80 | (self._bits - 1) << 4 | (self._bits - 1), 0, 0))
+        f.write(table)
+        # the Netscape extension repeats the animation, loop times or forever (0)
+        f.write(b"!\xff\x0bNETSCAPE2.0\x03" + _LOOP.pack(1, loop) + b"\x00")
+
+    def add_frame(
+            self,
+            x: int,
+            y: int,
+            width: int,
+            height: int,
+            indexes: bytes,
+            duration: int,
+            transparent: int | None = None,
+            disposal: int = KEEP
+    ) -> None:
+        """Adds a frame of width x height indexes at (x, y), shown for duration milliseconds"""
+        flags = disposal << 2 | (transparent is not None)
+        # the delay is in hundredths of a second
+        delay = max(1, round(duration / 10))
+        self.f.write(b"!\xf9\x04" + _CONTROL.pack(flags, delay, transparent or 0) + b"\x00")
+        self.f.write(b"," + _DESCRIPTOR.pack(x, y, width, height, 0))
+        code_size = max(2, self._bits)
+        data = lzw(indexes, code_size)
+        blocks = [bytes((code_size,))]
+        for i in range(0, len(data), 255):
+            block = data[i:i + 255]
+            blocks += [bytes((len(block),)), block]
+        blocks.append(b"\x00")
+        self.f.write(b"".join(blocks))
+
+    def close(self) -> None:
+        self.f.write(b";")
@@ -0,0 +1,82 @@
+"""
+Reading and writing other formats with Pillow.
+
+Images are imported in strips of at most STRIP_SIZE bytes of RGBA data. Uncompressed
+formats (BMP, TGA, PPM, TIFF without compression) are read from the file one strip at a
+time. Compressed formats have to be decoded by Pillow as a whole, but only in their own
+mode (e.g. one byte per pixel for palette images); the conversion to RGBA is done a strip
+at a time, so there is never a second full size copy of the image.
+"""
+from __future__ import annotations
+
+import mmap
+from collections.abc import Iterator
+from typing import Any
+from typing import BinaryIO
+
+from pixediter.formats.common import BYTES_PER_PIXEL
+
+STRIP_SIZE = 1 << 18
+
+# modes that can be decoded without any extra information (like a palette)
+_RAW_MODES = ("1", "L", "LA", "RGB", "RGBA", "RGBX")
+
+
+def read(f: BinaryIO) -> tuple[int, int, Iterator[bytes]]:
+    """Returns the size of the image in f and an iterator of strips of RGBA rows"""
+    from PIL import Image
+    image = Image.open(f)
+    width, height = image.size
+    return width, height, _strips(image, f)
+
+
+def _raw_layout(image: Any) -> tuple[int, str, int, int] | None:
+    """Returns (offset, rawmode, stride, orientation) of uncompressed images, None for anything else"""
+    from PIL import Image
+    if image.mode not in _RAW_MODES or len(image.tile) != 1 or getattr(image, "n_frames", 1) != 1:
+        return None
+    codec, extents, offset, args = image.tile[0]
+    if codec != "raw" or tuple(extents) != (0, 0, *image.size):
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, orientation = (*args, 0, 1)[:3]
+    if stride == 0:
+        try:
+            stride = len(Image.new(image.mode, (image.width, 1)).tobytes("raw", rawmode))
+        except (ValueError, OSError):
+            # no way to tell the size of the rows
+            return None
+    return offset, rawmode, stride, orientation
+
+
+def _strips(image: Any, f: BinaryIO) -> Iterator[bytes]:
+    from PIL import Image
+    width, height = image.size
+    rows = max(1, STRIP_SIZE // (width * BYTES_PER_PIXEL))
+    with image:
+        layout = _raw_layout(image)
+        if layout is None:
+            image.load()
+            for y in range(0, height, rows):
+                yield image.crop((0, y, width, min(height, y + rows))).convert("RGBA").tobytes()
+            return
+
+        offset, rawmode, stride, orientation = layout
+        for y in range(0, height, rows):
+            count = min(rows, height - y)
+            # bottom-up images store the last row first
+            first = y if orientation > 0 else height - y - count
+            f.seek(offset + first * stride)
+            data = f.read(count * stride)
+            strip = Image.frombytes(image.mode, (width, count), data, "raw", rawmode, stride, orientation)
+            yield strip.convert("RGBA").tobytes()
+
+
+def write(filepath: str, width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> None:
+    from PIL import Image
+    image = Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1)
+    if opaque:
+        # not all formats support alpha channel
+        image = image.convert("RGB")
+    image.save(filepath)
@@ -0,0 +1,377 @@
+"""
+PNG reader and writer built on zlib.
+
+Both directions stream: the reader inflates IDAT chunks a piece at a time and yields
+each scanline as soon as it is complete, the writer deflates one scanline at a time.
+Animated PNGs (APNG) are written a frame at a time too: the first frame is the image that
+viewers without APNG support show, the rest go in fdAT chunks, each a rectangle that
+replaces the pixels under it.
+
+Scanline filters are undone a whole row at a time where possible. A row is treated as one
+big integer and bytes are added or subtracted without carrying into their neighbors (see
+_add_bytes), so only the Avg and Paeth filters need a loop over individual bytes. The
+writer only uses the None, Sub and Up filters for the same reason.
+"""
+from __future__ import annotations
+
+import functools
+import mmap
+import struct
+import zlib
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from pixediter.formats.common import BYTES_PER_PIXEL
+from pixediter.formats.common import ImageFormatError
+from pixediter.formats.common import UnsupportedImage
+
+SIGNATURE = b"\x89PNG\r\n\x1a\n"
+MAGIC = SIGNATURE
+EXTENSIONS = (".png",)
+
+# size of the pieces that are inflated or written at once
+CHUNK_SIZE = 1 << 16
+
+_IHDR = struct.Struct(">IIBBBBB")
+_ACTL = struct.Struct(">II")
+_FCTL = struct.Struct(">IIIIIHHBB")
+_SEQUENCE = struct.Struct(">I")
+_CHUNK_HEADER = struct.Struct(">I4s")
+
+GRAY, RGB, PALETTE, GRAY_ALPHA, RGBA = 0, 2, 3, 4, 6
+_CHANNELS = {GRAY: 1, RGB: 3, PALETTE: 1, GRAY_ALPHA: 2, RGBA: 4}
+_BIT_DEPTHS = {GRAY: (1, 2, 4, 8, 16), RGB: (8, 16), PALETTE: (1, 2, 4, 8), GRAY_ALPHA: (8, 16), RGBA: (8, 16)}
+
+FILTER_NONE, FILTER_SUB, FILTER_UP, FILTER_AVG, FILTER_PAETH = range(5)
+
+
+@functools.lru_cache(maxsize=16)
+def _masks(length: int) -> tuple[int, int, int]:
+    """Returns masks with the low 7 bits, the high bit and all bits of length bytes set"""
+    return (
+        int.from_bytes(b"\x7f" * length, "little"),
+        int.from_bytes(b"\x80" * length, "little"),
+        (1 << (8 * length)) - 1,
+    )
+
+
+def _add_bytes(a: int, b: int, length: int) -> int:
+    """Adds the bytes of a and b pairwise, modulo 256"""
+    low, high, _ = _masks(length)
+    return ((a & low) + (b & low)) ^ ((a ^ b) & high)
+
+
+def _sub_bytes(a: int, b: int, length: int) -> int:
+    """Subtracts the bytes of b from the bytes of a pairwise, modulo 256"""
+    low, high, _ = _masks(length)
+    return ((a | high) - (b & low)) ^ ((a ^ ~b) & high)
+
+
+def _unfilter(filter_type: int, line: bytes, prior: bytes, bpp: int) -> bytes:
+    length = len(line)
+    if filter_type == FILTER_NONE:
+        return line
+    if filter_type == FILTER_UP:
+        value = _add_bytes(int.from_bytes(line, "little"), int.from_bytes(prior, "little"), length)
+        return value.to_bytes(length, "little")
+    if filter_type == FILTER_SUB:
+        # prefix sum of every bpp:th byte, doubling the distance on every step
+        full = _masks(length)[2]
+        value = int.from_bytes(line, "little")
+        shift = bpp
+        while shift < length:
+            value = _add_bytes(value, (value << (8 * shift)) & full, length)
+            shift *= 2
+        return value.to_bytes(length, "little")
+    out = bytearray(line)
+    if filter_type == FILTER_AVG:
+        for i in range(bpp):
+            out[i] = (out[i] + (prior[i] >> 1)) & 0xFF
+        for i in range(bpp, length):
+            out[i] = (out[i] + ((out[i - bpp] + prior[i]) >> 1)) & 0xFF
+    elif filter_type == FILTER_PAETH:
+        for i in range(bpp):
+            out[i] = (out[i] + prior[i]) & 0xFF
+        for i in range(bpp, length):
+            a = out[i - bpp]
+            b = prior[i]
+            c = prior[i - bpp]
+            pa = abs(b - c)
+            pb = abs(a - c)
+            pc = abs(a + b - c - c)
+            if pa <= pb and pa <= pc:
+                out[i] = (out[i] + a) & 0xFF
+            elif pb <= pc:
+                out[i] = (out[i] + b) & 0xFF
+            else:
+                out[i] = (out[i] + c) & 0xFF
+    else:
+        raise ImageFormatError(f"Unknown PNG filter type {filter_type}")
+    return bytes(out)
+
+
+def _chunks(f: BinaryIO) -> Iterator[tuple[bytes, bytes]]:
+    while True:
+        header = f.read(_CHUNK_HEADER.size)
+        if len(header) < _CHUNK_HEADER.size:
+            raise ImageFormatError("Unexpected end of PNG file")
+        length, chunk_type = _CHUNK_HEADER.unpack(header)
+        data = f.read(length)
+        crc = f.read(4)
+        if len(data) != length or len(crc) != 4:
+            raise ImageFormatError("Unexpected end of PNG file")
+        if zlib.crc32(data, zlib.crc32(chunk_type)) != int.from_bytes(crc, "big"):
+            raise ImageFormatError(f"Corrupted {chunk_type.decode(errors='replace')} chunk in PNG file")
+        yield chunk_type, data
+        if chunk_type == b"IEND":
+            return
+
+
+def _unpack_table(depth: int) -> list[bytes]:
+    """Returns a table that maps a byte to its samples when there are depth bits per sample"""
+    per_byte = 8 // depth
+    mask = (1 << depth) - 1
+    return [
+        bytes((byte >> (8 - depth * (i + 1))) & mask for i in range(per_byte))
+        for byte in range(256)
+    ]
+
+
+class _Converter:
+    """Converts unfiltered scanlines of any PNG color type to RGBA"""
+
+    def __init__(self, width: int, depth: int, color_type: int, palette: bytes, transparency: bytes | None):
+        self.width = width
+        self.depth = depth
+        self.color_type = color_type
+        self.unpack = _unpack_table(depth) if depth < 8 else None
+        self.key: bytes | None = None
+        if color_type == PALETTE:
+            if not palette:
+                raise ImageFormatError("PNG file is missing its palette")
+            count = len(palette) // 3
+            alphas = (transparency or b"")[:count]
+            alphas += b"\xff" * (count - len(alphas))
+            # indexes outside of the palette become transparent black
+            self.tables = [
+                bytes(palette[i * 3 + channel] for i in range(count)) + bytes(256 - count)
+                for channel in range(3)
+            ] + [alphas + bytes(256 - count)]
+        elif transparency is not None:
+            if depth == 16:
+                raise UnsupportedImage("16-bit PNG images with a transparent color key are not supported")
+            if color_type == GRAY:
+                gray = struct.unpack(">H", transparency[:2])[0] * (255 // ((1 << depth) - 1))
+                self.key = bytes((gray, gray, gray, 255))
+            elif color_type == RGB:
+                self.key = bytes(struct.unpack(">HHH", transparency[:6])) + b"\xff"
+        # scales gray samples with less than 8 bits to the full range
+        self.scale = bytes(min(255, v * (255 // ((1 << depth) - 1))) for v in range(256)) if depth < 8 else None
+
+    def __call__(self, line: bytes) -> bytes:
+        if self.depth == 16:
+            # only the most significant byte of each sample is kept
+            line = line[0::2]
+        elif self.unpack is not None:
+            line = b"".join(map(self.unpack.__getitem__, line))[:self.width]
+            if self.color_type == GRAY and self.scale is not None:
+                line = line.translate(self.scale)
+
+        color_type = self.color_type
+        if color_type == RGBA:
+            return line
+        out = bytearray(self.width * BYTES_PER_PIXEL)
+        if color_type == PALETTE:
+            for channel, table in enumerate(self.tables):
+                out[channel::BYTES_PER_PIXEL] = line.translate(table)
+            return bytes(out)
+        if color_type == RGB:
+            out[0::4] = line[0::3]
+            out[1::4] = line[1::3]
+            out[2::4] = line[2::3]
+            out[3::4] = b"\xff" * self.width
+        elif color_type == GRAY:
+            out[0::4] = out[1::4] = out[2::4] = line
+            out[3::4] = b"\xff" * self.width
+        else:
+            gray = line[0::2]
+            out[0::4] = out[1::4] = out[2::4] = gray
+            out[3::4] = line[1::2]
+        if self.key is not None:
+            i = out.find(self.key)
+            while i != -1:
+                if i % BYTES_PER_PIXEL == 0:
+                    out[i + 3] = 0
+                i = out.find(self.key, i + 1)
+        return bytes(out)
+
+
+def read(f: BinaryIO) -> tuple[int, int, Iterator[bytes]]:
+    """
+    Reads the header of a PNG file and returns its size and an iterator that decodes
+    the image one RGBA row at a time
+    """
+    if f.read(len(SIGNATURE)) != SIGNATURE:
+        raise ImageFormatError("Not a PNG file")
+    chunks = _chunks(f)
+    chunk_type, data = next(chunks)
+    if chunk_type != b"IHDR" or len(data) != _IHDR.size:
+        raise ImageFormatError("PNG file does not start with a header")
+    width, height, depth, color_type, compression, filter_method, interlace = _IHDR.unpack(data)
+    if depth not in _BIT_DEPTHS.get(color_type, ()) or compression != 0 or filter_method != 0:
+        raise ImageFormatError("Invalid PNG header")
+    if interlace != 0:
+        raise UnsupportedImage("Interlaced PNG images are not supported")
+
+    palette = b""
+    transparency = None
+    for chunk_type, data in chunks:
+        if chunk_type == b"PLTE":
+            palette = data
+        elif chunk_type == b"tRNS":
+            transparency = data
+        elif chunk_type == b"IDAT":
+            break
+        elif chunk_type == b"IEND":
+            raise ImageFormatError("PNG file has no image data")
+
+    bits_per_pixel = _CHANNELS[color_type] * depth
+    stride = (width * bits_per_pixel + 7) // 8
+    bpp = max(1, bits_per_pixel // 8)
+    convert = _Converter(width, depth, color_type, palette, transparency)
+    return width, height, _rows(chunks, data, height, stride, bpp, convert)
+
+
+def _rows(
+    chunks: Iterator[tuple[bytes, bytes]],
+    first: bytes,
+    height: int,
+    stride: int,
+    bpp: int,
+    convert: _Converter,
+) -> Iterator[bytes]:
+    inflate = zlib.decompressobj()
+    buf = bytearray()
+    prior = bytes(stride)
+    y = 0
+
+    def complete_rows() -> Iterator[bytes]:
+        nonlocal prior, y
+        pos = 0
+        while len(buf) - pos > stride and y < height:
+            line = _unfilter(buf[pos], bytes(buf[pos + 1:pos + 1 + stride]), prior, bpp)
+            pos += stride + 1
+            prior = line
+            y += 1
+            yield convert(line)
+        del buf[:pos]
+
+    idat: bytes | None = first
+    while idat is not None:
+        pending = idat
+        while pending:
+            buf.extend(inflate.decompress(pending, CHUNK_SIZE))
+            pending = inflate.unconsumed_tail
+            yield from complete_rows()
+        idat = None
+        for chunk_type, data in chunks:
+            if chunk_type == b"IDAT":
+                idat = data
+                break
+    buf.extend(inflate.flush())
+    yield from complete_rows()
+    if y < height:
+        raise ImageFormatError("PNG image data is truncated")
+
+
+def _write_chunk(f: BinaryIO, chunk_type: bytes, data: bytes) -> None:
+    f.write(_CHUNK_HEADER.pack(len(data), chunk_type))
+    f.write(data)
+    f.write(zlib.crc32(data, zlib.crc32(chunk_type)).to_bytes(4, "big"))
+
+
+def _filtered(line: bytes, prior: int, bpp: int) -> bytes:
+    """Filters line with whichever of None, Sub and Up leaves the most zero bytes"""
+    length = len(line)
+    value = int.from_bytes(line, "little")
+    full = _masks(length)[2]
+    candidates = [
+        bytes((FILTER_NONE,)) + line,
+        bytes((FILTER_SUB,)) + _sub_bytes(value, (value << (8 * bpp)) & full, length).to_bytes(length, "little"),
+        bytes((FILTER_UP,)) + _sub_bytes(value, prior, length).to_bytes(length, "little"),
+    ]
+    return max(candidates, key=lambda candidate: candidate.count(0))
+
+
+def _image_data(width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> Iterator[bytes]:
+    """Filters and deflates RGBA pixel data, returns it in pieces of at least CHUNK_SIZE bytes (but the last)"""
+    bpp = 3 if opaque else 4
+    deflate = zlib.compressobj()
+    pending = bytearray()
+    prior = 0
+    stride = width * BYTES_PER_PIXEL
+    for y in range(height):
+        line = bytes(data[y * stride:(y + 1) * stride])
+        if opaque:
+            rgb = bytearray(width * 3)
+            rgb[0::3] = line[0::4]
+            rgb[1::3] = line[1::4]
+            rgb[2::3] = line[2::4]
+            line = bytes(rgb)
+        pending += deflate.compress(_filtered(line, prior, bpp))
+        prior = int.from_bytes(line, "little")
+        if len(pending) >= CHUNK_SIZE:
+            yield bytes(pending)
+            pending.clear()
+    pending += deflate.flush()
+    yield bytes(pending)
+
+
+def write(f: BinaryIO, width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> None:
+    """Writes RGBA pixel data as a PNG file (without the alpha channel if opaque is True)"""
+    f.write(SIGNATURE)
+    _write_chunk(f, b"IHDR", _IHDR.pack(width, height, 8, RGB if opaque else RGBA, 0, 0, 0))
+    for piece in _image_data(width, height, data, opaque):
+        _write_chunk(f, b"IDAT", piece)
+    _write_chunk(f, b"IEND", b"")
+
+
+class AnimationWriter:
+    """Writes an animated PNG of frame_count frames a frame at a time (without the alpha channel if opaque is True)"""
+
+    def __init__(self, f: BinaryIO, width: int, height: int, frame_count: int, opaque: bool, loop: int = 0):
+        self.f = f
+        self.width = width
+        self.height = height
+        self.frame_count = frame_count
+        self.opaque = opaque
+        self._frames = 0
+        # fcTL and fdAT chunks are numbered
+        self._sequence = 0
+        f.write(SIGNATURE)
+        _write_chunk(f, b"IHDR", _IHDR.pack(width, height, 8, RGB if opaque else RGBA, 0, 0, 0))
+        _write_chunk(f, b"acTL", _ACTL.pack(frame_count, loop))
+
+    def add_frame(self, x: int, y: int, width: int, height: int, data: bytes, duration: int) -> None:
+        """Adds RGBA pixel data of width x height pixels at (x, y), shown for duration milliseconds"""
+        if self._frames == self.frame_count:
+            raise ValueError(f"The animation has only {self.frame_count} frames")
+        if self._frames == 0 and (x, y, width, height) != (0, 0, self.width, self.height):
+            raise ValueError("The first frame of an animated PNG covers the whole image")
+        # the delay is in milliseconds, the area isn't cleared after the frame and the next frame replaces its pixels
+        _write_chunk(self.f, b"fcTL", _FCTL.pack(self._next(), width, height, x, y, duration, 1000, 0, 0))
+        for piece in _image_data(width, height, data, self.opaque):
+            if self._frames == 0:
+                _write_chunk(self.f, b"IDAT", piece)
+            else:
+                _write_chunk(self.f, b"fdAT", _SEQUENCE.pack(self._next()) + piece)
+        self._frames += 1
+
+    def close(self) -> None:
+        if self._frames != self.frame_count:
+            raise ValueError(f"The animation has {self.frame_count} frames, {self._frames} were added")
+        _write_chunk(self.f, b"IEND", b"")
+
+    def _next(self) -> int:
+        self._sequence += 1
+        return self._sequence - 1
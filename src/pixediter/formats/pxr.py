@@ -0,0 +1,155 @@
+"""
+Raw canvas files (.pxr), made for opening huge canvases instantly.
+
+The pixels are stored uncompressed, exactly like ImageData stores them, starting at a
+page boundary. The file is memory mapped and the mapping is used as the pixel data of
+the image: opening takes the same time no matter how large the canvas is, a page is only
+read from the disk when something (usually the viewport) touches it, and edits go back
+to the file through the mapping. Saving to the file the image was opened from only
+flushes the pages that have changed since the last save.
+
+The header (little-endian) has the magic, version, mode, width, height, number of
+palette entries and the offset of the pixel data, and is followed by the palette as
+RGBA entries. Indexed canvases store a palette index per pixel; they have to be
+converted to RGBA, so they are read into memory instead of being mapped.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+import weakref
+
+from pixediter.formats.common import BYTES_PER_PIXEL
+from pixediter.formats.common import ImageFormatError
+from pixediter.image import ImageData
+
+MAGIC = b"PXRCANV\0"
+EXTENSIONS = (".pxr",)
+VERSION = 1
+
+MODE_RGBA = 0
+MODE_INDEXED = 1
+
+_HEADER = struct.Struct("<8sBBIIHI")
+
+
+class _Mapping:
+    """Keeps track of the pages of a mapped image that have changed since the last flush"""
+
+    def __init__(self, img: ImageData, buffer: mmap.mmap, filepath: str):
+        # the image refers to this through its change listener, so only a weak reference back
+        self.image = weakref.ref(img)
+        self.buffer = buffer
+        self.path = os.path.realpath(filepath)
+        self.dirty_pages: set[int] = set()
+        img.add_change_listener(self.on_change)
+
+    def attached(self, img: ImageData) -> bool:
+        """Whether the pixels of img are still the mapped file (transforms replace them)"""
+        return img.data is self.buffer
+
+    def on_change(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        img = self.image()
+        if img is None or not self.attached(img) or x0 >= x1 or y0 >= y1:
+            return
+        stride = img.width * BYTES_PER_PIXEL
+        if x0 == 0 and x1 == img.width:
+            spans = [(y0 * stride, y1 * stride)]
+        else:
+            spans = [(y * stride + x0 * BYTES_PER_PIXEL, y * stride + x1 * BYTES_PER_PIXEL) for y in range(y0, y1)]
+        for start, end in spans:
+            self.dirty_pages.update(range(start // mmap.PAGESIZE, (end - 1) // mmap.PAGESIZE + 1))
+
+    def flush(self) -> None:
+        """Writes the changed pages to the disk, consecutive pages with a single call"""
+        pages = sorted(self.dirty_pages)
+        i = 0
+        while i < len(pages):
+            first = pages[i]
+            while i + 1 < len(pages) and pages[i + 1] == pages[i] + 1:
+                i += 1
+            start = first * mmap.PAGESIZE
+            end = min(len(self.buffer), (pages[i] + 1) * mmap.PAGESIZE)
+            self.buffer.flush(start, end - start)
+            i += 1
+        self.dirty_pages.clear()
+
+
+# images whose pixels are a mapped file
+_mappings: weakref.WeakKeyDictionary[ImageData, _Mapping] = weakref.WeakKeyDictionary()
+
+
+def _data_offset(palette_size: int) -> int:
+    """Offset of the pixel data: the first page boundary after the header and palette"""
+    end = _HEADER.size + palette_size * BYTES_PER_PIXEL
+    return -(-end // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY
+
+
+def load(filepath: str) -> ImageData:
+    """Opens a raw canvas file, mapping RGBA canvases to memory instead of reading them"""
+    # read-only files are mapped copy-on-write, their edits stay in memory
+    writable = os.access(filepath, os.W_OK)
+    with open(filepath, "r+b" if writable else "rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ImageFormatError(f"'{filepath}' is not a raw canvas file")
+        _, version, mode, width, height, palette_size, offset = _HEADER.unpack(header)
+        if version != VERSION or mode not in (MODE_RGBA, MODE_INDEXED):
+            raise ImageFormatError(f"Unsupported raw canvas version {version} or mode {mode}")
+        palette = f.read(palette_size * BYTES_PER_PIXEL)
+        size = width * height * (BYTES_PER_PIXEL if mode == MODE_RGBA else 1)
+        if len(palette) != palette_size * BYTES_PER_PIXEL or os.fstat(f.fileno()).st_size < offset + size:
+            raise ImageFormatError("Raw canvas data is truncated")
+
+        if mode == MODE_INDEXED:
+            f.seek(offset)
+            return ImageData(width, height, filepath, _unpalette(f.read(size), palette))
+        if offset % mmap.ALLOCATIONGRANULARITY != 0:
+            # can't be mapped on this system
+            f.seek(offset)
+            return ImageData(width, height, filepath, bytearray(f.read(size)))
+
+        access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_COPY
+        buffer = mmap.mmap(f.fileno(), size, access=access, offset=offset)
+    img = ImageData(width, height, filepath, buffer)
+    if writable:
+        _mappings[img] = _Mapping(img, buffer, filepath)
+    return img
+
+
+def _unpalette(indices: bytes, palette: bytes) -> bytearray:
+    """Converts palette indices to RGBA pixels (missing entries are transparent)"""
+    out = bytearray(len(indices) * BYTES_PER_PIXEL)
+    padded = palette.ljust(256 * BYTES_PER_PIXEL, b"\0")
+    for channel in range(BYTES_PER_PIXEL):
+        out[channel::BYTES_PER_PIXEL] = indices.translate(padded[channel::BYTES_PER_PIXEL])
+    return out
+
+
+def save(img: ImageData, filepath: str) -> None:
+    """
+    Saves img as a raw canvas. If img is mapped from filepath only the changed pages are
+    flushed; an image that is mapped from another file is mapped from filepath afterwards.
+    """
+    mapping = _mappings.get(img)
+    if mapping is not None and mapping.attached(img) and mapping.path == os.path.realpath(filepath):
+        mapping.flush()
+        return
+
+    with open(filepath, "wb") as f:
+        offset = _data_offset(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, MODE_RGBA, img.width, img.height, 0, offset))
+        f.seek(offset)
+        f.write(img.data)
+
+    if mapping is not None:
+        # follow the canvas to its new file, edits should not keep changing the old one
+        del _mappings[img]
+        img.on_change_listeners.remove(mapping.on_change)
+        if mapping.attached(img):
+            mapping.flush()
+            with open(filepath, "r+b") as f:
+                img.data = mmap.mmap(f.fileno(), len(mapping.buffer), offset=offset)
+            _mappings[img] = _Mapping(img, img.data, filepath)
+        mapping.buffer.close()
@@ -0,0 +1,152 @@
+"""
+QOI ("Quite OK Image format") reader and writer, see https://qoiformat.org/qoi-specification.pdf
+"""
+from __future__ import annotations
+
+import mmap
+import struct
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from pixediter.formats.common import BYTES_PER_PIXEL
+from pixediter.formats.common import ImageFormatError
+
+MAGIC = b"qoif"
+EXTENSIONS = (".qoi",)
+
+CHUNK_SIZE = 1 << 16
+
+_HEADER = struct.Struct(">4sIIBB")
+_END = b"\0" * 7 + b"\1"
+# the longest operation is QOI_OP_RGBA: a tag and four bytes
+_MAX_OP_SIZE = 5
+
+OP_INDEX = 0x00
+OP_DIFF = 0x40
+OP_LUMA = 0x80
+OP_RUN = 0xC0
+OP_RGB = 0xFE
+OP_RGBA = 0xFF
+MAX_RUN = 62
+
+
+def read(f: BinaryIO) -> tuple[int, int, Iterator[bytes]]:
+    """
+    Reads the header of a QOI file and returns its size and an iterator that decodes
+    the image one RGBA row at a time
+    """
+    header = f.read(_HEADER.size)
+    if len(header) != _HEADER.size:
+        raise ImageFormatError("Not a QOI file")
+    magic, width, height, channels, colorspace = _HEADER.unpack(header)
+    if magic != MAGIC or channels not in (3, 4) or colorspace not in (0, 1):
+        raise ImageFormatError("Not a QOI file")
+    return width, height, _rows(f, width, height)
+
+
+def _rows(f: BinaryIO, width: int, height: int) -> Iterator[bytes]:
+    buf = f.read(CHUNK_SIZE)
+    pos = 0
+    index = [(0, 0, 0, 0)] * 64
+    r, g, b, a = 0, 0, 0, 255
+    run = 0
+    # an operation cut off by the end of the file reads past the buffer, which is only checked here
+    # rather than before every operation
+    try:
+        for _ in range(height):
+            row = bytearray(width * BYTES_PER_PIXEL)
+            for i in range(0, len(row), BYTES_PER_PIXEL):
+                if run:
+                    run -= 1
+                else:
+                    if len(buf) - pos < _MAX_OP_SIZE:
+                        buf = buf[pos:] + f.read(CHUNK_SIZE)
+                        pos = 0
+                        if not buf:
+                            raise ImageFormatError("QOI image data is truncated")
+                    tag = buf[pos]
+                    if tag == OP_RGB:
+                        r, g, b = buf[pos + 1], buf[pos + 2], buf[pos + 3]
+                        pos += 4
+                    elif tag == OP_RGBA:
+                        r, g, b, a = buf[pos + 1], buf[pos + 2], buf[pos + 3], buf[pos + 4]
+                        pos += 5
+                    else:
+                        op = tag & 0xC0
+                        if op == OP_INDEX:
+                            r, g, b, a = index[tag]
+                            pos += 1
+                        elif op == OP_DIFF:
+                            r = (r + ((tag >> 4) & 3) - 2) & 0xFF
+                            g = (g + ((tag >> 2) & 3) - 2) & 0xFF
+                            b = (b + (tag & 3) - 2) & 0xFF
+                            pos += 1
+                        elif op == OP_LUMA:
+                            dg = (tag & 0x3F) - 32
+                            second = buf[pos + 1]
+                            r = (r + dg - 8 + (second >> 4)) & 0xFF
+                            g = (g + dg) & 0xFF
+                            b = (b + dg - 8 + (second & 0x0F)) & 0xFF
+                            pos += 2
+                        else:
+                            run = tag & 0x3F
+                            pos += 1
+                    index[(r * 3 + g * 5 + b * 7 + a * 11) % 64] = (r, g, b, a)
+                row[i] = r
+                row[i + 1] = g
+                row[i + 2] = b
+                row[i + 3] = a
+            yield bytes(row)
+    except IndexError:
+        raise ImageFormatError("QOI image data is truncated") from None
+
+
+def write(f: BinaryIO, width: int, height: int, data: bytes | bytearray | mmap.mmap, opaque: bool) -> None:
+    f.write(_HEADER.pack(MAGIC, width, height, 3 if opaque else 4, 0))
+    out = bytearray()
+    # pixels are compared as whole 32-bit values, channels are only looked at when they change
+    pixels = memoryview(data).cast("I")
+    # transparent black is 0 regardless of byte order, like the initial value of the index
+    index = [0] * 64
+    previous = memoryview(bytes((0, 0, 0, 255))).cast("I")[0]
+    pr, pg, pb, pa = 0, 0, 0, 255
+    run = 0
+    for i, px in enumerate(pixels):
+        if px == previous:
+            run += 1
+            if run == MAX_RUN:
+                out.append(OP_RUN | (run - 1))
+                run = 0
+            continue
+        if run:
+            out.append(OP_RUN | (run - 1))
+            run = 0
+        r, g, b, a = data[i * BYTES_PER_PIXEL:(i + 1) * BYTES_PER_PIXEL]
+        h = (r * 3 + g * 5 + b * 7 + a * 11) % 64
+        if index[h] == px:
+            out.append(OP_INDEX | h)
+        else:
+            index[h] = px
+            if a == pa:
+                dr = ((r - pr + 128) & 0xFF) - 128
+                dg = ((g - pg + 128) & 0xFF) - 128
+                db = ((b - pb + 128) & 0xFF) - 128
+                dr_dg = dr - dg
+                db_dg = db - dg
+                if -3 < dr < 2 and -3 < dg < 2 and -3 < db < 2:
+                    out.append(OP_DIFF | (dr + 2) << 4 | (dg + 2) << 2 | (db + 2))
+                elif -33 < dg < 32 and -9 < dr_dg < 8 and -9 < db_dg < 8:
+                    out += bytes((OP_LUMA | (dg + 32), (dr_dg + 8) << 4 | (db_dg + 8)))
+                else:
+                    out += bytes((OP_RGB, r, g, b))
+            else:
+                out += bytes((OP_RGBA, r, g, b, a))
+        previous = px
+        pr, pg, pb, pa = r, g, b, a
+        if len(out) >= CHUNK_SIZE:
+            f.write(out)
+            out.clear()
+    if run:
+        out.append(OP_RUN | (run - 1))
+    out += _END
+    f.write(out)
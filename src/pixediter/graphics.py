@@ -0,0 +1,148 @@
+"""
+Showing images in terminals that can draw pixels: the kitty graphics protocol and sixel.
+
+With the kitty protocol the image is transmitted once and stays in the terminal's memory,
+where parts of it can be replaced (by editing its first animation frame) and any part of
+it can be placed on the screen. The pixels are sent as compressed RGBA.
+
+Sixel images are drawn into the cells like text and are overwritten like text, so every
+part is sent again whenever the cells have been painted over. Sixel uses a palette of at
+most 256 colors and it has no transparency here: translucent pixels are blended on top
+of black like in the minimap.
+"""
+from __future__ import annotations
+
+import base64
+import zlib
+from collections.abc import Iterable
+
+from pixediter import terminal
+from pixediter.image import BYTES_PER_PIXEL
+
+# the payload of a kitty graphics command is sent in chunks of at most this many bytes
+KITTY_CHUNK_SIZE = 4096
+SIXEL_MAX_COLORS = 256
+
+
+class GraphicsError(ValueError):
+    pass
+
+
+def protocol(supported: Iterable[str]) -> str:
+    """The way to show images that the terminal supports, the kitty protocol if it supports both"""
+    supported = frozenset(supported)
+    for name in terminal.GRAPHICS:
+        if name in supported:
+            return name
+    raise GraphicsError(
+        "The terminal can't show images (kitty graphics or sixel), "
+        f"set {terminal.FEATURES_VARIABLE} if it can"
+    )
+
+
+def kitty_command(control: dict[str, int | str], payload: bytes = b"") -> str:
+    """Returns the escape sequences of a kitty graphics command, the payload split into chunks"""
+    keys = ",".join(f"{key}={value}" for key, value in control.items())
+    encoded = base64.standard_b64encode(payload).decode()
+    if len(encoded) <= KITTY_CHUNK_SIZE:
+        return f"\x1b_G{keys};{encoded}\x1b\\"
+    chunks = [encoded[i:i + KITTY_CHUNK_SIZE] for i in range(0, len(encoded), KITTY_CHUNK_SIZE)]
+    # only the first chunk has the keys, m=1 tells that more chunks follow
+    parts = [f"\x1b_G{keys},m=1;{chunks[0]}\x1b\\"]
+    parts += [f"\x1b_Gm=1;{chunk}\x1b\\" for chunk in chunks[1:-1]]
+    parts.append(f"\x1b_Gm=0;{chunks[-1]}\x1b\\")
+    return "".join(parts)
+
+
+class KittyImage:
+    """An image kept in the memory of a terminal that supports the kitty graphics protocol"""
+
+    def __init__(self, image_id: int):
+        self.image_id = image_id
+
+    def transmit(self, width: int, height: int, rgba: bytes) -> str:
+        # q=2 keeps the terminal from answering, the answers would end up in the input
+        return kitty_command(
+            {"a": "t", "f": 32, "o": "z", "s": width, "v": height, "i": self.image_id, "q": 2},
+            zlib.compress(rgba),
+        )
+
+    def edit(self, x: int, y: int, width: int, height: int, rgba: bytes) -> str:
+        """Replaces an area of the image, its placements show the change"""
+        return kitty_command(
+            {"a": "f", "r": 1, "f": 32, "o": "z", "x": x, "y": y, "s": width, "v": height,
+             "i": self.image_id, "q": 2},
+            zlib.compress(rgba),
+        )
+
+    def place(self, x: int, y: int, width: int, height: int) -> str:
+        """Shows the area of the image at the cursor at its natural size, replacing where it was shown before"""
+        # C=1 leaves the cursor where it was
+        return kitty_command(
+            {"a": "p", "i": self.image_id, "p": 1, "x": x, "y": y, "w": width, "h": height, "C": 1, "q": 2}
+        )
+
+    def delete(self) -> str:
+        """Removes the image from the screen and frees its memory"""
+        return kitty_command({"a": "d", "d": "I", "i": self.image_id, "q": 2})
+
+
+def sixel(width: int, height: int, rgba: bytes) -> str:
+    """Returns a sixel image of the pixels, at most SIXEL_MAX_COLORS colors (more are rounded)"""
+    pixels = []
+    for i in range(0, len(rgba), BYTES_PER_PIXEL):
+        r, g, b, a = rgba[i:i + BYTES_PER_PIXEL]
+        if a != 255:
+            r, g, b = (r * a + 127) // 255, (g * a + 127) // 255, (b * a + 127) // 255
+        pixels.append((r, g, b))
+    palette = sorted(set(pixels))
+    if len(palette) > SIXEL_MAX_COLORS:
+        # 6 levels of each channel, the usual 216 color cube
+        pixels = [(r // 51 * 51, g // 51 * 51, b // 51 * 51) for r, g, b in pixels]
+        palette = sorted(set(pixels))
+    register = {color: i for i, color in enumerate(palette)}
+    # the raster attributes give the size, P2=1 leaves the pixels that aren't set alone
+    parts = [f'\x1bP0;1;0q"1;1;{width};{height}']
+    # the channels are given in percent
+    parts += [
+        f"#{i};2;{(r * 100 + 127) // 255};{(g * 100 + 127) // 255};{(b * 100 + 127) // 255}"
+        for i, (r, g, b) in enumerate(palette)
+    ]
+    bands = []
+    for band in range(0, height, 6):
+        rows = range(band, min(band + 6, height))
+        # the bits of each column for each color of the band, a bit for each of the six rows
+        columns: dict[int, list[int]] = {}
+        for bit, y in enumerate(rows):
+            for x in range(width):
+                color = register[pixels[y * width + x]]
+                if color not in columns:
+                    columns[color] = [0] * width
+                columns[color][x] |= 1 << bit
+        lines = []
+        for color, bits in columns.items():
+            lines.append(f"#{color}{_sixel_runs(bits)}")
+        # $ goes back to the start of the band for the next color
+        bands.append("$".join(lines))
+    # - moves to the next band
+    parts.append("-".join(bands))
+    parts.append("\x1b\\")
+    return "".join(parts)
+
+
+def _sixel_runs(bits: list[int]) -> str:
+    """The sixel characters of a line, runs of the same character compressed"""
+    # the columns after the last set pixel can be left out
+    end = len(bits)
+    while end and bits[end - 1] == 0:
+        end -= 1
+    out = []
+    i = 0
+    while i < end:
+        j = i
+        while j < end and bits[j] == bits[i]:
+            j += 1
+        char = chr(63 + bits[i])
+        out.append(f"!{j - i}{char}" if j - i > 3 else char * (j - i))
+        i = j
+    return "".join(out)
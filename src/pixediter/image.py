@@ -1,44 +1,76 @@
 from __future__ import annotations
 
-import os
+import mmap
+from collections.abc import Callable
 from collections.abc import Generator
 
+from pixediter import blending
 from pixediter import colors
 from pixediter.colors import Color
 
 
 Pos = tuple[int, int]
+# called with the changed area (x0, y0, x1, y1), x1 and y1 exclusive
+ChangeListener = Callable[[int, int, int, int], None]
 
+# pixels are stored as consecutive R, G, B, A bytes, one row after another
+BYTES_PER_PIXEL = 4
+# raw canvas files are memory mapped and used as the pixel data directly
+PixelBuffer = bytearray | mmap.mmap
 
-class NoFilePathException(Exception):
-    pass
+RAW_CANVAS_EXTENSION = ".pxr"
 
 
-class TooBigImageException(Exception):
+class NoFilePathException(Exception):
     pass
 
 
 class ImageData:
-    def __init__(self, width: int = 16, height: int = 16, filepath: str | None = None):
+    def __init__(
+            self,
+            width: int = 16,
+            height: int = 16,
+            filepath: str | None = None,
+            data: PixelBuffer | None = None
+    ):
         self.width = width
         self.height = height
         self.filepath = filepath
-        self.pixels = [[colors.WHITE for w in range(width)] for h in range(height)]
+        if data is None:
+            # repeating a bytearray allocates the pixel data only once
+            data = bytearray(bytes(colors.WHITE.rgba())) * (width * height)
+        elif len(data) != width * height * BYTES_PER_PIXEL:
+            raise ValueError("Pixel data does not match the size of the image")
+        self.data: PixelBuffer = data
+        self.on_change_listeners: list[ChangeListener] = []
+
+    def add_change_listener(self, fn: ChangeListener) -> None:
+        self.on_change_listeners.append(fn)
+
+    def mark_changed(self, x0: int = 0, y0: int = 0, x1: int | None = None, y1: int | None = None) -> None:
+        """Notifies listeners that pixels in the given area (by default the whole image) have changed"""
+        if x1 is None:
+            x1 = self.width
+        if y1 is None:
+            y1 = self.height
+        for fn in self.on_change_listeners:
+            fn(x0, y0, x1, y1)
 
     @classmethod
     def from_file(cls, filepath: str) -> ImageData:
-        from PIL import Image
-        with Image.open(filepath) as image:
-            rgb_image = image.convert("RGB")
-            width, height = rgb_image.size
-            terminal_width, terminal_height = os.get_terminal_size()
-            if 2 * width > terminal_width or height > terminal_height:
-                raise TooBigImageException("Images larger than the current terminal size are not yet supported")
+        if filepath.endswith(RAW_CANVAS_EXTENSION):
+            from pixediter.formats import pxr
+            return pxr.load(filepath)
+
+        from pixediter import formats
+        with open(filepath, "rb") as f:
+            width, height, chunks = formats.read(f)
             new = cls(width, height, filepath)
-            for x in range(width):
-                for y in range(height):
-                    r, g, b = rgb_image.getpixel((x, y))
-                    new[x, y] = Color(r, g, b)
+            # decoded pixels are copied straight into place, a chunk at a time
+            pos = 0
+            for chunk in chunks:
+                new.data[pos:pos + len(chunk)] = chunk
+                pos += len(chunk)
         return new
 
     def save_file(self, filepath: str | None = None) -> None:
@@ -47,33 +79,44 @@ class ImageData:
                 raise NoFilePathException("Unable to save: file path not given")
             filepath = self.filepath
 
-        from PIL import Image
-        image = Image.new("RGB", (self.width, self.height))
-        for x in range(self.width):
-            for y in range(self.height):
-                image.putpixel((x, y), self[x, y].rgb())
-        image.save(filepath)
+        if filepath.endswith(RAW_CANVAS_EXTENSION):
+            from pixediter.formats import pxr
+            pxr.save(self, filepath)
+        else:
+            from pixediter import formats
+            formats.write(filepath, self.width, self.height, self.data, self.is_opaque())
         self.filepath = filepath
 
-    def crop(self, x0: int, y0: int, x1: int, y1: int) -> None:
-        new_pixels = []
+    def crop(self, x0: int, y0: int, x1: int, y1: int, fill: Color = colors.WHITE) -> None:
         if x1 < x0:
             x0, x1, = x1, x0
         if y1 < y0:
             y0, y1 = y1, y0
 
+        width = x1 - x0
+        fill_row = bytes(fill.rgba()) * width
+        # the part of each row that overlaps the old image is copied with a single slice
+        src_x0, src_x1 = max(0, x0), min(self.width, x1)
+        left = bytes(fill.rgba()) * max(0, min(width, -x0))
+        right = bytes(fill.rgba()) * max(0, min(width, x1 - self.width))
+        stride = self.width * BYTES_PER_PIXEL
+        rows = []
         for y in range(y0, y1):
-            row = []
-            for x in range(x0, x1):
-                if 0 <= y < self.height and 0 <= x < self.width:
-                    pixel = self[x, y]
-                else:
-                    pixel = colors.WHITE
-                row.append(pixel)
-            new_pixels.append(row)
-        self.height = len(new_pixels)
-        self.width = len(new_pixels[0])
-        self.pixels = new_pixels
+            if 0 <= y < self.height and src_x0 < src_x1:
+                start = y * stride + src_x0 * BYTES_PER_PIXEL
+                rows.append(left + self.data[start:start + (src_x1 - src_x0) * BYTES_PER_PIXEL] + right)
+            else:
+                rows.append(fill_row)
+        self.replace(width, y1 - y0, bytearray(b"".join(rows)))
+
+    def replace(self, width: int, height: int, data: bytearray) -> None:
+        """Replaces the whole image with new pixel data (possibly of a different size)"""
+        if len(data) != width * height * BYTES_PER_PIXEL:
+            raise ValueError("Pixel data does not match the size of the image")
+        self.width = width
+        self.height = height
+        self.data = data
+        self.mark_changed()
 
     def paint_rectangle(self, x0: int, y0: int, x1: int, y1: int, color: Color) -> None:
         if x0 > x1:
@@ -81,21 +124,92 @@ class ImageData:
         if y0 > y1:
             y0, y1 = y1, y0
         for x in range(x0, x1 + 1):
-            self.pixels[y0][x] = color
-            self.pixels[y1][x] = color
+            self[x, y0] = color
+            self[x, y1] = color
         for y in range(y0, y1 + 1):
-            self.pixels[y][x0] = color
-            self.pixels[y][x1] = color
+            self[x0, y] = color
+            self[x1, y] = color
+
+    def is_opaque(self) -> bool:
+        return self.data[3::BYTES_PER_PIXEL].count(255) == self.width * self.height
+
+    def composited(self, xy: Pos, color: Color) -> Color:
+        """Returns the color that pixel xy would have if color was blended on top of it"""
+        return blending.over(color, self[xy])
+
+    def blend(self, xy: Pos, color: Color) -> None:
+        """Blends color on top of the pixel at xy"""
+        if color.a == 255:
+            self[xy] = color
+        else:
+            self[xy] = blending.over(color, self[xy])
+
+    def fill_span(self, x0: int, x1: int, y: int, color: Color, blend: bool = True) -> None:
+        """Fills pixels x0 <= x < x1 on row y with color (blending it on top of them unless blend is False)"""
+        x0 = max(0, x0)
+        x1 = min(self.width, x1)
+        if x0 >= x1 or not 0 <= y < self.height:
+            return
+        start = self.offset(x0, y)
+        end = start + (x1 - x0) * BYTES_PER_PIXEL
+        data = self.data
+        if not blend or color.a == 255:
+            data[start:end] = bytes(color.rgba()) * (x1 - x0)
+        elif color.a == 0:
+            return
+        elif data[start + 3:end:BYTES_PER_PIXEL].count(255) == x1 - x0:
+            # opaque destination: the result of blending is a lookup table per channel
+            for channel, lut in enumerate(blending.over_luts(color.rgba())):
+                data[start + channel:end:BYTES_PER_PIXEL] = data[start + channel:end:BYTES_PER_PIXEL].translate(lut)
+        else:
+            row = bytearray(data[start:end])
+            blending.blend_row(row, bytes(color.rgba()) * (x1 - x0))
+            data[start:end] = row
+
+    def blend_row(self, x: int, y: int, row: bytes) -> None:
+        """Composites a row of pixels on top of the image starting at (x, y), clipped to the image"""
+        if not 0 <= y < self.height:
+            return
+        skip = max(0, -x)
+        x1 = min(self.width, x + len(row) // BYTES_PER_PIXEL)
+        if x + skip >= x1:
+            return
+        start = self.offset(x + skip, y)
+        end = start + (x1 - x - skip) * BYTES_PER_PIXEL
+        segment = bytearray(self.data[start:end])
+        blending.blend_row(segment, row[skip * BYTES_PER_PIXEL:skip * BYTES_PER_PIXEL + end - start])
+        self.data[start:end] = segment
+
+    def offset(self, x: int, y: int) -> int:
+        """Returns the index of the first byte of pixel (x, y) in self.data"""
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            raise IndexError(f"Pixel ({x}, {y}) is outside of the image")
+        return (y * self.width + x) * BYTES_PER_PIXEL
+
+    def region(self, x0: int, y0: int, x1: int, y1: int) -> bytes:
+        """Returns raw pixel data of the area x0 <= x < x1, y0 <= y < y1 (rows concatenated)"""
+        stride = self.width * BYTES_PER_PIXEL
+        start = x0 * BYTES_PER_PIXEL
+        end = x1 * BYTES_PER_PIXEL
+        if start == 0 and end == stride:
+            return bytes(self.data[y0 * stride:y1 * stride])
+        return b"".join(self.data[y * stride + start:y * stride + end] for y in range(y0, y1))
 
     def __iter__(self) -> Generator[tuple[Pos, Color], None, None]:
-        for row_index, row in enumerate(self.pixels):
-            for col_index, pixel in enumerate(row):
-                yield (col_index, row_index), pixel
+        data = self.data
+        i = 0
+        for row_index in range(self.height):
+            for col_index in range(self.width):
+                yield (col_index, row_index), Color(data[i], data[i + 1], data[i + 2], data[i + 3])
+                i += BYTES_PER_PIXEL
 
     def __getitem__(self, xy: Pos) -> Color:
-        x, y = xy
-        return self.pixels[y][x]
+        i = self.offset(*xy)
+        return Color(*self.data[i:i + BYTES_PER_PIXEL])
 
     def __setitem__(self, xy: Pos, color: Color) -> None:
-        x, y = xy
-        self.pixels[y][x] = color
+        i = self.offset(*xy)
+        self.data[i:i + BYTES_PER_PIXEL] = bytes(color.rgba())
+        if self.on_change_listeners:
+            x, y = xy
+            self.mark_changed(x, y, x + 1, y + 1)
@@ -0,0 +1,136 @@
+"""
+Colors for terminals that can't show any RGB color, as indexes into their palettes.
+
+The xterm 256 color palette starts with the 16 colors of the terminal's theme, which are
+left out because they can be anything, followed by a 6x6x6 cube of colors at CUBE_LEVELS
+and a ramp of 24 grays. With 16 colors only the theme is left, and the xterm defaults
+(ANSI_COLORS) stand in for it.
+
+Finding the nearest color of a palette is a search, too slow to do for every pixel, so each
+palette has a table made once (the first time it is needed) with the nearest index for
+every color whose channels are cut to their top bits. Mapping a color is then a few shifts
+and a lookup. The cube is searched a channel at a time, which is exact because the cube's
+levels are the same on every axis, and the nearest gray is the one nearest to the mean of
+the channels; the 16 colors are few enough to be searched for each entry of a smaller table.
+"""
+from __future__ import annotations
+
+from pixediter import terminal
+
+CUBE_LEVELS = (0, 95, 135, 175, 215, 255)
+GRAYS = tuple(8 + 10 * i for i in range(24))
+# xterm's defaults, the first 8 are SGR 30-37 and the bright ones 90-97
+ANSI_COLORS = (
+    (0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+    (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+    (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+    (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255),
+)
+# the bits of each channel that the tables are indexed by
+TABLE_BITS = {
+    terminal.COLORS_256: 5,
+    terminal.COLORS_16: 4,
+}
+
+RGB = tuple[int, int, int]
+
+
+class Palette:
+    """The colors of a terminal's palette by index, and the table to find the nearest of them"""
+
+    def __init__(self, colors: dict[int, RGB], table: bytes, bits: int, foreground: list[str], background: list[str]):
+        self.colors = colors
+        self.table = table
+        self.bits = bits
+        self._shift = 8 - bits
+        # the parameters of the SGR sequences by index
+        self._foreground = foreground
+        self._background = background
+
+    def index(self, r: int, g: int, b: int) -> int:
+        shift, bits = self._shift, self.bits
+        return self.table[(r >> shift << 2 * bits) | (g >> shift << bits) | (b >> shift)]
+
+    def foreground(self, r: int, g: int, b: int) -> str:
+        """The SGR parameters that set the foreground to the nearest color"""
+        return self._foreground[self.index(r, g, b)]
+
+    def background(self, r: int, g: int, b: int) -> str:
+        return self._background[self.index(r, g, b)]
+
+
+_palettes: dict[str, Palette] = {}
+
+
+def palette(depth: str) -> Palette:
+    """The palette of terminals with depth (COLORS_256 or COLORS_16), made the first time it is asked for"""
+    found = _palettes.get(depth)
+    if found is None:
+        if depth == terminal.COLORS_256:
+            found = _xterm_256()
+        elif depth == terminal.COLORS_16:
+            found = _ansi_16()
+        else:
+            raise ValueError(f"No palette for {depth} colors")
+        _palettes[depth] = found
+    return found
+
+
+def _centers(bits: int) -> list[int]:
+    """The middle of the range of channel values that each value of the top bits stands for"""
+    step = 1 << (8 - bits)
+    return [value * step + step // 2 for value in range(1 << bits)]
+
+
+def _nearest(value: int, levels: tuple[int, ...]) -> int:
+    return min(range(len(levels)), key=lambda i: abs(levels[i] - value))
+
+
+def _xterm_256() -> Palette:
+    bits = TABLE_BITS[terminal.COLORS_256]
+    centers = _centers(bits)
+    # the nearest level of the cube and how far it is, for each channel value
+    levels = [_nearest(value, CUBE_LEVELS) for value in centers]
+    errors = [(CUBE_LEVELS[level] - value) ** 2 for level, value in zip(levels, centers)]
+    table = bytearray()
+    for r, r_level, r_error in zip(centers, levels, errors):
+        for g, g_level, g_error in zip(centers, levels, errors):
+            cube = 16 + 36 * r_level + 6 * g_level
+            for b, b_level, b_error in zip(centers, levels, errors):
+                gray = min(23, max(0, round(((r + g + b) / 3 - 8) / 10)))
+                level = GRAYS[gray]
+                gray_error = (r - level) ** 2 + (g - level) ** 2 + (b - level) ** 2
+                table.append(cube + b_level if r_error + g_error + b_error <= gray_error else 232 + gray)
+    colors = {
+        16 + 36 * r + 6 * g + b: (CUBE_LEVELS[r], CUBE_LEVELS[g], CUBE_LEVELS[b])
+        for r in range(6) for g in range(6) for b in range(6)
+    }
+    colors.update((232 + i, (level, level, level)) for i, level in enumerate(GRAYS))
+    return Palette(
+        colors,
+        bytes(table),
+        bits,
+        [f"38;5;{index}" for index in range(256)],
+        [f"48;5;{index}" for index in range(256)],
+    )
+
+
+def _ansi_16() -> Palette:
+    bits = TABLE_BITS[terminal.COLORS_16]
+    centers = _centers(bits)
+    # the squared distances of each channel value from each color's channel
+    channels = [[[(color[channel] - value) ** 2 for color in ANSI_COLORS] for value in centers] for channel in range(3)]
+    table = bytearray()
+    for r_errors in channels[0]:
+        for g_errors in channels[1]:
+            rg_errors = [r + g for r, g in zip(r_errors, g_errors)]
+            for b_errors in channels[2]:
+                errors = [rg + b for rg, b in zip(rg_errors, b_errors)]
+                table.append(errors.index(min(errors)))
+    return Palette(
+        dict(enumerate(ANSI_COLORS)),
+        bytes(table),
+        bits,
+        [str(30 + index if index < 8 else 90 + index - 8) for index in range(16)],
+        [str(40 + index if index < 8 else 100 + index - 8) for index in range(16)],
+    )
@@ -0,0 +1,298 @@
+"""
+Crash-safe journal of edits that have not been saved yet.
+
+Every committed operation (a tool stroke, a command) is appended to a binary journal next
+to the image file as a record of the tool, its parameters, the layers (their order and
+properties) and the changed spans of pixels (their new contents). Layers are identified by
+a number that stays the same when they are moved, so operations that only reorder, remove
+or change the properties of layers are recorded too. Committing only copies the changed
+spans into a buffer; a background thread writes the buffer to the file and fsyncs it every
+FLUSH_INTERVAL seconds, so journaling adds no file I/O to the strokes themselves.
+
+The journal starts with the size and modification time of the saved image it applies to.
+Replaying arranges the layers of that image as recorded and writes the spans on top of
+them, in order, stopping at the first incomplete record (the one that was being written
+when the program died). Saving the image starts a new journal.
+"""
+from __future__ import annotations
+
+import os
+import struct
+import threading
+import zlib
+from collections.abc import Iterator
+from typing import BinaryIO
+
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.layers import Layer
+from pixediter.layers import LayerStack
+
+FLUSH_INTERVAL = 1.0
+
+_MAGIC = b"PXJOURNL"
+_VERSION = 2
+_HEADER = struct.Struct("<8sBqq")
+# length and CRC-32 of the payload of a record
+_RECORD_HEADER = struct.Struct("<II")
+_STR_LENGTH = struct.Struct("<H")
+_SIZE = struct.Struct("<II")
+_COUNT = struct.Struct("<H")
+_LAYER = struct.Struct("<HI")
+_LAYER_PROPERTIES = struct.Struct("<I?B")
+_SPAN = struct.Struct("<III")
+
+# row -> [x0, x1) of the pixels that have changed on that row
+_Spans = dict[int, list[int]]
+# the number, name, visibility, opacity and blend mode of each layer, bottom one first
+_Structure = tuple[tuple[int, str, bool, int, str], ...]
+
+
+class JournalError(ValueError):
+    pass
+
+
+def journal_path(filepath: str) -> str:
+    """The journal of an image is a hidden file in the same directory"""
+    directory, name = os.path.split(os.path.abspath(filepath))
+    return os.path.join(directory, f".{name}.journal")
+
+
+def _base_stamp(filepath: str) -> tuple[int, int]:
+    """Identifies the saved version of the image (an image that has not been saved yet is (-1, 0))"""
+    try:
+        stat = os.stat(filepath)
+    except FileNotFoundError:
+        return -1, 0
+    return stat.st_size, stat.st_mtime_ns
+
+
+class Journal:
+    """Journals the changes to the layers of stack, which is the image at filepath"""
+
+    def __init__(self, filepath: str, stack: LayerStack, flush_interval: float = FLUSH_INTERVAL):
+        self.filepath = filepath
+        self.stack = stack
+        self.path = journal_path(filepath)
+        self.flush_interval = flush_interval
+        self._base = _base_stamp(filepath)
+        # id(layer) -> (layer, changed spans) of the changes that have not been committed yet
+        self._pending: dict[int, tuple[Layer, _Spans]] = {}
+        # id(layer) -> (layer, number) of the layers the journal has seen, the saved ones are 0, 1, ...
+        self._numbers: dict[int, tuple[Layer, int]] = {id(layer): (layer, i) for i, layer in enumerate(stack)}
+        self._structure = self._current_structure()
+        self._buffer = bytearray()
+        # _lock guards the buffer and is only held briefly, _io_lock guards the file
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._file: BinaryIO | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        stack.add_change_listener(self._on_change)
+
+    def _on_change(self, layer: Layer, x0: int, y0: int, x1: int, y1: int) -> None:
+        if x0 >= x1:
+            return
+        _, spans = self._pending.setdefault(id(layer), (layer, {}))
+        for y in range(y0, y1):
+            span = spans.get(y)
+            if span is None:
+                spans[y] = [x0, x1]
+            else:
+                span[0] = min(span[0], x0)
+                span[1] = max(span[1], x1)
+
+    def _number(self, layer: Layer) -> int:
+        """The number of layer, layers that are new to the journal get the next one"""
+        found = self._numbers.get(id(layer))
+        if found is not None:
+            return found[1]
+        number = len(self._numbers)
+        self._numbers[id(layer)] = (layer, number)
+        if bytes(layer.image.data).strip(b"\0"):
+            # added with pixels of its own, which have to be in the journal too
+            self._on_change(layer, 0, 0, layer.image.width, layer.image.height)
+        return number
+
+    def _current_structure(self) -> _Structure:
+        return tuple(
+            (self._number(layer), layer.name, layer.visible, layer.opacity, layer.blend_mode)
+            for layer in self.stack
+        )
+
+    def commit(self, tool: str, params: str = "") -> None:
+        """Appends the changes since the previous commit as one operation (nothing if there are none)"""
+        structure = self._current_structure()
+        if not self._pending and structure == self._structure:
+            return
+        self._structure = structure
+        pending, self._pending = self._pending, {}
+        stack = self.stack
+        parts = [_str(tool), _str(params), _SIZE.pack(stack.width, stack.height)]
+        parts.append(_COUNT.pack(len(structure)) + _COUNT.pack(stack.active_index))
+        for number, name, visible, opacity, blend_mode in structure:
+            parts += [_LAYER_PROPERTIES.pack(number, visible, opacity), _str(name), _str(blend_mode)]
+        entries = []
+        for layer, spans in pending.values():
+            index = next((i for i, other in enumerate(stack.layers) if other is layer), None)
+            if index is None:
+                # removed before the operation ended
+                continue
+            img = layer.image
+            stride = img.width * BYTES_PER_PIXEL
+            rows = []
+            for y, (x0, x1) in sorted(spans.items()):
+                x0, x1 = max(0, x0), min(img.width, x1)
+                if x0 < x1 and 0 <= y < img.height:
+                    start = y * stride + x0 * BYTES_PER_PIXEL
+                    rows.append(_SPAN.pack(y, x0, x1) + img.data[start:start + (x1 - x0) * BYTES_PER_PIXEL])
+            entries.append(_LAYER.pack(index, len(rows)) + b"".join(rows))
+        parts.append(_COUNT.pack(len(entries)))
+        payload = b"".join(parts + entries)
+        with self._lock:
+            self._buffer += _RECORD_HEADER.pack(len(payload), zlib.crc32(payload))
+            self._buffer += payload
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the committed operations to the journal and waits until they are on the disk"""
+        with self._io_lock:
+            with self._lock:
+                data, self._buffer = self._buffer, bytearray()
+            if not data:
+                return
+            if self._file is None:
+                self._file = open(self.path, "wb")
+                self._file.write(_HEADER.pack(_MAGIC, _VERSION, *self._base))
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self, discard: bool = True) -> None:
+        """
+        Stops journaling. The journal is removed when discard is True (the image was saved or
+        its changes were thrown away on purpose), otherwise everything committed is flushed.
+        """
+        self.stack.on_change_listeners.remove(self._on_change)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if not discard:
+            self.flush()
+        with self._io_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if discard and os.path.exists(self.path):
+                os.remove(self.path)
+
+
+def _str(text: str) -> bytes:
+    encoded = text.encode()
+    return _STR_LENGTH.pack(len(encoded)) + encoded
+
+
+def _records(path: str, base: tuple[int, int]) -> Iterator[memoryview]:
+    """Yields the payloads of the complete records of the journal at path if it applies to base"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return
+    if len(data) < _HEADER.size:
+        return
+    magic, version, size, mtime = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != _VERSION or (size, mtime) != base:
+        return
+    view = memoryview(data)
+    pos = _HEADER.size
+    while pos + _RECORD_HEADER.size <= len(data):
+        length, crc = _RECORD_HEADER.unpack_from(data, pos)
+        payload = view[pos + _RECORD_HEADER.size:pos + _RECORD_HEADER.size + length]
+        if len(payload) != length or zlib.crc32(payload) != crc:
+            # the write that was going on when the program died
+            return
+        yield payload
+        pos += _RECORD_HEADER.size + length
+
+
+def recoverable(filepath: str) -> int:
+    """Returns how many operations the journal of filepath has on top of the saved image"""
+    return sum(1 for _ in _records(journal_path(filepath), _base_stamp(filepath)))
+
+
+def replay(filepath: str, stack: LayerStack) -> int:
+    """Applies the operations in the journal of filepath to stack, returns how many there were"""
+    count = 0
+    # the layers by their number in the journal, starting with the saved ones
+    layers = dict(enumerate(stack))
+    for payload in _records(journal_path(filepath), _base_stamp(filepath)):
+        _apply(payload, stack, layers)
+        count += 1
+    return count
+
+
+def _apply(payload: memoryview, stack: LayerStack, layers: dict[int, Layer]) -> None:
+    pos = 0
+
+    def read(fmt: struct.Struct) -> tuple[int, ...]:
+        nonlocal pos
+        values = fmt.unpack_from(payload, pos)
+        pos += fmt.size
+        return values
+
+    def read_str() -> str:
+        nonlocal pos
+        length, = read(_STR_LENGTH)
+        pos += length
+        return bytes(payload[pos - length:pos]).decode()
+
+    # the tool and its parameters only describe the operation, the layers and spans are what changed
+    read_str()
+    read_str()
+    width, height = read(_SIZE)
+    if (width, height) != (stack.width, stack.height):
+        # the operation resized the image, all of its pixels are in the record
+        stack.transform(lambda img: img.replace(width, height, bytearray(width * height * BYTES_PER_PIXEL)))
+
+    count, = read(_COUNT)
+    active, = read(_COUNT)
+    order = []
+    for _ in range(count):
+        number, visible, opacity = read(_LAYER_PROPERTIES)
+        name, blend_mode = read_str(), read_str()
+        layer = layers.get(number)
+        if layer is None:
+            layer = layers[number] = stack.new_layer(name)
+        layer.name, layer.visible, layer.opacity = name, bool(visible), opacity
+        stack.set_blend_mode(stack.layers.index(layer), blend_mode)
+        order.append(layer)
+    for layer in [layer for layer in stack if layer not in order]:
+        stack.remove(stack.layers.index(layer))
+    for i, layer in enumerate(order):
+        stack.move(stack.layers.index(layer), i)
+    if not 0 <= active < len(stack):
+        raise JournalError("The journal does not match the image")
+    stack.active_index = active
+    stack.invalidate()
+
+    entries, = read(_COUNT)
+    for _ in range(entries):
+        index, rows = read(_LAYER)
+        if index >= len(stack):
+            raise JournalError("The journal does not match the image")
+        img = stack.layers[index].image
+        if (img.width, img.height) != (width, height):
+            raise JournalError("The journal does not match the image")
+        for _ in range(rows):
+            y, x0, x1 = read(_SPAN)
+            start = img.offset(x0, y)
+            end = start + (x1 - x0) * BYTES_PER_PIXEL
+            img.data[start:end] = payload[pos:pos + end - start]
+            pos += end - start
+            img.mark_changed(x0, y, x1, y + 1)
@@ -0,0 +1,404 @@
+"""
+Layers of a document and their composited result.
+
+The composite is cached in tiles of TILE_SIZE x TILE_SIZE pixels. Changes to a layer's
+pixels only invalidate the tiles they touch, so drawing never recomposites the whole
+stack; the dirty tiles are recomposited the next time the composite is needed.
+A single normal, fully opaque layer is its own composite, so a document with one layer
+(like a huge memory mapped canvas) has no second copy of its pixels.
+The downsampled copies of the composite for zooming out (see mipmap) are kept up to date
+the same way.
+"""
+from __future__ import annotations
+
+import struct
+import zlib
+from collections.abc import Callable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any
+from typing import BinaryIO
+from typing import TYPE_CHECKING
+
+from pixediter import blending
+from pixediter import colors
+from pixediter.colors import Color
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ChangeListener
+from pixediter.image import ImageData
+from pixediter.image import PixelBuffer
+
+if TYPE_CHECKING:
+    from pixediter.mipmap import Pyramid
+
+TILE_SIZE = 16
+
+LAYERED_FILE_EXTENSION = ".pxd"
+_MAGIC = b"PXDLAYERS"
+_VERSION = 1
+_HEADER = struct.Struct("<9sBIIHH")
+_LAYER_HEADER = struct.Struct("<?B")
+_LENGTH = struct.Struct("<I")
+_INFLATE_CHUNK_SIZE = 1 << 16
+
+
+class LayerError(ValueError):
+    pass
+
+
+@dataclass
+class Layer:
+    image: ImageData
+    name: str
+    visible: bool = True
+    opacity: int = 255
+    blend_mode: str = "normal"
+
+
+# called with the layer whose pixels changed and the area (x0, y0, x1, y1), x1 and y1 exclusive
+LayerChangeListener = Callable[[Layer, int, int, int, int], None]
+
+
+class LayerStack:
+    def __init__(self, base: ImageData, name: str = "Background"):
+        self.width = base.width
+        self.height = base.height
+        self.filepath = base.filepath
+        self.layers: list[Layer] = []
+        self.active_index = 0
+        self._composite: ImageData | None = None
+        self._pyramid: Pyramid | None = None
+        self.dirty_tiles: set[tuple[int, int]] = set()
+        self.on_change_listeners: list[LayerChangeListener] = []
+        self.add(Layer(base, name))
+
+    @property
+    def composite(self) -> ImageData:
+        """The cached composite, allocated when the stack stops being a single layer"""
+        if self._composite is None:
+            self._composite = ImageData(self.width, self.height)
+        return self._composite
+
+    @property
+    def pyramid(self) -> Pyramid:
+        """The downsampled copies of the composite, created when first needed"""
+        if self._pyramid is None:
+            from pixediter.mipmap import Pyramid
+            self._pyramid = Pyramid(self)
+        return self._pyramid
+
+    def _passthrough(self) -> bool:
+        """Whether the only layer can be shown as is, without compositing it"""
+        if len(self.layers) != 1:
+            return False
+        layer = self.layers[0]
+        return layer.visible and layer.opacity == 255 and layer.blend_mode == "normal"
+
+    @property
+    def active(self) -> Layer:
+        return self.layers[self.active_index]
+
+    def __len__(self) -> int:
+        return len(self.layers)
+
+    def add_change_listener(self, fn: LayerChangeListener) -> None:
+        """fn is called with the layer and the area whenever the pixels of a layer change"""
+        self.on_change_listeners.append(fn)
+
+    def __iter__(self) -> Iterator[Layer]:
+        return iter(self.layers)
+
+    def add(self, layer: Layer, index: int | None = None) -> None:
+        """Adds layer on top of the stack (or at index) and makes it the active layer"""
+        if (layer.image.width, layer.image.height) != (self.width, self.height):
+            raise LayerError("All layers must be the same size")
+        if index is None:
+            index = len(self.layers)
+        self.layers.insert(index, layer)
+        self.active_index = index
+        layer.image.add_change_listener(self._on_layer_change(layer))
+        self.invalidate()
+
+    def new_layer(self, name: str | None = None) -> Layer:
+        """Creates a transparent layer above the active layer"""
+        image = ImageData(self.width, self.height)
+        image.data[:] = bytes(colors.TRANSPARENT.rgba()) * (self.width * self.height)
+        layer = Layer(image, name or f"Layer {len(self.layers)}")
+        self.add(layer, self.active_index + 1)
+        return layer
+
+    def remove(self, index: int) -> Layer:
+        if len(self.layers) == 1:
+            raise LayerError("Can't remove the only layer")
+        layer = self.layers.pop(index)
+        self.active_index = min(self.active_index, len(self.layers) - 1)
+        self.invalidate()
+        return layer
+
+    def move(self, index: int, new_index: int) -> None:
+        if not 0 <= new_index < len(self.layers):
+            return
+        layer = self.layers.pop(index)
+        self.layers.insert(new_index, layer)
+        if self.active_index == index:
+            self.active_index = new_index
+        self.invalidate()
+
+    def select(self, index: int) -> Layer:
+        if not 0 <= index < len(self.layers):
+            raise LayerError(f"No layer {index}")
+        self.active_index = index
+        return self.active
+
+    def set_visible(self, index: int, visible: bool) -> None:
+        self.layers[index].visible = visible
+        self.invalidate()
+
+    def set_opacity(self, index: int, opacity: int) -> None:
+        if not 0 <= opacity <= 255:
+            raise LayerError("Opacity has to be between 0 and 255")
+        self.layers[index].opacity = opacity
+        self.invalidate()
+
+    def set_blend_mode(self, index: int, mode: str) -> None:
+        if mode not in blending.BLEND_MODES:
+            raise LayerError(f"Unknown blend mode '{mode}' (available: {', '.join(blending.BLEND_MODES)})")
+        self.layers[index].blend_mode = mode
+        self.invalidate()
+
+    def crop(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        for i, layer in enumerate(self.layers):
+            # new area is only filled on the bottom layer, layers above it stay transparent
+            layer.image.crop(x0, y0, x1, y1, colors.WHITE if i == 0 else colors.TRANSPARENT)
+        self._resized()
+
+    def transform(self, fn: Callable[[ImageData], None]) -> None:
+        """Applies fn (which may change the size of the image) to every layer"""
+        for layer in self.layers:
+            fn(layer.image)
+        self._resized()
+
+    def _resized(self) -> None:
+        self.width = self.layers[0].image.width
+        self.height = self.layers[0].image.height
+        self._composite = None
+        self._pyramid = None
+        self.dirty_tiles.clear()
+        self.invalidate()
+
+    def _on_layer_change(self, layer: Layer) -> ChangeListener:
+        def on_change(x0: int, y0: int, x1: int, y1: int) -> None:
+            if any(layer is other for other in self.layers):
+                self.invalidate(x0, y0, x1, y1)
+                for fn in self.on_change_listeners:
+                    fn(layer, x0, y0, x1, y1)
+        return on_change
+
+    def invalidate(self, x0: int = 0, y0: int = 0, x1: int | None = None, y1: int | None = None) -> None:
+        """Marks the tiles in the given area (by default everything) to be recomposited"""
+        if x1 is None:
+            x1 = self.width
+        if y1 is None:
+            y1 = self.height
+        if self._pyramid is not None:
+            self._pyramid.invalidate(x0, y0, x1, y1)
+        if self._passthrough():
+            # nothing is cached, whatever makes the stack composite again invalidates everything
+            return
+        for ty in range(y0 // TILE_SIZE, (y1 - 1) // TILE_SIZE + 1):
+            for tx in range(x0 // TILE_SIZE, (x1 - 1) // TILE_SIZE + 1):
+                self.dirty_tiles.add((tx, ty))
+
+    def _composite_tile(self, tx: int, ty: int) -> None:
+        x0 = tx * TILE_SIZE
+        y0 = ty * TILE_SIZE
+        x1 = min(self.width, x0 + TILE_SIZE)
+        y1 = min(self.height, y0 + TILE_SIZE)
+        if x0 >= x1 or y0 >= y1:
+            return
+        visible = [layer for layer in self.layers if layer.visible and layer.opacity > 0]
+        for y in range(y0, y1):
+            start = (y * self.width + x0) * BYTES_PER_PIXEL
+            end = (y * self.width + x1) * BYTES_PER_PIXEL
+            row = bytearray(end - start)
+            for layer in visible:
+                blending.blend_row(row, bytes(layer.image.data[start:end]), layer.opacity, layer.blend_mode)
+            self.composite.data[start:end] = row
+
+    def flatten(self, x0: int = 0, y0: int = 0, x1: int | None = None, y1: int | None = None) -> ImageData:
+        """
+        Returns the composited image, only recompositing the tiles that have changed.
+        If an area is given only that area of the result is guaranteed to be up to date.
+        """
+        if self._passthrough():
+            self.dirty_tiles.clear()
+            return self.layers[0].image
+        if x1 is None and y1 is None and x0 == y0 == 0:
+            tiles = list(self.dirty_tiles)
+        else:
+            tx0, ty0 = x0 // TILE_SIZE, y0 // TILE_SIZE
+            tx1 = ((self.width if x1 is None else x1) - 1) // TILE_SIZE
+            ty1 = ((self.height if y1 is None else y1) - 1) // TILE_SIZE
+            tiles = [(tx, ty) for tx, ty in self.dirty_tiles if tx0 <= tx <= tx1 and ty0 <= ty <= ty1]
+        for tx, ty in tiles:
+            self._composite_tile(tx, ty)
+        self.dirty_tiles.difference_update(tiles)
+        self.composite.filepath = self.filepath
+        return self.composite
+
+    def composite_pixel(self, x: int, y: int, active_color: Color | None = None) -> Color:
+        """
+        Composites a single pixel through the stack, optionally pretending that the
+        active layer has active_color at (x, y) (used for previewing tools)
+        """
+        if active_color is None and self._passthrough():
+            return self.layers[0].image[x, y]
+        if active_color is None and (x // TILE_SIZE, y // TILE_SIZE) not in self.dirty_tiles:
+            return self.composite[x, y]
+        pixel = bytearray(BYTES_PER_PIXEL)
+        for layer in self.layers:
+            if not layer.visible or layer.opacity == 0:
+                continue
+            if active_color is not None and layer is self.active:
+                src = bytes(active_color.rgba())
+            else:
+                i = layer.image.offset(x, y)
+                src = bytes(layer.image.data[i:i + BYTES_PER_PIXEL])
+            blending.blend_row(pixel, src, layer.opacity, layer.blend_mode)
+        return Color(*pixel)
+
+    def composite_region(self, x0: int, y0: int, x1: int, y1: int, active_data: bytes) -> bytes:
+        """
+        Composites the area x0 <= x < x1, y0 <= y < y1 through the stack as if the active
+        layer had active_data there (the rows of the area concatenated, used for previewing filters)
+        """
+        stride = (x1 - x0) * BYTES_PER_PIXEL
+        result = bytearray(stride * (y1 - y0))
+        visible = [layer for layer in self.layers if layer.visible and layer.opacity > 0]
+        for y in range(y0, y1):
+            row = bytearray(stride)
+            for layer in visible:
+                if layer is self.active:
+                    i = (y - y0) * stride
+                    src = active_data[i:i + stride]
+                else:
+                    start = layer.image.offset(x0, y)
+                    src = bytes(layer.image.data[start:start + stride])
+                blending.blend_row(row, src, layer.opacity, layer.blend_mode)
+            result[(y - y0) * stride:(y - y0 + 1) * stride] = row
+        return bytes(result)
+
+    def save_file(self, filepath: str | None = None) -> None:
+        if filepath is None:
+            filepath = self.filepath
+        if filepath is not None and filepath.endswith(LAYERED_FILE_EXTENSION):
+            self.save_layered(filepath)
+        else:
+            self.flatten().save_file(filepath)
+        self.filepath = filepath
+
+    def save_layered(self, filepath: str) -> None:
+        """
+        Saves all layers and the cached composite, so that loading the file does not need
+        to composite anything
+        """
+        composite = self.flatten()
+        with open(filepath, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.width, self.height, len(self.layers), self.active_index))
+            for layer in self.layers:
+                _write_str(f, layer.name)
+                _write_str(f, layer.blend_mode)
+                f.write(_LAYER_HEADER.pack(layer.visible, layer.opacity))
+                _write_bytes(f, zlib.compress(layer.image.data))
+            _write_bytes(f, zlib.compress(composite.data))
+
+    @classmethod
+    def load_layered(cls, filepath: str) -> LayerStack:
+        with open(filepath, "rb") as f:
+            magic, version, width, height, count, active = _read(f, _HEADER)
+            if magic != _MAGIC or version != _VERSION:
+                raise LayerError(f"'{filepath}' is not a layered PixEdiTer file")
+            if count == 0:
+                raise LayerError(f"'{filepath}' has no layers")
+            if active >= count:
+                raise LayerError(f"'{filepath}' has no layer {active} to select")
+            layers = []
+            for _ in range(count):
+                name = _read_str(f)
+                blend_mode = _read_str(f)
+                if blend_mode not in blending.BLEND_MODES:
+                    raise LayerError(f"Unknown blend mode '{blend_mode}' in '{filepath}'")
+                visible, opacity = _read(f, _LAYER_HEADER)
+                image = ImageData(width, height)
+                _inflate_into(image.data, _read_bytes(f))
+                layers.append(Layer(image, name, visible, opacity, blend_mode))
+            composite = _read_bytes(f)
+
+        bottom, *rest = layers
+        bottom.image.filepath = filepath
+        stack = cls(bottom.image, bottom.name)
+        stack.set_visible(0, bottom.visible)
+        stack.set_opacity(0, bottom.opacity)
+        stack.set_blend_mode(0, bottom.blend_mode)
+        for layer in rest:
+            stack.add(layer)
+        stack.active_index = active
+        if not stack._passthrough():
+            _inflate_into(stack.composite.data, composite)
+        stack.dirty_tiles.clear()
+        return stack
+
+    @classmethod
+    def from_file(cls, filepath: str) -> LayerStack:
+        if filepath.endswith(LAYERED_FILE_EXTENSION):
+            return cls.load_layered(filepath)
+        return cls(ImageData.from_file(filepath))
+
+
+def _write_bytes(f: BinaryIO, data: bytes) -> None:
+    f.write(_LENGTH.pack(len(data)))
+    f.write(data)
+
+
+def _read(f: BinaryIO, fields: struct.Struct) -> tuple[Any, ...]:
+    data = f.read(fields.size)
+    if len(data) != fields.size:
+        raise LayerError("Unexpected end of file")
+    return fields.unpack(data)
+
+
+def _read_bytes(f: BinaryIO) -> bytes:
+    length, = _read(f, _LENGTH)
+    data: bytes = f.read(length)
+    if len(data) != length:
+        raise LayerError("Unexpected end of file")
+    return data
+
+
+def _inflate_into(out: PixelBuffer, compressed: bytes) -> None:
+    """Decompresses data into out a piece at a time, without a second copy of the whole result"""
+    inflate = zlib.decompressobj()
+    pos = 0
+    pending = compressed
+    while True:
+        chunk = inflate.decompress(pending, _INFLATE_CHUNK_SIZE) if pending else inflate.flush()
+        if pos + len(chunk) > len(out):
+            break
+        out[pos:pos + len(chunk)] = chunk
+        pos += len(chunk)
+        if not pending:
+            break
+        pending = inflate.unconsumed_tail
+    if pos != len(out) or not inflate.eof:
+        raise LayerError("Layer data does not match the size of the image")
+
+
+def _write_str(f: BinaryIO, text: str) -> None:
+    _write_bytes(f, text.encode())
+
+
+def _read_str(f: BinaryIO) -> str:
+    try:
+        return _read_bytes(f).decode()
+    except UnicodeDecodeError:
+        raise LayerError("Invalid text in layer file")
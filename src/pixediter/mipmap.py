@@ -0,0 +1,152 @@
+"""
+Downsampled copies of the composite of a layer stack, for showing the image zoomed out.
+
+Level k of the pyramid is the image at 1 / 2**k of its size (rounded up), each pixel the
+average of 2x2 pixels of level k - 1 (the last row and column are repeated when the size
+is odd). Level 0 is the composite itself. Colors are weighted by their alpha, so that the
+color of transparent pixels doesn't bleed into their neighbours.
+
+The levels are created when they are first needed and then kept up to date like the
+composite of the stack: a change marks the tiles it touches on every level as dirty, and
+the dirty tiles are computed from the level below the next time that area is read.
+"""
+from __future__ import annotations
+
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+from pixediter.layers import TILE_SIZE
+
+
+def max_level(width: int, height: int) -> int:
+    """The level at which an image of the given size is a single pixel"""
+    return max(width - 1, height - 1, 0).bit_length()
+
+
+def level_size(width: int, height: int, level: int) -> tuple[int, int]:
+    scale = 1 << level
+    return (width + scale - 1) >> level, (height + scale - 1) >> level
+
+
+def average_2x2(top: bytes, bottom: bytes) -> bytes:
+    """
+    Averages blocks of 2x2 pixels of two rows with an even number of pixels, e.g. rows of
+    2n pixels make a row of n pixels
+    """
+    if top[3::4] + bottom[3::4] == b"\xff" * (len(top) // 2):
+        return _average_opaque(top, bottom)
+    return _average_weighted(top, bottom)
+
+
+def _average_opaque(top: bytes, bottom: bytes) -> bytes:
+    # the bytes of the four pixels of every block are summed at once as big integers with
+    # every other byte masked out, so that each sum has 16 bits of room
+    size = len(top) // 2
+    mask = int.from_bytes(b"\xff\x00" * (size // 2), "little")
+    rounding = mask // 0xff * 2
+    low = high = 0
+    for row in (top, bottom):
+        pixels = memoryview(row).cast("I")
+        for half in (pixels[0::2], pixels[1::2]):
+            value = int.from_bytes(half.tobytes(), "little")
+            low += value & mask
+            high += (value >> 8) & mask
+    low = ((low + rounding) >> 2) & mask
+    high = ((high + rounding) >> 2) & mask
+    return (low | high << 8).to_bytes(size, "little")
+
+
+def _average_weighted(top: bytes, bottom: bytes) -> bytes:
+    result = bytearray(len(top) // 2)
+    for o in range(0, len(result), BYTES_PER_PIXEL):
+        i = 2 * o
+        alphas = (top[i + 3], top[i + 7], bottom[i + 3], bottom[i + 7])
+        alpha = sum(alphas)
+        if alpha:
+            for c in range(3):
+                weighted = (
+                    top[i + c] * alphas[0] + top[i + 4 + c] * alphas[1]
+                    + bottom[i + c] * alphas[2] + bottom[i + 4 + c] * alphas[3]
+                )
+                result[o + c] = (weighted + alpha // 2) // alpha
+        result[o + 3] = (alpha + 2) // 4
+    return bytes(result)
+
+
+class Pyramid:
+    def __init__(self, stack: LayerStack):
+        self.stack = stack
+        # levels[k - 1] is level k, and dirty_tiles[k - 1] the tiles of it that need updating
+        self.levels: list[ImageData] = []
+        self.dirty_tiles: list[set[tuple[int, int]]] = []
+
+    def invalidate(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Marks the tiles showing the area (in the pixels of the image) on every level as dirty"""
+        for k, dirty in enumerate(self.dirty_tiles, 1):
+            scale = 1 << k
+            lx0, ly0 = x0 >> k, y0 >> k
+            lx1, ly1 = (x1 + scale - 1) >> k, (y1 + scale - 1) >> k
+            for ty in range(ly0 // TILE_SIZE, (ly1 - 1) // TILE_SIZE + 1):
+                for tx in range(lx0 // TILE_SIZE, (lx1 - 1) // TILE_SIZE + 1):
+                    dirty.add((tx, ty))
+
+    def level(self, k: int, x0: int = 0, y0: int = 0, x1: int | None = None, y1: int | None = None) -> ImageData:
+        """
+        Returns level k. If an area (in the pixels of that level) is given, only that area
+        is guaranteed to be up to date.
+        """
+        if k == 0:
+            return self.stack.flatten(x0, y0, x1, y1)
+        while len(self.levels) < k:
+            width, height = level_size(self.stack.width, self.stack.height, len(self.levels) + 1)
+            self.levels.append(ImageData(width, height))
+            self.dirty_tiles.append({
+                (tx, ty)
+                for ty in range((height - 1) // TILE_SIZE + 1)
+                for tx in range((width - 1) // TILE_SIZE + 1)
+            })
+        target = self.levels[k - 1]
+        dirty = self.dirty_tiles[k - 1]
+        tx0, ty0 = x0 // TILE_SIZE, y0 // TILE_SIZE
+        tx1 = ((target.width if x1 is None else x1) - 1) // TILE_SIZE
+        ty1 = ((target.height if y1 is None else y1) - 1) // TILE_SIZE
+        tiles = [(tx, ty) for tx, ty in dirty if tx0 <= tx <= tx1 and ty0 <= ty <= ty1]
+        if tiles:
+            # the area of the level below that the tiles are made of
+            bx0 = min(tx for tx, _ in tiles) * TILE_SIZE
+            by0 = min(ty for _, ty in tiles) * TILE_SIZE
+            bx1 = (max(tx for tx, _ in tiles) + 1) * TILE_SIZE
+            by1 = (max(ty for _, ty in tiles) + 1) * TILE_SIZE
+            source = self.level(k - 1, 2 * bx0, 2 * by0, 2 * bx1, 2 * by1)
+            self._downsample(source, target, tiles)
+            dirty.difference_update(tiles)
+        return target
+
+    @staticmethod
+    def _downsample(source: ImageData, target: ImageData, tiles: list[tuple[int, int]]) -> None:
+        """Computes the tiles of target from source, the level below it"""
+        # neighbouring tiles on the same row are done together
+        spans: dict[int, list[int]] = {}
+        for tx, ty in sorted(tiles, key=lambda tile: (tile[1], tile[0])):
+            runs = spans.setdefault(ty, [])
+            if runs and runs[-1] == tx:
+                runs[-1] = tx + 1
+            else:
+                runs += [tx, tx + 1]
+        source_stride = source.width * BYTES_PER_PIXEL
+        for ty, runs in spans.items():
+            for y in range(ty * TILE_SIZE, min(target.height, (ty + 1) * TILE_SIZE)):
+                top_start = 2 * y * source_stride
+                bottom_start = min(2 * y + 1, source.height - 1) * source_stride
+                for i in range(0, len(runs), 2):
+                    x0 = runs[i] * TILE_SIZE
+                    x1 = min(target.width, runs[i + 1] * TILE_SIZE)
+                    start, end = 2 * x0 * BYTES_PER_PIXEL, min(2 * x1, source.width) * BYTES_PER_PIXEL
+                    top = bytes(source.data[top_start + start:top_start + end])
+                    bottom = bytes(source.data[bottom_start + start:bottom_start + end])
+                    if 2 * x1 > source.width:
+                        # the last pixel of an odd row is averaged with itself
+                        top += top[-BYTES_PER_PIXEL:]
+                        bottom += bottom[-BYTES_PER_PIXEL:]
+                    offset = (y * target.width + x0) * BYTES_PER_PIXEL
+                    target.data[offset:offset + (x1 - x0) * BYTES_PER_PIXEL] = average_2x2(top, bottom)
@@ -0,0 +1,152 @@
+"""
+Runs whole-image operations on tiles of the pixel buffer in a pool of worker processes.
+
+The pixel data is copied into a shared memory segment, which the executor keeps for the
+next operation; workers attach to the segment by name and modify their own band of rows in
+place, so no pixel data is ever pickled. A band is handed to the pool as soon as it has been
+copied in, and copied back into the image as soon as its worker is done, so the copies
+overlap with the work on the other bands instead of adding two passes over the whole image.
+
+The workers are started with forkserver (spawn where there is none) rather than forked from
+the editor, which has threads of its own, and the pool is shut down when the program exits.
+"""
+from __future__ import annotations
+
+import atexit
+import os
+from collections.abc import Callable
+from typing import Any
+from typing import TYPE_CHECKING
+
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing.shared_memory import SharedMemory
+
+
+# kernel(buffer, start, end, *args) modifies buffer[start:end] in place,
+# start and end are always at the beginning of a row of pixels
+Kernel = Callable[..., None]
+
+# images smaller than this (in pixels) are not worth the overhead of the process pool
+PARALLEL_THRESHOLD = 512 * 512
+
+# each worker gets roughly this many tiles so that uneven tiles even out
+TILES_PER_WORKER = 4
+
+
+def _run_tile(shm_name: str, start: int, end: int, kernel: Kernel, args: tuple[Any, ...]) -> None:
+    from multiprocessing.shared_memory import SharedMemory
+    shm = SharedMemory(name=shm_name)
+    try:
+        kernel(shm.buf, start, end, *args)
+    finally:
+        shm.close()
+
+
+class TileExecutor:
+    def __init__(self, workers: int | None = None, threshold: int = PARALLEL_THRESHOLD):
+        self.workers = workers or os.cpu_count() or 1
+        self.threshold = threshold
+        self._pool: ProcessPoolExecutor | None = None
+        self._shared: SharedMemory | None = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # multiprocessing takes a while to import and most images never need it
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context(method))
+            atexit.register(self.shutdown)
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+            atexit.unregister(self.shutdown)
+        if self._shared is not None:
+            self._shared.close()
+            self._shared.unlink()
+            self._shared = None
+
+    def _segment(self, size: int) -> SharedMemory:
+        """The shared memory segment, made larger if it has less than size bytes"""
+        if self._shared is None or self._shared.size < size:
+            from multiprocessing.shared_memory import SharedMemory
+            if self._shared is not None:
+                self._shared.close()
+                self._shared.unlink()
+            self._shared = SharedMemory(create=True, size=size)
+        return self._shared
+
+    def tiles(self, img: ImageData) -> list[tuple[int, int]]:
+        """Splits the image into bands of whole rows, returns their (start, end) byte offsets"""
+        stride = img.width * BYTES_PER_PIXEL
+        tile_count = min(img.height, self.workers * TILES_PER_WORKER)
+        rows_per_tile = -(-img.height // tile_count)
+        return [
+            (y * stride, min(img.height, y + rows_per_tile) * stride)
+            for y in range(0, img.height, rows_per_tile)
+        ]
+
+    def run(self, img: ImageData, kernel: Kernel, *args: Any) -> None:
+        """
+        Runs kernel on every tile of img, modifying img in place.
+        Kernel and args must be picklable (e.g. kernel should be a module level function).
+        """
+        size = len(img.data)
+        if size == 0:
+            return
+        if self.workers == 1 or img.width * img.height < self.threshold:
+            with memoryview(img.data) as buf:
+                kernel(buf, 0, size, *args)
+            return
+
+        from concurrent.futures import as_completed
+        from concurrent.futures import wait
+        shm = self._segment(size)
+        shared = shm.buf
+        assert shared is not None
+        bands: dict[Future[None], tuple[int, int]] = {}
+        with memoryview(img.data) as pixels:
+            try:
+                for start, end in self.tiles(img):
+                    shared[start:end] = pixels[start:end]
+                    bands[self.pool.submit(_run_tile, shm.name, start, end, kernel, args)] = (start, end)
+                for future in as_completed(bands):
+                    future.result()
+                    start, end = bands[future]
+                    pixels[start:end] = shared[start:end]
+            finally:
+                # the segment is used again by the next operation
+                for future in bands:
+                    future.cancel()
+                wait(bands)
+
+
+_default_executor: TileExecutor | None = None
+
+
+def default_executor() -> TileExecutor:
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = TileExecutor()
+    return _default_executor
+
+
+def run_serially() -> None:
+    """Makes the default executor run everything in this process (e.g. in a worker of a pool)"""
+    global _default_executor
+    _default_executor = TileExecutor(workers=1)
+
+
+def shutdown() -> None:
+    """Stops the workers of the default executor, if it has any"""
+    if _default_executor is not None:
+        _default_executor.shutdown()
@@ -0,0 +1,287 @@
+"""
+Measuring where the time of handling each event goes.
+
+Handling an event is split into stages: decoding the input, the tool or command, rendering,
+writing to the terminal, flushing it and the journal. The app marks the stages with
+Profiler.stage() and the terminal output is timed by TimedBackend. Stages nest (a command
+renders, rendering writes), and each stage is only charged for the time it didn't spend
+in the stages inside it, so the stages of an event add up to its total.
+
+The times are collected per event ("mouse_down Pencil", ":crop", "key"...) into histograms
+like HdrHistogram's: values are grouped by their power of two and every group is split into
+SUB_BUCKETS linear buckets, which keeps the relative error below 1 / SUB_BUCKETS for any
+latency from nanoseconds to seconds in a few dozen buckets. The histograms are exported in
+HdrHistogram's percentile distribution format, which its plotting tools read.
+
+A Profiler that wasn't started does nothing, so the app can always call it.
+"""
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections.abc import Iterable
+from collections.abc import Iterator
+from contextlib import AbstractContextManager
+from contextlib import nullcontext
+from typing import Any
+from typing import TYPE_CHECKING
+
+from pixediter import events
+from pixediter import terminal
+from pixediter.events import MouseEvent
+
+if TYPE_CHECKING:
+    import cProfile
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+STAGES = ("decode", "tool", "command", "render", "output", "flush", "journal", "other")
+# the stage of the time that was not inside any marked stage
+OTHER = "other"
+# events that happen before the first input, e.g. drawing the screen for the first time
+STARTUP = "startup"
+CPROFILE_FILE = "pixediter.pstats"
+
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    """Counts of durations (in nanoseconds) in log-linear buckets"""
+
+    def __init__(self) -> None:
+        # the lowest value of a bucket -> how many values were in it
+        self.buckets: dict[int, int] = {}
+        self.count = 0
+        self.total = 0
+        self.squares = 0
+        self.max = 0
+
+    @staticmethod
+    def bucket(value: int) -> tuple[int, int]:
+        """Returns the lowest and highest value that are counted in the same bucket as value"""
+        # the values from 2^n to 2^(n + 1) are split into SUB_BUCKETS buckets
+        shift = max(0, value.bit_length() - 1 - SUB_BUCKET_BITS)
+        lowest = value >> shift << shift
+        return lowest, lowest + (1 << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        value = max(0, int(seconds * 1e9))
+        lowest, _ = self.bucket(value)
+        self.buckets[lowest] = self.buckets.get(lowest, 0) + 1
+        self.count += 1
+        self.total += value
+        self.squares += value * value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    @property
+    def stddev(self) -> float:
+        if not self.count:
+            return 0.0
+        return math.sqrt(max(0.0, self.squares / self.count - self.mean ** 2))
+
+    def percentile(self, p: float) -> int:
+        """The value (in nanoseconds) that p percent of the values are at most"""
+        target = max(1, math.ceil(p / 100 * self.count))
+        seen = 0
+        for lowest in sorted(self.buckets):
+            seen += self.buckets[lowest]
+            if seen >= target:
+                return min(self.bucket(lowest)[1], self.max)
+        return self.max
+
+    def distribution(self, ticks_per_half: int = 5) -> str:
+        """The histogram in HdrHistogram's percentile distribution format, values in milliseconds"""
+        lines = [f"{'Value':>12} {'Percentile':>14} {'TotalCount':>10} {'1/(1-Percentile)':>14}", ""]
+        if not self.count:
+            return "\n".join(lines) + "\n"
+        ordered = sorted(self.buckets)
+        seen = 0
+        i = 0
+        for level in _levels(ticks_per_half):
+            while seen < max(1, math.ceil(level * self.count)):
+                seen += self.buckets[ordered[i]]
+                i += 1
+            value = min(self.bucket(ordered[i - 1])[1], self.max) / 1e6
+            if seen == self.count:
+                lines.append(f"{value:12.3f} {1:14.12f} {seen:10d}")
+                break
+            lines.append(f"{value:12.3f} {level:14.12f} {seen:10d} {1 / (1 - level):14.2f}")
+        lines += [
+            f"#[Mean    = {self.mean / 1e6:12.3f}, StdDeviation   = {self.stddev / 1e6:12.3f}]",
+            f"#[Max     = {self.max / 1e6:12.3f}, Total count    = {self.count:12d}]",
+            f"#[Buckets = {len(self.buckets):12d}, SubBuckets     = {SUB_BUCKETS:12d}]",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _levels(ticks_per_half: int) -> Iterator[float]:
+    """
+    The percentiles (as fractions) to report, denser towards the tail: every halving of the
+    distance to 100% is split into the same number of ticks
+    """
+    half = 0
+    while True:
+        start, end = 1 - 0.5 ** half, 1 - 0.5 ** (half + 1)
+        for tick in range(ticks_per_half):
+            yield start + (end - start) * tick / ticks_per_half
+        half += 1
+
+
+class _Stage:
+    __slots__ = ("profiler", "name", "start", "inner")
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+        self.start = 0.0
+        # time spent in the stages inside this one
+        self.inner = 0.0
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+        self.profiler._stack.append(self)
+
+    def __exit__(self, *exc_info: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        stack = self.profiler._stack
+        stack.pop()
+        if stack:
+            stack[-1].inner += elapsed
+        self.profiler.record(self.profiler.event_name, self.name, elapsed - self.inner)
+
+
+class _Event(_Stage):
+    __slots__ = ("previous",)
+
+    def __enter__(self) -> None:
+        self.previous = self.profiler.event_name
+        self.profiler.event_name = self.name
+        super().__enter__()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.profiler._stack.pop()
+        profiler = self.profiler
+        decode, profiler._decode = profiler._decode, None
+        profiler.record(self.name, OTHER, elapsed - self.inner)
+        if decode is not None:
+            profiler.record(self.name, "decode", decode)
+            elapsed += decode
+        profiler.record(self.name, "total", elapsed)
+        profiler.event_name = self.previous
+
+
+class Profiler:
+    def __init__(self, cprofile: bool = False):
+        self.enabled = False
+        # (event, stage) -> durations
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.event_name = STARTUP
+        self.cprofile: cProfile.Profile | None = None
+        if cprofile:
+            from cProfile import Profile
+            self.cprofile = Profile()
+        self._stack: list[_Stage] = []
+        # the time it took to decode the event that is handled next, if it was decoded
+        self._decode: float | None = None
+
+    def start(self) -> None:
+        self.enabled = True
+        if self.cprofile is not None:
+            self.cprofile.enable()
+
+    def stop(self) -> None:
+        self.enabled = False
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def record(self, event: str, stage: str, seconds: float) -> None:
+        histogram = self.histograms.get((event, stage))
+        if histogram is None:
+            histogram = self.histograms[event, stage] = Histogram()
+        histogram.record(seconds)
+
+    def event(self, name: str) -> AbstractContextManager[None]:
+        """Times handling an event, the stages inside it are counted as parts of it"""
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Event(self, name)
+
+    def stage(self, name: str) -> AbstractContextManager[None]:
+        if not self.enabled or not self._stack:
+            return _NULL_CONTEXT
+        return _Stage(self, name)
+
+    def decoded(self, raw_input: Iterable[str]) -> Iterator[MouseEvent | str]:
+        """Like events.listen, timing how long decoding each event takes"""
+        for raw in raw_input:
+            start = time.perf_counter()
+            ev = events.parse(raw)
+            self._decode = time.perf_counter() - start
+            yield ev
+
+    def table(self) -> list[str]:
+        """A summary of the events: how many there were, their latency and what it was spent on"""
+        names = sorted({event for event, _ in self.histograms})
+        stages = [stage for stage in STAGES if any((event, stage) in self.histograms for event in names)]
+        lines = [
+            f"{'event':<24} {'count':>6} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}"
+            + "".join(f" {stage:>8}" for stage in stages)
+        ]
+        for event in names:
+            total = self.histograms.get((event, "total"))
+            if total is None:
+                continue
+            line = (
+                f"{event[:24]:<24} {total.count:>6} {total.percentile(50) / 1e6:>8.3f} "
+                f"{total.percentile(99) / 1e6:>8.3f} {total.max / 1e6:>8.3f}"
+            )
+            for stage in stages:
+                histogram = self.histograms.get((event, stage))
+                # the mean time of the stage per event, not per time the stage happened
+                mean = histogram.total / total.count / 1e6 if histogram is not None else 0.0
+                line += f" {mean:>8.3f}"
+            lines.append(line)
+        return lines
+
+    def export(self, directory: str) -> list[str]:
+        """Writes the histograms, the summary and the cProfile statistics into directory, returns the files"""
+        import re
+        os.makedirs(directory, exist_ok=True)
+        written = []
+        for (event, stage), histogram in sorted(self.histograms.items()):
+            filename = re.sub(r"[^\w.-]+", "_", f"{event}.{stage}").strip("_") + ".hgrm"
+            filepath = os.path.join(directory, filename)
+            with open(filepath, "w") as f:
+                f.write(histogram.distribution())
+            written.append(filepath)
+        filepath = os.path.join(directory, "summary.txt")
+        with open(filepath, "w") as f:
+            f.write("\n".join(self.table()) + "\n")
+        written.append(filepath)
+        if self.cprofile is not None:
+            filepath = os.path.join(directory, CPROFILE_FILE)
+            self.cprofile.dump_stats(filepath)
+            written.append(filepath)
+        return written
+
+
+class TimedBackend(terminal.BackendWrapper):
+    """Passes output to another backend, timing the writes and flushes as stages of the profiler"""
+
+    def __init__(self, backend: terminal.Backend, profiler: Profiler):
+        super().__init__(backend)
+        self.profiler = profiler
+
+    def write(self, text: str) -> None:
+        with self.profiler.stage("output"):
+            self.backend.write(text)
+
+    def flush(self) -> None:
+        with self.profiler.stage("flush"):
+            self.backend.flush()
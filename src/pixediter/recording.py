@@ -0,0 +1,126 @@
+"""
+Recording the input of an editing session and replaying it.
+
+A recording is a JSON lines file. The first line is a header with the size of the terminal
+and the canvas and the file that was edited; every other line is [seconds since the start,
+raw input], with raw input exactly as events.read_input returned it. Replaying feeds the
+same input to App.run, either with the original timing (scaled by a speed factor) or as
+fast as possible, and measures how long the app took to handle each event and how much
+it wrote to the terminal.
+"""
+from __future__ import annotations
+
+import json
+import time
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import asdict
+from dataclasses import dataclass
+from dataclasses import field
+
+from pixediter import terminal
+
+VERSION = 1
+
+
+class RecordingError(ValueError):
+    pass
+
+
+@dataclass
+class Header:
+    columns: int
+    rows: int
+    width: int
+    height: int
+    file: str | None = None
+    version: int = VERSION
+
+
+def record(raw_input: Iterable[str], path: str, header: Header) -> Iterator[str]:
+    """Passes raw_input through, writing every piece of it to the recording at path"""
+    with open(path, "w") as f:
+        f.write(json.dumps(asdict(header)) + "\n")
+        f.flush()
+        start = time.monotonic()
+        for raw in raw_input:
+            f.write(json.dumps([round(time.monotonic() - start, 6), raw]) + "\n")
+            # the session may end with a crash, everything up to it should be in the file
+            f.flush()
+            yield raw
+
+
+def read_header(path: str) -> Header:
+    with open(path) as f:
+        try:
+            header = Header(**json.loads(f.readline()))
+        except (TypeError, ValueError) as exc:
+            raise RecordingError(f"'{path}' is not a recording: {exc}") from exc
+    if header.version != VERSION:
+        raise RecordingError(f"Unsupported recording version {header.version}")
+    return header
+
+
+def replay(path: str, speed: float | None = 1.0) -> Iterator[str]:
+    """
+    Yields the recorded input, waiting between the events like the user did (speed times
+    faster), or not at all if speed is None
+    """
+    start = time.monotonic()
+    with open(path) as f:
+        f.readline()
+        for line in f:
+            timestamp, raw = json.loads(line)
+            if speed is not None:
+                delay = start + timestamp / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield raw
+
+
+@dataclass
+class ReplayStats:
+    # how long handling each event took, in seconds
+    latencies: list[float] = field(default_factory=list)
+    seconds: float = 0.0
+    bytes: int = 0
+    writes: int = 0
+
+    def timed(self, events: Iterable[str]) -> Iterator[str]:
+        """
+        Passes events through, measuring the time until the next one is asked for, which is
+        the time the consumer took to handle the event
+        """
+        start = time.perf_counter()
+        for ev in events:
+            handled = time.perf_counter()
+            yield ev
+            self.latencies.append(time.perf_counter() - handled)
+        self.seconds = time.perf_counter() - start
+
+    def percentile(self, p: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    def report(self) -> str:
+        ms = [self.percentile(p) * 1000 for p in (50, 95, 99, 100)]
+        return (
+            f"{len(self.latencies)} events in {self.seconds:.3f} s, "
+            f"latency p50 {ms[0]:.2f} ms, p95 {ms[1]:.2f} ms, p99 {ms[2]:.2f} ms, max {ms[3]:.2f} ms, "
+            f"{self.bytes} bytes in {self.writes} writes"
+        )
+
+
+class CountingBackend(terminal.BackendWrapper):
+    """Passes output to another backend, counting the bytes and writes into stats"""
+
+    def __init__(self, backend: terminal.Backend, stats: ReplayStats):
+        super().__init__(backend)
+        self.stats = stats
+
+    def write(self, text: str) -> None:
+        self.stats.bytes += len(text.encode())
+        self.stats.writes += 1
+        self.backend.write(text)
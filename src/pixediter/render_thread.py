@@ -0,0 +1,165 @@
+"""
+Writing to the terminal on a thread of its own.
+
+Writing to a slow terminal blocks until it has read the output, and while the editor is
+blocked it doesn't read its input either: mouse events pile up in the tty and are handled
+late, all at once. A RenderThread stands between the editor and the terminal (its backend),
+so the thread handling the input only formats the output and never waits for the terminal.
+
+Writes go into a display list, which the thread takes and writes when it is flushed. Text
+written at a position (see terminal.addstr) replaces text written at the same position
+earlier that is still in the list, if it covers at least as many cells, so when the
+terminal falls behind only the latest state of each cell is sent. Any other write (moving
+the screen contents, images, modes) keeps its place in the list, and the text before it
+too. The list is double buffered: the thread swaps in an empty list and writes the whole
+taken one with a single write and flush, so the threads only share the list for a moment.
+What is in the list was formatted from the pixels as they were, a snapshot that editing
+the image afterwards doesn't touch. The list counts in the backlog of the output (see
+bandwidth), so the previews draw less when it grows.
+
+Until start() and after stop() the writes go straight to the backend, which lets the
+first frame be drawn before threading is imported.
+"""
+from __future__ import annotations
+
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from pixediter import terminal
+
+if TYPE_CHECKING:
+    import threading
+
+# the write of terminal.addstr(): text (with colors) at a row and column
+_TEXT = re.compile(r"\x1b7\x1b\[(\d+;\d+)f(?:[^\x1b]|\x1b\[[0-9;]*m)*\x1b8\Z")
+_SGR = re.compile(r"\x1b\[[0-9;]*m")
+
+
+class RenderThread(terminal.BackendWrapper):
+    def __init__(self, backend: terminal.Backend):
+        super().__init__(backend)
+        # the writes the thread hasn't taken yet, "" for the replaced ones
+        self._list: list[str] = []
+        # where in the list the text at each position ("row;col") is, since the last write that wasn't text
+        self._texts: dict[str, int] = {}
+        # the characters in the list and in what the thread is writing
+        self._queued = 0
+        self._writing = 0
+        # how many writes were replaced before they were written
+        self.replaced = 0
+        self._flushed = False
+        self._stopping = False
+        self._error: Exception | None = None
+        self._thread: threading.Thread | None = None
+        self._wakeup: threading.Condition | None = None
+
+    def start(self) -> None:
+        import threading
+        # reentrant, for the SIGWINCH handler that draws while the input thread is writing
+        self._wakeup = threading.Condition(threading.RLock())
+        self._thread = threading.Thread(target=self._run, name="render", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Waits for everything in the display list to be written and stops the thread"""
+        if self._wakeup is None or self._thread is None:
+            return
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join()
+        self._thread = self._wakeup = None
+        self._stopping = False
+        self._raise()
+
+    @contextmanager
+    def running(self) -> Iterator[None]:
+        """Writes on the thread inside the with block"""
+        self.start()
+        try:
+            yield
+        finally:
+            self.stop()
+
+    def write(self, text: str) -> None:
+        wakeup = self._wakeup
+        if wakeup is None:
+            self.backend.write(text)
+            return
+        with wakeup:
+            self._append(text)
+
+    def flush(self) -> None:
+        wakeup = self._wakeup
+        if wakeup is None:
+            self.backend.flush()
+            return
+        self._raise()
+        with wakeup:
+            self._flushed = True
+            wakeup.notify()
+
+    def backlog(self) -> int | None:
+        """The output in the display list and being written (in characters) and what the backend has queued"""
+        queued = super().backlog()
+        return self._queued + self._writing + (queued or 0)
+
+    def _append(self, text: str) -> None:
+        match = _TEXT.match(text)
+        if match is None:
+            self._texts.clear()
+        else:
+            position = match.group(1)
+            index = self._texts.get(position)
+            if index is not None and _width(self._list[index], position) <= _width(text, position):
+                self._queued -= len(self._list[index])
+                self._list[index] = ""
+                self.replaced += 1
+            self._texts[position] = len(self._list)
+        self._list.append(text)
+        self._queued += len(text)
+
+    def _run(self) -> None:
+        assert self._wakeup is not None
+        wakeup = self._wakeup
+        while True:
+            with wakeup:
+                while not (self._flushed or self._stopping):
+                    wakeup.wait()
+                writes, self._list = self._list, []
+                self._texts.clear()
+                self._writing, self._queued = self._queued, 0
+                self._flushed = False
+                stopping = self._stopping
+            try:
+                text = "".join(writes)
+                if text:
+                    self.backend.write(text)
+                self.backend.flush()
+            except Exception as error:
+                # e.g. the terminal went away, raised in the input thread when it flushes next
+                self._error = error
+                return
+            finally:
+                self._writing = 0
+            if stopping:
+                return
+
+    def _raise(self) -> None:
+        """Raises what stopped the thread in the input thread, and goes back to writing straight to the backend"""
+        error = self._error
+        if error is None:
+            return
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = self._wakeup = None
+        self._error = None
+        raise error
+
+
+def _width(text: str, position: str) -> int:
+    """The cells covered by a write of terminal.addstr()"""
+    # without the colors, what is left around the text is "\x1b7\x1b[", position, "f" and "\x1b8"
+    return len(_SGR.sub("", text)) - len(position) - 7
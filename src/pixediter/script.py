@@ -0,0 +1,247 @@
+"""
+Headless scripts: runs the command language of the editor on image files without a terminal.
+
+A script is a text file with one command per line, written like on the command line of the
+editor (the leading ':' is optional). Empty lines and lines starting with '#' are skipped.
+Tools are used with
+
+    :tool <name> [left | right] <x> <y> [<x> <y>...]
+
+which presses the mouse button on the first point, drags it through the rest and releases
+it on the last one. Paths given to :save and :open can refer to the file being processed
+with {path}, {dir}, {name} (file name), {stem} (without extension) and {ext}.
+
+Every file is processed on its own, in a pool of worker processes, and results are
+reported in the order the files finish.
+"""
+from __future__ import annotations
+
+import os
+import shlex
+import sys
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
+from concurrent.futures import as_completed
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from pixediter import colors
+from pixediter import commands
+from pixediter import parallel
+from pixediter import transform
+from pixediter.AreaSelector import AreaSelector
+from pixediter.colors import Color
+from pixediter.ColorSelector import ColorSelector
+from pixediter.events import MouseButton
+from pixediter.events import MouseEventType
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+from pixediter.tools import DrawEvent
+from pixediter.ToolSelector import ToolSelector
+
+Line = tuple[int, str]  # (line number, command)
+
+
+class ScriptError(ValueError):
+    pass
+
+
+def parse(text: str) -> list[Line]:
+    """Returns the commands of a script with their line numbers"""
+    lines = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if line and not line.startswith("#"):
+            lines.append((number, line if line.startswith(":") else f":{line}"))
+    return lines
+
+
+@dataclass
+class Result:
+    filepath: str
+    ok: bool
+    commands: int
+    seconds: float
+    error: str = ""
+
+
+class Session:
+    """The state a script works on: the image and its layers, colors and selection"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.color = ColorSelector(primary=colors.GRAY, secondary=colors.WHITE)
+        self.selection = AreaSelector()
+        self.tools = ToolSelector(self.selection)
+        self.layers = LayerStack.from_file(filepath)
+        self.commands: dict[str, Callable[[list[str]], None]] = {
+            ":new": self.new_image,
+            ":open": self.open_image,
+            ":save": self.save_image,
+            ":setcolor": self.setcolor,
+            ":crop": self.crop,
+            ":scale": self.scale,
+            ":rotate": self.rotate,
+            ":flip": self.flip,
+            ":transpose": self.transpose,
+            ":filter": self.filter,
+            ":layer": self.layer,
+            ":select": self.select,
+            ":copy": self.copy,
+            ":cut": self.cut,
+            ":paste": self.paste,
+            ":fill": self.fill,
+            ":recolor": self.recolor,
+            ":tool": self.tool,
+        }
+
+    @property
+    def image(self) -> ImageData:
+        return self.layers.active.image
+
+    def run(self, command: str) -> None:
+        cmd, *args = shlex.split(command)
+        if cmd not in self.commands:
+            raise ScriptError(f"Unknown command '{cmd}'")
+        self.commands[cmd](args)
+
+    def expand(self, path: str) -> str:
+        """Fills in the placeholders that refer to the file being processed"""
+        directory, name = os.path.split(self.filepath)
+        stem, ext = os.path.splitext(name)
+        return path.format(path=self.filepath, dir=directory or ".", name=name, stem=stem, ext=ext)
+
+    def _set_layers(self, layers: LayerStack) -> None:
+        self.layers = layers
+        self.selection.select(None)
+
+    def _transform(self, fn: transform.Transform) -> None:
+        self.layers.transform(fn)
+        self.selection.select(None)
+
+    def new_image(self, args: list[str]) -> None:
+        self._set_layers(LayerStack(ImageData(*commands.image_size(args))))
+
+    def open_image(self, args: list[str]) -> None:
+        path, = args
+        self._set_layers(LayerStack.from_file(self.expand(path)))
+
+    def save_image(self, args: list[str]) -> None:
+        if len(args) > 1:
+            raise ScriptError("save takes at most one path")
+        self.layers.save_file(self.expand(args[0]) if args else self.filepath)
+
+    def setcolor(self, args: list[str]) -> None:
+        commands.setcolor(self.color, args)
+
+    def crop(self, args: list[str]) -> None:
+        self.layers.crop(*commands.crop_area(args))
+        self.selection.select(None)
+
+    def scale(self, args: list[str]) -> None:
+        self._transform(commands.scale(args, self.layers.width, self.layers.height))
+
+    def rotate(self, args: list[str]) -> None:
+        self._transform(commands.rotate(args))
+
+    def flip(self, args: list[str]) -> None:
+        self._transform(commands.flip(args))
+
+    def transpose(self, args: list[str]) -> None:
+        self._transform(commands.transpose(args))
+
+    def filter(self, args: list[str]) -> None:
+        commands.filter_pipeline(args).apply_to_image(self.image)
+
+    def layer(self, args: list[str]) -> None:
+        commands.layer(self.layers, args)
+
+    def select(self, args: list[str]) -> None:
+        commands.select(self.selection, self.image, args)
+
+    def copy(self, args: list[str]) -> None:
+        commands.copy(self.selection, self.image)
+
+    def cut(self, args: list[str]) -> None:
+        commands.cut(self.selection, self.image)
+
+    def paste(self, args: list[str]) -> None:
+        commands.paste(self.selection, self.image, args)
+
+    def fill(self, args: list[str]) -> None:
+        commands.fill(self.selection, self.image, self.color, args)
+
+    def recolor(self, args: list[str]) -> None:
+        commands.recolor(self.selection, self.image, args)
+
+    def tool(self, args: list[str]) -> None:
+        if not args:
+            raise ScriptError("tool requires the name of a tool")
+        name, *rest = args
+        found = next((tool for tool in self.tools.names if tool.lower() == name.lower()), None)
+        if found is None:
+            raise ScriptError(f"Unknown tool '{name}' (available: {', '.join(self.tools.names)})")
+        tool = self.tools.select(found)
+        button = MouseButton.LEFT
+        if rest and rest[0] in ("left", "right"):
+            button = MouseButton.LEFT if rest.pop(0) == "left" else MouseButton.RIGHT
+        if not rest or len(rest) % 2:
+            raise ScriptError("tool requires one or more x y coordinates")
+        points = [(int(x), int(y)) for x, y in zip(rest[::2], rest[1::2])]
+
+        def no_preview(x: int, y: int, color: Color) -> None:
+            pass
+
+        img = self.image
+        tool.mouse_down(img, DrawEvent(points[0], MouseEventType.MOUSE_DOWN, button, self.color), no_preview)
+        for point in points[1:]:
+            tool.mouse_drag(img, DrawEvent(point, MouseEventType.MOUSE_DRAG, button, self.color), no_preview)
+        tool.mouse_up(img, DrawEvent(points[-1], MouseEventType.MOUSE_UP, button, self.color), no_preview)
+        tool.reset_state()
+
+
+def run_file(lines: list[Line], filepath: str) -> Result:
+    """Runs the script on a single file, errors are reported in the result"""
+    start = time.perf_counter()
+    done = 0
+    try:
+        session = Session(filepath)
+        for number, command in lines:
+            try:
+                session.run(command)
+            except Exception as exc:
+                raise ScriptError(f"line {number} ({command}): {exc}") from exc
+            done += 1
+    except Exception as exc:
+        return Result(filepath, False, done, time.perf_counter() - start, str(exc))
+    return Result(filepath, True, done, time.perf_counter() - start)
+
+
+def run(lines: list[Line], filepaths: list[str], jobs: int | None = None) -> Iterator[Result]:
+    """Runs the script on every file, yields the results as soon as files are finished"""
+    jobs = min(jobs or os.cpu_count() or 1, len(filepaths))
+    if jobs <= 1:
+        for filepath in filepaths:
+            yield run_file(lines, filepath)
+        return
+    # the files are already processed in parallel, so the workers don't start pools of their own
+    with ProcessPoolExecutor(max_workers=jobs, initializer=parallel.run_serially) as pool:
+        futures = [pool.submit(run_file, lines, filepath) for filepath in filepaths]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(script_path: str, filepaths: list[str], jobs: int | None = None) -> int:
+    """Runs the script at script_path on the files and prints a line per file, returns the exit status"""
+    with open(script_path) as f:
+        lines = parse(f.read())
+    failed = 0
+    for result in run(lines, filepaths, jobs):
+        if result.ok:
+            print(f"ok     {result.filepath} ({result.commands} commands, {result.seconds * 1000:.1f} ms)", flush=True)
+        else:
+            failed += 1
+            print(f"error  {result.filepath}: {result.error}", flush=True)
+    print(f"{len(filepaths) - failed} of {len(filepaths)} files done", file=sys.stderr)
+    return 1 if failed else 0
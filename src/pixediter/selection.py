@@ -0,0 +1,213 @@
+"""
+Selections and clipboard operations.
+
+A selection is stored as one integer per row of the image, bit x of a row is set
+when pixel x of that row is selected. All operations work on runs of selected pixels
+("spans") so that they can copy whole slices of the pixel buffer at once.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from pixediter import colors
+from pixediter.colors import Color
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+
+
+Span = tuple[int, int, int]  # (y, x0, x1), x1 exclusive
+
+
+def bit_spans(mask: int) -> Iterator[tuple[int, int]]:
+    """Yields (start, end) of every run of set bits in mask, end exclusive"""
+    x = 0
+    while mask:
+        skip = (mask & -mask).bit_length() - 1
+        mask >>= skip
+        x += skip
+        run = (mask ^ (mask + 1)).bit_length() - 1
+        yield x, x + run
+        mask >>= run
+        x += run
+
+
+class Selection:
+    def __init__(self, width: int, height: int, rows: list[int] | None = None):
+        self.width = width
+        self.height = height
+        self.rows = rows if rows is not None else [0] * height
+
+    @classmethod
+    def rectangle(cls, width: int, height: int, x0: int, y0: int, x1: int, y1: int) -> Selection:
+        """Selects the rectangle between the corners (x0, y0) and (x1, y1) (inclusive)"""
+        if x0 > x1:
+            x0, x1 = x1, x0
+        if y0 > y1:
+            y0, y1 = y1, y0
+        x0, x1 = max(0, x0), min(width - 1, x1)
+        y0, y1 = max(0, y0), min(height - 1, y1)
+        rows = [0] * height
+        if x0 <= x1:
+            mask = ((1 << (x1 - x0 + 1)) - 1) << x0
+            for y in range(y0, y1 + 1):
+                rows[y] = mask
+        return cls(width, height, rows)
+
+    @classmethod
+    def everything(cls, width: int, height: int) -> Selection:
+        return cls.rectangle(width, height, 0, 0, width - 1, height - 1)
+
+    @classmethod
+    def magic_wand(cls, img: ImageData, x: int, y: int) -> Selection:
+        """Selects the contiguous area that has the same color as pixel (x, y)"""
+        data = img.data
+        stride = img.width * BYTES_PER_PIXEL
+        start = img.offset(x, y)
+        target = bytes(data[start:start + BYTES_PER_PIXEL])
+        rows = [0] * img.height
+
+        def matches(x: int, y: int) -> bool:
+            i = y * stride + x * BYTES_PER_PIXEL
+            return data[i:i + BYTES_PER_PIXEL] == target
+
+        stack = [(x, y)]
+        while stack:
+            x, y = stack.pop()
+            if (rows[y] >> x) & 1:
+                continue
+            # expand to the whole horizontal run of matching pixels
+            x0 = x
+            while x0 > 0 and matches(x0 - 1, y):
+                x0 -= 1
+            x1 = x + 1
+            while x1 < img.width and matches(x1, y):
+                x1 += 1
+            rows[y] |= ((1 << (x1 - x0)) - 1) << x0
+            for ny in (y - 1, y + 1):
+                if not 0 <= ny < img.height:
+                    continue
+                in_run = False
+                for nx in range(x0, x1):
+                    if not (rows[ny] >> nx) & 1 and matches(nx, ny):
+                        if not in_run:
+                            stack.append((nx, ny))
+                            in_run = True
+                    else:
+                        in_run = False
+        return cls(img.width, img.height, rows)
+
+    def __bool__(self) -> bool:
+        return any(self.rows)
+
+    def contains(self, x: int, y: int) -> bool:
+        return 0 <= y < self.height and x >= 0 and bool((self.rows[y] >> x) & 1)
+
+    def spans(self) -> Iterator[Span]:
+        for y, mask in enumerate(self.rows):
+            for x0, x1 in bit_spans(mask):
+                yield y, x0, x1
+
+    def bbox(self) -> tuple[int, int, int, int] | None:
+        """Returns (x0, y0, x1, y1) of the selected area (x1 and y1 exclusive)"""
+        used = [y for y, mask in enumerate(self.rows) if mask]
+        if not used:
+            return None
+        combined = 0
+        for y in used:
+            combined |= self.rows[y]
+        x0 = (combined & -combined).bit_length() - 1
+        return x0, used[0], combined.bit_length(), used[-1] + 1
+
+    def union(self, other: Selection) -> Selection:
+        return Selection(self.width, self.height, [a | b for a, b in zip(self.rows, other.rows)])
+
+    def difference_spans(self, other: Selection | None) -> Iterator[Span]:
+        """Yields the spans of pixels whose selected state differs between self and other"""
+        other_rows = other.rows if other is not None else [0] * self.height
+        for y, (a, b) in enumerate(zip(self.rows, other_rows)):
+            for x0, x1 in bit_spans(a ^ b):
+                yield y, x0, x1
+
+    def placed(self, width: int, height: int, x: int, y: int) -> Selection:
+        """Returns this selection moved to (x, y) on a canvas of the given size"""
+        rows = [0] * height
+        limit = (1 << width) - 1
+        for row_y, mask in enumerate(self.rows):
+            if 0 <= row_y + y < height:
+                rows[row_y + y] = (mask << x if x >= 0 else mask >> -x) & limit
+        return Selection(width, height, rows)
+
+
+@dataclass
+class Clipboard:
+    width: int
+    height: int
+    data: bytes
+    # which pixels of the clipboard were selected
+    mask: Selection
+
+
+def copy(img: ImageData, selection: Selection) -> Clipboard | None:
+    """Copies the selected pixels, unselected pixels inside the bounding box are transparent"""
+    bbox = selection.bbox()
+    if bbox is None:
+        return None
+    bx0, by0, bx1, by1 = bbox
+    width = bx1 - bx0
+    out = bytearray(width * (by1 - by0) * BYTES_PER_PIXEL)
+    stride = img.width * BYTES_PER_PIXEL
+    for y, x0, x1 in selection.spans():
+        src = y * stride + x0 * BYTES_PER_PIXEL
+        dst = ((y - by0) * width + x0 - bx0) * BYTES_PER_PIXEL
+        length = (x1 - x0) * BYTES_PER_PIXEL
+        out[dst:dst + length] = img.data[src:src + length]
+    mask = Selection(width, by1 - by0, [selection.rows[y] >> bx0 for y in range(by0, by1)])
+    return Clipboard(width, by1 - by0, bytes(out), mask)
+
+
+def fill(img: ImageData, selection: Selection, color: Color, blend: bool = True) -> None:
+    """Fills the selected pixels with color, blending translucent colors unless blend is False"""
+    for y, x0, x1 in selection.spans():
+        img.fill_span(x0, x1, y, color, blend)
+    bbox = selection.bbox()
+    if bbox is not None:
+        img.mark_changed(*bbox)
+
+
+def clear(img: ImageData, selection: Selection) -> None:
+    fill(img, selection, colors.TRANSPARENT, blend=False)
+
+
+def paste(img: ImageData, clip: Clipboard, x: int, y: int) -> None:
+    """Composites the clipboard on top of img with its top left corner at (x, y)"""
+    row_length = clip.width * BYTES_PER_PIXEL
+    for row_y in range(clip.height):
+        row = clip.data[row_y * row_length:(row_y + 1) * row_length]
+        img.blend_row(x, y + row_y, row)
+    img.mark_changed(max(0, x), max(0, y), min(img.width, x + clip.width), min(img.height, y + clip.height))
+
+
+def recolor(img: ImageData, selection: Selection, old: Color, new: Color) -> int:
+    """Replaces the selected pixels that are exactly old with new, returns how many were replaced"""
+    target = bytes(old.rgba())
+    replacement = bytes(new.rgba())
+    data = img.data
+    stride = img.width * BYTES_PER_PIXEL
+    count = 0
+    for y, x0, x1 in selection.spans():
+        end = y * stride + x1 * BYTES_PER_PIXEL
+        # searching is done by find, matches that don't start at a pixel boundary are skipped
+        pos = data.find(target, y * stride + x0 * BYTES_PER_PIXEL, end)
+        while pos != -1:
+            misaligned = pos % BYTES_PER_PIXEL
+            if misaligned:
+                pos = data.find(target, pos + BYTES_PER_PIXEL - misaligned, end)
+                continue
+            data[pos:pos + BYTES_PER_PIXEL] = replacement
+            count += 1
+            pos = data.find(target, pos + BYTES_PER_PIXEL, end)
+    bbox = selection.bbox()
+    if count and bbox is not None:
+        img.mark_changed(*bbox)
+    return count
@@ -1,44 +1,425 @@
+"""
+Output to the terminal.
+
+Everything is written through a backend: normally the real terminal on stdout, but any
+object with write, flush and size (e.g. a VirtualTerminal) can be swapped in with using(),
+so the whole user interface can be rendered without a pty.
+
+The size of the terminal is asked from the backend once and remembered until resized() is
+called, which the SIGWINCH handler installed by resize_handler() does, so rendering doesn't
+make a system call for every question about the size.
+
+Writes can be clipped to a rectangle with clipped(), which lets a part of the screen be
+repainted by rendering whatever covers it without touching the cells around it.
+
+What is already on the screen can be moved with shift() instead of drawing it again, if the
+terminal has the features for it: scroll regions (DECSTBM with SU/SD) move whole rows up
+and down, with left and right margins (DECSLRM) only a part of them, and rectangle copy
+(DECCRA) moves any rectangle in any direction. A backend tells what it supports with its
+features attribute; the real terminal guesses from the environment, see detect_features().
+It may also tell how much of the output the terminal hasn't read yet (see bandwidth).
+
+Colors are written as 24-bit RGB unless the backend's color_depth says the terminal only
+has a palette of 256 or 16 colors, which tmux and screen often don't pass RGB colors
+through to. Then colors are mapped to the nearest in the palette (see indexed_colors),
+which also makes the sequences shorter. The real terminal guesses the depth from the
+environment too, see detect_color_depth().
+"""
+from __future__ import annotations
+
 import os
+import re
 import sys
+from collections.abc import Callable
 from collections.abc import Iterator
+from collections.abc import Mapping
 from contextlib import contextmanager
+from typing import Any
+from typing import Protocol
+from typing import TYPE_CHECKING
+from typing import TypeVar
+
+if TYPE_CHECKING:
+    from pixediter import indexed_colors
+
+
+class Backend(Protocol):
+    def write(self, text: str) -> None:
+        ...
+
+    def flush(self) -> None:
+        ...
+
+    def size(self) -> tuple[int, int]:
+        """Returns (columns, rows)"""
+        ...
+
+
+SCROLL_REGIONS = "scroll-regions"
+LEFT_RIGHT_MARGINS = "left-right-margins"
+RECTANGLE_COPY = "rectangle-copy"
+FEATURES = (SCROLL_REGIONS, LEFT_RIGHT_MARGINS, RECTANGLE_COPY)
+# ways of drawing images (see graphics)
+KITTY_GRAPHICS = "kitty-graphics"
+SIXEL = "sixel"
+GRAPHICS = (KITTY_GRAPHICS, SIXEL)
+# a comma separated list of the FEATURES and GRAPHICS of the terminal, instead of guessing them
+FEATURES_VARIABLE = "PIXEDITER_TERMINAL_FEATURES"
+# the size of a cell in pixels (width, height) when the terminal doesn't tell
+DEFAULT_CELL_SIZE = (10, 20)
+# how many colors the terminal can show
+TRUECOLOR = "truecolor"
+COLORS_256 = "256"
+COLORS_16 = "16"
+COLOR_DEPTHS = (TRUECOLOR, COLORS_256, COLORS_16)
+# one of the COLOR_DEPTHS, instead of guessing it
+COLORS_VARIABLE = "PIXEDITER_COLORS"
+
+
+def detect_features(environ: Mapping[str, str]) -> frozenset[str]:
+    """Guesses what the terminal supports from the environment"""
+    listed = environ.get(FEATURES_VARIABLE)
+    if listed is not None:
+        return frozenset(feature for feature in listed.split(",") if feature in FEATURES + GRAPHICS)
+    term = environ.get("TERM", "")
+    if term in ("", "dumb", "linux"):
+        return frozenset()
+    found = {SCROLL_REGIONS}
+    # margins and copying rectangles are rare outside of xterm itself
+    if term.startswith("xterm") and "XTERM_VERSION" in environ:
+        found.update(FEATURES)
+    # tmux doesn't pass images through
+    program = environ.get("TERM_PROGRAM", "")
+    if "TMUX" in environ:
+        pass
+    elif term == "xterm-kitty" or "KITTY_WINDOW_ID" in environ or program in ("WezTerm", "ghostty"):
+        found.add(KITTY_GRAPHICS)
+    elif term.startswith(("foot", "mlterm")) or program == "mintty":
+        found.add(SIXEL)
+    return frozenset(found)
+
+
+def detect_color_depth(environ: Mapping[str, str]) -> str:
+    """Guesses how many colors the terminal can show from the environment"""
+    listed = environ.get(COLORS_VARIABLE)
+    if listed in COLOR_DEPTHS:
+        return listed
+    term = environ.get("TERM", "")
+    if term in ("", "dumb", "linux") or term.startswith("vt"):
+        return COLORS_16
+    # multiplexers pass RGB colors through only when configured to, whatever the terminal outside says
+    if "TMUX" in environ or "STY" in environ or term.startswith(("screen", "tmux")):
+        return COLORS_256
+    if environ.get("COLORTERM") in ("truecolor", "24bit"):
+        return TRUECOLOR
+    return COLORS_256 if term.endswith("256color") else TRUECOLOR
+
+
+def features(backend: Backend | None = None) -> frozenset[str]:
+    """What backend (by default the current one) supports of FEATURES and GRAPHICS"""
+    found: frozenset[str] = getattr(_backend if backend is None else backend, "features", frozenset())
+    return found
+
+
+def color_depth(backend: Backend | None = None) -> str:
+    """How many colors backend (by default the current one) can show, one of the COLOR_DEPTHS"""
+    depth: str = getattr(_backend if backend is None else backend, "color_depth", TRUECOLOR)
+    return depth
+
+
+def cell_size() -> tuple[int, int]:
+    """The size of a cell in pixels (width, height)"""
+    get_size = getattr(_backend, "cell_size", None)
+    size: tuple[int, int] | None = get_size() if get_size is not None else None
+    return DEFAULT_CELL_SIZE if size is None else size
+
+
+class StdoutBackend:
+    """The terminal the program is running in"""
+
+    def __init__(self, color_depth: str | None = None) -> None:
+        self.features = detect_features(os.environ)
+        self.color_depth = detect_color_depth(os.environ) if color_depth is None else color_depth
+
+    def write(self, text: str) -> None:
+        sys.stdout.write(text)
+
+    def flush(self) -> None:
+        sys.stdout.flush()
+
+    def size(self) -> tuple[int, int]:
+        columns, rows = os.get_terminal_size()
+        return columns, rows
+
+    def cell_size(self) -> tuple[int, int] | None:
+        """The size of a cell in pixels, None if the terminal doesn't tell"""
+        import fcntl
+        import struct
+        import termios
+        try:
+            window = fcntl.ioctl(sys.stdout.fileno(), termios.TIOCGWINSZ, bytes(8))
+        except OSError:
+            return None
+        rows, columns, width, height = struct.unpack("HHHH", window)
+        if not (rows and columns and width and height):
+            return None
+        return width // columns, height // rows
+
+    def backlog(self) -> int | None:
+        """The bytes in the tty's output queue that the terminal hasn't read yet, None if it can't be told"""
+        import fcntl
+        import struct
+        import termios
+        request = getattr(termios, "TIOCOUTQ", None)
+        if request is None:
+            return None
+        try:
+            queued = fcntl.ioctl(sys.stdout.fileno(), request, bytes(4))
+        except OSError:
+            return None
+        count: int = struct.unpack("i", queued)[0]
+        return count
+
+
+class BackendWrapper:
+    """
+    Passes output to another backend. Subclasses change what they add to, everything else
+    (the optional methods and attributes of backends too) is the other backend's.
+    """
+
+    def __init__(self, backend: Backend):
+        self.backend = backend
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for what the wrapper doesn't have itself
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def write(self, text: str) -> None:
+        self.backend.write(text)
+
+    def flush(self) -> None:
+        self.backend.flush()
+
+    def size(self) -> tuple[int, int]:
+        return self.backend.size()
+
+    def cell_size(self) -> tuple[int, int] | None:
+        get_size = getattr(self.backend, "cell_size", None)
+        size: tuple[int, int] | None = get_size() if get_size is not None else None
+        return size
+
+    def backlog(self) -> int | None:
+        get_backlog = getattr(self.backend, "backlog", None)
+        backlog: int | None = get_backlog() if get_backlog is not None else None
+        return backlog
+
+
+_backend: Backend = StdoutBackend()
+_size: tuple[int, int] | None = None
+# x0, y0, x1, y1: the columns and rows (corners included) that can be written, None for all
+_clip: tuple[int, int, int, int] | None = None
+_SGR = re.compile(r"(\x1b\[[0-9;]*m)")
+_depth = color_depth()
+# the palette of _depth if it isn't TRUECOLOR, made when it's first needed
+_indexed: indexed_colors.Palette | None = None
+
+B = TypeVar("B", bound=Backend)
+
+
+@contextmanager
+def using(new_backend: B) -> Iterator[B]:
+    """Sends all output to new_backend inside the with block"""
+    global _backend, _size, _depth, _indexed
+    old_backend, _backend = _backend, new_backend
+    old_depth, _depth = _depth, color_depth(new_backend)
+    old_indexed, _indexed = _indexed, None
+    _size = None
+    try:
+        yield new_backend
+    finally:
+        _backend = old_backend
+        _depth, _indexed = old_depth, old_indexed
+        _size = None
 
 
 def enable_mouse_tracking() -> None:
-    sys.stdout.write("\033[?1000;1002;1006;1015h")
-    sys.stdout.flush()
+    _backend.write("\033[?1000;1002;1006;1015h")
+    _backend.flush()
 
 
 def disable_mouse_tracking() -> None:
-    sys.stdout.write("\033[?1000;1002;1006;1015l")
-    sys.stdout.flush()
+    _backend.write("\033[?1000;1002;1006;1015l")
+    _backend.flush()
 
 
 def hide_cursor() -> None:
-    sys.stdout.write("\033[?25l")
-    sys.stdout.flush()
+    _backend.write("\033[?25l")
+    _backend.flush()
 
 
 def show_cursor() -> None:
-    sys.stdout.write("\x1b[?25h")
-    sys.stdout.flush()
+    _backend.write("\x1b[?25h")
+    _backend.flush()
 
 
 def size() -> tuple[int, int]:
-    return os.get_terminal_size()
+    global _size
+    if _size is None:
+        _size = _backend.size()
+    return _size
+
+
+def resized() -> None:
+    """Forgets the size of the terminal, so that it's asked again the next time it's needed"""
+    global _size
+    _size = None
+
+
+@contextmanager
+def resize_handler(callback: Callable[[], None]) -> Iterator[None]:
+    """Calls callback when the terminal is resized (on SIGWINCH) inside the with block"""
+    import signal
+
+    def on_sigwinch(signum: int, frame: object) -> None:
+        resized()
+        callback()
+
+    previous = signal.signal(signal.SIGWINCH, on_sigwinch)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGWINCH, previous)
 
 
 def clear() -> None:
-    sys.stdout.write("\033[2J")
+    _backend.write("\033[2J")
 
 
 def colorize(text: str, r: int, g: int, b: int) -> str:
-    return f"\x1b[38;2;{r};{g};{b}m{text}\x1b[0m"
+    if _depth == TRUECOLOR:
+        return f"\x1b[38;2;{r};{g};{b}m{text}\x1b[0m"
+    return f"\x1b[{_palette().foreground(r, g, b)}m{text}\x1b[0m"
+
+
+def colorize_cell(text: str, fg: tuple[int, int, int], bg: tuple[int, int, int]) -> str:
+    """Like colorize() with a background color too"""
+    if _depth == TRUECOLOR:
+        return f"\x1b[38;2;{fg[0]};{fg[1]};{fg[2]};48;2;{bg[0]};{bg[1]};{bg[2]}m{text}\x1b[0m"
+    palette = _palette()
+    return f"\x1b[{palette.foreground(*fg)};{palette.background(*bg)}m{text}\x1b[0m"
+
+
+def _palette() -> indexed_colors.Palette:
+    global _indexed
+    if _indexed is None:
+        from pixediter import indexed_colors
+        _indexed = indexed_colors.palette(_depth)
+    return _indexed
 
 
 def addstr(row: int, col: int, text: str) -> None:
-    sys.stdout.write(f"\x1b7\x1b[{row};{col}f{text}\x1b8")
-    sys.stdout.flush()
+    if _clip is not None:
+        col, text = _clipped_text(row, col, text, _clip)
+        if not text:
+            return
+    _backend.write(f"\x1b7\x1b[{row};{col}f{text}\x1b8")
+    _backend.flush()
+
+
+def send(sequence: str) -> None:
+    """Writes escape sequences that don't draw anything, e.g. to send an image to be shown later"""
+    _backend.write(sequence)
+    _backend.flush()
+
+
+def draw_image(row: int, col: int, sequence: str) -> None:
+    """
+    Writes the escape sequences of an image (see graphics) with the cursor at row, col.
+    Images are not cut to the clipped area, they are left out if row, col is outside it.
+    """
+    if _clip is not None:
+        x0, y0, x1, y1 = _clip
+        if not (x0 <= col <= x1 and y0 <= row <= y1):
+            return
+    _backend.write(f"\x1b7\x1b[{row};{col}f{sequence}\x1b8")
+    _backend.flush()
+
+
+def _clipped_text(row: int, col: int, text: str, clip: tuple[int, int, int, int]) -> tuple[int, str]:
+    """
+    Returns where the part of text (written at row, col) inside clip starts and the part,
+    with all of the color sequences kept. Every other character is assumed to be one column.
+    """
+    x0, y0, x1, y1 = clip
+    if not y0 <= row <= y1:
+        return col, ""
+    parts = _SGR.split(text)
+    start = None
+    x = col
+    # the parts alternate between text and color sequences
+    for i in range(0, len(parts), 2):
+        part = parts[i]
+        visible = part[max(0, x0 - x):max(0, x1 - x + 1)]
+        if visible and start is None:
+            start = max(x, x0)
+        parts[i] = visible
+        x += len(part)
+    if start is None:
+        return col, ""
+    return start, "".join(parts)
+
+
+def shift(x0: int, y0: int, x1: int, y1: int, dx: int, dy: int, whole_rows: bool = False) -> bool:
+    """
+    Moves what is on the screen in the cells x0 <= column <= x1, y0 <= row <= y1 by dx
+    columns and dy rows, what moves out of the area is lost and the cells that are left
+    need to be drawn again. With whole_rows the rest of the rows may move too, e.g. when
+    they look the same on every row. Returns False if the terminal can't do it.
+    """
+    if dx == dy == 0:
+        return True
+    if abs(dx) > x1 - x0 or abs(dy) > y1 - y0:
+        # nothing would be left to move
+        return False
+    supported = features()
+    if RECTANGLE_COPY in supported:
+        # the part of the area that is still inside it after moving
+        sx0, sy0, sx1, sy1 = max(x0, x0 - dx), max(y0, y0 - dy), min(x1, x1 - dx), min(y1, y1 - dy)
+        _backend.write(f"\x1b[{sy0};{sx0};{sy1};{sx1};1;{sy0 + dy};{sx0 + dx};1$v")
+        _backend.flush()
+        return True
+    margins = LEFT_RIGHT_MARGINS in supported and not whole_rows
+    if dx != 0 or SCROLL_REGIONS not in supported or not (whole_rows or margins):
+        return False
+    # setting the margins moves the cursor, so it's saved around them
+    sequence = "\x1b7"
+    if margins:
+        sequence += f"\x1b[?69h\x1b[{x0};{x1}s"
+    sequence += f"\x1b[{y0};{y1}r"
+    sequence += f"\x1b[{-dy}S" if dy < 0 else f"\x1b[{dy}T"
+    sequence += "\x1b[r"
+    if margins:
+        sequence += "\x1b[?69l"
+    _backend.write(sequence + "\x1b8")
+    _backend.flush()
+    return True
+
+
+@contextmanager
+def clipped(x0: int, y0: int, x1: int, y1: int) -> Iterator[None]:
+    """Inside the with block, only the cells x0 <= column <= x1, y0 <= row <= y1 are written"""
+    global _clip
+    old_clip = _clip
+    if old_clip is not None:
+        ox0, oy0, ox1, oy1 = old_clip
+        x0, y0, x1, y1 = max(x0, ox0), max(y0, oy0), min(x1, ox1), min(y1, oy1)
+    _clip = (x0, y0, x1, y1)
+    try:
+        yield
+    finally:
+        _clip = old_clip
 
 
 @contextmanager
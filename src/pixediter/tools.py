@@ -6,10 +6,14 @@ from collections.abc import Iterator
 from dataclasses import dataclass
 from typing import Protocol
 
+from pixediter import blending
+from pixediter import selection
+from pixediter.AreaSelector import AreaSelector
 from pixediter.colors import Color
 from pixediter.ColorSelector import ColorSelector
 from pixediter.events import MouseButton
 from pixediter.events import MouseEventType
+from pixediter.image import BYTES_PER_PIXEL
 from pixediter.image import ImageData
 from pixediter.utils import rect
 
@@ -52,26 +56,27 @@ class Tool(Protocol):
 class PencilTool:
     name = "Pencil"
 
-    @staticmethod
-    def mouse_down(img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
-        return PencilTool.mouse_drag(img, ev, draw)
+    def __init__(self) -> None:
+        # translucent colors should only be blended once per pixel during a stroke
+        self.painted: set[Pos] = set()
 
-    @staticmethod
-    def mouse_up(img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+    def mouse_down(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        return self.mouse_drag(img, ev, draw)
+
+    def mouse_up(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
         return False
 
-    @staticmethod
-    def mouse_drag(img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+    def mouse_drag(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
         if ev.button in (MouseButton.LEFT, MouseButton.RIGHT):
-            color = ev.active_color()
-            draw(*ev.pos, color)
-            img[ev.pos] = color
+            if ev.pos not in self.painted:
+                img.blend(ev.pos, ev.active_color())
+                self.painted.add(ev.pos)
+                draw(*ev.pos, img[ev.pos])
             return True
         return False
 
-    @staticmethod
-    def reset_state() -> None:
-        pass
+    def reset_state(self) -> None:
+        self.painted = set()
 
 
 class RectangleTool:
@@ -92,7 +97,7 @@ class RectangleTool:
         if ev.button.left() or ev.button.right():
             self.starting_pos = ev.pos
             color = ev.active_color()
-            draw(*ev.pos, color)
+            draw(*ev.pos, img.composited(ev.pos, color))
             self.last_drawn[ev.pos] = color
             return True
 
@@ -121,7 +126,7 @@ class RectangleTool:
         # draw current
         for x, y in rect(start_x, start_y, curr_x, curr_y):
             if (0 <= x < img.width) and (0 <= y < img.height):
-                draw(x, y, color)
+                draw(x, y, img.composited((x, y), color))
                 drawn[(x, y)] = color
 
         # clean up previous
@@ -137,7 +142,7 @@ class RectangleTool:
             return False
         # draw permanently
         for (x, y), color in self.last_drawn.items():
-            img[x, y] = color
+            img.blend((x, y), color)
         return True
 
     def reset_state(self) -> None:
@@ -196,7 +201,7 @@ class LineTool:
         if ev.button in (MouseButton.LEFT, MouseButton.RIGHT):
             self.starting_pos = ev.pos
             color = ev.active_color()
-            draw(*ev.pos, color)
+            draw(*ev.pos, img.composited(ev.pos, color))
             self.last_drawn[ev.pos] = color
             return True
 
@@ -210,7 +215,7 @@ class LineTool:
         drawn = {}
         # draw current
         for x, y in self.line(self.starting_pos, ev.pos):
-            draw(x, y, color)
+            draw(x, y, img.composited((x, y), color))
             drawn[(x, y)] = color
 
         # clean up previous
@@ -227,7 +232,7 @@ class LineTool:
 
         # draw permanently
         for (x, y), color in self.last_drawn.items():
-            img[x, y] = color
+            img.blend((x, y), color)
         return True
 
     def reset_state(self) -> None:
@@ -238,10 +243,17 @@ class LineTool:
 class FillTool:
     name = "Fill"
 
+    def __init__(self) -> None:
+        # dragging over an area that was already filled during this stroke should not blend it again
+        self.filled: set[Pos] = set()
+
     def mouse_down(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        if ev.pos in self.filled:
+            return True
         img_x, img_y = ev.pos
         from_color = img[img_x, img_y]
-        color = ev.active_color()
+        # every filled pixel has the same color to begin with so the result is the same for all of them
+        color = img.composited(ev.pos, ev.active_color())
         if from_color == color:
             return True
         stack = [(img_x, img_y)]
@@ -261,6 +273,7 @@ class FillTool:
                 stack.append((x, y + 1))
             if x < img.width - 1 and (x + 1, y) not in visited:
                 stack.append((x + 1, y))
+        self.filled |= visited
         return True
 
     def mouse_up(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
@@ -270,7 +283,7 @@ class FillTool:
         return self.mouse_down(img, ev, draw)
 
     def reset_state(self) -> None:
-        pass
+        self.filled = set()
 
 
 def vector_projection(target: Pos, vec: Pos) -> tuple[float, float]:
@@ -367,7 +380,7 @@ class Gradient:
             return False
 
         x, y = ev.pos
-        draw(x, y, self.color_a)
+        draw(x, y, img.composited(ev.pos, self.color_a))
         self.last_drawn = {ev.pos: self.color_a}
         self.start = ev.pos
         return True
@@ -376,7 +389,7 @@ class Gradient:
         if not self.is_started():
             return False
         for (x, y), color in self.last_drawn.items():
-            img[x, y] = color
+            img.blend((x, y), color)
         self.reset_state()
         return True
 
@@ -390,7 +403,7 @@ class Gradient:
         gradient = self.radial_gradient if ev.button.ctrl() else self.linear_gradient
         for (x, y), color in gradient(img, self.start, ev.pos, self.color_a, self.color_b, lerp):
             drawn[x, y] = color
-            draw(x, y, color)
+            draw(x, y, img.composited((x, y), color))
         for x, y in self.last_drawn:
             if (x, y) not in drawn:
                 draw(x, y, img[x, y])
@@ -400,3 +413,154 @@ class Gradient:
     def reset_state(self) -> None:
         self.start = (-1, -1)
         self.last_drawn = {}
+
+
+class SelectTool:
+    """
+    Dragging selects a rectangle, dragging a selected area with the left button moves
+    the selected pixels
+    """
+    name = "Select"
+
+    def __init__(self, selector: AreaSelector) -> None:
+        self.selector = selector
+        self.starting_pos = (-1, -1)
+        # pixels that are being moved, they are not part of the image until mouse is released
+        self.floating: selection.Clipboard | None = None
+        self.floating_origin = (0, 0)
+        self.floating_pos = (0, 0)
+        self.img: ImageData | None = None
+
+    def is_started(self) -> bool:
+        return self.starting_pos != (-1, -1)
+
+    def mouse_down(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        if self.is_started():
+            # pressing another mouse button while dragging cancels
+            if self.floating is not None:
+                self._preview_move(img, draw, self.floating_pos, self.floating_origin)
+                self.floating_pos = self.floating_origin
+            self.reset_state()
+            return True
+        if not (ev.button.left() or ev.button.right()):
+            return False
+
+        self.img = img
+        self.starting_pos = ev.pos
+        current = self.selector.current
+        if ev.button.left() and current is not None and current.contains(*ev.pos):
+            # lift the selected pixels from the image, what is shown stays the same
+            self.floating = selection.copy(img, current)
+            bbox = current.bbox()
+            assert bbox is not None
+            self.floating_origin = self.floating_pos = bbox[:2]
+            self.selector.select(None)
+            selection.clear(img, current)
+        else:
+            self.selector.select(selection.Selection.rectangle(img.width, img.height, *ev.pos, *ev.pos))
+        return True
+
+    def mouse_drag(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        if not self.is_started():
+            return False
+        start_x, start_y = self.starting_pos
+        curr_x, curr_y = ev.pos
+        if self.floating is not None:
+            origin_x, origin_y = self.floating_origin
+            new_pos = (origin_x + curr_x - start_x, origin_y + curr_y - start_y)
+            self._preview_move(img, draw, self.floating_pos, new_pos)
+            self.floating_pos = new_pos
+        else:
+            self.selector.select(selection.Selection.rectangle(img.width, img.height, start_x, start_y, curr_x, curr_y))
+        return True
+
+    def mouse_up(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        if not self.is_started():
+            return False
+        if self.floating is None and ev.pos == self.starting_pos:
+            # clicking without dragging removes the selection
+            self.selector.select(None)
+        self._drop()
+        return True
+
+    def reset_state(self) -> None:
+        # the mouse may have been released outside the draw area, moved pixels must not be lost
+        self._drop()
+        self.starting_pos = (-1, -1)
+        self.img = None
+
+    def _drop(self) -> None:
+        """Pastes the moved pixels at their current position"""
+        if self.floating is None or self.img is None:
+            return
+        clip, self.floating = self.floating, None
+        x, y = self.floating_pos
+        selection.paste(self.img, clip, x, y)
+        self.selector.select(clip.mask.placed(self.img.width, self.img.height, x, y))
+
+    def _floating_row(self, img: ImageData, y: int, x0: int, x1: int, pos: Pos) -> bytes:
+        """Returns pixels x0 <= x < x1 of row y as they look with the floating pixels at pos"""
+        assert self.floating is not None
+        start = img.offset(x0, y)
+        row = bytearray(img.data[start:start + (x1 - x0) * BYTES_PER_PIXEL])
+        clip = self.floating
+        pos_x, pos_y = pos
+        if pos_y <= y < pos_y + clip.height:
+            row_length = clip.width * BYTES_PER_PIXEL
+            clip_row = clip.data[(y - pos_y) * row_length:(y - pos_y + 1) * row_length]
+            # place the clipboard row relative to x0, dropping what falls outside of [x0, x1)
+            skip = max(0, x0 - pos_x)
+            left = max(0, pos_x - x0)
+            width = min(clip.width - skip, x1 - x0 - left)
+            if width > 0:
+                segment = row[left * BYTES_PER_PIXEL:(left + width) * BYTES_PER_PIXEL]
+                blending.blend_row(
+                    segment, clip_row[skip * BYTES_PER_PIXEL:(skip + width) * BYTES_PER_PIXEL]
+                )
+                row[left * BYTES_PER_PIXEL:(left + width) * BYTES_PER_PIXEL] = segment
+        return bytes(row)
+
+    def _preview_move(self, img: ImageData, draw: DrawFn, old_pos: Pos, new_pos: Pos) -> None:
+        """Redraws only the pixels that look different after moving the floating pixels"""
+        assert self.floating is not None
+        if old_pos == new_pos:
+            return
+        (old_x, old_y), (new_x, new_y) = old_pos, new_pos
+        x0 = max(0, min(old_x, new_x))
+        y0 = max(0, min(old_y, new_y))
+        x1 = min(img.width, max(old_x, new_x) + self.floating.width)
+        y1 = min(img.height, max(old_y, new_y) + self.floating.height)
+        for y in range(y0, y1):
+            before = self._floating_row(img, y, x0, x1, old_pos)
+            after = self._floating_row(img, y, x0, x1, new_pos)
+            if before == after:
+                continue
+            for i in range(0, len(after), BYTES_PER_PIXEL):
+                if before[i:i + BYTES_PER_PIXEL] != after[i:i + BYTES_PER_PIXEL]:
+                    draw(x0 + i // BYTES_PER_PIXEL, y, Color(*after[i:i + BYTES_PER_PIXEL]))
+
+
+class MagicWandTool:
+    """Selects the contiguous area of the same color, ctrl adds to the current selection"""
+    name = "Magic wand"
+
+    def __init__(self, selector: AreaSelector) -> None:
+        self.selector = selector
+
+    def mouse_down(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        if not ev.button.left():
+            return False
+        area = selection.Selection.magic_wand(img, *ev.pos)
+        if ev.button.ctrl() and self.selector.current is not None:
+            area = self.selector.current.union(area)
+        self.selector.select(area)
+        return True
+
+    def mouse_up(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        return False
+
+    def mouse_drag(self, img: ImageData, ev: DrawEvent, draw: DrawFn) -> bool:
+        return False
+
+    def reset_state(self) -> None:
+        pass
@@ -0,0 +1,221 @@
+"""
+Geometric transforms of ImageData.
+
+Pixels are moved as whole 32-bit values through strided memoryview slices (a column of
+the image is view[x::width]), so flipping, rotating and transposing never touch
+individual pixels from Python. Scaling works a row at a time:
+
+* nearest: rows are repeated or dropped as a whole, columns are scaled by transposing the
+  image and scaling its rows (integer factors use a strided slice assignment instead)
+* bilinear: rows are interpolated with lookup tables and big integer addition (the two
+  weighted halves of every byte never add up to more than 255, so there are no carries
+  between bytes), columns are scaled by transposing and scaling rows again
+* scale2x: the EPX/Scale2x pixel art scaler, with its neighbor comparisons done on whole
+  rows at once by treating a row as one big integer with a 32-bit lane per pixel
+"""
+from __future__ import annotations
+
+import mmap
+from collections.abc import Callable
+
+from pixediter.blending import MUL
+from pixediter.image import BYTES_PER_PIXEL
+from pixediter.image import ImageData
+
+
+Transform = Callable[[ImageData], None]
+
+
+def _pixels(data: bytes | bytearray | mmap.mmap) -> memoryview:
+    return memoryview(data).cast("I")
+
+
+def flip_horizontal(img: ImageData) -> None:
+    src = _pixels(img.data)
+    out = bytearray(len(img.data))
+    dst = _pixels(out)
+    w = img.width
+    for y in range(img.height):
+        dst[y * w:(y + 1) * w] = src[y * w:(y + 1) * w][::-1]
+    img.replace(img.width, img.height, out)
+
+
+def flip_vertical(img: ImageData) -> None:
+    stride = img.width * BYTES_PER_PIXEL
+    rows = [img.data[y * stride:(y + 1) * stride] for y in range(img.height)]
+    img.replace(img.width, img.height, bytearray(b"".join(reversed(rows))))
+
+
+def transpose(img: ImageData) -> None:
+    img.replace(img.height, img.width, _transposed(img.data, img.width, img.height))
+
+
+def _transposed(data: bytes | bytearray | mmap.mmap, width: int, height: int) -> bytearray:
+    src = _pixels(data)
+    out = bytearray(len(data))
+    dst = _pixels(out)
+    for x in range(width):
+        dst[x * height:(x + 1) * height] = src[x::width]
+    return out
+
+
+def rotate(img: ImageData, degrees: int) -> None:
+    """Rotates the image clockwise by 90, 180 or 270 degrees"""
+    degrees %= 360
+    if degrees % 90 != 0:
+        raise ValueError("Rotation has to be a multiple of 90 degrees")
+    if degrees == 0:
+        return
+    src = _pixels(img.data)
+    w, h = img.width, img.height
+    out = bytearray(len(img.data))
+    dst = _pixels(out)
+    if degrees == 180:
+        dst[:] = src[::-1]
+        img.replace(w, h, out)
+    elif degrees == 90:
+        # new row y is old column y read from the bottom up
+        for y in range(w):
+            dst[y * h:(y + 1) * h] = src[y::w][::-1]
+        img.replace(h, w, out)
+    else:
+        # new row y is old column (w - 1 - y) read from the top down
+        for y in range(w):
+            dst[y * h:(y + 1) * h] = src[w - 1 - y::w]
+        img.replace(h, w, out)
+
+
+def _pick_rows(data: bytes | bytearray | mmap.mmap, width: int, height: int, new_height: int) -> bytearray:
+    """Scales the image vertically by repeating or dropping whole rows"""
+    stride = width * BYTES_PER_PIXEL
+    rows = [data[y * stride:(y + 1) * stride] for y in range(height)]
+    return bytearray(b"".join(rows[y * height // new_height] for y in range(new_height)))
+
+
+def scale_nearest(img: ImageData, new_width: int, new_height: int) -> None:
+    w, h = img.width, img.height
+    data = _pick_rows(img.data, w, h, new_height)
+    if new_width % w == 0:
+        # every pixel is repeated the same number of times: one strided assignment per copy
+        factor = new_width // w
+        out = bytearray(new_width * new_height * BYTES_PER_PIXEL)
+        dst = _pixels(out)
+        for i in range(factor):
+            dst[i::factor] = _pixels(data)
+        data = out
+    else:
+        # columns are scaled the same way as rows
+        data = _transposed(data, w, new_height)
+        data = _pick_rows(data, new_height, w, new_width)
+        data = _transposed(data, new_height, new_width)
+    img.replace(new_width, new_height, data)
+
+
+def _lerp_rows(a: bytes, b: bytes, weight: int) -> bytes:
+    """Returns a * (255 - weight) / 255 + b * weight / 255 for every byte"""
+    if weight == 0:
+        return a
+    low = int.from_bytes(a.translate(MUL[255 - weight]), "little")
+    high = int.from_bytes(b.translate(MUL[weight]), "little")
+    return (low + high).to_bytes(len(a), "little")
+
+
+def _scale_rows_bilinear(data: bytes | bytearray | mmap.mmap, width: int, height: int, new_height: int) -> bytearray:
+    stride = width * BYTES_PER_PIXEL
+    rows = [bytes(data[y * stride:(y + 1) * stride]) for y in range(height)]
+    out = []
+    for y in range(new_height):
+        # sample at pixel centers
+        pos = max(0.0, (y + 0.5) * height / new_height - 0.5)
+        y0 = min(int(pos), height - 1)
+        y1 = min(y0 + 1, height - 1)
+        weight = round((pos - y0) * 255)
+        out.append(_lerp_rows(rows[y0], rows[y1], weight))
+    return bytearray(b"".join(out))
+
+
+def scale_bilinear(img: ImageData, new_width: int, new_height: int) -> None:
+    w, h = img.width, img.height
+    data = _scale_rows_bilinear(img.data, w, h, new_height)
+    data = _transposed(data, w, new_height)
+    data = _scale_rows_bilinear(data, new_height, w, new_width)
+    img.replace(new_width, new_height, _transposed(data, new_height, new_width))
+
+
+_LANE_BITS = 8 * BYTES_PER_PIXEL
+
+
+def _lanes(count: int, value: int) -> int:
+    """Returns an integer with value repeated in count lanes"""
+    return int.from_bytes(value.to_bytes(BYTES_PER_PIXEL, "little") * count, "little")
+
+
+def _equal_lanes(a: int, b: int, high: int, low: int) -> int:
+    """Returns a mask that has all bits of a lane set where the lanes of a and b are equal"""
+    diff = a ^ b
+    # the high bit of a lane ends up set if any bit of the lane was set, without carrying over
+    nonzero = (diff | ((diff & low) + low)) & high
+    ones = nonzero >> (_LANE_BITS - 1)
+    return ~((ones << _LANE_BITS) - ones) & (high | low)
+
+
+def _select_lanes(condition: int, if_true: int, if_false: int, full: int) -> int:
+    return (if_true & condition) | (if_false & ~condition & full)
+
+
+def scale2x(img: ImageData) -> None:
+    """Doubles the size of the image with the Scale2x (EPX) algorithm"""
+    w, h = img.width, img.height
+    stride = w * BYTES_PER_PIXEL
+    high = _lanes(w, 1 << (_LANE_BITS - 1))
+    low = _lanes(w, (1 << (_LANE_BITS - 1)) - 1)
+    full = high | low
+    first_lane = (1 << _LANE_BITS) - 1
+    last_lane = first_lane << (_LANE_BITS * (w - 1))
+    rows = [int.from_bytes(img.data[y * stride:(y + 1) * stride], "little") for y in range(h)]
+
+    out = bytearray(4 * len(img.data))
+    dst = _pixels(out)
+    for y, e in enumerate(rows):
+        b = rows[max(0, y - 1)]
+        hh = rows[min(h - 1, y + 1)]
+        # left and right neighbors, the edge pixels are their own neighbors
+        d = ((e << _LANE_BITS) & full) | (e & first_lane)
+        f = (e >> _LANE_BITS) | (e & last_lane)
+
+        bd = _equal_lanes(b, d, high, low)
+        bf = _equal_lanes(b, f, high, low)
+        dh = _equal_lanes(d, hh, high, low)
+        fh = _equal_lanes(f, hh, high, low)
+
+        corners = (
+            _select_lanes(bd & ~bf & ~dh, d, e, full),
+            _select_lanes(bf & ~bd & ~fh, f, e, full),
+            _select_lanes(dh & ~bd & ~fh, d, e, full),
+            _select_lanes(fh & ~dh & ~bf, f, e, full),
+        )
+        top = 4 * y * w
+        bottom = top + 2 * w
+        for start, value in zip((top, top + 1, bottom, bottom + 1), corners):
+            dst[start:start + 2 * w - 1:2] = _pixels(value.to_bytes(stride, "little"))
+    img.replace(2 * w, 2 * h, out)
+
+
+SCALING_METHODS = ("nearest", "bilinear", "scale2x")
+
+
+def scale(img: ImageData, new_width: int, new_height: int, method: str = "nearest") -> None:
+    if new_width < 1 or new_height < 1:
+        raise ValueError("Size has to be at least 1x1")
+    if method == "nearest":
+        scale_nearest(img, new_width, new_height)
+    elif method == "bilinear":
+        scale_bilinear(img, new_width, new_height)
+    elif method == "scale2x":
+        # scale2x only doubles the size, use it as many times as possible and finish with nearest
+        while img.width * 2 <= new_width and img.height * 2 <= new_height:
+            scale2x(img)
+        if (img.width, img.height) != (new_width, new_height):
+            scale_nearest(img, new_width, new_height)
+    else:
+        raise ValueError(f"Unknown scaling method '{method}' (available: {', '.join(SCALING_METHODS)})")
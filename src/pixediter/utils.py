@@ -1,4 +1,6 @@
+import importlib
 from collections.abc import Generator
+from typing import Any
 
 from pixediter import borders
 from pixediter import colors
@@ -7,6 +9,17 @@ from pixediter.colors import Color
 
 
 FILLED_PIXEL = "██"
+SELECTED_PIXEL = "▓▓"
+
+
+class LazyModule:
+    """Stands for the module name, which is imported when one of its attributes is first used"""
+
+    def __init__(self, name: str):
+        self._name = name
+
+    def __getattr__(self, attribute: str) -> Any:
+        return getattr(importlib.import_module(self._name), attribute)
 
 
 def draw(x: int, y: int, text: str, color: Color = colors.WHITE) -> None:
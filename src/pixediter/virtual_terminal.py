@@ -0,0 +1,429 @@
+"""
+A terminal emulated in memory, for rendering without a pty.
+
+The escape sequences the program writes are parsed into a grid of cells (a character with
+its foreground and background color), so tests can check what ended up on the screen. The
+terminal also counts what it costs to get there: the bytes, write calls and flushes of the
+current frame and which cells they touched. end_frame() returns the counts and starts
+a new frame.
+
+Only the parts of the terminal the program uses are emulated: cursor positioning, saving
+and restoring the cursor, clearing, SGR colors (truecolor, 256 and 16 colors), private
+modes, and moving the contents with scroll regions and margins (DECSTBM, DECSLRM, SU and
+SD) or by copying rectangles (DECCRA). Other sequences are ignored. Text that reaches the
+right edge wraps to the next row, text below the last row is dropped. The features the
+terminal reports can be limited, to see what the program does on terminals without them,
+and so can its color depth.
+
+Images are emulated too. Kitty graphics commands keep the images and their placements in
+images and placements, and sixel images are decoded into the pixels of the cells they
+cover (which text written in a cell replaces), see pixel().
+"""
+from __future__ import annotations
+
+import base64
+import re
+import zlib
+from collections.abc import Iterable
+from dataclasses import dataclass
+from dataclasses import field
+from typing import NamedTuple
+
+from pixediter import terminal
+
+# a color is an (r, g, b) tuple, an index to the 256 color palette or None for the default
+TermColor = tuple[int, int, int] | int | None
+
+_SEQUENCE = re.compile(
+    r"\x1b\[(?P<private>[?]?)(?P<params>[0-9;]*)(?P<intermediate>[ -/]*)(?P<final>[@-~])"
+    r"|\x1b(?P<kind>[P_])(?P<string>[^\x1b]*)\x1b\\"
+    r"|\x1b(?P<esc>[^\[])"
+    r"|(?P<text>[^\x1b\n\r]+)"
+    r"|(?P<control>[\n\r])"
+)
+# the start of a sequence that continues in the next write
+_INCOMPLETE = re.compile(r"\x1b(\[[?]?[0-9;]*[ -/]*)?\Z|\x1b[P_][^\x1b]*\x1b?\Z")
+_SIXEL = re.compile(r"#(?P<register>[0-9]+)(?P<definition>(;[0-9]+){4})?|!(?P<count>[0-9]+)(?P<repeated>.)|(?P<char>.)")
+
+
+class Cell(NamedTuple):
+    char: str = " "
+    fg: TermColor = None
+    bg: TermColor = None
+
+
+BLANK = Cell()
+
+
+@dataclass
+class FrameStats:
+    bytes: int = 0
+    writes: int = 0
+    flushes: int = 0
+    # distinct cells that were written and how many times cells were written in total
+    cells: int = 0
+    cell_writes: int = 0
+
+
+@dataclass
+class _Frame:
+    stats: FrameStats = field(default_factory=FrameStats)
+    touched: set[tuple[int, int]] = field(default_factory=set)
+
+
+@dataclass
+class KittyImage:
+    width: int
+    height: int
+    data: bytearray
+
+
+# where an image is shown: the row and column of its top left corner and the area of the
+# image (x, y, width, height)
+Placement = tuple[int, int, int, int, int, int]
+
+
+class VirtualTerminal:
+    def __init__(
+            self,
+            columns: int = 80,
+            rows: int = 24,
+            features: Iterable[str] = terminal.FEATURES,
+            cell_size: tuple[int, int] = terminal.DEFAULT_CELL_SIZE,
+            color_depth: str = terminal.TRUECOLOR
+    ):
+        self.columns = columns
+        self.rows = rows
+        self.features = frozenset(features)
+        self.color_depth = color_depth
+        self.grid = [[BLANK] * columns for _ in range(rows)]
+        # 1-based like the escape sequences
+        self.row = 1
+        self.col = 1
+        self.fg: TermColor = None
+        self.bg: TermColor = None
+        self.modes: set[str] = set()
+        # the scroll region (top, bottom) and margins (left, right), 1-based and inclusive
+        self.region = (1, rows)
+        self.margins = (1, columns)
+        self.total = FrameStats()
+        self.images: dict[int, KittyImage] = {}
+        # by image id and placement id
+        self.placements: dict[tuple[int, int], Placement] = {}
+        # the pixels of sixel images, (r, g, b) by cell and by x, y inside the cell
+        self.sixels: dict[tuple[int, int], dict[tuple[int, int], tuple[int, int, int]]] = {}
+        self._cell_size = cell_size
+        # a kitty command whose payload comes in more chunks
+        self._kitty_chunks: tuple[dict[str, str], list[str]] | None = None
+        self._saved_cursor = (1, 1)
+        self._pending = ""
+        self._frame = _Frame()
+
+    # Backend
+
+    def write(self, text: str) -> None:
+        size = len(text.encode())
+        for stats in (self._frame.stats, self.total):
+            stats.writes += 1
+            stats.bytes += size
+        text = self._pending + text
+        incomplete = _INCOMPLETE.search(text)
+        if incomplete is not None:
+            self._pending = text[incomplete.start():]
+            text = text[:incomplete.start()]
+        else:
+            self._pending = ""
+        for match in _SEQUENCE.finditer(text):
+            if match["text"] is not None:
+                self._put(match["text"])
+            elif match["final"] is not None:
+                self._csi(match["private"], match["params"], match["intermediate"] + match["final"])
+            elif match["kind"] == "_":
+                self._kitty(match["string"])
+            elif match["kind"] == "P":
+                self._dcs(match["string"])
+            elif match["esc"] is not None:
+                self._esc(match["esc"])
+            elif match["control"] == "\n":
+                self.row += 1
+            else:
+                self.col = 1
+
+    def flush(self) -> None:
+        self._frame.stats.flushes += 1
+        self.total.flushes += 1
+
+    def size(self) -> tuple[int, int]:
+        return self.columns, self.rows
+
+    def cell_size(self) -> tuple[int, int]:
+        return self._cell_size
+
+    # Inspecting
+
+    def end_frame(self) -> FrameStats:
+        """Returns the counts of the frame that ends and starts a new one"""
+        frame, self._frame = self._frame, _Frame()
+        frame.stats.cells = len(frame.touched)
+        return frame.stats
+
+    def resize(self, columns: int, rows: int) -> None:
+        """Changes the size, keeping the contents that still fit"""
+        self.grid = [
+            (self.grid[y][:columns] + [BLANK] * (columns - self.columns) if y < self.rows else [BLANK] * columns)
+            for y in range(rows)
+        ]
+        self.columns, self.rows = columns, rows
+        self.region = (1, rows)
+        self.margins = (1, columns)
+
+    def cell(self, row: int, col: int) -> Cell:
+        return self.grid[row - 1][col - 1]
+
+    def line(self, row: int) -> str:
+        """The characters on a row"""
+        return "".join(cell.char for cell in self.grid[row - 1])
+
+    def pixel(self, x: int, y: int) -> tuple[int, int, int] | None:
+        """The color of a pixel of the screen drawn by a sixel image, None if there is none"""
+        width, height = self._cell_size
+        cell = self.sixels.get((y // height + 1, x // width + 1))
+        return None if cell is None else cell.get((x % width, y % height))
+
+    def text(self) -> str:
+        """The characters on the screen, rows separated by newlines and trailing spaces removed"""
+        return "\n".join(self.line(row).rstrip() for row in range(1, self.rows + 1))
+
+    # Emulation
+
+    def _put(self, text: str) -> None:
+        touched = self._frame.touched
+        stats = self._frame.stats
+        for char in text:
+            if self.col > self.columns:
+                self.row += 1
+                self.col = 1
+            if 1 <= self.row <= self.rows:
+                self.grid[self.row - 1][self.col - 1] = Cell(char, self.fg, self.bg)
+                if self.sixels:
+                    self.sixels.pop((self.row, self.col), None)
+                touched.add((self.row, self.col))
+                stats.cell_writes += 1
+                self.total.cell_writes += 1
+            self.col += 1
+
+    def _esc(self, char: str) -> None:
+        if char == "7":
+            self._saved_cursor = (self.row, self.col)
+        elif char == "8":
+            self.row, self.col = self._saved_cursor
+
+    def _csi(self, private: str, params: str, command: str) -> None:
+        args = [int(arg) if arg else 0 for arg in params.split(";")] if params else []
+
+        def arg(i: int, default: int) -> int:
+            return args[i] if len(args) > i and args[i] else default
+
+        if private:
+            if command in ("h", "l"):
+                for mode in params.split(";"):
+                    if command == "h":
+                        self.modes.add(mode)
+                    else:
+                        self.modes.discard(mode)
+                if "69" not in self.modes:
+                    self.margins = (1, self.columns)
+        elif command in ("H", "f"):
+            self.row = min(max(1, arg(0, 1)), self.rows)
+            self.col = min(max(1, arg(1, 1)), self.columns)
+        elif command == "A":
+            self.row = max(1, self.row - arg(0, 1))
+        elif command == "B":
+            self.row = min(self.rows, self.row + arg(0, 1))
+        elif command == "C":
+            self.col = min(self.columns, self.col + arg(0, 1))
+        elif command == "D":
+            self.col = max(1, self.col - arg(0, 1))
+        elif command == "J":
+            self._erase_display(arg(0, 0))
+        elif command == "K":
+            self._erase_line(arg(0, 0))
+        elif command == "m":
+            self._sgr(args or [0])
+        elif command == "r":
+            top, bottom = arg(0, 1), min(arg(1, self.rows), self.rows)
+            if top < bottom:
+                self.region = (top, bottom)
+                self.row = self.col = 1
+        elif command == "s" and "69" in self.modes:
+            left, right = arg(0, 1), min(arg(1, self.columns), self.columns)
+            if left < right:
+                self.margins = (left, right)
+                self.row = self.col = 1
+        elif command == "s":
+            self._saved_cursor = (self.row, self.col)
+        elif command == "S":
+            self._scroll(arg(0, 1))
+        elif command == "T":
+            self._scroll(-arg(0, 1))
+        elif command == "$v":
+            self._copy_rectangle(
+                arg(0, 1), arg(1, 1), min(arg(2, self.rows), self.rows), min(arg(3, self.columns), self.columns),
+                arg(5, 1), arg(6, 1),
+            )
+
+    def _kitty(self, command: str) -> None:
+        if not command.startswith("G"):
+            return
+        keys, _, payload = command[1:].partition(";")
+        control = dict(key.split("=", 1) for key in keys.split(",") if "=" in key)
+        if self._kitty_chunks is not None:
+            # the keys of the first chunk apply
+            first, payloads = self._kitty_chunks
+            payloads.append(payload)
+            if control.get("m") == "1":
+                return
+            control, payload = first, "".join(payloads)
+            self._kitty_chunks = None
+        elif control.get("m") == "1":
+            self._kitty_chunks = (control, [payload])
+            return
+
+        def number(key: str, default: int = 0) -> int:
+            return int(control.get(key, default))
+
+        action = control.get("a", "t")
+        image_id = number("i")
+        data = base64.standard_b64decode(payload)
+        if control.get("o") == "z":
+            data = zlib.decompress(data)
+        if action in ("t", "T"):
+            self.images[image_id] = KittyImage(number("s"), number("v"), bytearray(data))
+        if action == "f" and image_id in self.images:
+            image = self.images[image_id]
+            x, y, width = number("x"), number("y"), number("s", image.width)
+            for row in range(number("v", image.height)):
+                start = ((y + row) * image.width + x) * 4
+                image.data[start:start + width * 4] = data[row * width * 4:(row + 1) * width * 4]
+        if action in ("T", "p") and image_id in self.images:
+            image = self.images[image_id]
+            self.placements[image_id, number("p")] = (
+                self.row, self.col, number("x"), number("y"), number("w", image.width), number("h", image.height)
+            )
+        if action == "d":
+            for key in list(self.placements):
+                if key[0] == image_id:
+                    del self.placements[key]
+            if control.get("d") == "I":
+                self.images.pop(image_id, None)
+
+    def _dcs(self, string: str) -> None:
+        _, q, sixel = string.partition("q")
+        if not q:
+            return
+        # the raster attributes
+        sixel = re.sub(r'^"[0-9;]*', "", sixel)
+        width, height = self._cell_size
+        registers: dict[int, tuple[int, int, int]] = {}
+        color = (0, 0, 0)
+        x = y = 0
+        for match in _SIXEL.finditer(sixel):
+            if match["register"] is not None:
+                register = int(match["register"])
+                if match["definition"] is not None:
+                    _, r, g, b = (int(n) for n in match["definition"][1:].split(";"))
+                    registers[register] = ((r * 255 + 50) // 100, (g * 255 + 50) // 100, (b * 255 + 50) // 100)
+                color = registers.get(register, (0, 0, 0))
+                continue
+            char, count = match["char"], 1
+            if match["count"] is not None:
+                char, count = match["repeated"], int(match["count"])
+            if char == "$":
+                x = 0
+            elif char == "-":
+                x, y = 0, y + 6
+            elif "?" <= char <= "~":
+                bits = ord(char) - 63
+                for px in range(x, x + count):
+                    for bit in range(6):
+                        if bits & (1 << bit):
+                            # in the pixels of the screen
+                            sx = (self.col - 1) * width + px
+                            sy = (self.row - 1) * height + y + bit
+                            cell = self.sixels.setdefault((sy // height + 1, sx // width + 1), {})
+                            cell[sx % width, sy % height] = color
+                x += count
+
+    def _scroll(self, n: int) -> None:
+        """Moves the contents of the scroll region and margins up by n rows (down if n is negative)"""
+        top, bottom = self.region
+        left, right = self.margins
+        rows = [self.grid[y][left - 1:right] for y in range(top - 1, bottom)]
+        n = max(-len(rows), min(n, len(rows)))
+        blank = [[BLANK] * (right - left + 1)]
+        rows = rows[n:] + blank * n if n >= 0 else blank * -n + rows[:n]
+        for y, cells in zip(range(top - 1, bottom), rows):
+            self.grid[y][left - 1:right] = cells
+
+    def _copy_rectangle(self, top: int, left: int, bottom: int, right: int, to_top: int, to_left: int) -> None:
+        source = [self.grid[y][left - 1:right] for y in range(top - 1, bottom)]
+        for y, cells in enumerate(source, to_top - 1):
+            if 0 <= y < self.rows:
+                cells = cells[:max(0, self.columns - to_left + 1)]
+                self.grid[y][to_left - 1:to_left - 1 + len(cells)] = cells
+
+    def _erase_display(self, how: int) -> None:
+        if how == 0:
+            self._erase_line(0)
+            rows = range(self.row, self.rows)
+        elif how == 1:
+            self._erase_line(1)
+            rows = range(0, self.row - 1)
+        else:
+            rows = range(self.rows)
+            # images go with the text
+            self.placements.clear()
+            self.sixels.clear()
+        for y in rows:
+            self.grid[y] = [BLANK] * self.columns
+
+    def _erase_line(self, how: int) -> None:
+        if not 1 <= self.row <= self.rows:
+            return
+        line = self.grid[self.row - 1]
+        if how == 0:
+            start, end = self.col - 1, self.columns
+        elif how == 1:
+            start, end = 0, self.col
+        else:
+            start, end = 0, self.columns
+        line[start:end] = [BLANK] * (end - start)
+
+    def _sgr(self, args: list[int]) -> None:
+        i = 0
+        while i < len(args):
+            code = args[i]
+            if code == 0:
+                self.fg = self.bg = None
+            elif code in (38, 48):
+                color: TermColor
+                if args[i + 1:i + 2] == [2]:
+                    r, g, b = (args[i + 2:i + 5] + [0, 0, 0])[:3]
+                    color = (r, g, b)
+                    i += 4
+                else:
+                    color = args[i + 2] if i + 2 < len(args) else 0
+                    i += 2
+                if code == 38:
+                    self.fg = color
+                else:
+                    self.bg = color
+            elif code == 39:
+                self.fg = None
+            elif code == 49:
+                self.bg = None
+            elif 30 <= code <= 37 or 90 <= code <= 97:
+                self.fg = code - 30 if code < 90 else code - 90 + 8
+            elif 40 <= code <= 47 or 100 <= code <= 107:
+                self.bg = code - 40 if code < 100 else code - 100 + 8
+            i += 1
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from typing import Optional
 
+from pixediter import blending
+from pixediter import colors
 from pixediter import events
 from pixediter.borders import Borders
 from pixediter.colors import Color
@@ -25,7 +27,7 @@ class ColorAdjuster(TerminalWidget):
     ):
         self.width = 17
         super().__init__(
-            bbox=(left, top, left + self.width - 1, top + 9),
+            bbox=(left, top, left + self.width - 1, top + 10),
             borders=borders
         )
         self.color = color
@@ -68,15 +70,16 @@ class ColorAdjuster(TerminalWidget):
     def render(self) -> None:
         def add_color(x: int, y: int, color: Color) -> None:
             self._color_from_coord[(x, y)] = color
-            draw(x, y, FILLED_PIXEL[0], color)
+            # translucent colors are shown on top of black so that the alpha is visible
+            draw(x, y, FILLED_PIXEL[0], blending.over(color, colors.BLACK))
 
         super().render()
         row = self.top
-        draw(self.left, row, f"    {self.color.primary.hex()}" + " " * (self.width - 4 - 7))
+        draw(self.left, row, f"    {self.color.primary.hex()}".ljust(self.width))
         add_color(self.left + 1, row, self.color.primary)
         add_color(self.left + 2, row, self.color.primary)
         row += 1
-        draw(self.left, row, f"    {self.color.secondary.hex()}" + " " * (self.width - 4 - 7))
+        draw(self.left, row, f"    {self.color.secondary.hex()}".ljust(self.width))
         add_color(self.left + 1, row, self.color.secondary)
         add_color(self.left + 2, row, self.color.secondary)
         row += 1
@@ -89,18 +92,22 @@ class ColorAdjuster(TerminalWidget):
         draw(left - 1, row + 0, "R")
         draw(left - 1, row + 1, "G")
         draw(left - 1, row + 2, "B")
+        draw(left - 1, row + 3, "A")
         for i in range(rgb_gradient_width):
             rgb_delta = round(self.delta * 255 * (i - rgb_gradient_width // 2))
             r_adjusted = color.add_rgb(rgb_delta, 0, 0)
             g_adjusted = color.add_rgb(0, rgb_delta, 0)
             b_adjusted = color.add_rgb(0, 0, rgb_delta)
+            a_adjusted = color.add_alpha(rgb_delta)
             add_color(left + i, row + 0, r_adjusted)
             add_color(left + i, row + 1, g_adjusted)
             add_color(left + i, row + 2, b_adjusted)
+            add_color(left + i, row + 3, a_adjusted)
         draw(left + rgb_gradient_width, row + 0, f"{color.r:3}")
         draw(left + rgb_gradient_width, row + 1, f"{color.g:3}")
         draw(left + rgb_gradient_width, row + 2, f"{color.b:3}")
-        row += 3
+        draw(left + rgb_gradient_width, row + 3, f"{color.a:3}")
+        row += 4
         draw(self.left, row, " " * self.width)
         row += 1
 
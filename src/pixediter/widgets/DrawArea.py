@@ -1,21 +1,56 @@
 from __future__ import annotations
 
+import functools
+import time
+from collections.abc import Callable
+from collections.abc import Iterator
 from typing import Optional
+from typing import TYPE_CHECKING
 
+from pixediter import blending
 from pixediter import events
+from pixediter import terminal
+from pixediter.animation import Animation
+from pixediter.animation import changed_runs
+from pixediter.AreaSelector import AreaSelector
 from pixediter.borders import Borders
 from pixediter.colors import Color
 from pixediter.ColorSelector import ColorSelector
 from pixediter.events import MouseButton
 from pixediter.events import MouseEventType
+from pixediter.image import BYTES_PER_PIXEL
 from pixediter.image import ImageData
-from pixediter.tools import DrawEvent
+from pixediter.layers import LayerStack
 from pixediter.ToolSelector import ToolSelector
 from pixediter.utils import draw
 from pixediter.utils import FILLED_PIXEL
+from pixediter.utils import SELECTED_PIXEL
 
 from .TerminalWidget import TerminalWidget
 
+if TYPE_CHECKING:
+    from pixediter.filters import Pipeline
+    from pixediter.selection import Selection
+    from pixediter.transform import Transform
+
+# how many pixels one step of the scroll wheel pans the image
+SCROLL_STEP = 4
+
+CHECKERBOARD_LIGHT = Color(204, 204, 204)
+CHECKERBOARD_DARK = Color(153, 153, 153)
+
+
+@functools.lru_cache(maxsize=4096)
+def transparent_pixel(rgba: tuple[int, int, int, int], odd_row: bool, pixel: str = FILLED_PIXEL) -> str:
+    """
+    Returns a (colorized) pixel that shows a translucent color on top of a checkerboard,
+    each half of the pixel is one square of the checkerboard
+    """
+    color = Color(*rgba)
+    light = blending.over(color, CHECKERBOARD_LIGHT).colorize(pixel[0])
+    dark = blending.over(color, CHECKERBOARD_DARK).colorize(pixel[1])
+    return dark + light if odd_row else light + dark
+
 
 class DrawArea(TerminalWidget):
     def __init__(
@@ -25,23 +60,72 @@ class DrawArea(TerminalWidget):
             borders: Optional[Borders] = None,
             image: ImageData,
             color: ColorSelector,
-            tools: ToolSelector
+            tools: ToolSelector,
+            selector: AreaSelector
     ):
         super().__init__(bbox=bbox, borders=borders)
-        self.image = image
+        self.layers = LayerStack(image)
+        # the frames of the document, self.layers are those of the current one
+        self.frames = Animation(self.layers)
         self.color = color
         self.tools = tools
+        self.selector = selector
+        self.selector.add_change_listener(self._on_selection_change)
+        # zoomed out, the image is shown at 1 / 2**zoom of its size from a level of the
+        # pyramid of the layers (see mipmap) and every pixel on the screen is a block of
+        # pixels of the image
+        self.zoom = 0
+        # images larger than the terminal are shown through a viewport that starts at
+        # pixel (scroll_x, scroll_y) and is view_width x view_height pixels in size, these
+        # are pixels of the level that is shown
+        self.scroll_x = 0
+        self.scroll_y = 0
+        self.view_width = self.layers.width
+        self.view_height = self.layers.height
+        # moves what is on the screen in an area of cells (x0, y0, x1, y1) by (dx, dy)
+        # cells, returns False if it can't (see terminal.shift)
+        self.shift_screen: Callable[[int, int, int, int, int, int], bool] = terminal.shift
+        # on a slow link (see bandwidth) the previews of the tools are collected by pixel of
+        # the shown level and drawn together by draw_previews(), in blocks of preview_block
+        # pixels when it's more than 1; None draws them right away
+        self.preview_block: int | None = None
+        self._previews: dict[tuple[int, int], tuple[Color, bool]] = {}
+        # what the previews of the stroke so far look like, and the areas (x0, y0, x1, y1)
+        # that were drawn in blocks and need to be drawn again pixel by pixel
+        self._stroke: dict[tuple[int, int], tuple[Color, bool]] = {}
+        self._coarse: set[tuple[int, int, int, int]] = set()
+        # how many frames before and after the current one are shown on top of it, and what they look like
+        self.onion: tuple[int, int] | None = None
+        self._overlay: ImageData | None = None
+        # during playback the next frame is shown at _frame_due (time.monotonic())
+        self.playing = False
+        self._frame_due = 0.0
+
+    @property
+    def image(self) -> ImageData:
+        """The image of the active layer, this is what the tools draw on"""
+        return self.layers.active.image
 
     def onclick(self, ev: events.MouseEvent) -> bool:
+        if ev.button.scroll():
+            # vertical wheel pans up and down, with shift (or a horizontal wheel) left and right
+            step = SCROLL_STEP if ev.button.value & 1 else -SCROLL_STEP
+            if ev.button.shift() or ev.button in (MouseButton.SCROLL_LEFT, MouseButton.SCROLL_RIGHT):
+                self.scroll(step, 0)
+            else:
+                self.scroll(0, step)
+            return True
+
+        from pixediter.tools import DrawEvent
         img_x, img_y = self.terminal_coords_to_img_coords(ev.x, ev.y)
         draw_event = DrawEvent((img_x, img_y), ev.event_type, ev.button, self.color)
 
         if ev.event_type == MouseEventType.MOUSE_DOWN:
-            handled = self.tools.current.mouse_down(self.image, draw_event, self.render_pixel)
+            handled = self.tools.current.mouse_down(self.image, draw_event, self.preview_pixel)
         elif ev.event_type == MouseEventType.MOUSE_DRAG:
-            handled = self.tools.current.mouse_drag(self.image, draw_event, self.render_pixel)
+            handled = self.tools.current.mouse_drag(self.image, draw_event, self.preview_pixel)
         elif ev.event_type == MouseEventType.MOUSE_UP:
-            handled = self.tools.current.mouse_up(self.image, draw_event, self.render_pixel)
+            handled = self.tools.current.mouse_up(self.image, draw_event, self.preview_pixel)
 
         if handled:
             return True
@@ -52,37 +136,467 @@ class DrawArea(TerminalWidget):
 
         return False
 
+    @property
+    def scale(self) -> int:
+        """How many pixels of the image each pixel on the screen shows, in both directions"""
+        return 1 << self.zoom
+
+    def shown_size(self) -> tuple[int, int]:
+        """The size of the image at the current zoom"""
+        scale = self.scale
+        return -(-self.layers.width // scale), -(-self.layers.height // scale)
+
     def render(self) -> None:
+        self._update_pos()
         super().render()
-        for (x, y), color in self.image:
-            self.render_pixel(x, y, color)
+        self._render_view(*self.visible_view())
+
+    def render_clipped(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        # only the pixels in the area are rendered, not the whole image
+        with terminal.clipped(x0, y0, x1, y1):
+            super().render()
+            img_x0, img_y0 = self.terminal_coords_to_img_coords(x0, y0)
+            img_x1, img_y1 = self.terminal_coords_to_img_coords(x1, y1)
+            self.render_region(img_x0, img_y0, img_x1 + 1, img_y1 + 1)
+
+    def render_region(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Renders the pixels x0 <= x < x1, y0 <= y < y1 of the image (clipped to the viewport)"""
+        scale = self.scale
+        self._render_view(x0 // scale, y0 // scale, -(-x1 // scale), -(-y1 // scale))
+
+    def _render_view(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Renders the pixels x0 <= x < x1, y0 <= y < y1 of the shown level (clipped to the viewport)"""
+        vx0, vy0, vx1, vy1 = self.visible_view()
+        x0, y0, x1, y1 = max(x0, vx0), max(y0, vy0), min(x1, vx1), min(y1, vy1)
+        if x0 >= x1 or y0 >= y1:
+            return
+        zoom = self.zoom
+        shown = self._shown_level(x0, y0, x1, y1)
+        selection = self.selector.current
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                selected = selection is not None and selection.contains(x << zoom, y << zoom)
+                self._draw_pixel(x, y, shown[x, y], selected)
+
+    def _shown_level(self, x0: int, y0: int, x1: int, y1: int) -> ImageData:
+        """The shown level, up to date in the area x0 <= x < x1, y0 <= y < y1"""
+        if self.zoom == 0:
+            return self.layers.flatten(x0, y0, x1, y1)
+        return self.layers.pyramid.level(self.zoom, x0, y0, x1, y1)
+
+    def scroll(self, dx: int, dy: int) -> None:
+        """Pans the viewport by dx, dy pixels (of the shown level)"""
+        width, height = self.shown_size()
+        scroll_x = min(max(0, self.scroll_x + dx), width - self.view_width)
+        scroll_y = min(max(0, self.scroll_y + dy), height - self.view_height)
+        if (scroll_x, scroll_y) == (self.scroll_x, self.scroll_y):
+            return
+        # how far the pixels that stay in view move on the screen
+        moved_x, moved_y = self.scroll_x - scroll_x, self.scroll_y - scroll_y
+        self.scroll_x, self.scroll_y = scroll_x, scroll_y
+        x0, y0, x1, y1 = self.visible_view()
+        col0, row0 = self._view_to_terminal(x0, y0)
+        col1, row1 = self._view_to_terminal(x1, y1)
+        if not self.shift_screen(col0, row0, col1 - 1, row1 - 1, 2 * moved_x, moved_y):
+            self._render_view(x0, y0, x1, y1)
+            return
+        # the terminal moved the rest, only the pixels that came into view are drawn
+        if moved_x > 0:
+            self._render_view(x0, y0, x0 + moved_x, y1)
+        elif moved_x < 0:
+            self._render_view(x1 + moved_x, y0, x1, y1)
+        if moved_y > 0:
+            self._render_view(x0, y0, x1, y0 + moved_y)
+        elif moved_y < 0:
+            self._render_view(x0, y1 + moved_y, x1, y1)
+
+    def center_on(self, x: int, y: int) -> None:
+        """Pans the viewport so that pixel (x, y) of the image is in the middle of it"""
+        scale = self.scale
+        self.scroll(
+            x // scale - self.view_width // 2 - self.scroll_x,
+            y // scale - self.view_height // 2 - self.scroll_y,
+        )
+
+    def set_zoom(self, zoom: int) -> None:
+        """Shows the image at 1 / 2**zoom of its size, keeping the middle of the viewport in place"""
+        from pixediter import mipmap
+        # the previews are in the pixels of the level, the whole image is drawn again anyway
+        self._forget_previews()
+        zoom = max(0, min(zoom, mipmap.max_level(self.layers.width, self.layers.height)))
+        # the middle of the viewport in the pixels of the image
+        center_x = (2 * self.scroll_x + self.view_width) * self.scale // 2
+        center_y = (2 * self.scroll_y + self.view_height) * self.scale // 2
+        self.zoom = zoom
+        self._update_pos()
+        self.scroll_x = center_x // self.scale - self.view_width // 2
+        self.scroll_y = center_y // self.scale - self.view_height // 2
+        self._update_pos()
+
+    def _on_selection_change(self, old: Selection | None, new: Selection | None) -> None:
+        # only the pixels that were selected or deselected need to be redrawn
+        if new is not None:
+            changed = new.difference_spans(old)
+        elif old is not None:
+            changed = old.difference_spans(None)
+        else:
+            return
+        if self.zoom:
+            for y, x0, x1 in changed:
+                self.render_region(x0, y, x1, y + 1)
+            return
+        vx0, vy0, vx1, vy1 = self.visible_region()
+        for y, x0, x1 in changed:
+            if vy0 <= y < vy1:
+                for x in range(max(x0, vx0), min(x1, vx1)):
+                    self.render_pixel(x, y, self.layers.composite_pixel(x, y))
+
+    def visible_region(self) -> tuple[int, int, int, int]:
+        """Returns the area (x0, y0, x1, y1) of the image that is visible in the viewport"""
+        x0, y0, x1, y1 = self.visible_view()
+        scale = self.scale
+        return x0 * scale, y0 * scale, min(x1 * scale, self.layers.width), min(y1 * scale, self.layers.height)
+
+    def visible_view(self) -> tuple[int, int, int, int]:
+        """Returns the area (x0, y0, x1, y1) of the shown level that is visible in the viewport"""
+        columns, rows = terminal.size()
+        # the widget itself may have been moved partially outside of the terminal
+        x0 = self.scroll_x + max(0, (1 - self.left + 1) // 2)
+        y0 = self.scroll_y + max(0, 1 - self.top)
+        x1 = min(self.scroll_x + self.view_width, self.scroll_x + (columns - self.left - 1) // 2 + 1)
+        y1 = min(self.scroll_y + self.view_height, self.scroll_y + rows - self.top + 1)
+        return x0, y0, max(x0, x1), max(y0, y1)
+
+    def preview_filter(self, pipeline: Pipeline) -> None:
+        """Renders the filtered image without modifying it (only the visible part is filtered)"""
+        if self.zoom:
+            # zoomed out the active layer is filtered at full size under the visible part,
+            # composited with the other layers and then downsampled like the shown level
+            x0, y0, x1, y1 = self.visible_view()
+            ix0, iy0, ix1, iy1 = self.visible_region()
+            if ix0 >= ix1 or iy0 >= iy1:
+                return
+            active = pipeline.apply(self.image.region(ix0, iy0, ix1, iy1))
+            area = ImageData(ix1 - ix0, iy1 - iy0)
+            area.data[:] = self.layers.composite_region(ix0, iy0, ix1, iy1, active)
+            # the area starts on a block of the level, so its levels are the same blocks
+            filtered = bytes(LayerStack(area).pyramid.level(self.zoom).data)
+            i = 0
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    self._draw_pixel(x, y, Color(*filtered[i:i + BYTES_PER_PIXEL]), False)
+                    i += BYTES_PER_PIXEL
+            return
+        x0, y0, x1, y1 = self.visible_region()
+        filtered = pipeline.apply(self.image.region(x0, y0, x1, y1))
+        i = 0
+        for y in range(y0, y1):
+            for x in range(x0, x1):
+                self.preview_pixel(x, y, Color(*filtered[i:i + BYTES_PER_PIXEL]))
+                i += BYTES_PER_PIXEL
+
+    def apply_filter(self, pipeline: Pipeline) -> None:
+        pipeline.apply_to_image(self.image)
+        self.render()
 
     def terminal_coords_to_img_coords(self, x: int, y: int) -> tuple[int, int]:
-        img_x = (x - self.left) // 2
-        img_y = y - self.top
+        img_x = ((x - self.left) // 2 + self.scroll_x) * self.scale
+        img_y = (y - self.top + self.scroll_y) * self.scale
         return img_x, img_y
 
+    def _view_to_terminal(self, x: int, y: int) -> tuple[int, int]:
+        """Returns the column and row of the left half of a pixel of the shown level"""
+        return self.left + 2 * (x - self.scroll_x), self.top + y - self.scroll_y
+
     def paint(self, img_x: int, img_y: int, color: Color) -> None:
         self.image[img_x, img_y] = color
-        self.render_pixel(img_x, img_y, color)
+        self.preview_pixel(img_x, img_y, color)
+
+    def preview_pixel(self, x: int, y: int, color: Color) -> None:
+        """Renders pixel (x, y) as if the active layer had the given color there"""
+        composite = self.layers.composite_pixel(x, y, color)
+        if self.preview_block is None:
+            self.render_pixel(x, y, composite)
+            return
+        selection = self.selector.current
+        selected = selection is not None and selection.contains(x, y)
+        self._previews[x >> self.zoom, y >> self.zoom] = (composite, selected)
+
+    def has_previews(self) -> bool:
+        """Whether there are previews that haven't been drawn, or have only been drawn in blocks"""
+        return bool(self._previews or self._coarse)
+
+    def draw_previews(self) -> bool:
+        """Draws the collected previews, returns whether there were any"""
+        if not self._previews:
+            return False
+        previews, self._previews = self._previews, {}
+        self._stroke.update(previews)
+        block = self.preview_block or 1
+        if block == 1:
+            self._draw_pixels(previews)
+            return True
+        # every block is drawn in the color of one of the pixels in it
+        blocks: dict[tuple[int, int], tuple[Color, bool]] = {}
+        for (x, y), pixel in previews.items():
+            blocks.setdefault((x - x % block, y - y % block), pixel)
+        pixels = {}
+        for (bx, by), pixel in blocks.items():
+            self._coarse.add((bx, by, bx + block, by + block))
+            for y in range(by, by + block):
+                for x in range(bx, bx + block):
+                    pixels[x, y] = pixel
+        self._draw_pixels(pixels)
+        return True
+
+    def refine(self) -> bool:
+        """
+        Draws the collected previews and the blocks that were drawn coarsely pixel by pixel,
+        returns whether there was anything to draw
+        """
+        if not self.has_previews():
+            return False
+        self._stroke.update(self._previews)
+        pixels = {}
+        vx0, vy0, vx1, vy1 = self.visible_view()
+        selection = self.selector.current
+        zoom = self.zoom
+        for x0, y0, x1, y1 in self._coarse:
+            x0, y0, x1, y1 = max(x0, vx0), max(y0, vy0), min(x1, vx1), min(y1, vy1)
+            if x0 >= x1 or y0 >= y1:
+                continue
+            shown = self._shown_level(x0, y0, x1, y1)
+            for y in range(y0, y1):
+                for x in range(x0, x1):
+                    pixel = self._stroke.get((x, y))
+                    if pixel is None:
+                        selected = selection is not None and selection.contains(x << zoom, y << zoom)
+                        pixel = (shown[x, y], selected)
+                    pixels[x, y] = pixel
+        pixels.update(self._previews)
+        self._previews = {}
+        self._coarse.clear()
+        self._draw_pixels(pixels)
+        return True
+
+    def end_stroke(self) -> None:
+        """Draws what is left of the previews of a stroke that ended"""
+        self.refine()
+        self._stroke.clear()
+
+    def _draw_pixels(self, pixels: dict[tuple[int, int], tuple[Color, bool]]) -> None:
+        """
+        Draws pixels of the shown level with their colors and whether they are selected,
+        every run of them on a row with a single write
+        """
+        vx0, vy0, vx1, vy1 = self.visible_view()
+        rows: dict[int, list[int]] = {}
+        for x, y in pixels:
+            if vx0 <= x < vx1 and vy0 <= y < vy1:
+                rows.setdefault(y, []).append(x)
+        for y, xs in rows.items():
+            xs.sort()
+            start = 0
+            for i in range(1, len(xs) + 1):
+                if i == len(xs) or xs[i] != xs[i - 1] + 1:
+                    self._draw_run(xs[start], y, [pixels[x, y] for x in xs[start:i]])
+                    start = i
+
+    def _draw_run(self, x: int, y: int, run: list[tuple[Color, bool]]) -> None:
+        """Draws pixels x, x + 1... of row y of the shown level, runs of the same color share an escape sequence"""
+        parts = []
+        same: list[str] = []
+        same_color: Color | None = None
+        for i, (color, selected) in enumerate(run):
+            if self._overlay is not None:
+                color = self._with_onion_skin(x + i, y, color)
+            pixel = SELECTED_PIXEL if selected else FILLED_PIXEL
+            if color.a == 255 and color == same_color:
+                same.append(pixel)
+                continue
+            if same_color is not None:
+                parts.append(same_color.colorize("".join(same)))
+            if color.a == 255:
+                same, same_color = [pixel], color
+            else:
+                same, same_color = [], None
+                parts.append(transparent_pixel(color.rgba(), y % 2 == 1, pixel))
+        if same_color is not None:
+            parts.append(same_color.colorize("".join(same)))
+        col, row = self._view_to_terminal(x, y)
+        terminal.addstr(row, col, "".join(parts))
 
     def render_pixel(self, x: int, y: int, color: Color) -> None:
+        """Renders pixel (x, y) of the image, zoomed out it covers the whole pixel it's shown in"""
+        selection = self.selector.current
+        selected = selection is not None and selection.contains(x, y)
+        self._draw_pixel(x >> self.zoom, y >> self.zoom, color, selected)
+
+    def _draw_pixel(self, x: int, y: int, color: Color, selected: bool) -> None:
+        """Draws pixel (x, y) of the shown level"""
+        view_x = x - self.scroll_x
+        view_y = y - self.scroll_y
+        if not (0 <= view_x < self.view_width and 0 <= view_y < self.view_height):
+            return
         # pixels are 2 characters wide
-        x = self.left + 2 * x
-        y = self.top + y
-        draw(x, y, FILLED_PIXEL, color)
+        col = self.left + 2 * view_x
+        row = self.top + view_y
+        pixel = SELECTED_PIXEL if selected else FILLED_PIXEL
+        if self._overlay is not None:
+            color = self._with_onion_skin(x, y, color)
+        if color.a == 255:
+            draw(col, row, pixel, color)
+        else:
+            terminal.addstr(row, col, transparent_pixel(color.rgba(), y % 2 == 1, pixel))
+
+    def _with_onion_skin(self, x: int, y: int, color: Color) -> Color:
+        """Color of pixel (x, y) of the shown level with the onion skin on top"""
+        assert self._overlay is not None
+        x, y = x << self.zoom, y << self.zoom
+        if x >= self._overlay.width or y >= self._overlay.height:
+            return color
+        skin = self._overlay[x, y]
+        return blending.over(skin, color) if skin.a else color
 
     def set_image(self, image: ImageData) -> None:
-        self.image = image
+        self.set_layers(LayerStack(image))
+
+    def set_layers(self, layers: LayerStack) -> None:
+        self.set_animation(Animation(layers))
+
+    def set_animation(self, frames: Animation) -> None:
+        self.frames = frames
+        self.layers = frames.live
+        self.playing = False
+        self._update_overlay()
+        self._forget_previews()
+        # the image is redrawn anyway so listeners don't need to know about the selection
+        self.selector.current = None
         self._update_pos()
 
+    def select_frame(self, index: int) -> None:
+        """Shows frame index for editing, drawing only the pixels that differ from the frame shown now"""
+        if index != self.frames.index:
+            self._show_frame(lambda: self.frames.select(index))
+
+    def insert_frame(self, copy: bool = True) -> None:
+        """Adds a frame after the current one (a copy of it or a blank one) and shows it"""
+        self._show_frame(lambda: self.frames.insert(copy))
+
+    def remove_frame(self) -> None:
+        self._show_frame(self.frames.remove)
+
+    def move_frame(self, new_index: int) -> None:
+        self.frames.move(new_index)
+        if self._overlay is not None:
+            # the neighbours are others now
+            self._update_overlay()
+            self._render_view(*self.visible_view())
+
+    def _show_frame(self, change: Callable[[], LayerStack]) -> None:
+        """Shows the frame that change() makes the current one, drawing the pixels that differ"""
+        frames = self.frames
+        old = frames.composite(frames.index)
+        had_overlay = self._overlay is not None
+        self.layers = change()
+        self._forget_previews()
+        self._update_overlay()
+        if had_overlay or self._overlay is not None:
+            # the onion skin moved along with the frame
+            self._render_view(*self.visible_view())
+            return
+        changed = changed_runs(old, frames.composite(frames.index))
+        if not self.zoom:
+            for y, x0, x1 in changed:
+                self._render_view(x0, y, x1, y + 1)
+            return
+        # zoomed out, the runs are gathered by the pixels of the level they are shown in
+        zoom, scale = self.zoom, self.scale
+        rows: dict[int, set[int]] = {}
+        for y, x0, x1 in changed:
+            rows.setdefault(y >> zoom, set()).update(range(x0 >> zoom, -(-x1 // scale)))
+        for y, xs in rows.items():
+            for x0, x1 in _runs(sorted(xs)):
+                self._render_view(x0, y, x1, y + 1)
+
+    def set_onion_skin(self, onion: tuple[int, int] | None) -> None:
+        """Shows (before, after) neighbouring frames on top of the current one, or none"""
+        self.onion = onion
+        self._update_overlay()
+        self._render_view(*self.visible_view())
+
+    def _update_overlay(self) -> None:
+        if self.onion is None or self.playing:
+            self._overlay = None
+        else:
+            self._overlay = self.frames.onion_skin(*self.onion)
+
+    def play(self) -> None:
+        """Starts showing the frames one after another, for their durations"""
+        self.playing = True
+        self._frame_due = time.monotonic() + self.frames.frame.duration / 1000
+        if self._overlay is not None:
+            self._update_overlay()
+            self._render_view(*self.visible_view())
+
+    def stop(self) -> None:
+        self.playing = False
+        if self.onion is not None:
+            self._update_overlay()
+            self._render_view(*self.visible_view())
+
+    def playback_timeout(self) -> float | None:
+        """Seconds until the next frame is due during playback, None when not playing"""
+        if not self.playing:
+            return None
+        return max(0.0, self._frame_due - time.monotonic())
+
+    def advance(self) -> bool:
+        """Shows the next frame if it is due, returns whether it did"""
+        now = time.monotonic()
+        if not self.playing or now < self._frame_due:
+            return False
+        self.select_frame((self.frames.index + 1) % len(self.frames))
+        duration = self.frames.frame.duration / 1000
+        # keeps to the timing unless it fell behind by a whole frame
+        if now - self._frame_due > duration:
+            self._frame_due = now
+        self._frame_due += duration
+        return True
+
     def crop(self, x0: int, y0: int, x1: int, y1: int) -> None:
-        self.image.crop(x0, y0, x1, y1)
+        self.frames.apply(lambda layers: layers.crop(x0, y0, x1, y1))
+        self.selector.current = None
+        self._update_overlay()
+        self._update_pos()
+
+    def transform(self, fn: Transform) -> None:
+        """Applies a geometric transform to every layer of every frame"""
+        self.frames.apply(lambda layers: layers.transform(fn))
+        self.selector.current = None
+        self._update_overlay()
         self._update_pos()
 
+    def _forget_previews(self) -> None:
+        self._previews = {}
+        self._stroke.clear()
+        self._coarse.clear()
+
     def _update_pos(self) -> None:
-        self.right = self.left + 2 * self.image.width - 1
-        self.bottom = self.top + self.image.height - 1
+        """Fits the widget to the image, or to the terminal when the image is larger than it"""
+        if self.zoom:
+            from pixediter import mipmap
+            # the image may have shrunk
+            self.zoom = min(self.zoom, mipmap.max_level(self.layers.width, self.layers.height))
+        width, height = self.shown_size()
+        columns, rows = terminal.size()
+        # the last row of the terminal is used for messages and one more is needed for the border
+        self.view_width = max(1, min(width, (columns - self.left) // 2))
+        self.view_height = max(1, min(height, rows - 2 - self.top))
+        self.scroll_x = max(0, min(self.scroll_x, width - self.view_width))
+        self.scroll_y = max(0, min(self.scroll_y, height - self.view_height))
+        self.right = self.left + 2 * self.view_width - 1
+        self.bottom = self.top + self.view_height - 1
 
     def resize_up(self) -> None:
         if self.image.height > 1:
@@ -97,3 +611,12 @@ class DrawArea(TerminalWidget):
 
     def resize_right(self) -> None:
         self.crop(0, 0, self.image.width + 1, self.image.height)
+
+
+def _runs(xs: list[int]) -> Iterator[tuple[int, int]]:
+    """The runs (x0, x1) of consecutive numbers in sorted xs"""
+    start = 0
+    for i in range(1, len(xs) + 1):
+        if i == len(xs) or xs[i] != xs[i - 1] + 1:
+            yield xs[start], xs[i - 1] + 1
+            start = i
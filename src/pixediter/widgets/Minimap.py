@@ -0,0 +1,165 @@
+"""
+An overview of the whole image, with the part that the draw area shows highlighted.
+
+Every cell shows 2x2 "subpixels" with the quadrant block characters, in two colors: the
+subpixels are split into the two groups that are farthest apart in color and each group is
+shown in its average color. A subpixel is half as wide as it is tall, so a cell shows a
+block of the image twice as tall as it is wide to keep the proportions of the image. The
+pixels come from the level of the mipmap pyramid that is the smallest one to fit.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from pixediter import events
+from pixediter import terminal
+from pixediter.borders import Borders
+from pixediter.events import MouseButton
+from pixediter.events import MouseEventType
+from pixediter.image import BYTES_PER_PIXEL
+
+from .DrawArea import DrawArea
+from .TerminalWidget import TerminalWidget
+
+MINIMAP_COLUMNS = 16
+MINIMAP_ROWS = 8
+
+# indexed by which subpixels are in the foreground color: 1 top left, 2 top right, 4 bottom
+# left and 8 bottom right
+QUADRANTS = " ▘▝▀▖▌▞▛▗▚▐▜▄▙▟█"
+
+RGB = tuple[int, int, int]
+
+
+def _distance(a: RGB, b: RGB) -> int:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+def _average(colors: list[RGB]) -> RGB:
+    n = len(colors)
+    return (
+        (sum(c[0] for c in colors) + n // 2) // n,
+        (sum(c[1] for c in colors) + n // 2) // n,
+        (sum(c[2] for c in colors) + n // 2) // n,
+    )
+
+
+def quadrant_cell(subpixels: list[RGB]) -> tuple[str, RGB, RGB]:
+    """
+    Returns the character and its foreground and background color that show the four
+    subpixels (in the order of QUADRANTS) best
+    """
+    if subpixels.count(subpixels[0]) == 4:
+        return QUADRANTS[15], subpixels[0], subpixels[0]
+    # the two colors that are farthest apart start the two groups
+    pairs = [(i, j) for i in range(4) for j in range(i + 1, 4)]
+    i, j = max(pairs, key=lambda pair: _distance(subpixels[pair[0]], subpixels[pair[1]]))
+    first, second = subpixels[i], subpixels[j]
+    mask = 0
+    for k, color in enumerate(subpixels):
+        if _distance(color, first) <= _distance(color, second):
+            mask |= 1 << k
+    fg = _average([color for k, color in enumerate(subpixels) if mask & (1 << k)])
+    bg = _average([color for k, color in enumerate(subpixels) if not mask & (1 << k)])
+    return QUADRANTS[mask], fg, bg
+
+
+class Minimap(TerminalWidget):
+    def __init__(
+            self,
+            *,
+            top: int,
+            left: int,
+            borders: Optional[Borders] = None,
+            draw_area: DrawArea
+    ):
+        super().__init__(
+            bbox=(left, top, left + MINIMAP_COLUMNS - 1, top + MINIMAP_ROWS - 1),
+            borders=borders
+        )
+        self.draw_area = draw_area
+        # the rows as they were last drawn, so that refresh() only draws the ones that changed
+        self._rows: list[str] = []
+
+    def level(self) -> int:
+        """The level of the pyramid the minimap shows, the smallest one that fits"""
+        layers = self.draw_area.layers
+        columns = self.right - self.left + 1
+        rows = self.bottom - self.top + 1
+        k = 0
+        while -(-layers.width >> k) > 2 * columns or -(-layers.height >> k) > 4 * rows:
+            k += 1
+        return k
+
+    def onclick(self, ev: events.MouseEvent) -> bool:
+        if ev.button != MouseButton.LEFT or ev.event_type == MouseEventType.MOUSE_UP:
+            return False
+        # the middle of the block of the image the cell shows
+        k = self.level()
+        x = (2 * (ev.x - self.left) + 1) << k
+        y = (4 * (ev.y - self.top) + 2) << k
+        layers = self.draw_area.layers
+        self.draw_area.center_on(min(x, layers.width - 1), min(y, layers.height - 1))
+        return True
+
+    def render(self) -> None:
+        super().render()
+        self._rows = self._render_rows()
+        for i, row in enumerate(self._rows):
+            terminal.addstr(self.top + i, self.left, row)
+
+    def refresh(self) -> bool:
+        """Draws the rows that changed since the minimap was last drawn, returns whether there were any"""
+        rows = self._render_rows()
+        changed = False
+        for i, row in enumerate(rows):
+            if i >= len(self._rows) or row != self._rows[i]:
+                terminal.addstr(self.top + i, self.left, row)
+                changed = True
+        self._rows = rows
+        return changed
+
+    def _render_rows(self) -> list[str]:
+        layers = self.draw_area.layers
+        k = self.level()
+        # level 0 is the composite itself, the pyramid isn't needed for small images
+        shown = layers.flatten() if k == 0 else layers.pyramid.level(k)
+        data = shown.data
+        vx0, vy0, vx1, vy1 = self.draw_area.visible_region()
+        columns = self.right - self.left + 1
+
+        def subpixel(x: int, y: int) -> RGB | None:
+            """The color of the subpixel that shows pixel (x, y) of the level, None outside of the image"""
+            if x >= shown.width or y >= shown.height:
+                return None
+            i = (y * shown.width + x) * BYTES_PER_PIXEL
+            r, g, b, a = data[i:i + BYTES_PER_PIXEL]
+            # translucent pixels are shown on top of black
+            if a != 255:
+                r, g, b = (r * a + 127) // 255, (g * a + 127) // 255, (b * a + 127) // 255
+            # the parts outside of the viewport are dimmed
+            if (x + 1) << k <= vx0 or x << k >= vx1 or (y + 2) << k <= vy0 or y << k >= vy1:
+                r, g, b = r // 2, g // 2, b // 2
+            return r, g, b
+
+        rows = []
+        for cy in range(self.bottom - self.top + 1):
+            # runs of cells in the same colors share their escape sequence
+            runs: list[tuple[RGB, RGB, list[str]] | str] = []
+            for cx in range(columns):
+                x, y = 2 * cx, 4 * cy
+                subpixels = [subpixel(x, y), subpixel(x + 1, y), subpixel(x, y + 2), subpixel(x + 1, y + 2)]
+                if subpixels[0] is None:
+                    runs.append(" ")
+                    continue
+                char, fg, bg = quadrant_cell([(0, 0, 0) if color is None else color for color in subpixels])
+                last = runs[-1] if runs else None
+                if isinstance(last, tuple) and last[0] == fg and last[1] == bg:
+                    last[2].append(char)
+                else:
+                    runs.append((fg, bg, [char]))
+            rows.append("".join(
+                run if isinstance(run, str) else terminal.colorize_cell("".join(run[2]), run[0], run[1])
+                for run in runs
+            ))
+        return rows
@@ -0,0 +1,231 @@
+"""
+The image at its natural size, a pixel of the image on a pixel of the screen, in terminals
+that can show images (see graphics).
+
+The image is split into tiles, and the pixels of each tile are kept as the terminal last
+got them. Changes to the layers only mark the tiles they touch, which are compared to what
+was sent when the preview is refreshed, so only the tiles that really changed are sent
+again. With the kitty protocol the whole image is kept up to date in the terminal and any
+part of it can be shown by placing it again. Sixel tiles are one cell in size, and their
+encoded images are cached to draw them again when something was painted over them.
+
+When the image is larger than the widget, the part around the middle of the canvas is
+shown.
+"""
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Optional
+
+from pixediter import graphics
+from pixediter import terminal
+from pixediter.borders import Borders
+from pixediter.layers import Layer
+from pixediter.layers import LayerStack
+from pixediter.layers import TILE_SIZE
+
+from .DrawArea import DrawArea
+from .TerminalWidget import TerminalWidget
+
+PREVIEW_MAX_COLUMNS = 32
+PREVIEW_MAX_ROWS = 12
+# the id of the image in the terminal's memory (kitty graphics)
+PREVIEW_IMAGE_ID = 1
+
+Tile = tuple[int, int]
+
+
+class Preview(TerminalWidget):
+    def __init__(
+            self,
+            *,
+            top: int,
+            left: int,
+            borders: Optional[Borders] = None,
+            draw_area: DrawArea,
+            protocol: str
+    ):
+        super().__init__(bbox=(left, top, left, top), borders=borders)
+        self.draw_area = draw_area
+        self.protocol = protocol
+        self._kitty = graphics.KittyImage(PREVIEW_IMAGE_ID) if protocol == terminal.KITTY_GRAPHICS else None
+        self.cell_size = terminal.cell_size()
+        # what the tiles were made of: the layers, the size of the image and of the cells
+        self._source: tuple[LayerStack, int, int, tuple[int, int]] | None = None
+        # the pixels of the tiles as the terminal has them, and the sixel images of them
+        self._sent: dict[Tile, bytes] = {}
+        self._sixels: dict[Tile, str] = {}
+        self.dirty_tiles: set[Tile] = set()
+        # the area of the image (x, y, width, height) that was shown the last time
+        self._shown: tuple[int, int, int, int] | None = None
+        self.fit()
+
+    @property
+    def tile_size(self) -> tuple[int, int]:
+        return (TILE_SIZE, TILE_SIZE) if self._kitty is not None else self.cell_size
+
+    def fit(self) -> None:
+        """Fits the widget to the image, up to PREVIEW_MAX_COLUMNS x PREVIEW_MAX_ROWS cells"""
+        layers = self.draw_area.layers
+        self.cell_size = terminal.cell_size()
+        cell_width, cell_height = self.cell_size
+        self.right = self.left + max(1, min(-(-layers.width // cell_width), PREVIEW_MAX_COLUMNS)) - 1
+        self.bottom = self.top + max(1, min(-(-layers.height // cell_height), PREVIEW_MAX_ROWS)) - 1
+
+    def invalidate(self) -> None:
+        """Marks every tile to be compared, for changes that don't come from the pixels of a layer"""
+        tile_width, tile_height = self.tile_size
+        layers = self.draw_area.layers
+        self.dirty_tiles.update(
+            (tx, ty)
+            for ty in range(-(-layers.height // tile_height))
+            for tx in range(-(-layers.width // tile_width))
+        )
+
+    def shown_area(self) -> tuple[int, int, int, int]:
+        """The area of the image (x, y, width, height) that fits in the widget, around the middle of the canvas"""
+        layers = self.draw_area.layers
+        cell_width, cell_height = self.cell_size
+        width = min(layers.width, (self.right - self.left + 1) * cell_width)
+        height = min(layers.height, (self.bottom - self.top + 1) * cell_height)
+        vx0, vy0, vx1, vy1 = self.draw_area.visible_region()
+        x = max(0, min((vx0 + vx1 - width) // 2, layers.width - width))
+        y = max(0, min((vy0 + vy1 - height) // 2, layers.height - height))
+        if self._kitty is None:
+            # sixel tiles are whole cells
+            x -= x % cell_width
+            y -= y % cell_height
+            width = min(width, layers.width - x)
+            height = min(height, layers.height - y)
+        return x, y, width, height
+
+    def render(self) -> None:
+        self.fit()
+        super().render()
+        blank = " " * (self.right - self.left + 1)
+        for row in range(self.top, self.bottom + 1):
+            terminal.addstr(row, self.left, blank)
+        if self._reset():
+            return
+        self._shown = self.shown_area()
+        if self._kitty is not None:
+            self._send_changes()
+            self._place()
+        else:
+            self._draw_sixels(self._shown_tiles())
+
+    def refresh(self) -> bool:
+        """Sends the changes to the terminal and shows them, returns whether anything was drawn"""
+        if self._reset():
+            return True
+        shown = self.shown_area()
+        moved = shown != self._shown
+        self._shown = shown
+        if self._kitty is not None:
+            changed = self._send_changes()
+            if moved:
+                self._place()
+            return moved or bool(changed)
+        tiles = self._shown_tiles()
+        changed = self._compare([tile for tile in tiles if tile in self.dirty_tiles])
+        self._draw_sixels(tiles if moved else changed)
+        return moved or bool(changed)
+
+    def hide(self) -> None:
+        """Takes the image off the screen and out of the terminal's memory, sixels are just painted over"""
+        if self._kitty is not None:
+            terminal.send(self._kitty.delete())
+
+    def _reset(self) -> bool:
+        """Starts over if the image was replaced or resized, returns whether it did (and drew everything)"""
+        layers = self.draw_area.layers
+        source = (layers, layers.width, layers.height, self.cell_size)
+        if source == self._source:
+            return False
+        if self._source is None or self._source[0] is not layers:
+            layers.add_change_listener(self._on_change(layers))
+        self._source = source
+        self._sent.clear()
+        self._sixels.clear()
+        self.dirty_tiles.clear()
+        self.invalidate()
+        self._shown = self.shown_area()
+        if self._kitty is not None:
+            composite = layers.flatten()
+            self._sent.update((tile, self._tile_pixels(tile)) for tile in self.dirty_tiles)
+            self.dirty_tiles.clear()
+            terminal.send(self._kitty.transmit(layers.width, layers.height, bytes(composite.data)))
+            self._place()
+        else:
+            self._draw_sixels(self._shown_tiles())
+        return True
+
+    def _on_change(self, layers: LayerStack) -> Callable[[Layer, int, int, int, int], None]:
+        def on_change(layer: Layer, x0: int, y0: int, x1: int, y1: int) -> None:
+            # the listener stays on layers that were replaced
+            if self._source is None or self._source[0] is not layers:
+                return
+            tile_width, tile_height = self.tile_size
+            for ty in range(y0 // tile_height, (y1 - 1) // tile_height + 1):
+                for tx in range(x0 // tile_width, (x1 - 1) // tile_width + 1):
+                    self.dirty_tiles.add((tx, ty))
+        return on_change
+
+    def _tile_area(self, tile: Tile) -> tuple[int, int, int, int]:
+        layers = self.draw_area.layers
+        tile_width, tile_height = self.tile_size
+        x0, y0 = tile[0] * tile_width, tile[1] * tile_height
+        return x0, y0, min(layers.width, x0 + tile_width), min(layers.height, y0 + tile_height)
+
+    def _tile_pixels(self, tile: Tile) -> bytes:
+        x0, y0, x1, y1 = self._tile_area(tile)
+        return self.draw_area.layers.flatten(x0, y0, x1, y1).region(x0, y0, x1, y1)
+
+    def _compare(self, tiles: list[Tile]) -> list[Tile]:
+        """Returns the tiles whose pixels differ from what was sent, and marks them as sent"""
+        changed = []
+        for tile in tiles:
+            self.dirty_tiles.discard(tile)
+            pixels = self._tile_pixels(tile)
+            if self._sent.get(tile) != pixels:
+                self._sent[tile] = pixels
+                self._sixels.pop(tile, None)
+                changed.append(tile)
+        return changed
+
+    def _shown_tiles(self) -> list[Tile]:
+        assert self._shown is not None
+        x, y, width, height = self._shown
+        tile_width, tile_height = self.tile_size
+        return [
+            (tx, ty)
+            for ty in range(y // tile_height, -(-(y + height) // tile_height))
+            for tx in range(x // tile_width, -(-(x + width) // tile_width))
+        ]
+
+    def _send_changes(self) -> list[Tile]:
+        """Replaces the tiles that changed in the terminal's copy of the image (kitty graphics)"""
+        assert self._kitty is not None
+        changed = self._compare(sorted(self.dirty_tiles))
+        for tile in changed:
+            x0, y0, x1, y1 = self._tile_area(tile)
+            terminal.send(self._kitty.edit(x0, y0, x1 - x0, y1 - y0, self._sent[tile]))
+        return changed
+
+    def _place(self) -> None:
+        assert self._kitty is not None and self._shown is not None
+        terminal.draw_image(self.top, self.left, self._kitty.place(*self._shown))
+
+    def _draw_sixels(self, tiles: list[Tile]) -> None:
+        assert self._shown is not None
+        self._compare([tile for tile in tiles if tile in self.dirty_tiles or tile not in self._sent])
+        x, y, _, _ = self._shown
+        cell_width, cell_height = self.cell_size
+        for tile in tiles:
+            x0, y0, x1, y1 = self._tile_area(tile)
+            payload = self._sixels.get(tile)
+            if payload is None:
+                payload = self._sixels[tile] = graphics.sixel(x1 - x0, y1 - y0, self._sent[tile])
+            row = self.top + (y0 - y) // cell_height
+            col = self.left + (x0 - x) // cell_width
+            terminal.draw_image(row, col, payload)
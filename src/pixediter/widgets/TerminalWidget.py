@@ -4,6 +4,7 @@ from typing import Optional
 
 from pixediter import colors
 from pixediter import events
+from pixediter import terminal
 from pixediter.borders import Borders
 from pixediter.utils import draw
 from pixediter.utils import draw_box
@@ -23,6 +24,12 @@ class TerminalWidget:
         """
         return self.top <= y <= self.bottom and self.left <= x <= self.right
 
+    def outer_bbox(self) -> tuple[int, int, int, int]:
+        """Returns the cells (x0, y0, x1, y1, corners included) the widget covers with its borders and title"""
+        border = 1 if self.borders is not None else 0
+        top = 1 if self.borders is not None or self.title is not None else 0
+        return self.left - border, self.top - top, self.right + border, self.bottom + border
+
     def move(self, dx: int, dy: int) -> None:
         """Moves the widget dx columns to the left and dy rows down"""
         self.left += dx
@@ -51,6 +58,11 @@ class TerminalWidget:
         if self.title is not None:
             draw(self.left, self.top - 1, self.title)
 
+    def render_clipped(self, x0: int, y0: int, x1: int, y1: int) -> None:
+        """Draws the part of the widget in the cells x0 <= column <= x1, y0 <= row <= y1"""
+        with terminal.clipped(x0, y0, x1, y1):
+            self.render()
+
     def resize_up(self) -> None:
         if self.bottom > self.top:
             self.bottom -= 1
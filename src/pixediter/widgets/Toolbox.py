@@ -24,7 +24,7 @@ class Toolbox(TerminalWidget):
             selector: ToolSelector
     ):
         if width is None:
-            width = max(len(tool.name) for tool in selector)
+            width = max(len(name) for name in selector.names)
         right = left + width - 1
         bottom = top + len(selector) - 1
         bbox = (left, top, right, bottom)
@@ -43,9 +43,10 @@ class Toolbox(TerminalWidget):
     def render(self) -> None:
         super().render()
         y = self.top
-        for tool in self.selector:
-            color = colors.WHITE if tool == self.selector.current else colors.GRAY
-            toolstr = tool.name.ljust(self.width)[:self.width]
+        # by name, the tools are created when they are first used
+        for i, name in enumerate(self.selector.names):
+            color = colors.WHITE if i == self.selector.current_index else colors.GRAY
+            toolstr = name.ljust(self.width)[:self.width]
             draw(self.left, y, toolstr, color=color)
             y += 1
 
@@ -0,0 +1,165 @@
+import gc
+import random
+import tracemalloc
+
+from pixediter import animation as animation_module
+from pixediter import colors
+from pixediter import events
+from pixediter import terminal
+from pixediter.animation import Animation
+from pixediter.application import App
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+from pixediter.virtual_terminal import VirtualTerminal
+from pixediter.widgets import DrawArea
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def noise(width, height, seed=1):
+    rng = random.Random(seed)
+    image = ImageData(width, height)
+    for y in range(height):
+        for x in range(width):
+            image[x, y] = colors.Color(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    return image
+
+
+def walk_cycle(frames, size=64):
+    """An animation of a black 4x4 sprite walking across a background of noise"""
+    animation = Animation(LayerStack(noise(size, size)))
+    background = noise(size, size)
+    for i in range(frames):
+        if i:
+            animation.insert(copy=True)
+        image = animation.live.active.image
+        if i:
+            # the sprite is erased where the previous frame had it
+            for y in range(40, 44):
+                for x in range(i - 1, i + 3):
+                    image[x, y] = background[x, y]
+        for y in range(40, 44):
+            for x in range(i, i + 4):
+                image[x, y] = colors.BLACK
+    animation.store()
+    return animation
+
+
+def test_frames_share_the_tiles_that_are_the_same():
+    animation = walk_cycle(48)
+    size = 64 * 64 * 4
+    assert len(animation) == 48
+    # the background and the tiles the sprite is in, instead of 48 whole frames
+    assert animation.tiles.size < 48 * size / 8
+    before = bytes(animation.composite(10).data)
+    animation.select(11)
+    animation.live.active.image[0, 0] = colors.RED
+    animation.select(10)
+    # editing a frame doesn't change the tiles that it shared with others
+    assert bytes(animation.composite(10).data) == before
+    assert animation.composite(11)[0, 0] == colors.RED
+    animation.remove()
+    assert len(animation) == 47 and animation.index == 10
+    assert animation.composite(10)[0, 0] == colors.RED
+
+
+def test_playback_keeps_a_few_composites():
+    frame_size = 128 * 128 * 4
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        animation = Animation(LayerStack(ImageData(128, 128)))
+        for _ in range(31):
+            animation.insert()
+        for i in range(len(animation)):
+            animation.select(i)
+            # what the onion skin of the frame reads
+            animation.composite((i + 1) % len(animation))
+        # the stacks of the frames that were let go of refer to themselves
+        gc.collect()
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    assert animation.tiles.size < frame_size / 16
+    # the cached composites and the live frame, instead of one composite for each of 32 frames
+    assert used < (animation_module.CACHED_COMPOSITES + 4) * frame_size
+
+
+def test_animations_are_saved_with_the_tiles_once(tmp_path):
+    animation = walk_cycle(16)
+    animation.set_duration(40, every_frame=True)
+    filepath = str(tmp_path / "walk.pxa")
+    animation.save(filepath)
+    assert (tmp_path / "walk.pxa").stat().st_size < 2 * 64 * 64 * 4
+    loaded = Animation.load(filepath)
+    assert len(loaded) == 16 and loaded.index == animation.index
+    assert len(loaded.tiles) == len(animation.tiles)
+    for i in range(16):
+        assert bytes(loaded.composite(i).data) == bytes(animation.composite(i).data)
+        assert loaded.frames[i].duration == 40
+
+
+def test_switching_frames_draws_the_pixels_that_differ():
+    with terminal.using(VirtualTerminal(140, 50)) as vt:
+        app = App(32, 32)
+        app.draw_area.set_image(noise(32, 32))
+        app.full_redraw()
+        app.run([*":frame copy", "\n"])
+        image = app.draw_area.image
+        for x in range(3, 8):
+            image[x, 5] = colors.RED
+        image[20, 30] = colors.BLUE
+        vt.end_frame()
+        app.draw_area.select_frame(0)
+        # pixels are 2 cells wide
+        assert vt.end_frame().cells == 2 * 6
+        area = app.draw_area
+        assert vt.grid[area.top + 5 - 1][area.left + 2 * 3 - 1].fg != colors.RED.rgb()
+        app.run(["."])
+        assert vt.grid[area.top + 5 - 1][area.left + 2 * 3 - 1].fg == colors.RED.rgb()
+        assert app.draw_area.frames.index == 1
+
+
+def test_the_onion_skin_shows_the_neighbouring_frames():
+    with terminal.using(VirtualTerminal(140, 50)) as vt:
+        app = App(8, 8)
+        app.draw_area.image[2, 2] = colors.BLACK
+        app.full_redraw()
+        app.run([*":frame new", "\n", *":onion", "\n"])
+        area = app.draw_area
+        cell = vt.grid[area.top + 2 - 1][area.left + 2 * 2 - 1]
+        # the previous frame's black pixel shows faintly on top of the blank frame
+        assert 0 < cell.fg[0] < 255
+        assert vt.grid[area.top - 1][area.left - 1].fg == colors.WHITE.rgb()
+        app.run([*":onion off", "\n"])
+        assert vt.grid[area.top + 2 - 1][area.left + 2 * 2 - 1].fg == colors.WHITE.rgb()
+
+
+def test_playback_shows_the_frames_for_their_durations(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(DrawArea.time, "monotonic", clock)
+    with terminal.using(VirtualTerminal(140, 50)):
+        app = App(8, 8)
+        app.full_redraw()
+        app.run([*":frame new", "\n", *":frame duration 200", "\n", *":frame 0", "\n", "p"])
+        assert app.draw_area.playing
+        assert abs(app.idle_timeout() - 0.1) < 1e-9
+        clock.now += 0.05
+        app.run([events.IDLE])
+        assert app.draw_area.frames.index == 0
+        clock.now += 0.06
+        app.run([events.IDLE])
+        assert app.draw_area.frames.index == 1
+        assert abs(app.idle_timeout() - 0.19) < 1e-9
+        clock.now += 0.2
+        app.run([events.IDLE])
+        assert app.draw_area.frames.index == 0
+        # any key stops the playback
+        app.run(["p"])
+        assert not app.draw_area.playing and app.idle_timeout() is None
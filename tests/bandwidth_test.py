@@ -0,0 +1,186 @@
+import os
+import sys
+import time
+
+from pixediter import application
+from pixediter import bandwidth
+from pixediter import events
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.render_thread import RenderThread
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class SlowLink(VirtualTerminal):
+    """A terminal on a slow link: queued bytes haven't been read yet and every flush blocks for delay seconds"""
+
+    def __init__(self, clock, columns, rows):
+        super().__init__(columns, rows)
+        self.clock = clock
+        self.queued = 0
+        self.delay = 0.0
+
+    def flush(self):
+        super().flush()
+        self.clock.now += self.delay
+
+    def backlog(self):
+        return self.queued
+
+
+def stroke(app, points):
+    """The events of dragging from the first point through the rest (in pixels of the image)"""
+    area = app.draw_area
+    kinds = [MouseEventType.MOUSE_DOWN] + [MouseEventType.MOUSE_DRAG] * (len(points) - 1)
+    return [MouseEvent(kind, MouseButton.LEFT, area.left + 2 * x, area.top + y) for kind, (x, y) in zip(kinds, points)]
+
+
+def timed(clock, evs, step):
+    for ev in evs:
+        clock.now += step
+        yield ev
+
+
+def canvas(vt, app):
+    area = app.draw_area
+    return [
+        (cell.char, cell.fg)
+        for row in range(area.top, area.bottom + 1)
+        for cell in vt.grid[row - 1][area.left - 1:area.right]
+    ]
+
+
+def test_the_mode_follows_the_link(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bandwidth.time, "monotonic", clock)
+    link = bandwidth.Monitor()
+    vt = SlowLink(clock, 80, 24)
+    output = link.metered(vt)
+    assert not link.sample() and link.mode == bandwidth.FULL
+
+    vt.queued = 100_000
+    clock.now += 1
+    assert link.sample() and link.mode == bandwidth.DROP_FRAMES
+    # the new mode gets a chance to help first
+    assert not link.sample()
+    clock.now += bandwidth.ESCALATE_AFTER
+    assert link.sample() and link.mode == bandwidth.COARSE
+    clock.now += 1
+    assert not link.frame_due()
+
+    vt.queued = 0
+    assert not link.sample() and link.frame_due()
+    clock.now += 0.5
+    assert not link.sample()
+    clock.now += 0.5
+    assert link.sample() and link.mode == bandwidth.DROP_FRAMES
+    clock.now += bandwidth.RECOVER_AFTER
+    assert link.sample() and link.mode == bandwidth.FULL
+
+    # writes that block show a slow link where the backlog can't be seen
+    vt.delay = 0.1
+    output.write("x")
+    output.flush()
+    clock.now += 1
+    assert link.sample() and link.mode == bandwidth.DROP_FRAMES
+    assert link.pin(bandwidth.FULL) and not link.sample()
+
+
+def test_coarse_previews_are_refined_when_the_mouse_stops(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bandwidth.time, "monotonic", clock)
+    screens = {}
+    output = {}
+    for mode in (bandwidth.FULL, bandwidth.COARSE):
+        with terminal.using(VirtualTerminal(140, 50)) as vt:
+            app = App(48, 40)
+            app.tool.select("Gradient")
+            app.full_redraw()
+            app.run([*f":link {mode}", "\n"])
+            vt.end_frame()
+            app.run(timed(clock, stroke(app, [(2, 2)] + [(4 + i, 3 + i) for i in range(20)]), 0.05))
+            output[mode] = vt.end_frame().bytes
+            if mode == bandwidth.COARSE:
+                assert app.draw_area.has_previews() and app.idle_timeout() == application.REFINE_DELAY
+                assert "[slow link: coarse previews]" in vt.line(app.terminal_rows - 1)
+                app.run([events.IDLE])
+                assert not app.draw_area.has_previews()
+            screens[mode] = canvas(vt, app)
+    assert screens[bandwidth.COARSE] == screens[bandwidth.FULL]
+    assert output[bandwidth.COARSE] < output[bandwidth.FULL] / 4
+
+
+def test_the_app_adapts_to_the_link_and_recovers(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(bandwidth.time, "monotonic", clock)
+    link = bandwidth.Monitor()
+    vt = SlowLink(clock, 140, 50)
+    with terminal.using(link.metered(vt)):
+        app = App(48, 40, link=link)
+        app.tool.select("Gradient")
+        app.full_redraw()
+        vt.delay = 0.01
+        app.run(timed(clock, stroke(app, [(2, 2), (10, 10), (20, 20), (30, 30)]), 0.05))
+        assert link.mode == bandwidth.COARSE
+        assert "[slow link: coarse previews]" in vt.line(app.terminal_rows - 1)
+
+        vt.delay = 0.0
+        app.run([events.IDLE])
+        assert not app.draw_area.has_previews()
+        for _ in range(40):
+            if app.idle_timeout() is None:
+                break
+            clock.now += app.idle_timeout()
+            app.run([events.IDLE])
+        assert link.mode == bandwidth.FULL
+        assert "slow link" not in vt.line(app.terminal_rows - 1)
+
+
+class SlowTerminal(VirtualTerminal):
+    def flush(self):
+        time.sleep(0.03)
+        super().flush()
+
+
+def test_the_link_is_measured_behind_the_render_thread():
+    link = bandwidth.Monitor()
+    vt = SlowTerminal(80, 24)
+    renderer = RenderThread(link.metered(vt))
+    link.watch(renderer)
+    with renderer.running(), terminal.using(renderer):
+        for i in range(4):
+            start = time.monotonic()
+            terminal.addstr(1, 1, f"frame {i}")
+            renderer.flush()
+            # the input thread doesn't wait for the terminal, the render thread does
+            assert time.monotonic() - start < 0.03
+            deadline = start + 5
+            while renderer.backlog():
+                assert time.monotonic() < deadline
+                time.sleep(0.001)
+            link.sample()
+    assert link.latency > bandwidth.LATENCY_HIGH
+
+
+def test_input_stopping_is_an_event(monkeypatch):
+    master, slave = os.openpty()
+    with open(slave) as stdin:
+        monkeypatch.setattr(sys, "stdin", stdin)
+        raw_input = events.read_input(lambda: 0.01)
+        assert next(raw_input) == ""
+        assert events.parse("") == events.IDLE
+        os.write(master, "a\x1b[Aä".encode())
+        assert [next(raw_input) for _ in range(4)] == ["a", "\x1b[A", "ä", ""]
+        raw_input.close()
+    os.close(master)
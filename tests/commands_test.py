@@ -0,0 +1,39 @@
+import pytest
+
+from pixediter import colors
+from pixediter import commands
+from pixediter.AreaSelector import AreaSelector
+from pixediter.ColorSelector import ColorSelector
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+
+
+def test_layer_actions():
+    layers = LayerStack(ImageData(2, 2))
+    commands.layer(layers, ["new", "top", "layer"])
+    commands.layer(layers, ["opacity", "100"])
+    commands.layer(layers, ["down"])
+    assert [layer.name for layer in layers] == ["top layer", "Background"]
+    assert layers.active_index == 0 and layers.active.opacity == 100
+    with pytest.raises(commands.CommandError):
+        commands.layer(layers, ["sideways"])
+
+
+def test_clipboard_commands_return_the_area_to_repaint():
+    image = ImageData(6, 6)
+    selector = AreaSelector()
+    color = ColorSelector(primary=colors.RED, secondary=colors.BLUE)
+    commands.select(selector, image, ["1", "1", "2", "2"])
+    assert commands.fill(selector, image, color, ["s"]) == (1, 1, 3, 3)
+    commands.copy(selector, image)
+    assert commands.paste(selector, image, ["3", "4"]) == (3, 4, 5, 6)
+    assert image[4, 5] == colors.BLUE
+    assert commands.recolor(selector, image, ["#0000ff", "#00ff00"]) == ((3, 4, 5, 6), 4)
+    with pytest.raises(commands.CommandError):
+        commands.fill(selector, image, color, ["tertiary"])
+
+
+@pytest.mark.parametrize("args", [["1"], ["1", "2", "3"]])
+def test_crop_requires_2_or_4_arguments(args):
+    with pytest.raises(commands.CommandError):
+        commands.crop_area(args)
@@ -0,0 +1,54 @@
+import os
+import signal
+
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.compositor import difference
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def test_difference_of_rectangles():
+    assert difference((0, 0, 9, 9), (20, 20, 30, 30)) == [(0, 0, 9, 9)]
+    assert difference((0, 0, 9, 9), (-5, -5, 15, 15)) == []
+    # moved one column to the right: only the first column is left
+    assert difference((0, 0, 9, 9), (1, 0, 10, 9)) == [(0, 0, 0, 9)]
+    assert difference((0, 0, 9, 9), (3, 3, 5, 5)) == [(0, 0, 9, 2), (0, 6, 9, 9), (0, 3, 2, 5), (6, 3, 9, 5)]
+
+
+def test_moving_a_widget_repaints_only_what_changed():
+    with terminal.using(VirtualTerminal(300, 150)) as vt:
+        app = App(128, 128)
+        app.full_redraw()
+        full = vt.end_frame()
+        # the color adjuster is moved on top of the canvas, a step at a time
+        app.run(["3", *["left"] * 20])
+        vt.end_frame()
+        app.run(["left"])
+        step = vt.end_frame()
+        # the adjuster with its borders and the column it left
+        assert step.cells < 300
+        assert full.cells > 100 * step.cells
+
+        app.run(["3", "4", "down"])
+        moved = [row[:] for row in vt.grid]
+    with terminal.using(VirtualTerminal(300, 150)) as fresh:
+        app.full_redraw()
+    assert fresh.grid == moved
+
+
+def test_resizing_the_terminal_repaints_the_screen():
+    with terminal.using(VirtualTerminal(300, 150)) as vt, terminal.resize_handler(lambda: app.on_resize()):
+        app = App(128, 128)
+        app.full_redraw()
+        assert app.draw_area.view_height == 128
+
+        def source():
+            yield "r"
+            vt.resize(300, 60)
+            # while the app waits for input
+            os.kill(os.getpid(), signal.SIGWINCH)
+            assert app.draw_area.view_height == 55
+            assert "PixEdiTer" in vt.line(1)
+
+        app.run(source())
+    assert app.terminal_rows == 60
@@ -0,0 +1,133 @@
+import os
+import random
+import tracemalloc
+
+from PIL import Image
+from PIL import ImageSequence
+
+from pixediter import colors
+from pixediter import events
+from pixediter import export
+from pixediter import terminal
+from pixediter.animation import Animation
+from pixediter.application import App
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+from pixediter.virtual_terminal import VirtualTerminal
+
+PALETTE = [colors.Color(r, g, 40) for r in range(0, 256, 51) for g in range(0, 256, 51)]
+
+
+def sprite_walk(frames, size=32, background=None, seed=1):
+    """A 4x4 black sprite walking over a background (by default of a few colors), 100 ms a frame"""
+    rng = random.Random(seed)
+    if background is None:
+        background = ImageData(size, size)
+        for y in range(size):
+            for x in range(size):
+                background[x, y] = rng.choice(PALETTE)
+    animation = Animation(LayerStack(ImageData(size, size, data=bytearray(background.data))))
+    for i in range(frames):
+        if i:
+            animation.insert(copy=True)
+        image = animation.live.active.image
+        image.data[:] = background.data
+        for y in range(10, 14):
+            for x in range(i, i + 4):
+                image[x % size, y] = colors.BLACK
+    return animation
+
+
+def decoded(filepath):
+    with Image.open(filepath) as image:
+        return [
+            (frame.convert("RGBA").tobytes(), frame.info.get("duration"))
+            for frame in ImageSequence.Iterator(image)
+        ]
+
+
+def test_gif_frames_cover_only_what_changed(tmp_path):
+    animation = sprite_walk(12)
+    # the last frame is shown twice as long
+    animation.insert(copy=True)
+    filepath = str(tmp_path / "walk.gif")
+    export.export(filepath, 32, 32, animation.snapshot())
+    frames = decoded(filepath)
+    assert [duration for _, duration in frames] == [100] * 11 + [200]
+    for i, (pixels, _) in enumerate(frames):
+        assert pixels == bytes(animation.composite(i).data)
+    plan = export.plan(13, animation.composite, [100] * 13)
+    # where the sprite was and where it is
+    assert [change.area for change in plan.changes[1:3]] == [(0, 10, 5, 14), (1, 10, 6, 14)]
+    # the first frame in full, the rest only the sprite
+    single = str(tmp_path / "first.gif")
+    export.export(single, 32, 32, animation.snapshot()[:1])
+    assert os.path.getsize(filepath) - os.path.getsize(single) < 12 * 60
+
+
+def test_apng_keeps_the_colors_and_the_transparency(tmp_path):
+    background = ImageData(32, 32)
+    rng = random.Random(2)
+    for y in range(32):
+        for x in range(32):
+            background[x, y] = colors.Color(*(rng.randrange(256) for _ in range(4)))
+    animation = sprite_walk(8, background=background)
+    animation.set_duration(40, every_frame=True)
+    filepath = str(tmp_path / "walk.png")
+    export.export(filepath, 32, 32, animation.snapshot())
+    frames = decoded(filepath)
+    assert len(frames) == 8
+    for i, (pixels, duration) in enumerate(frames):
+        assert pixels == bytes(animation.composite(i).data)
+        assert duration == 40
+
+
+def test_gif_with_many_colors_uses_the_xterm_palette(tmp_path):
+    background = ImageData(48, 48)
+    rng = random.Random(3)
+    for y in range(48):
+        for x in range(48):
+            background[x, y] = colors.Color(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    animation = sprite_walk(3, size=48, background=background)
+    filepath = str(tmp_path / "noise.gif")
+    export.export(filepath, 48, 48, animation.snapshot())
+    frames = decoded(filepath)
+    assert len(frames) == 3
+    for i, (pixels, _) in enumerate(frames):
+        expected = bytes(animation.composite(i).data)
+        # the cube's levels are at most 40 apart, and 95 from black
+        assert max(abs(a - b) for a, b in zip(pixels, expected)) <= 48
+
+
+def test_exporting_takes_memory_for_a_few_frames(tmp_path):
+    peaks = []
+    for count in (16, 160):
+        frames = sprite_walk(count, size=64).snapshot()
+        tracemalloc.start()
+        try:
+            export.export(str(tmp_path / "walk.png"), 64, 64, frames)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    # not 10 times as much for 10 times as many frames
+    assert peaks[1] < 1.5 * peaks[0]
+    assert peaks[1] < 40 * 64 * 64 * 4
+
+
+def test_the_export_runs_in_the_background(tmp_path):
+    filepath = str(tmp_path / "anim.gif")
+    with terminal.using(VirtualTerminal(140, 50)) as vt:
+        app = App(8, 8)
+        app.full_redraw()
+        app.run([*":frame new", "\n"])
+        app.draw_area.image[2, 3] = colors.RED
+        app.run([*f":export {filepath}", "\n"])
+        assert app.export is not None
+        app.export.wait()
+        app.run([events.IDLE])
+        assert app.export is None
+        assert f"Exported 2 frames to {filepath}" in vt.line(vt.rows - 1)
+        app.run([*":export anim.bmp", "\n"])
+        assert "Error" in vt.line(vt.rows - 1)
+    frames = decoded(filepath)
+    assert len(frames) == 2 and frames[1][0][4 * (3 * 8 + 2):4 * (3 * 8 + 3)] == bytes(colors.RED.rgba())
@@ -0,0 +1,52 @@
+import pytest
+
+from pixediter import filters
+
+
+PIXELS = bytes([0, 0, 0, 255, 255, 255, 255, 0, 10, 200, 30, 128, 128, 64, 32, 255])
+
+
+def run_separately(pipeline):
+    data = PIXELS
+    for stage in pipeline.stages:
+        data = filters.Pipeline([stage]).apply(data)
+    return data
+
+
+@pytest.mark.parametrize("text", [
+    "invert",
+    "contrast 1.2 | brightness -10 | posterize 4",
+    "grayscale | contrast 1.2 | posterize 4",
+    "sepia | invert | grayscale",
+    "balance 1 0.5 2 | saturation 1.5 | gamma 2.2",
+])
+def test_fused_pipeline_matches_separate_stages(text):
+    pipeline = filters.parse(text)
+    assert pipeline.apply(PIXELS) == run_separately(pipeline)
+
+
+def test_luts_are_fused_into_one():
+    pipeline = filters.parse("invert | invert | brightness 0")
+    assert pipeline.lut is not None and pipeline.lut.is_identity()
+    assert pipeline.apply(PIXELS) == PIXELS
+
+
+def test_grayscale():
+    out = filters.parse("grayscale").apply(bytes([255, 0, 0, 255, 255, 255, 255, 7]))
+    assert out == bytes([76, 76, 76, 255, 255, 255, 255, 7])
+
+
+@pytest.mark.parametrize("text", ["nope", "posterize", "contrast x", "invert |", "gamma 0"])
+def test_invalid_pipelines(text):
+    with pytest.raises(filters.FilterError):
+        filters.parse(text)
+
+
+def test_matrix_filters_run_once_per_color(monkeypatch):
+    pipeline = filters.parse("grayscale | contrast 1.2")
+    calls = []
+    kernel = pipeline.kernels[0]
+    monkeypatch.setattr(kernel, "apply", lambda *rgb: calls.append(rgb) or filters.MixKernel.apply(kernel, *rgb))
+    out = pipeline.apply(PIXELS * 100)
+    assert out == filters.parse("grayscale | contrast 1.2").apply(PIXELS) * 100
+    assert len(calls) == 4
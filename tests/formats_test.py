@@ -0,0 +1,246 @@
+import io
+import mmap
+import random
+import struct
+import tracemalloc
+import zlib
+
+import pytest
+from PIL import Image
+
+from pixediter import formats
+from pixediter.formats import farbfeld
+from pixediter.formats import pillow
+from pixediter.formats import png
+from pixediter.formats import pxr
+from pixediter.formats import qoi
+from pixediter.formats.common import ImageFormatError
+from pixediter.formats.common import UnsupportedImage
+from pixediter.colors import Color
+from pixediter.image import ImageData
+
+
+def noise(width, height, colors=8, seed=0):
+    rng = random.Random(seed)
+    palette = [bytes(rng.randrange(256) for _ in range(4)) for _ in range(colors)]
+    # runs of the same color so that every kind of encoding gets used
+    pixels = []
+    while len(pixels) < width * height:
+        pixels += [rng.choice(palette)] * rng.randrange(1, 80)
+    return b"".join(pixels[:width * height])
+
+
+def decode(codec_read, data):
+    width, height, rows = codec_read(io.BytesIO(data))
+    return width, height, b"".join(rows)
+
+
+def pillow_png(image, **params):
+    buf = io.BytesIO()
+    image.save(buf, "PNG", **params)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "RGB", "L", "LA", "P", "1"])
+@pytest.mark.parametrize("optimize", [False, True])
+def test_png_decoding_matches_pillow(mode, optimize):
+    image = Image.frombytes("RGBA", (37, 23), noise(37, 23)).convert(mode)
+    data = pillow_png(image, optimize=optimize)
+    assert decode(png.read, data) == (37, 23, Image.open(io.BytesIO(data)).convert("RGBA").tobytes())
+
+
+@pytest.mark.parametrize("bits", [1, 2, 4])
+def test_png_low_bit_depth_palette(bits):
+    image = Image.frombytes("RGBA", (13, 5), noise(13, 5, colors=2 ** bits)).convert("RGB")
+    image = image.quantize(2 ** bits)
+    data = pillow_png(image, bits=bits)
+    assert decode(png.read, data)[2] == Image.open(io.BytesIO(data)).convert("RGBA").tobytes()
+
+
+def test_png_16_bit_keeps_high_byte():
+    values = bytes(range(0, 250, 10))
+    image = Image.frombytes("I;16", (len(values), 1), b"".join(bytes((v, v)) for v in values))
+    _, _, pixels = decode(png.read, pillow_png(image))
+    assert pixels[0::4] == values
+    assert pixels[3::4] == b"\xff" * len(values)
+
+
+def test_png_transparent_color_key():
+    image = Image.frombytes("RGBA", (9, 9), noise(9, 9)).convert("RGB")
+    key = image.getpixel((0, 0))
+    data = pillow_png(image, transparency=key)
+    _, _, pixels = decode(png.read, data)
+    assert pixels[3] == 0
+    assert pixels == Image.open(io.BytesIO(data)).convert("RGBA").tobytes()
+
+
+@pytest.mark.parametrize("opaque", [False, True])
+def test_png_round_trip(opaque):
+    pixels = noise(50, 30)
+    if opaque:
+        pixels = Image.frombytes("RGBA", (50, 30), pixels).convert("RGB").convert("RGBA").tobytes()
+    buf = io.BytesIO()
+    png.write(buf, 50, 30, pixels, opaque)
+    assert decode(png.read, buf.getvalue()) == (50, 30, pixels)
+    with Image.open(io.BytesIO(buf.getvalue())) as image:
+        assert image.mode == ("RGB" if opaque else "RGBA")
+        assert image.convert("RGBA").tobytes() == pixels
+
+
+def test_png_corrupted_chunk():
+    buf = io.BytesIO()
+    png.write(buf, 4, 4, noise(4, 4), False)
+    data = bytearray(buf.getvalue())
+    data[20] ^= 1
+    with pytest.raises(ImageFormatError):
+        decode(png.read, bytes(data))
+
+
+def test_interlaced_png_is_left_for_pillow():
+    buf = io.BytesIO()
+    buf.write(png.SIGNATURE)
+    png._write_chunk(buf, b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, png.RGB, 0, 0, 1))
+    png._write_chunk(buf, b"IDAT", zlib.compress(bytes((0, 10, 20, 30))))
+    png._write_chunk(buf, b"IEND", b"")
+    buf.seek(0)
+    with pytest.raises(UnsupportedImage):
+        png.read(buf)
+    buf.seek(0)
+    assert decode(formats.read, buf.getvalue()) == (1, 1, bytes((10, 20, 30, 255)))
+
+
+@pytest.mark.parametrize("opaque", [False, True])
+def test_qoi_round_trip(opaque):
+    pixels = noise(64, 40, colors=100)
+    if opaque:
+        pixels = Image.frombytes("RGBA", (64, 40), pixels).convert("RGB").convert("RGBA").tobytes()
+    buf = io.BytesIO()
+    qoi.write(buf, 64, 40, pixels, opaque)
+    assert decode(qoi.read, buf.getvalue()) == (64, 40, pixels)
+    with Image.open(io.BytesIO(buf.getvalue())) as image:
+        assert image.convert("RGBA").tobytes() == pixels
+
+
+def test_qoi_long_runs_and_small_differences():
+    gradient = b"".join(bytes((x % 256, (x // 3) % 256, 255 - x % 256, 255)) for x in range(300))
+    pixels = bytes(4 * 300) + gradient + b"\x10\x20\x30\xff" * 300
+    buf = io.BytesIO()
+    qoi.write(buf, 30, 30, pixels, False)
+    assert decode(qoi.read, buf.getvalue())[2] == pixels
+
+
+@pytest.mark.parametrize("cut", [1, 2, 3, 4, 5, 6, 7])
+def test_qoi_truncated_in_the_middle_of_an_operation(cut):
+    pixels = noise(8, 8)
+    buf = io.BytesIO()
+    qoi.write(buf, 8, 8, pixels, False)
+    with pytest.raises(ImageFormatError, match="truncated"):
+        decode(qoi.read, buf.getvalue()[:14 + cut])
+
+
+def test_farbfeld_round_trip():
+    pixels = noise(7, 3)
+    buf = io.BytesIO()
+    farbfeld.write(buf, 7, 3, pixels, False)
+    assert len(buf.getvalue()) == 16 + 7 * 3 * 8
+    assert decode(farbfeld.read, buf.getvalue()) == (7, 3, pixels)
+
+
+@pytest.mark.parametrize("extension", [".png", ".qoi", ".ff", ".bmp"])
+def test_image_data_files(tmp_path, extension):
+    img = ImageData(12, 7)
+    img.data[:] = noise(12, 7) if extension != ".bmp" else bytes(img.data)
+    filepath = str(tmp_path / f"image{extension}")
+    img.save_file(filepath)
+    assert ImageData.from_file(filepath).data == img.data
+
+
+@pytest.mark.parametrize("extension", [".bmp", ".tga", ".ppm", ".tif", ".gif", ".webp"])
+@pytest.mark.parametrize("mode", ["RGB", "L", "P"])
+def test_pillow_strips_match_whole_image(tmp_path, monkeypatch, extension, mode):
+    # small strips so that the image is read in many pieces
+    monkeypatch.setattr(pillow, "STRIP_SIZE", 100)
+    if (extension, mode) == (".ppm", "P"):
+        pytest.skip("PPM has no palette mode")
+    image = Image.frombytes("RGBA", (23, 17), noise(23, 17, colors=40)).convert(mode)
+    filepath = tmp_path / f"image{extension}"
+    image.save(filepath)
+    with open(filepath, "rb") as f:
+        assert decode(formats.read, f.read())[2] == Image.open(filepath).convert("RGBA").tobytes()
+
+
+@pytest.mark.parametrize("extension", [".png", ".bmp", ".gif"])
+def test_import_does_not_copy_whole_image(tmp_path, extension):
+    width, height = 1024, 1024
+    image = Image.frombytes("RGBA", (width, height), noise(width, height))
+    image = image.convert("RGB" if extension != ".gif" else "P")
+    filepath = str(tmp_path / f"image{extension}")
+    image.save(filepath)
+    decoded_size = width * height * 4
+    # load everything that gets imported on the first use
+    image.resize((1, 1)).save(tmp_path / f"small{extension}")
+    ImageData.from_file(str(tmp_path / f"small{extension}"))
+
+    tracemalloc.start()
+    try:
+        img = ImageData.from_file(filepath)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(img.data) == decoded_size
+    # the pixel data itself and strips/rows that are small compared to it
+    assert peak < decoded_size + 4 * pillow.STRIP_SIZE
+
+
+def test_raw_canvas_is_mapped_and_edited_in_place(tmp_path):
+    filepath = str(tmp_path / "canvas.pxr")
+    img = ImageData(300, 200)
+    img.data[:] = noise(300, 200)
+    img.save_file(filepath)
+
+    mapped = ImageData.from_file(filepath)
+    assert isinstance(mapped.data, mmap.mmap)
+    assert mapped.data == img.data
+    mapped[299, 199] = Color(1, 2, 3)
+    mapped.fill_span(0, 10, 100, Color(9, 9, 9, 100))
+    mapped.mark_changed(0, 100, 10, 101)
+    page = mmap.PAGESIZE
+    assert pxr._mappings[mapped].dirty_pages == {
+        (100 * 300 * 4) // page, (300 * 200 * 4 - 1) // page
+    }
+    mapped.save_file()
+    assert not pxr._mappings[mapped].dirty_pages
+
+    reopened = ImageData.from_file(filepath)
+    assert reopened[299, 199] == Color(1, 2, 3)
+    assert reopened.data[:] == mapped.data[:]
+
+
+def test_raw_canvas_save_as_follows_the_new_file(tmp_path):
+    first, second = str(tmp_path / "first.pxr"), str(tmp_path / "second.pxr")
+    ImageData(5, 4).save_file(first)
+    img = ImageData.from_file(first)
+    img.save_file(second)
+    img[0, 0] = Color(1, 2, 3)
+    img.save_file()
+    assert ImageData.from_file(second)[0, 0] == Color(1, 2, 3)
+    assert ImageData.from_file(first)[0, 0] != Color(1, 2, 3)
+
+    # transforms replace the pixels, saving writes the whole file again
+    img.crop(0, 0, 3, 3)
+    img.save_file()
+    assert ImageData.from_file(second).data == img.data
+
+
+def test_indexed_raw_canvas(tmp_path):
+    filepath = tmp_path / "indexed.pxr"
+    palette = bytes((255, 0, 0, 255, 0, 0, 255, 128))
+    offset = pxr._data_offset(2)
+    header = pxr._HEADER.pack(pxr.MAGIC, pxr.VERSION, pxr.MODE_INDEXED, 3, 1, 2, offset)
+    filepath.write_bytes((header + palette).ljust(offset, b"\0") + bytes((1, 0, 7)))
+    img = ImageData.from_file(str(filepath))
+    assert [img[x, 0] for x in range(3)] == [Color(0, 0, 255, 128), Color(255, 0, 0), Color(0, 0, 0, 0)]
+
+    filepath.write_bytes(header)
+    with pytest.raises(ImageFormatError):
+        ImageData.from_file(str(filepath))
@@ -0,0 +1,117 @@
+from pixediter import colors
+from pixediter import graphics
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.image import ImageData
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def gradient(width, height):
+    image = ImageData(width, height)
+    for y in range(height):
+        for x in range(width):
+            image[x, y] = colors.Color(4 * x % 256, 8 * y % 256, 128)
+    return image
+
+
+def click(app, x, y):
+    """Draws a pixel on the canvas with the pencil"""
+    col, row = app.draw_area.left + 2 * x, app.draw_area.top + y
+    app.run([
+        MouseEvent(MouseEventType.MOUSE_DOWN, MouseButton.LEFT, col, row),
+        MouseEvent(MouseEventType.MOUSE_UP, MouseButton.LEFT, col, row),
+    ])
+
+
+def close_to(actual, expected):
+    # the channels of sixel colors go through percents
+    return actual is not None and all(abs(a - b) <= 2 for a, b in zip(actual, expected))
+
+
+def test_image_support_is_detected_from_the_environment():
+    assert terminal.KITTY_GRAPHICS in terminal.detect_features({"TERM": "xterm-kitty"})
+    assert terminal.KITTY_GRAPHICS not in terminal.detect_features({"TERM": "xterm-kitty", "TMUX": "/tmp/tmux"})
+    assert terminal.SIXEL in terminal.detect_features({"TERM": "foot"})
+    assert terminal.detect_features({terminal.FEATURES_VARIABLE: "sixel,scroll-regions,x"}) == {
+        terminal.SIXEL, terminal.SCROLL_REGIONS
+    }
+    assert graphics.protocol([terminal.SIXEL, terminal.KITTY_GRAPHICS]) == terminal.KITTY_GRAPHICS
+
+
+def test_sixel_images_decode_to_their_pixels():
+    image = gradient(7, 9)
+    vt = VirtualTerminal(20, 5)
+    vt.write("\x1b[2;3f" + graphics.sixel(7, 9, bytes(image.data)))
+    for x, y in ((0, 0), (6, 5), (3, 8)):
+        assert close_to(vt.pixel(20 + x, 20 + y), image[x, y].rgb())
+    assert vt.pixel(27, 20) is None
+    # text replaces the image in its cell
+    vt.write("\x1b[2;3fa")
+    assert vt.pixel(20, 20) is None
+
+
+def test_kitty_preview_sends_only_what_changed(monkeypatch):
+    image = gradient(100, 40)
+    sent = []
+    send = terminal.send
+    monkeypatch.setattr(terminal, "send", lambda sequence: sent.append(sequence) or send(sequence))
+    with terminal.using(VirtualTerminal(160, 50, [terminal.KITTY_GRAPHICS])) as vt:
+        app = App(100, 40)
+        app.draw_area.set_image(image)
+        app.full_redraw()
+        app.run([*":preview", "\n"])
+        preview = app.preview
+        assert vt.images[1].data == image.data
+        # 100 x 40 pixels take 10 x 2 cells
+        assert (preview.right - preview.left, preview.bottom - preview.top) == (9, 1)
+        assert vt.placements[1, 1] == (preview.top, preview.left, 0, 0, 100, 40)
+        sent.clear()
+
+        click(app, 50, 20)
+        assert image[50, 20] == app.color.primary
+        assert vt.images[1].data == image.data
+        # only the tile of 16 x 16 pixels with the pixel is sent again
+        assert len(sent) == 1 and "a=f," in sent[0] and "x=48,y=16,s=16,v=16," in sent[0]
+
+        app.full_redraw()
+        assert (1, 1) in vt.placements
+        app.run([*":preview off", "\n"])
+        assert not vt.images and app.preview is None
+
+
+def test_sixel_preview_draws_changed_cells_and_reuses_the_rest(monkeypatch):
+    image = gradient(40, 40)
+    encoded = []
+    sixel = graphics.sixel
+    monkeypatch.setattr(graphics, "sixel", lambda *args: encoded.append(args) or sixel(*args))
+    with terminal.using(VirtualTerminal(160, 50, [terminal.SIXEL])) as vt:
+        app = App(40, 40)
+        app.draw_area.set_image(image)
+        app.full_redraw()
+        app.run([*":preview", "\n"])
+        preview = app.preview
+        # 4 x 2 cells of 10 x 20 pixels
+        assert len(encoded) == 8
+        origin_x, origin_y = (preview.left - 1) * 10, (preview.top - 1) * 20
+        assert vt.pixel(origin_x + 39, origin_y + 39) is not None
+
+        click(app, 12, 25)
+        assert len(encoded) == 9
+        assert close_to(vt.pixel(origin_x + 12, origin_y + 25), app.color.primary.rgb())
+
+        # painted over and back, from the cached images
+        app.run(["r"])
+        assert len(encoded) == 9
+        assert close_to(vt.pixel(origin_x + 12, origin_y + 25), app.color.primary.rgb())
+
+
+def test_preview_needs_image_support():
+    with terminal.using(VirtualTerminal(160, 50, [])) as vt:
+        app = App()
+        app.full_redraw()
+        app.run([*":preview", "\n"])
+        assert app.preview is None
+        assert "Error: The terminal can't show images" in vt.line(app.terminal_rows - 1)
@@ -0,0 +1,50 @@
+import pytest
+
+from pixediter import blending
+from pixediter import colors
+from pixediter.colors import Color
+from pixediter.image import ImageData
+
+
+def test_new_image_is_opaque_white():
+    img = ImageData(3, 2)
+    assert img[2, 1] == colors.WHITE
+    assert img.is_opaque()
+
+
+def test_pixels_outside_image_raise():
+    img = ImageData(3, 2)
+    with pytest.raises(IndexError):
+        img[3, 0]
+    with pytest.raises(IndexError):
+        img[0, -1] = colors.RED
+
+
+def test_blend_half_transparent_over_opaque():
+    img = ImageData(1, 1)
+    img.blend((0, 0), Color(255, 0, 0, 128))
+    assert img[0, 0] == Color(255, 127, 127, 255)
+
+
+def test_blend_over_transparent():
+    assert blending.over(Color(10, 20, 30, 100), colors.TRANSPARENT) == Color(10, 20, 30, 100)
+    assert blending.over(colors.TRANSPARENT, colors.RED) == colors.RED
+
+
+@pytest.mark.parametrize("alpha", [0, 1, 127, 128, 254, 255])
+def test_blend_matches_float_math(alpha):
+    src = Color(200, 100, 50, alpha)
+    dst = Color(0, 50, 255, 200)
+    out = blending.over(src, dst)
+    a = alpha / 255
+    out_alpha = a + dst.a / 255 * (1 - a)
+    assert out.a == pytest.approx(out_alpha * 255, abs=1)
+    for s, d, o in zip(src.rgb(), dst.rgb(), out.rgb()):
+        expected = (s * a + d * dst.a / 255 * (1 - a)) / out_alpha
+        assert o == pytest.approx(expected, abs=1)
+
+
+def test_hex_with_alpha():
+    assert Color.from_hex("#11223344") == Color(0x11, 0x22, 0x33, 0x44)
+    assert Color(0x11, 0x22, 0x33, 0x44).hex() == "#11223344"
+    assert Color.from_hex("112233").a == 255
@@ -0,0 +1,63 @@
+import random
+
+from pixediter import colors
+from pixediter import indexed_colors
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.image import ImageData
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def test_the_table_finds_the_nearest_color_of_the_palette():
+    rng = random.Random(1)
+    for depth in (terminal.COLORS_256, terminal.COLORS_16):
+        palette = indexed_colors.palette(depth)
+        step = 1 << (8 - palette.bits)
+        for _ in range(500):
+            rgb = tuple(rng.randrange(256) for _ in range(3))
+            # the table is made for the middle of the range that the channels are cut to
+            center = tuple(value - value % step + step // 2 for value in rgb)
+            nearest = min(distance(color, center) for color in palette.colors.values())
+            assert distance(palette.colors[palette.index(*rgb)], center) == nearest
+    palette = indexed_colors.palette(terminal.COLORS_256)
+    assert palette.index(0, 0, 0) == 16 and palette.index(255, 255, 255) == 231
+    assert palette.index(255, 0, 0) == 196 and palette.index(100, 100, 100) == 241
+    assert indexed_colors.palette(terminal.COLORS_16).index(250, 10, 10) == 9
+
+
+def test_the_color_depth_is_detected_from_the_environment():
+    detect = terminal.detect_color_depth
+    assert detect({"TERM": "xterm-256color", "COLORTERM": "truecolor"}) == terminal.TRUECOLOR
+    assert detect({"TERM": "xterm-256color"}) == terminal.COLORS_256
+    assert detect({"TERM": "screen", "COLORTERM": "truecolor"}) == terminal.COLORS_256
+    assert detect({"TERM": "xterm-256color", "COLORTERM": "truecolor", "TMUX": "/tmp/tmux"}) == terminal.COLORS_256
+    assert detect({"TERM": "linux"}) == terminal.COLORS_16
+    assert detect({"TERM": "screen", terminal.COLORS_VARIABLE: "truecolor"}) == terminal.TRUECOLOR
+
+
+def test_indexed_colors_take_fewer_bytes():
+    image = ImageData(32, 32)
+    rng = random.Random(2)
+    for y in range(32):
+        for x in range(32):
+            image[x, y] = colors.Color(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    output = {}
+    for depth in terminal.COLOR_DEPTHS:
+        with terminal.using(VirtualTerminal(140, 50, color_depth=depth)) as vt:
+            app = App(32, 32)
+            app.draw_area.set_image(image)
+            app.full_redraw()
+            vt.end_frame()
+            app.draw_area.render()
+            output[depth] = vt.end_frame().bytes
+            area = app.draw_area
+            cell = vt.grid[area.top - 1][area.left - 1]
+            if depth == terminal.TRUECOLOR:
+                assert cell.fg == image[0, 0].rgb()
+            else:
+                assert cell.fg == indexed_colors.palette(depth).index(*image[0, 0].rgb())
+    assert output[terminal.COLORS_16] < output[terminal.COLORS_256] < output[terminal.TRUECOLOR]
@@ -0,0 +1,117 @@
+import os
+import time
+
+from pixediter import colors
+from pixediter import journal
+from pixediter import transform
+from pixediter.colors import Color
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+
+
+def saved_stack(tmp_path, width=6, height=4):
+    filepath = str(tmp_path / "image.png")
+    ImageData(width, height).save_file(filepath)
+    return filepath, LayerStack.from_file(filepath)
+
+
+def test_replay_reapplies_committed_operations(tmp_path):
+    filepath, stack = saved_stack(tmp_path)
+    log = journal.Journal(filepath, stack, flush_interval=60)
+    stack.active.image[1, 1] = colors.RED
+    stack.active.image[4, 1] = colors.BLUE
+    log.commit("Pencil", "LEFT")
+    top = stack.new_layer()
+    top.image.fill_span(0, 3, 2, Color(0, 255, 0, 100))
+    top.image.mark_changed(0, 2, 3, 3)
+    log.commit(":fill")
+    stack.transform(lambda img: transform.rotate(img, 90))
+    log.commit(":rotate", "90")
+    # nothing is written before the timer (or an explicit flush)
+    assert not os.path.exists(log.path)
+    log.flush()
+
+    assert journal.recoverable(filepath) == 3
+    replayed = LayerStack.from_file(filepath)
+    assert journal.replay(filepath, replayed) == 3
+    assert (replayed.width, replayed.height) == (4, 6)
+    assert len(replayed) == 2
+    for layer, expected in zip(replayed, stack):
+        assert layer.image.data == expected.image.data
+
+
+def test_incomplete_record_is_ignored(tmp_path):
+    filepath, stack = saved_stack(tmp_path)
+    log = journal.Journal(filepath, stack, flush_interval=60)
+    stack.active.image[0, 0] = colors.RED
+    log.commit("Pencil")
+    stack.active.image[1, 0] = colors.RED
+    log.commit("Pencil")
+    log.flush()
+    with open(log.path, "r+b") as f:
+        f.truncate(os.path.getsize(log.path) - 1)
+
+    replayed = LayerStack.from_file(filepath)
+    assert journal.replay(filepath, replayed) == 1
+    assert replayed.active.image[0, 0] == colors.RED
+    assert replayed.active.image[1, 0] == colors.WHITE
+
+
+def test_journal_only_applies_to_the_image_it_was_written_for(tmp_path):
+    filepath, stack = saved_stack(tmp_path)
+    log = journal.Journal(filepath, stack, flush_interval=60)
+    stack.active.image[0, 0] = colors.RED
+    log.commit("Pencil")
+    log.flush()
+    stack.save_file()
+    os.utime(filepath, ns=(0, 0))
+    assert journal.recoverable(filepath) == 0
+
+
+def test_timer_flushes_and_close_discards(tmp_path):
+    filepath, stack = saved_stack(tmp_path)
+    log = journal.Journal(filepath, stack, flush_interval=0.01)
+    stack.active.image[0, 0] = colors.RED
+    log.commit("Pencil")
+    deadline = time.monotonic() + 5
+    while journal.recoverable(filepath) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal.recoverable(filepath) == 1
+
+    log.close()
+    assert not os.path.exists(log.path)
+    stack.active.image[1, 0] = colors.RED
+    assert not stack.on_change_listeners
+
+
+def test_replay_arranges_the_layers_as_they_were(tmp_path):
+    filepath = str(tmp_path / "image.pxd")
+    stack = LayerStack(ImageData(4, 4))
+    top = stack.new_layer("top")
+    top.image[0, 0] = colors.WHITE
+    stack.save_file(filepath)
+    log = journal.Journal(filepath, stack, flush_interval=60)
+    stack.move(1, 0)
+    log.commit(":layer", "down")
+    top.image[0, 0] = colors.RED
+    log.commit("Pencil")
+    stack.set_opacity(1, 100)
+    stack.set_blend_mode(1, "multiply")
+    log.commit(":layer", "blend multiply")
+    stack.new_layer("new").image[1, 1] = colors.BLUE
+    stack.set_visible(0, False)
+    log.commit("Pencil")
+    stack.remove(0)
+    log.commit(":layer", "delete")
+    log.flush()
+
+    assert journal.recoverable(filepath) == 5
+    replayed = LayerStack.from_file(filepath)
+    assert journal.replay(filepath, replayed) == 5
+    assert [(layer.name, layer.visible, layer.opacity, layer.blend_mode) for layer in replayed] == [
+        (layer.name, layer.visible, layer.opacity, layer.blend_mode) for layer in stack
+    ]
+    assert replayed.active_index == stack.active_index
+    for layer, expected in zip(replayed, stack):
+        assert layer.image.data == expected.image.data
+    assert replayed.flatten().data == stack.flatten().data
@@ -0,0 +1,104 @@
+import pytest
+
+from pixediter import colors
+from pixediter.colors import Color
+from pixediter.image import ImageData
+from pixediter.layers import LayerError
+from pixediter.layers import LayerStack
+from pixediter.layers import TILE_SIZE
+
+
+def test_composite_only_recomposites_changed_tiles():
+    stack = LayerStack(ImageData(3 * TILE_SIZE, 2 * TILE_SIZE))
+    stack.flatten()
+    assert not stack.dirty_tiles
+
+    layer = stack.new_layer()
+    stack.flatten()
+    layer.image[TILE_SIZE + 1, 1] = Color(255, 0, 0, 128)
+    assert stack.dirty_tiles == {(1, 0)}
+    assert stack.flatten()[TILE_SIZE + 1, 1] == Color(255, 127, 127)
+    assert stack.flatten()[0, 0] == colors.WHITE
+
+
+def test_flatten_area_leaves_other_tiles_dirty():
+    stack = LayerStack(ImageData(4 * TILE_SIZE, 4 * TILE_SIZE))
+    stack.new_layer()
+    composite = stack.flatten(0, 0, TILE_SIZE + 1, 5)
+    assert (0, 0) not in stack.dirty_tiles and (1, 0) not in stack.dirty_tiles
+    assert (2, 0) in stack.dirty_tiles and (0, 1) in stack.dirty_tiles
+    assert composite[TILE_SIZE, 4] == colors.WHITE
+    assert stack.composite_pixel(3 * TILE_SIZE, 3 * TILE_SIZE) == colors.WHITE
+
+
+def test_single_layer_is_its_own_composite():
+    base = ImageData(2 * TILE_SIZE, TILE_SIZE)
+    stack = LayerStack(base)
+    assert stack.flatten() is base
+    base[1, 1] = colors.RED
+    assert not stack.dirty_tiles
+    assert stack.composite_pixel(1, 1) == colors.RED
+
+    stack.set_opacity(0, 128)
+    assert stack.flatten() is not base
+    assert stack.flatten()[1, 1] == Color(255, 0, 0, 128)
+
+
+def test_blend_modes_and_opacity():
+    stack = LayerStack(ImageData(1, 1))
+    stack.layers[0].image[0, 0] = Color(200, 100, 50)
+    top = stack.new_layer()
+    top.image[0, 0] = Color(128, 128, 128)
+    stack.set_blend_mode(1, "multiply")
+    assert stack.flatten()[0, 0] == Color(100, 50, 25)
+    stack.set_opacity(1, 0)
+    assert stack.flatten()[0, 0] == Color(200, 100, 50)
+    stack.set_opacity(1, 255)
+    stack.set_visible(1, False)
+    assert stack.flatten()[0, 0] == Color(200, 100, 50)
+
+
+def test_preview_pixel_matches_composite():
+    stack = LayerStack(ImageData(2, 2))
+    stack.new_layer()
+    stack.new_layer()
+    stack.select(1)
+    stack.set_blend_mode(2, "screen")
+    stack.layers[2].image[1, 1] = Color(10, 20, 30, 200)
+    preview = stack.composite_pixel(1, 1, Color(0, 0, 255, 100))
+    stack.active.image[1, 1] = Color(0, 0, 255, 100)
+    assert stack.flatten()[1, 1] == preview
+
+
+def test_layered_file_roundtrip(tmp_path):
+    stack = LayerStack(ImageData(5, 4))
+    top = stack.new_layer("top")
+    top.image[2, 3] = colors.RED
+    stack.set_opacity(1, 100)
+    path = str(tmp_path / "image.pxd")
+    stack.save_file(path)
+
+    loaded = LayerStack.from_file(path)
+    assert not loaded.dirty_tiles
+    assert [layer.name for layer in loaded] == ["Background", "top"]
+    assert loaded.layers[1].opacity == 100
+    assert loaded.layers[1].image.data == top.image.data
+    assert loaded.flatten().data == stack.flatten().data
+    loaded.layers[0].image[0, 0] = colors.BLACK
+    assert loaded.dirty_tiles
+
+
+@pytest.mark.parametrize("change", [
+    # no layers, the active layer out of range, an unknown blend mode, cut short
+    lambda data: data[:18] + (0).to_bytes(2, "little") + data[20:],
+    lambda data: data[:20] + (1).to_bytes(2, "little") + data[22:],
+    lambda data: data.replace(b"normal", b"bogus!"),
+    lambda data: data[:30],
+    lambda data: data[:10],
+])
+def test_invalid_layered_files(tmp_path, change):
+    path = tmp_path / "image.pxd"
+    LayerStack(ImageData(2, 2)).save_file(str(path))
+    path.write_bytes(change(path.read_bytes()))
+    with pytest.raises(LayerError):
+        LayerStack.from_file(str(path))
@@ -0,0 +1,139 @@
+from pixediter import mipmap
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.colors import Color
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.image import ImageData
+from pixediter.layers import LayerStack
+from pixediter.layers import TILE_SIZE
+from pixediter.virtual_terminal import VirtualTerminal
+from pixediter.widgets.Minimap import quadrant_cell
+
+
+def naive_level(image, k):
+    """Level k made the slow way, one pixel at a time"""
+    for _ in range(k):
+        width, height = mipmap.level_size(image.width, image.height, 1)
+        smaller = ImageData(width, height)
+        for y in range(height):
+            for x in range(width):
+                block = [
+                    image[min(2 * x + dx, image.width - 1), min(2 * y + dy, image.height - 1)]
+                    for dy in (0, 1) for dx in (0, 1)
+                ]
+                alpha = sum(c.a for c in block)
+                if alpha == 0:
+                    smaller[x, y] = Color(0, 0, 0, 0)
+                    continue
+                r, g, b = (
+                    (sum(getattr(c, channel) * c.a for c in block) + alpha // 2) // alpha
+                    for channel in "rgb"
+                )
+                smaller[x, y] = Color(r, g, b, (alpha + 2) // 4)
+        image = smaller
+    return image
+
+
+def gradient(width, height, alpha=lambda x, y: 255):
+    image = ImageData(width, height)
+    for y in range(height):
+        for x in range(width):
+            image[x, y] = Color(7 * x % 256, 5 * y % 256, (x * y) % 256, alpha(x, y))
+    return image
+
+
+def test_levels_are_averages_of_the_level_below():
+    assert mipmap.max_level(37, 21) == 6
+    assert mipmap.level_size(37, 21, 2) == (10, 6)
+    opaque = gradient(37, 21)
+    translucent = gradient(37, 21, lambda x, y: (x * 40) % 256)
+    for image in (opaque, translucent):
+        pyramid = LayerStack(image).pyramid
+        for k in range(1, 7):
+            assert pyramid.level(k).data == naive_level(image, k).data
+
+
+def test_changes_only_update_the_tiles_they_touch():
+    image = gradient(4 * TILE_SIZE, 4 * TILE_SIZE)
+    stack = LayerStack(image)
+    pyramid = stack.pyramid
+    pyramid.level(3)
+    assert not any(pyramid.dirty_tiles)
+
+    image[3 * TILE_SIZE, 5] = Color(255, 255, 255)
+    assert pyramid.dirty_tiles == [{(1, 0)}, {(0, 0)}, {(0, 0)}]
+    # an area of level 1 away from the change is up to date without updating anything
+    pyramid.level(1, 0, TILE_SIZE, TILE_SIZE, 2 * TILE_SIZE)
+    assert pyramid.dirty_tiles[0] == {(1, 0)}
+    assert pyramid.level(3).data == naive_level(image, 3).data
+    assert not any(pyramid.dirty_tiles)
+
+
+def test_zoomed_out_canvas_shows_the_levels():
+    image = gradient(100, 60)
+    with terminal.using(VirtualTerminal(120, 40)) as vt:
+        app = App(100, 60)
+        app.draw_area.set_image(image)
+        app.full_redraw()
+        app.run(["-"])
+        draw_area = app.draw_area
+        assert draw_area.zoom == 1
+        assert (draw_area.view_width, draw_area.view_height) == (50, 30)
+        level = naive_level(image, 1)
+        for x, y in ((0, 0), (20, 11), (40, 29)):
+            cell = vt.cell(draw_area.top + y, draw_area.left + 2 * x)
+            assert cell.fg == level[x, y].rgb()
+        assert draw_area.terminal_coords_to_img_coords(draw_area.left + 41, draw_area.top + 11) == (40, 22)
+
+        app.run([*":zoom 9", "\n"])
+        assert draw_area.zoom == mipmap.max_level(100, 60) == 7
+        assert "Zoom 1:128" in vt.line(app.terminal_rows - 1)
+        app.run(["+"] * 7)
+        assert draw_area.zoom == 0
+
+
+def test_zoomed_out_filter_preview_matches_the_applied_filter():
+    image = gradient(100, 60)
+    with terminal.using(VirtualTerminal(120, 40)) as vt:
+        app = App(100, 60)
+        draw_area = app.draw_area
+        draw_area.set_image(image)
+        # the filter only changes the active layer, which is an empty one on top
+        app.run([*":layer new", "\n", "-"])
+        draw_area.layers.active.image[10, 10] = Color(0, 0, 255)
+        assert draw_area.zoom == 1
+        app.run([*":filter invert", "\n"])
+        preview = [vt.cell(draw_area.top + y, draw_area.left + 2 * x).fg for x, y in ((0, 0), (5, 5), (20, 11))]
+        app.run(["\n"])
+        applied = [vt.cell(draw_area.top + y, draw_area.left + 2 * x).fg for x, y in ((0, 0), (5, 5), (20, 11))]
+        assert preview == applied
+        assert preview[0] == naive_level(image, 1)[0, 0].rgb()
+
+
+def test_minimap_shows_the_viewport_and_moves_it():
+    assert quadrant_cell([(0, 0, 0), (250, 0, 0), (2, 0, 0), (255, 0, 0)]) == ("▌", (1, 0, 0), (253, 0, 0))
+    image = gradient(256, 128)
+    with terminal.using(VirtualTerminal(120, 40)) as vt:
+        app = App(256, 128)
+        app.draw_area.set_image(image)
+        app.full_redraw()
+        minimap = app.minimap
+        # 256 x 128 pixels fit in 16 x 8 cells from level 3
+        assert minimap.level() == 3
+        left = vt.cell(minimap.top, minimap.left)
+        right = vt.cell(minimap.top, minimap.right)
+        # the top left corner is in view, the top right is dimmed
+        assert sum(left.fg) > 0 and sum(right.bg) < sum(naive_level(image, 3)[31, 0].rgb())
+
+        app.run([
+            MouseEvent(MouseEventType.MOUSE_DOWN, MouseButton.LEFT, minimap.right, minimap.bottom),
+            MouseEvent(MouseEventType.MOUSE_UP, MouseButton.LEFT, minimap.right, minimap.bottom),
+        ])
+        draw_area = app.draw_area
+        x0, y0, x1, y1 = draw_area.visible_region()
+        assert (x1, y1) == (256, 128)
+        assert vt.cell(minimap.top, minimap.left).fg != left.fg
+        # the canvas shows the bottom right corner of the image
+        assert vt.cell(draw_area.top, draw_area.left).fg == image[x0, y0].rgb()
@@ -0,0 +1,44 @@
+import random
+
+from pixediter import filters
+from pixediter import parallel
+from pixediter.image import ImageData
+
+
+def test_tiled_filter_matches_serial():
+    img = ImageData(37, 23)
+    img.data[:] = random.Random(0).randbytes(len(img.data))
+    expected = filters.parse("invert | grayscale").apply(img.data)
+
+    executor = parallel.TileExecutor(workers=2, threshold=0)
+    try:
+        filters.parse("invert | grayscale").apply_to_image(img, executor)
+    finally:
+        executor.shutdown()
+    assert img.data == expected
+
+
+def test_tiles_cover_whole_image():
+    img = ImageData(5, 11)
+    tiles = parallel.TileExecutor(workers=3).tiles(img)
+    assert tiles[0][0] == 0
+    assert tiles[-1][1] == len(img.data)
+    assert all(end == start for (_, end), (start, _) in zip(tiles, tiles[1:]))
+
+
+def test_segment_is_kept_for_the_next_image():
+    executor = parallel.TileExecutor(workers=2, threshold=0)
+    try:
+        for size in (16, 8, 24):
+            img = ImageData(size, size)
+            img.data[:] = random.Random(size).randbytes(len(img.data))
+            expected = filters.parse("sepia").apply(img.data)
+            filters.parse("sepia").apply_to_image(img, executor)
+            assert img.data == expected
+            assert executor._shared.size >= len(img.data)
+        segment = executor._shared
+        filters.parse("invert").apply_to_image(ImageData(8, 8), executor)
+        assert executor._shared is segment
+    finally:
+        executor.shutdown()
+    assert executor._shared is None and executor._pool is None
@@ -0,0 +1,66 @@
+import pytest
+
+from pixediter import profiling
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.profiling import Histogram
+from pixediter.profiling import Profiler
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def test_histogram_is_precise_at_any_magnitude():
+    histogram = Histogram()
+    for i in range(1, 101):
+        histogram.record(i * 1e-3)
+    histogram.record(2.5)
+    assert histogram.count == 101
+    assert histogram.max == 2_500_000_000
+    for p, expected in ((50, 51e-3), (90, 91e-3), (99, 100e-3), (100, 2.5)):
+        assert histogram.percentile(p) / 1e9 == pytest.approx(expected, rel=1 / profiling.SUB_BUCKETS)
+    # values within a fraction of a percent of each other share buckets
+    close = Histogram()
+    for i in range(1000):
+        close.record(0.05 + i * 1e-7)
+    assert len(close.buckets) <= 2
+
+    lines = histogram.distribution().splitlines()
+    assert lines[0].split() == ["Value", "Percentile", "TotalCount", "1/(1-Percentile)"]
+    assert lines[-4].split() == ["2500.000", "1.000000000000", "101"]
+    assert lines[-2].startswith("#[Max     =     2500.000, Total count    =          101]")
+
+
+def test_stages_are_charged_their_own_time(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(profiling.time, "perf_counter", lambda: next(clock))
+    profiler = Profiler()
+    with profiler.event("ignored"):
+        pass
+    assert not profiler.histograms
+
+    profiler.start()
+    # the clock ticks on every enter and exit: the event 0..7, command 1..6, render 2..5, output 3..4
+    with profiler.event(":crop"):
+        with profiler.stage("command"):
+            with profiler.stage("render"):
+                with profiler.stage("output"):
+                    pass
+    seconds = {stage: h.total / 1e9 for (event, stage), h in profiler.histograms.items() if event == ":crop"}
+    assert seconds == {"total": 7, "command": 2, "render": 2, "output": 1, "other": 2}
+
+
+def test_app_profile_is_shown_and_exported(tmp_path):
+    profiler = Profiler()
+    profiler.start()
+    with terminal.using(profiling.TimedBackend(VirtualTerminal(120, 40), profiler)) as output:
+        app = App(4, 3, profiler)
+        app.full_redraw()
+        app.run(profiler.decoded(["\x1b[<0;5;4M", "\x1b[<0;5;4m", ":", "x", "\n", *":stats", "\n"]))
+        assert "mouse_down Pencil" in output.backend.text()
+    profiler.stop()
+
+    summary = {line.split()[0]: line.split() for line in profiler.table()[1:]}
+    assert set(summary) == {"mouse_down", "mouse_up", "key", ":x", ":stats"}
+    assert summary["key"][1] == "8"
+    written = profiler.export(str(tmp_path))
+    assert str(tmp_path / "mouse_up_Pencil.render.hgrm") in written
+    assert (tmp_path / "summary.txt").read_text().startswith("event")
@@ -0,0 +1,46 @@
+import pytest
+
+from pixediter import colors
+from pixediter import events
+from pixediter import recording
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+# a drag at row 4 from column 5 to 9, the pixels 1, 1 to 3, 1
+STROKE = ["\x1b[<0;5;4M", "\x1b[<32;7;4M", "\x1b[<32;9;4M", "\x1b[<0;9;4m"]
+
+
+def test_recording_passes_input_through(tmp_path):
+    log = str(tmp_path / "session.log")
+    header = recording.Header(80, 30, 4, 3, "sprite.png")
+    assert list(recording.record(iter(STROKE), log, header)) == STROKE
+    assert recording.read_header(log) == header
+    assert list(recording.replay(log, speed=None)) == STROKE
+
+
+def test_not_a_recording(tmp_path):
+    log = tmp_path / "session.log"
+    log.write_text("hello\n")
+    with pytest.raises(recording.RecordingError):
+        recording.read_header(str(log))
+
+
+def test_replay_drives_the_app_headless(tmp_path):
+    log = str(tmp_path / "session.log")
+    list(recording.record(iter(STROKE), log, recording.Header(80, 30, 4, 3)))
+
+    stats = recording.ReplayStats()
+    vt = VirtualTerminal(80, 30)
+    with terminal.using(recording.CountingBackend(vt, stats)):
+        app = App(4, 3)
+        app.full_redraw()
+        app.run(events.listen(stats.timed(recording.replay(log, speed=None))))
+
+    primary = app.color.primary
+    assert [app.draw_area.image[x, 1] for x in range(4)] == [colors.WHITE] + [primary] * 3
+    assert len(stats.latencies) == len(STROKE)
+    assert stats.bytes == vt.total.bytes > 0
+    assert stats.writes == vt.total.writes
+    assert f"{len(STROKE)} events" in stats.report()
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.render_thread import RenderThread
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+class StuckTerminal(VirtualTerminal):
+    """A terminal that doesn't read its output (flushing blocks) until it's let go"""
+
+    def __init__(self, columns, rows):
+        super().__init__(columns, rows)
+        self.going = threading.Event()
+        self.going.set()
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        assert self.going.wait(5)
+        super().flush()
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_text_written_again_replaces_what_the_terminal_hasnt_got():
+    vt = StuckTerminal(20, 5)
+    renderer = RenderThread(vt)
+    with renderer.running(), terminal.using(renderer):
+        vt.going.clear()
+        terminal.addstr(1, 1, "first")
+        wait_until(lambda: vt.flushes == 1)
+        terminal.addstr(2, 1, "\x1b[31mab\x1b[0m")
+        terminal.addstr(2, 1, "\x1b[32mcd\x1b[0m")
+        terminal.addstr(3, 1, "long")
+        terminal.addstr(3, 1, "x")
+        terminal.clear()
+        terminal.addstr(2, 1, "e")
+        assert renderer.backlog() > 0
+        vt.going.set()
+    assert renderer.replaced == 1
+    assert renderer.backlog() == 0
+    # the screen was cleared after the second row was written
+    assert [vt.line(row).strip() for row in (1, 2, 3)] == ["", "e", ""]
+
+
+def test_the_input_doesnt_wait_for_the_terminal():
+    screens = []
+    written = []
+    for threaded in (False, True):
+        vt = StuckTerminal(140, 50)
+        renderer = RenderThread(vt)
+        with terminal.using(renderer):
+            app = App(48, 40)
+            app.tool.select("Gradient")
+            app.full_redraw()
+            vt.end_frame()
+            area = app.draw_area
+            kinds = [MouseEventType.MOUSE_DOWN] + [MouseEventType.MOUSE_DRAG] * 20
+            stroke = [
+                MouseEvent(kind, MouseButton.LEFT, area.left + 4 + 2 * i, area.top + 2 + i)
+                for i, kind in enumerate(kinds)
+            ]
+            if threaded:
+                with renderer.running():
+                    vt.going.clear()
+                    app.run(stroke[:1])
+                    wait_until(lambda: vt.flushes > 0)
+                    # the whole stroke is handled while the terminal is stuck
+                    app.run(stroke[1:])
+                    assert renderer.backlog() > 0 and renderer.replaced > 0
+                    vt.going.set()
+            else:
+                app.run(stroke)
+            written.append(vt.end_frame().bytes)
+            screens.append([[cell for cell in row] for row in vt.grid])
+    assert screens[0] == screens[1]
+    assert written[1] < written[0] / 2
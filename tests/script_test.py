@@ -0,0 +1,72 @@
+from pixediter import colors
+from pixediter import script
+from pixediter import selection
+from pixediter.colors import Color
+from pixediter.image import ImageData
+
+
+SCRIPT = """
+# crop every sprite and swap a color
+crop 0 0 4 3
+setcolor #ff0000
+tool pencil 0 0
+tool line right 0 2 3 2
+:recolor #ffffff #00ff00
+:save {dir}/{stem}_out.png
+"""
+
+
+def sprites(tmp_path, count):
+    paths = []
+    for i in range(count):
+        filepath = str(tmp_path / f"sprite{i}.png")
+        ImageData(8, 8).save_file(filepath)
+        paths.append(filepath)
+    return paths
+
+
+def test_parse_skips_comments_and_adds_colons():
+    assert script.parse("# comment\n\n crop 1 2 \n:save x.png\n") == [(3, ":crop 1 2"), (4, ":save x.png")]
+
+
+def test_script_runs_commands_and_tools(tmp_path):
+    filepath, = sprites(tmp_path, 1)
+    result = script.run_file(script.parse(SCRIPT), filepath)
+    assert result.ok, result.error
+    assert result.commands == 6
+
+    out = ImageData.from_file(str(tmp_path / "sprite0_out.png"))
+    assert (out.width, out.height) == (4, 3)
+    assert out[0, 0] == colors.RED
+    assert out[1, 1] == colors.GREEN
+    # the line was drawn with the secondary color, which was recolored too
+    assert out[3, 2] == colors.GREEN
+
+
+def test_errors_name_the_line(tmp_path):
+    filepath, = sprites(tmp_path, 1)
+    result = script.run_file(script.parse("crop 2 2\n\nrotate 45\n"), filepath)
+    assert not result.ok
+    assert result.commands == 1
+    assert result.error.startswith("line 3 (:rotate 45)")
+
+
+def test_files_are_processed_in_parallel(tmp_path):
+    paths = sprites(tmp_path, 6) + [str(tmp_path / "missing.png")]
+    results = {result.filepath: result for result in script.run(script.parse(SCRIPT), paths, jobs=3)}
+    assert set(results) == set(paths)
+    assert not results.pop(paths[-1]).ok
+    assert all(result.ok for result in results.values())
+    for filepath in paths[:-1]:
+        assert ImageData.from_file(filepath.replace(".png", "_out.png"))[0, 0] == colors.RED
+
+
+def test_recolor_only_matches_whole_pixels():
+    img = ImageData(3, 1)
+    # 00 00 ff | ff ... would match #0000ffff across a pixel boundary
+    img[0, 0] = Color(0, 0, 0, 0)
+    img[1, 0] = Color(0, 255, 255, 0)
+    img[2, 0] = Color(0, 0, 255, 255)
+    area = selection.Selection.everything(3, 1)
+    assert selection.recolor(img, area, Color(0, 0, 255, 255), colors.RED) == 1
+    assert [img[x, 0] for x in range(3)] == [Color(0, 0, 0, 0), Color(0, 255, 255, 0), colors.RED]
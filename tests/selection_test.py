@@ -0,0 +1,79 @@
+from pixediter import blending
+from pixediter import colors
+from pixediter import selection
+from pixediter.AreaSelector import AreaSelector
+from pixediter.colors import Color
+from pixediter.ColorSelector import ColorSelector
+from pixediter.events import MouseButton
+from pixediter.events import MouseEventType
+from pixediter.image import ImageData
+from pixediter.selection import Selection
+from pixediter.tools import DrawEvent
+from pixediter.tools import SelectTool
+
+
+def test_bit_spans():
+    assert list(selection.bit_spans(0)) == []
+    assert list(selection.bit_spans(0b1110011)) == [(0, 2), (4, 7)]
+
+
+def test_rectangle_is_clipped_to_image():
+    sel = Selection.rectangle(4, 3, 5, -1, 2, 1)
+    assert list(sel.spans()) == [(0, 2, 4), (1, 2, 4)]
+    assert sel.bbox() == (2, 0, 4, 2)
+
+
+def test_magic_wand_selects_contiguous_area():
+    img = ImageData(5, 3)
+    for y in range(3):
+        img[2, y] = colors.BLACK
+    img[4, 0] = colors.BLACK
+    sel = Selection.magic_wand(img, 0, 0)
+    assert list(sel.spans()) == [(0, 0, 2), (1, 0, 2), (2, 0, 2)]
+    sel = Selection.magic_wand(img, 2, 1)
+    assert list(sel.spans()) == [(0, 2, 3), (1, 2, 3), (2, 2, 3)]
+
+
+def test_copy_and_paste():
+    img = ImageData(6, 4)
+    img[1, 1] = colors.RED
+    img[2, 2] = colors.BLUE
+    clip = selection.copy(img, Selection.rectangle(6, 4, 1, 1, 2, 2))
+    assert (clip.width, clip.height) == (2, 2)
+    selection.paste(img, clip, 4, 3)
+    assert img[4, 3] == colors.RED
+    assert img[5, 3] == colors.WHITE
+
+
+def test_translucent_fill_matches_blending():
+    img = ImageData(3, 1)
+    img[1, 0] = Color(10, 20, 30, 100)
+    color = Color(200, 0, 50, 128)
+    selection.fill(img, Selection.everything(3, 1), color)
+    assert img[0, 0] == blending.over(color, colors.WHITE)
+    assert img[1, 0] == blending.over(color, Color(10, 20, 30, 100))
+
+
+def test_moving_selection_only_redraws_changed_pixels():
+    img = ImageData(10, 10)
+    img.data[:] = bytes(colors.BLACK.rgba()) * 100
+    selector = AreaSelector()
+    selector.select(Selection.rectangle(10, 10, 0, 0, 3, 3))
+    tool = SelectTool(selector)
+    drawn = []
+
+    def draw(x, y, color):
+        drawn.append((x, y))
+
+    def event(pos, event_type):
+        return DrawEvent(pos, event_type, MouseButton.LEFT, ColorSelector(colors.BLACK, colors.WHITE))
+
+    tool.mouse_down(img, event((1, 1), MouseEventType.MOUSE_DOWN), draw)
+    tool.mouse_drag(img, event((2, 1), MouseEventType.MOUSE_DRAG), draw)
+    # the area that was moved away from becomes transparent, the other side was already black
+    assert sorted(drawn) == [(0, y) for y in range(4)]
+    tool.mouse_up(img, event((2, 1), MouseEventType.MOUSE_UP), draw)
+    tool.reset_state()
+    assert img[0, 0] == colors.TRANSPARENT
+    assert img[4, 3] == colors.BLACK
+    assert selector.current.bbox() == (1, 0, 5, 4)
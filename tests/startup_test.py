@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+
+# the imports needed to get the first frame on the screen, with the best of a few runs to
+# even out a busy machine
+IMPORT_BUDGET_MS = 100
+RUNS = 3
+
+# what the editor does before the first frame: parse the arguments and paint the app
+FIRST_FRAME = """
+import json
+import sys
+from pixediter import cli
+from pixediter import profiling
+from pixediter import terminal
+
+class Screen:
+    def write(self, text):
+        pass
+    def flush(self):
+        pass
+    def size(self):
+        return 120, 40
+
+with terminal.using(Screen()):
+    cli.open_app(24, 24, None, profiling.Profiler())
+print(json.dumps(sorted(sys.modules)))
+"""
+
+
+def first_frame():
+    """Returns the time spent importing before the first frame (in ms) and the modules imported"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", FIRST_FRAME],
+        capture_output=True,
+        text=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    # import time: self [us] | cumulative | imported package
+    microseconds = sum(
+        int(line.split(":")[1].split("|")[0])
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:") and "self [us]" not in line
+    )
+    return microseconds / 1000, json.loads(result.stdout)
+
+
+def test_editing_modules_are_imported_after_the_first_frame():
+    _, modules = first_frame()
+    for module in (
+        "pixediter.tools",
+        "pixediter.filters",
+        "pixediter.transform",
+        "pixediter.journal",
+        "pixediter.recording",
+        "pixediter.script",
+        "pixediter.formats",
+        "concurrent.futures",
+        "multiprocessing",
+        "threading",
+        "PIL",
+    ):
+        assert module not in modules
+
+
+def test_first_frame_import_budget():
+    best = min(first_frame()[0] for _ in range(RUNS))
+    assert best < IMPORT_BUDGET_MS
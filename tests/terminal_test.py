@@ -0,0 +1,146 @@
+import pytest
+
+from pixediter import bandwidth
+from pixediter import colors
+from pixediter import profiling
+from pixediter import recording
+from pixediter import terminal
+from pixediter.application import App
+from pixediter.events import MouseButton
+from pixediter.events import MouseEvent
+from pixediter.events import MouseEventType
+from pixediter.image import ImageData
+from pixediter.render_thread import RenderThread
+from pixediter.virtual_terminal import Cell
+from pixediter.virtual_terminal import VirtualTerminal
+
+
+def test_escape_sequences_are_parsed_into_cells():
+    vt = VirtualTerminal(10, 3)
+    vt.write("\x1b[2;3fab\x1b[38;2;1;2;3mc\x1b[0m")
+    # split in the middle of a sequence
+    vt.write("\x1b7\x1b[3;")
+    vt.write("9f\x1b[48;5;200mxyz\x1b8d")
+    assert vt.line(2) == "  abcd    "
+    assert vt.cell(2, 5) == Cell("c", (1, 2, 3), None)
+    assert vt.cell(3, 9) == Cell("x", None, 200)
+    # "z" wrapped past the right edge and the last row
+    assert vt.line(3) == " " * 8 + "xy"
+
+    vt.write("\x1b[?25l\x1b[?1000;1006h")
+    assert vt.modes == {"1000", "1006"}
+    vt.write("\x1b[2J")
+    assert vt.text() == "\n\n"
+
+
+def test_frames_count_bytes_writes_and_cells():
+    vt = VirtualTerminal(10, 3)
+    vt.write("\x1b[1;1fab")
+    vt.write("\x1b[1;1fa€")
+    vt.flush()
+    stats = vt.end_frame()
+    assert (stats.writes, stats.flushes, stats.cells, stats.cell_writes) == (2, 1, 2, 4)
+    assert stats.bytes == len("\x1b[1;1fab\x1b[1;1fa€".encode())
+    assert vt.end_frame().writes == 0
+    assert vt.total.writes == 2
+
+
+def test_app_renders_into_virtual_terminal():
+    with terminal.using(VirtualTerminal(80, 30)) as vt:
+        app = App(4, 3)
+        app.full_redraw()
+        full = vt.end_frame()
+        # the draw area starts at row 3, column 3 and pixels are two characters wide
+        assert vt.cell(3, 3) == Cell("█", colors.WHITE.rgb(), None)
+        assert "PixEdiTer" in vt.line(1)
+
+        app.color.set_color("primary", colors.RED)
+        vt.end_frame()
+        app._handle_click(MouseEvent(MouseEventType.MOUSE_DOWN, MouseButton.LEFT, 5, 4))
+        stroke = vt.end_frame()
+        assert vt.cell(4, 5) == Cell("█", colors.RED.rgb(), None)
+        assert app.draw_area.image[1, 1] == colors.RED
+        assert 0 < stroke.cells < full.cells
+
+
+def test_redrawing_asks_for_the_size_of_the_terminal_again():
+    with terminal.using(VirtualTerminal(80, 30)) as vt:
+        app = App(4, 3)
+        app.full_redraw()
+        # resized without a SIGWINCH handler, e.g. while replaying
+        vt.resize(100, 40)
+        assert terminal.size() == (80, 30)
+        app.run(["r"])
+        assert (app.terminal_columns, app.terminal_rows) == terminal.size() == (100, 40)
+
+
+def test_writes_are_clipped():
+    with terminal.using(VirtualTerminal(10, 3)) as vt:
+        with terminal.clipped(3, 1, 5, 2):
+            terminal.addstr(1, 1, colors.RED.colorize("abcdefg"))
+            terminal.addstr(2, 4, "a" + colors.RED.colorize("bc") + "d")
+            terminal.addstr(3, 1, "hidden")
+        terminal.addstr(1, 7, "x")
+    assert vt.text() == "  cde x\n   ab\n"
+    assert vt.cell(1, 3).fg == colors.RED.rgb()
+    assert vt.cell(2, 4).fg is None
+    assert vt.cell(2, 5).fg == colors.RED.rgb()
+
+
+def test_contents_are_moved_with_scroll_regions_and_rectangle_copy():
+    vt = VirtualTerminal(6, 4)
+    for row, text in enumerate(("abcdef", "ghijkl", "mnopqr", "stuvwx"), 1):
+        vt.write(f"\x1b[{row};1f{text}")
+    # rows 2-4 up by one
+    vt.write("\x1b[2;4r\x1b[S\x1b[r")
+    assert vt.text() == "abcdef\nmnopqr\nstuvwx\n"
+    # columns 2-3 of rows 1-2 down by one
+    vt.write("\x1b[?69h\x1b[2;3s\x1b[1;2r\x1b[T\x1b[r\x1b[?69l")
+    assert vt.text() == "a  def\nmbcpqr\nstuvwx\n"
+    # rows 2-3, columns 1-2 to row 1, column 5 (cut at the edge)
+    vt.write("\x1b[2;1;3;2;1;1;5;1$v")
+    assert vt.text() == "a  dmb\nmbcpst\nstuvwx\n"
+
+
+def test_panning_only_draws_what_comes_into_view():
+    image = ImageData(128, 128)
+    for y in range(128):
+        for x in range(128):
+            image[x, y] = colors.Color(2 * x, 2 * y, x * y % 256)
+    costs = {}
+    for features in (terminal.FEATURES, [terminal.SCROLL_REGIONS], []):
+        with terminal.using(VirtualTerminal(120, 40, features)) as vt:
+            app = App(128, 128)
+            app.draw_area.set_image(image)
+            # on top of the canvas, it moves along and is painted back
+            app.color_adjuster.move(-200, 0)
+            # the minimap is painted back the same way, it would only add the same to every cost
+            app.minimap.move(200, 0)
+            app.full_redraw()
+            vt.end_frame()
+            for button in (MouseButton.SCROLL_DOWN, MouseButton.SCROLL_RIGHT, MouseButton.SCROLL_UP):
+                app._handle_click(MouseEvent(MouseEventType.MOUSE_DOWN, button, 10, 10))
+            costs[len(features)] = vt.end_frame().bytes
+            panned = [row[:] for row in vt.grid]
+            app.full_redraw()
+            assert vt.grid == panned
+    # moving the canvas sideways needs rectangle copy, up and down only scroll regions
+    assert costs[3] < costs[1] < costs[0]
+    assert costs[3] * 4 < costs[0]
+
+
+@pytest.mark.parametrize("wrap", [
+    lambda backend: profiling.TimedBackend(backend, profiling.Profiler()),
+    lambda backend: recording.CountingBackend(backend, recording.ReplayStats()),
+    lambda backend: bandwidth.Monitor().metered(backend),
+    RenderThread,
+])
+def test_wrapped_backends_pass_on_what_the_backend_has(wrap):
+    vt = VirtualTerminal(80, 30, cell_size=(7, 15), color_depth=terminal.COLORS_256)
+    vt.custom = "passed on"
+    with terminal.using(wrap(vt)) as output:
+        assert terminal.cell_size() == (7, 15)
+        assert terminal.color_depth() == terminal.COLORS_256
+        assert terminal.features() == vt.features
+        assert output.custom == "passed on"
+        assert output.backlog() in (None, 0)
@@ -0,0 +1,15 @@
+from pixediter.AreaSelector import AreaSelector
+from pixediter.ToolSelector import ToolSelector
+from pixediter.ToolSelector import TOOLS
+
+
+def test_tools_are_listed_by_their_names():
+    for name, create in TOOLS.items():
+        assert create(AreaSelector()).name == name
+
+
+def test_tools_are_created_when_first_used():
+    selector = ToolSelector(AreaSelector())
+    assert not selector._tools
+    assert selector.select("Magic wand").selector is selector.selection
+    assert list(selector._tools) == [selector.names.index("Magic wand")]
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+from pixediter import colors
+from pixediter import transform
+from pixediter.colors import Color
+from pixediter.image import ImageData
+
+
+def noise(width, height, palette_size=256):
+    rng = random.Random(width * 1000 + height)
+    img = ImageData(width, height)
+    palette = [Color(rng.randrange(256), rng.randrange(256), rng.randrange(256), rng.randrange(256))
+               for _ in range(palette_size)]
+    for y in range(height):
+        for x in range(width):
+            img[x, y] = rng.choice(palette)
+    return img
+
+
+def pixels(img):
+    return {xy: color for xy, color in img}
+
+
+def test_flips():
+    img = noise(5, 3)
+    before = pixels(img)
+    transform.flip_horizontal(img)
+    assert all(img[4 - x, y] == c for (x, y), c in before.items())
+    transform.flip_horizontal(img)
+    transform.flip_vertical(img)
+    assert all(img[x, 2 - y] == c for (x, y), c in before.items())
+
+
+def test_transpose():
+    img = noise(5, 3)
+    before = pixels(img)
+    transform.transpose(img)
+    assert (img.width, img.height) == (3, 5)
+    assert all(img[y, x] == c for (x, y), c in before.items())
+
+
+@pytest.mark.parametrize("degrees", [90, 180, 270])
+def test_rotate(degrees):
+    img = noise(5, 3)
+    before = pixels(img)
+    transform.rotate(img, degrees)
+    for (x, y), c in before.items():
+        if degrees == 90:
+            assert img[2 - y, x] == c
+        elif degrees == 180:
+            assert img[4 - x, 2 - y] == c
+        else:
+            assert img[y, 4 - x] == c
+
+
+def test_rotations_add_up():
+    img = noise(4, 7)
+    original = bytes(img.data)
+    for degrees in (90, 270, 180, 180):
+        transform.rotate(img, degrees)
+    assert bytes(img.data) == original
+
+
+@pytest.mark.parametrize("size", [(10, 6), (3, 2), (7, 5), (15, 9)])
+def test_scale_nearest(size):
+    img = noise(5, 3)
+    before = ImageData(5, 3)
+    before.data[:] = img.data
+    transform.scale(img, *size)
+    assert (img.width, img.height) == size
+    for (x, y), c in img:
+        assert c == before[x * 5 // size[0], y * 3 // size[1]]
+
+
+def test_scale_bilinear():
+    img = ImageData(2, 1)
+    img[0, 0] = colors.BLACK
+    transform.scale(img, 4, 1, "bilinear")
+    assert [img[x, 0].r for x in range(4)] == [0, 64, 191, 255]
+    transform.scale(img, 4, 3, "bilinear")
+    assert all(img[1, y] == Color(64, 64, 64) for y in range(3))
+
+
+def test_scale_bilinear_keeps_flat_colors():
+    img = ImageData(7, 5)
+    img.data[:] = bytes(Color(12, 34, 56, 78).rgba()) * 35
+    transform.scale(img, 23, 2, "bilinear")
+    assert all(c == Color(12, 34, 56, 78) for _, c in img)
+
+
+def naive_scale2x(img):
+    def at(x, y):
+        return img[min(max(x, 0), img.width - 1), min(max(y, 0), img.height - 1)]
+
+    out = ImageData(2 * img.width, 2 * img.height)
+    for y in range(img.height):
+        for x in range(img.width):
+            b, d, e, f, h = at(x, y - 1), at(x - 1, y), at(x, y), at(x + 1, y), at(x, y + 1)
+            out[2 * x, 2 * y] = d if d == b and b != f and d != h else e
+            out[2 * x + 1, 2 * y] = f if b == f and b != d and f != h else e
+            out[2 * x, 2 * y + 1] = d if d == h and d != b and h != f else e
+            out[2 * x + 1, 2 * y + 1] = f if h == f and d != h and b != f else e
+    return out
+
+
+def test_scale2x_matches_reference():
+    img = noise(9, 7, palette_size=3)
+    expected = naive_scale2x(img)
+    transform.scale2x(img)
+    assert bytes(img.data) == bytes(expected.data)
+
+
+def test_scale2x_smooths_diagonals():
+    img = ImageData(2, 2)
+    img[0, 0] = colors.BLACK
+    img[1, 1] = colors.BLACK
+    transform.scale(img, 4, 4, "scale2x")
+    # the diagonal becomes a continuous line
+    assert img[2, 1] == colors.BLACK
+    assert img[1, 2] == colors.BLACK
+    assert img[1, 1] == colors.WHITE
+    assert img[3, 0] == colors.WHITE
+
+
+def test_crop_pads_with_fill():
+    img = noise(4, 3)
+    before = pixels(img)
+    img.crop(-1, 1, 6, 4, colors.TRANSPARENT)
+    assert (img.width, img.height) == (7, 3)
+    assert img[0, 0] == colors.TRANSPARENT
+    assert img[6, 0] == colors.TRANSPARENT
+    assert img[1, 2] == colors.TRANSPARENT
+    assert all(img[x + 1, y - 1] == before[x, y] for x in range(4) for y in range(1, 3))